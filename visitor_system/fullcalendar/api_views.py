@@ -1,13 +1,13 @@
 from django.http import JsonResponse
-from django.db.models import Q
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
+from django.db.models import Q
 from django.views.decorators.http import require_http_methods
 from django.shortcuts import render
 from datetime import datetime, timedelta
 
 # Импортируем модели
-from visitors.models import Visit, StudentVisit, VisitGroup
+from visitors.models import VisitGroup, VisitTimelineEntry
 from classroom_book.models import KeyBooking
 
 
@@ -47,90 +47,73 @@ def calendar_events_api(request):
         start_date = today - timedelta(days=30)
         end_date = today + timedelta(days=30)
     
-    # Получаем обычные визиты
-    visits_queryset = Visit.objects.select_related(
-        'guest', 'employee', 'department'
+    # Официальные и студенческие визиты - одним запросом по ленте визитов
+    # (VisitTimelineEntry, индексы по relevant_time и expected_time).
+    # Как и раньше, визит попадает в календарь, если в диапазон входит
+    # фактическое время входа или плановое
+    timeline_queryset = VisitTimelineEntry.objects.select_related(
+        'employee', 'department'
     ).filter(
-        Q(entry_time__range=[start_date, end_date]) |
-        Q(expected_entry_time__range=[start_date, end_date])
+        Q(relevant_time__range=[start_date, end_date]) |
+        Q(expected_time__range=[start_date, end_date]),
+        kind__in=[VisitTimelineEntry.KIND_OFFICIAL, VisitTimelineEntry.KIND_STUDENT],
     )
     
-    for visit in visits_queryset:
-        # Определяем время начала события
-        event_start = visit.entry_time or visit.expected_entry_time
-        if not event_start:
-            continue
-            
-        # Определяем время окончания (если есть exit_time, иначе +2 часа)
-        event_end = visit.exit_time
+    for entry in timeline_queryset:
+        event_start = entry.relevant_time
+        is_official = entry.kind == VisitTimelineEntry.KIND_OFFICIAL
+        
+        # Время окончания: exit_time, иначе +2 часа (визит) / +4 часа (студент)
+        event_end = entry.exit_time
         if not event_end:
-            event_end = event_start + timedelta(hours=2)
+            event_end = event_start + timedelta(hours=2 if is_official else 4)
         
         # Определяем цвет на основе статуса
-        color = get_visit_color(visit.status)
-        
-        # Создаем событие для календаря
-        employee_name = (visit.employee.get_full_name() or
-                        visit.employee.username)
-        purpose_text = (visit.purpose[:100] + '...'
-                       if len(visit.purpose) > 100 else visit.purpose)
+        color = get_visit_color(entry.status)
+        purpose_text = (entry.purpose[:100] + '...'
+                       if len(entry.purpose) > 100 else entry.purpose)
+        department_name = entry.department.name if entry.department else ''
         
-        event = {
-            'id': f'visit_{visit.id}',
-            'title': f'Визит: {visit.guest.full_name}',
-            'start': event_start.isoformat(),
-            'end': event_end.isoformat(),
-            'color': color,
-            'textColor': '#ffffff',
-            'extendedProps': {
-                'type': 'visit',
-                'status': visit.status,
-                'guest_name': visit.guest.full_name,
-                'employee_name': employee_name,
-                'department': visit.department.name,
-                'purpose': purpose_text,
-                'url': f'/visitors/visit/{visit.id}/'
+        if is_official:
+            employee_name = ''
+            if entry.employee:
+                employee_name = (entry.employee.get_full_name() or
+                                entry.employee.username)
+            event = {
+                'id': f'visit_{entry.source_id}',
+                'title': f'Визит: {entry.guest_name}',
+                'start': event_start.isoformat(),
+                'end': event_end.isoformat(),
+                'color': color,
+                'textColor': '#ffffff',
+                'extendedProps': {
+                    'type': 'visit',
+                    'status': entry.status,
+                    'guest_name': entry.guest_name,
+                    'employee_name': employee_name,
+                    'department': department_name,
+                    'purpose': purpose_text,
+                    'url': f'/visitors/visit/{entry.source_id}/'
+                }
             }
-        }
-        events.append(event)
-    
-    # Получаем студенческие визиты
-    student_visits_queryset = StudentVisit.objects.select_related(
-        'guest', 'department', 'registered_by'
-    ).filter(
-        entry_time__range=[start_date, end_date]
-    )
-    
-    for visit in student_visits_queryset:
-        if not visit.entry_time:
-            continue
-            
-        # Время окончания (если есть exit_time, иначе +4 часа для студентов)
-        event_end = visit.exit_time
-        if not event_end:
-            event_end = visit.entry_time + timedelta(hours=4)
-        
-        color = get_visit_color(visit.status)
-        purpose_text = (visit.purpose[:100] + '...'
-                       if len(visit.purpose) > 100 else visit.purpose)
-        
-        event = {
-            'id': f'student_visit_{visit.id}',
-            'title': f'Студент: {visit.guest.full_name}',
-            'start': visit.entry_time.isoformat(),
-            'end': event_end.isoformat(),
-            'color': color,
-            'textColor': '#ffffff',
-            'extendedProps': {
-                'type': 'student_visit',
-                'status': visit.status,
-                'guest_name': visit.guest.full_name,
-                'department': visit.department.name,
-                'purpose': purpose_text,
-                'student_id': getattr(visit, 'student_id', ''),
-                'url': f'/visitors/student-visit/{visit.id}/'
+        else:
+            event = {
+                'id': f'student_visit_{entry.source_id}',
+                'title': f'Студент: {entry.guest_name}',
+                'start': event_start.isoformat(),
+                'end': event_end.isoformat(),
+                'color': color,
+                'textColor': '#ffffff',
+                'extendedProps': {
+                    'type': 'student_visit',
+                    'status': entry.status,
+                    'guest_name': entry.guest_name,
+                    'department': department_name,
+                    'purpose': purpose_text,
+                    'student_id': '',
+                    'url': f'/visitors/student-visit/{entry.source_id}/'
+                }
             }
-        }
         events.append(event)
     
     # Получаем групповые визиты
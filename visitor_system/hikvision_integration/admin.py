@@ -4,13 +4,19 @@ from .models import HikCentralServer, HikDevice, HikFaceLibrary, HikPersonBindin
 
 @admin.register(HikCentralServer)
 class HikCentralServerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'base_url', 'integration_key', 'enabled', 'created_at')
-    list_filter = ('enabled',)
+    list_display = ('name', 'base_url', 'integration_key', 'enabled', 'is_default', 'created_at')
+    list_filter = ('enabled', 'is_default')
     search_fields = ('name', 'base_url', 'integration_key')
+    filter_horizontal = ('departments',)
     fieldsets = (
         (None, {
             'fields': ('name', 'base_url', 'enabled')
         }),
+        ('Маршрутизация', {
+            'fields': ('is_default', 'departments', 'rate_limit_calls', 'rate_limit_window'),
+            'description': 'Департаменты, визиты которых обслуживает этот сервер, '
+                           'и собственный лимит запросов к HCP'
+        }),
         ('Integration Partner', {
             'fields': ('integration_key', 'integration_secret'),
             'description': 'Учетные данные Integration Partner из HikCentral Professional'
@@ -30,8 +36,8 @@ class HikCentralServerAdmin(admin.ModelAdmin):
 
 @admin.register(HikDevice)
 class HikDeviceAdmin(admin.ModelAdmin):
-    list_display = ("name", "host", "port", "is_primary", "enabled")
-    list_filter = ("enabled", "is_primary")
+    list_display = ("name", "host", "port", "server", "is_primary", "enabled")
+    list_filter = ("enabled", "is_primary", "server")
     search_fields = ("name", "host")
 
 
@@ -0,0 +1,242 @@
+"""
+Движок правил обнаружения аномалий (SecurityIncident).
+
+Каждое правило - один set-based SQL-запрос по всем активным визитам:
+кандидаты выбираются фильтром в базе, визиты с уже созданным инцидентом
+этого типа исключаются через NOT EXISTS, новые инциденты создаются одним
+bulk_create. Повторная вставка при гонке отсекается уникальным
+ограничением (visit, incident_type).
+
+Новое правило - подкласс AnomalyRule с декоратором @register_rule:
+
+    @register_rule
+    class MyRule(AnomalyRule):
+        incident_type = SecurityIncident.INCIDENT_OTHER
+
+        def candidates(self, qs, now):
+            return qs.filter(...)
+
+        def describe(self, visit, now):
+            return 'Описание', {'key': 'value'}
+
+Правила можно отключить через settings.ANOMALY_RULES_DISABLED
+(список incident_type).
+"""
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple, Type
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from visitors.models import STATUS_CHECKED_IN, SecurityIncident, Visit
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, Type['AnomalyRule']] = {}
+
+
+def register_rule(rule_cls: Type['AnomalyRule']) -> Type['AnomalyRule']:
+    """Регистрирует правило (одно правило на incident_type)."""
+    _registry[rule_cls.incident_type] = rule_cls
+    return rule_cls
+
+
+def get_rules() -> List['AnomalyRule']:
+    """Экземпляры включённых правил."""
+    disabled = set(getattr(settings, 'ANOMALY_RULES_DISABLED', []) or [])
+    return [cls() for incident_type, cls in _registry.items() if incident_type not in disabled]
+
+
+class AnomalyRule:
+    """
+    Базовое правило.
+
+    Attributes:
+        incident_type: SecurityIncident.INCIDENT_*
+        severity: SecurityIncident.SEVERITY_*
+        time_field: Поле визита, по которому ограничивается окно проверки
+                    (старые «зависшие» визиты не порождают инциденты)
+    """
+    incident_type: str = ''
+    severity: str = SecurityIncident.SEVERITY_MEDIUM
+    time_field: str = 'entry_time'
+    only_fields: Tuple[str, ...] = ('id', 'entry_time')
+
+    def lookback(self) -> timedelta:
+        return timedelta(hours=getattr(settings, 'ANOMALY_RULES_LOOKBACK_HOURS', 48))
+
+    def candidates(self, qs, now):
+        """Фильтрует QuerySet визитов до нарушивших правило."""
+        raise NotImplementedError
+
+    def describe(self, visit, now) -> Tuple[str, dict]:
+        """Описание и metadata инцидента для визита."""
+        raise NotImplementedError
+
+    def queryset(self, now):
+        already_reported = SecurityIncident.objects.filter(
+            visit_id=OuterRef('pk'),
+            incident_type=self.incident_type,
+        )
+        qs = Visit.objects.filter(
+            **{f'{self.time_field}__gte': now - self.lookback()}
+        ).exclude(Exists(already_reported))
+        return self.candidates(qs, now).only(*self.only_fields)
+
+
+@register_rule
+class LongStayRule(AnomalyRule):
+    """Гость в здании дольше MAX_GUEST_STAY_HOURS."""
+    incident_type = SecurityIncident.INCIDENT_LONG_STAY
+    severity = SecurityIncident.SEVERITY_MEDIUM
+
+    def max_hours(self) -> float:
+        return getattr(settings, 'MAX_GUEST_STAY_HOURS', 8)
+
+    def candidates(self, qs, now):
+        return qs.filter(
+            status=STATUS_CHECKED_IN,
+            entry_time__lt=now - timedelta(hours=self.max_hours()),
+        )
+
+    def describe(self, visit, now):
+        max_stay_hours = self.max_hours()
+        hours_inside = (now - visit.entry_time).total_seconds() / 3600
+        description = (
+            f'Гость находится в здании более {max_stay_hours} часов. '
+            f'Entry time: {visit.entry_time.strftime("%Y-%m-%d %H:%M:%S")}. '
+            f'Время пребывания: {hours_inside:.1f} часов.'
+        )
+        return description, {
+            'entry_time': visit.entry_time.isoformat(),
+            'hours_inside': hours_inside,
+            'max_allowed_hours': max_stay_hours,
+        }
+
+
+@register_rule
+class SuspiciousTimeRule(AnomalyRule):
+    """Вход вне рабочих часов WORK_HOURS_START..WORK_HOURS_END (локальное время)."""
+    incident_type = SecurityIncident.INCIDENT_SUSPICIOUS_TIME
+    severity = SecurityIncident.SEVERITY_MEDIUM
+
+    def work_hours(self) -> Tuple[int, int]:
+        return (
+            getattr(settings, 'WORK_HOURS_START', 6),
+            getattr(settings, 'WORK_HOURS_END', 22),
+        )
+
+    def candidates(self, qs, now):
+        work_start, work_end = self.work_hours()
+        return qs.filter(status=STATUS_CHECKED_IN, entry_time__isnull=False).annotate(
+            entry_hour=ExtractHour('entry_time', tzinfo=timezone.get_current_timezone())
+        ).filter(Q(entry_hour__lt=work_start) | Q(entry_hour__gte=work_end))
+
+    def describe(self, visit, now):
+        work_start, work_end = self.work_hours()
+        entry_time = timezone.localtime(visit.entry_time)
+        description = (
+            f'Доступ в нерабочее время ({entry_time.hour:02d}:00). '
+            f'Рабочие часы: {work_start:02d}:00-{work_end:02d}:00. '
+            f'Entry time: {entry_time.strftime("%Y-%m-%d %H:%M:%S")}.'
+        )
+        return description, {
+            'entry_time': visit.entry_time.isoformat(),
+            'entry_hour': entry_time.hour,
+            'work_hours': f'{work_start:02d}:00-{work_end:02d}:00',
+        }
+
+
+@register_rule
+class ExitWithoutEntryRule(AnomalyRule):
+    """Турникет зафиксировал выход, но входа не было."""
+    incident_type = SecurityIncident.INCIDENT_EXIT_WITHOUT_ENTRY
+    severity = SecurityIncident.SEVERITY_HIGH
+    time_field = 'first_exit_detected'
+    only_fields = ('id', 'status', 'exit_count', 'first_exit_detected')
+
+    def candidates(self, qs, now):
+        return qs.filter(
+            first_exit_detected__isnull=False,
+            first_entry_detected__isnull=True,
+        )
+
+    def describe(self, visit, now):
+        exit_time = visit.first_exit_detected
+        description = (
+            f'Обнаружен выход через турникет без предварительного входа. '
+            f'Exit time: {exit_time.strftime("%Y-%m-%d %H:%M:%S")}. '
+            f'Возможная аномалия или выход через другой путь.'
+        )
+        return description, {
+            'exit_time': exit_time.isoformat(),
+            'exit_count': visit.exit_count,
+            'current_status': visit.status,
+        }
+
+
+def evaluate_rule(rule: AnomalyRule, now=None, send_alerts: bool = True) -> int:
+    """
+    Применяет одно правило ко всем визитам.
+
+    Returns:
+        Количество созданных инцидентов
+    """
+    now = now or timezone.now()
+    incidents = []
+    for visit in rule.queryset(now).iterator(chunk_size=500):
+        description, metadata = rule.describe(visit, now)
+        incidents.append(SecurityIncident(
+            visit_id=visit.id,
+            incident_type=rule.incident_type,
+            severity=rule.severity,
+            description=description,
+            metadata=metadata,
+        ))
+    if not incidents:
+        return 0
+
+    # ignore_conflicts: параллельный прогон мог успеть создать инцидент
+    SecurityIncident.objects.bulk_create(incidents, ignore_conflicts=True)
+
+    # PostgreSQL не возвращает id при ON CONFLICT DO NOTHING -
+    # перечитываем реально вставленные (alert ещё не отправлялся)
+    created = list(
+        SecurityIncident.objects.filter(
+            incident_type=rule.incident_type,
+            visit_id__in=[incident.visit_id for incident in incidents],
+            alert_sent=False,
+            detected_at__gte=now,
+        ).values_list('id', flat=True)
+    )
+    logger.warning(
+        "Anomaly rule %s: %d incident(s) created", rule.incident_type, len(created)
+    )
+
+    if send_alerts:
+        from .utils import send_security_alert_async
+        for incident_id in created:
+            send_security_alert_async(incident_id)
+    return len(created)
+
+
+def evaluate_rules(now=None, rules: Optional[List[AnomalyRule]] = None,
+                   send_alerts: bool = True) -> Dict[str, int]:
+    """
+    Прогоняет все включённые правила.
+
+    Returns:
+        {incident_type: количество созданных инцидентов}
+    """
+    now = now or timezone.now()
+    results = {}
+    for rule in rules if rules is not None else get_rules():
+        try:
+            results[rule.incident_type] = evaluate_rule(rule, now=now, send_alerts=send_alerts)
+        except Exception as e:
+            logger.error("Anomaly rule %s failed: %s", rule.incident_type, e)
+            results[rule.incident_type] = 0
+    return results
@@ -16,14 +16,14 @@ from .services import (
     batch_reapply_access,
     batch_assign_access_levels
 )
-from .models import HikCentralServer
+from .routing import get_default_server
 
 
 def example_single_guest_with_monitoring():
     """Пример обработки одного гостя с мониторингом производительности."""
     
     # Получаем сервер из базы
-    server = HikCentralServer.objects.first()
+    server = get_default_server()
     
     # Создаем сессию с настройками rate limiting
     session = HikCentralSession(
@@ -61,7 +61,7 @@ def example_single_guest_with_monitoring():
 def example_batch_processing_sync():
     """Пример синхронной batch обработки 20 гостей."""
     
-    server = HikCentralServer.objects.first()
+    server = get_default_server()
     session = HikCentralSession(server)
     
     # Подготавливаем данные гостей
@@ -89,7 +89,7 @@ def example_batch_processing_sync():
 def example_async_processing_large_batch():
     """Пример асинхронной обработки 100+ гостей."""
     
-    server = HikCentralServer.objects.first()
+    server = get_default_server()
     session = HikCentralSession(server)
     
     # Подготавливаем данные большой группы гостей
@@ -117,7 +117,7 @@ def example_async_processing_large_batch():
 def example_manual_batch_operations():
     """Пример ручного использования batch операций."""
     
-    server = HikCentralServer.objects.first()
+    server = get_default_server()
     session = HikCentralSession(server)
     
     # Предположим у нас есть список person_ids
@@ -144,7 +144,7 @@ def example_manual_batch_operations():
 def example_error_handling_and_retry():
     """Пример обработки ошибок с автоматическими повторами."""
     
-    server = HikCentralServer.objects.first()
+    server = get_default_server()
     session = HikCentralSession(server)
     
     try:
@@ -166,7 +166,7 @@ def example_error_handling_and_retry():
 def example_monitoring_dashboard():
     """Пример создания dashboard'а для мониторинга API."""
     
-    server = HikCentralServer.objects.first()
+    server = get_default_server()
     session = HikCentralSession(server)
     
     # После выполнения операций получаем детальную статистику
@@ -218,7 +218,7 @@ def django_view_example(request):
         guests_data = json.loads(request.body)
         
         # Обрабатываем через оптимизированный API
-        server = HikCentralServer.objects.first()
+        server = get_default_server()
         session = HikCentralSession(server)
         
         try:
@@ -250,7 +250,7 @@ def celery_task_example():
     def process_guest_batch_async(guests_data, access_group_id=None):
         """Celery task для асинхронной обработки гостей."""
         
-        server = HikCentralServer.objects.first()
+        server = get_default_server()
         session = HikCentralSession(server)
         
         try:
@@ -2,7 +2,8 @@
 Script to check and verify presence of a guest in HikCentral by guest ID
 """
 from django.core.management.base import BaseCommand
-from hikvision_integration.models import HikCentralServer, HikPersonBinding
+from hikvision_integration.models import HikPersonBinding
+from hikvision_integration.routing import get_server_for_guest
 from hikvision_integration.services import HikCentralSession
 import json
 import logging
@@ -27,7 +28,7 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f"Найден binding: guest_id={binding.guest_id}, person_id={binding.person_id}, status={binding.status}"))
         
         # Получаем сервер HikCentral
-        server = HikCentralServer.objects.filter(enabled=True).first()
+        server = get_server_for_guest(guest_id)
         if not server:
             self.stdout.write(self.style.ERROR("HikCentralServer не настроен или выключен"))
             return
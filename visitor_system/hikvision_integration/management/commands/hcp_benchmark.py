@@ -0,0 +1,173 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from hikvision_integration.mock_hcp import (
+    MockHCPConfig,
+    MockHCPServer,
+    make_server_model,
+    window_bounds,
+)
+from hikvision_integration.services import (
+    HikCentralSession,
+    assign_access_level_to_person,
+    ensure_person_hikcentral,
+    get_door_events,
+    revoke_access_level_from_person,
+)
+
+OPERATIONS = ('enroll', 'assign', 'revoke', 'monitor')
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер интеграции HikCentral (enroll/assign/revoke/monitor) '
+        'через настоящий HikCentralSession против локального mock HCP'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--persons', type=int, default=200, help='Количество гостей')
+        parser.add_argument('--concurrency', type=int, default=8, help='Параллельных потоков')
+        parser.add_argument('--latency-ms', type=float, default=5.0, help='Задержка mock HCP')
+        parser.add_argument('--jitter-ms', type=float, default=5.0, help='Разброс задержки')
+        parser.add_argument('--rate-429', type=float, default=0.0, help='Доля ответов HTTP 429 (0..1)')
+        parser.add_argument('--events', type=int, default=5000,
+                            help='Сколько событий проходов сгенерировать для monitor')
+        parser.add_argument('--page-size', type=int, default=1000, help='pageSize для door/events')
+        parser.add_argument('--operations', default=','.join(OPERATIONS),
+                            help='Список операций через запятую')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        operations = [op.strip() for op in options['operations'].split(',') if op.strip()]
+        unknown = set(operations) - set(OPERATIONS)
+        if unknown:
+            raise CommandError(f"Неизвестные операции: {', '.join(sorted(unknown))}")
+
+        config = MockHCPConfig(
+            stage=getattr(settings, 'HIKCENTRAL_STAGE', '') or '',
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            rate_limit_429=options['rate_429'],
+        )
+        mock = MockHCPServer(('127.0.0.1', 0), config)
+        mock.start()
+        server = make_server_model(mock)
+        access_group_id = str(getattr(settings, 'HIKCENTRAL_GUEST_ACCESS_GROUP_ID', '7'))
+        person_codes = [f"bench-{i}" for i in range(options['persons'])]
+        person_ids = {}
+
+        def enroll(code):
+            with HikCentralSession(server) as session:
+                person_ids[code] = ensure_person_hikcentral(session, code, f"Guest {code}", None, None)
+            return True
+
+        def assign(code):
+            with HikCentralSession(server) as session:
+                return assign_access_level_to_person(session, person_ids[code], access_group_id)
+
+        def revoke(code):
+            with HikCentralSession(server) as session:
+                return revoke_access_level_from_person(session, person_ids[code], access_group_id)
+
+        def monitor(_):
+            # Тот же запрос, что делает monitor_guest_passages_task
+            start, end = window_bounds()
+            with HikCentralSession(server) as session:
+                result = get_door_events(
+                    session, start_time=start, end_time=end,
+                    page_no=1, page_size=options['page_size'],
+                )
+            return bool(result)
+
+        handlers = {'enroll': enroll, 'assign': assign, 'revoke': revoke, 'monitor': monitor}
+        results = {}
+        try:
+            for op in operations:
+                if op in ('assign', 'revoke', 'monitor') and not person_ids:
+                    # Персоны нужны для остальных операций - создаём без замера
+                    for code in person_codes:
+                        enroll(code)
+                if op == 'monitor':
+                    # assign мог не запускаться - даём доступ, чтобы были события
+                    if not any(mock.state.privileges.values()):
+                        for code in person_codes:
+                            assign(code)
+                    mock.state.generate_events(options['events'])
+                    items = range(max(1, options['persons'] // 10))
+                else:
+                    items = person_codes
+                results[op] = self._run(handlers[op], items, options['concurrency'])
+        finally:
+            mock.stop()
+
+        results['_mock'] = {
+            'requests_total': mock.state.requests_total,
+            'rejected_signatures': mock.state.rejected_signatures,
+            'throttled': mock.state.throttled,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self._print(results)
+
+    def _run(self, func, items, concurrency):
+        latencies = []
+        failures = 0
+
+        def timed(item):
+            started = time.perf_counter()
+            try:
+                ok = func(item)
+            except Exception:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        wall_started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for elapsed, ok in pool.map(timed, items):
+                latencies.append(elapsed * 1000.0)
+                if not ok:
+                    failures += 1
+        wall = time.perf_counter() - wall_started
+
+        latencies.sort()
+        return {
+            'count': len(latencies),
+            'failures': failures,
+            'wall_seconds': round(wall, 3),
+            'throughput_per_sec': round(len(latencies) / wall, 1) if wall else 0.0,
+            'p50_ms': round(_percentile(latencies, 50), 2),
+            'p95_ms': round(_percentile(latencies, 95), 2),
+            'p99_ms': round(_percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        }
+
+    def _print(self, results):
+        header = f"{'операция':<10}{'кол-во':>8}{'ошибок':>8}{'оп/с':>10}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'max мс':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for op, stats in results.items():
+            if op.startswith('_'):
+                continue
+            self.stdout.write(
+                f"{op:<10}{stats['count']:>8}{stats['failures']:>8}{stats['throughput_per_sec']:>10}"
+                f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}"
+            )
+        mock = results['_mock']
+        self.stdout.write(
+            f"\nMock HCP: запросов {mock['requests_total']}, "
+            f"отклонено подписей {mock['rejected_signatures']}, ответов 429 {mock['throttled']}"
+        )
+        if mock['rejected_signatures']:
+            self.stdout.write(self.style.ERROR("Обнаружены запросы с неверной подписью!"))
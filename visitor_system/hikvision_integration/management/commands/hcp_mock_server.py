@@ -0,0 +1,58 @@
+import threading
+
+from django.core.management.base import BaseCommand
+
+from hikvision_integration.mock_hcp import MockHCPConfig, MockHCPServer
+
+
+class Command(BaseCommand):
+    help = 'Запускает локальный mock-сервер HikCentral Professional (Artemis OpenAPI)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9016)
+        parser.add_argument('--key', default='mock-key', help='Integration Partner Key')
+        parser.add_argument('--secret', default='mock-secret', help='Integration Partner Secret')
+        parser.add_argument('--stage', default='', help='Ожидаемый x-ca-stage')
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Базовая задержка ответа')
+        parser.add_argument('--jitter-ms', type=float, default=0.0, help='Случайная добавка к задержке')
+        parser.add_argument('--rate-429', type=float, default=0.0, help='Доля ответов HTTP 429 (0..1)')
+        parser.add_argument('--retry-after', type=int, default=1, help='Retry-After для 429, сек')
+        parser.add_argument('--events-per-minute', type=int, default=0,
+                            help='Генерировать события проходов для персон с доступом')
+        parser.add_argument('--no-verify-signature', action='store_true',
+                            help='Не проверять подпись X-Ca-Signature')
+
+    def handle(self, *args, **options):
+        config = MockHCPConfig(
+            integration_key=options['key'],
+            integration_secret=options['secret'],
+            stage=options['stage'],
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            rate_limit_429=options['rate_429'],
+            retry_after=options['retry_after'],
+            verify_signature=not options['no_verify_signature'],
+        )
+        server = MockHCPServer((options['host'], options['port']), config)
+        stop_event = threading.Event()
+        if options['events_per_minute']:
+            server.start_event_generator(options['events_per_minute'], stop_event)
+
+        self.stdout.write(self.style.SUCCESS(f"Mock HCP слушает {server.base_url}"))
+        self.stdout.write(f"  Integration key: {config.integration_key}")
+        self.stdout.write(f"  Integration secret: {config.integration_secret}")
+        self.stdout.write("Остановка: Ctrl+C")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_event.set()
+            server.server_close()
+            state = server.state
+            self.stdout.write(
+                f"\nЗапросов: {state.requests_total}, "
+                f"отклонено подписей: {state.rejected_signatures}, "
+                f"ответов 429: {state.throttled}"
+            )
@@ -1,8 +1,8 @@
 from django.core.management.base import BaseCommand, CommandError
 from typing import Optional
 from hikvision_integration.models import HikPersonBinding
+from hikvision_integration.routing import get_server_for_guest
 from hikvision_integration.services import HikCentralSession
-from hikvision_integration.models import HikCentralServer
 
 
 class Command(BaseCommand):
@@ -20,7 +20,7 @@ class Command(BaseCommand):
         if not binding and not options.get("person_id"):
             raise CommandError("Binding не найден и person_id не указан. Сначала выполните enroll_face_task или передайте --person-id.")
 
-        server = HikCentralServer.objects.filter(enabled=True).first()
+        server = get_server_for_guest(guest_id)
         if not server:
             raise CommandError("HikCentralServer не настроен или выключен.")
         session = HikCentralSession(server)
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from hikvision_integration.models import HikPersonBinding
+from hikvision_integration.routing import get_server_for_guest
 from hikvision_integration.services import HikCentralSession
-from hikvision_integration.models import HikCentralServer
 
 
 class Command(BaseCommand):
@@ -17,7 +17,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"Binding для guest_id={guest_id} не найден"))
             return
 
-        server = HikCentralServer.objects.filter(enabled=True).first()
+        server = get_server_for_guest(guest_id)
         if not server:
             self.stdout.write(self.style.ERROR("HikCentralServer не настроен или выключен"))
             return
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from hikvision_integration.models import HikCentralServer
+from hikvision_integration.routing import get_default_server
 from hikvision_integration.services import HikCentralSession
 
 
@@ -7,7 +7,7 @@ class Command(BaseCommand):
     help = 'POST /artemis/api/resource/v1/videoManagementServer (pageNo/pageSize) и вывод ответа'
 
     def handle(self, *args, **options):
-        server = HikCentralServer.objects.filter(enabled=True).first()
+        server = get_default_server()
         if not server:
             self.stdout.write(self.style.ERROR('Нет активных серверов HikCentral.'))
             return
@@ -2,7 +2,7 @@
 Management команда для просмотра Face Groups в HikCentral Professional
 """
 from django.core.management.base import BaseCommand
-from hikvision_integration.models import HikCentralServer
+from hikvision_integration.routing import get_default_server
 from hikvision_integration.services import HikCentralSession
 
 
@@ -15,7 +15,7 @@ class Command(BaseCommand):
         print("=" * 80)
         
         # Получаем активный сервер
-        server = HikCentralServer.objects.filter(enabled=True).first()
+        server = get_default_server()
         if not server:
             print("\n[ERROR] HikCentral сервер не найден или отключен")
             return
@@ -7,6 +7,7 @@ Management command для просмотра всех организаций в
 import logging
 from django.core.management.base import BaseCommand
 from hikvision_integration.models import HikCentralServer
+from hikvision_integration.routing import get_default_server
 from hikvision_integration.services import HikCentralSession
 
 logger = logging.getLogger(__name__)
@@ -21,7 +22,7 @@ class Command(BaseCommand):
 
         # Получаем HikCentral сервер
         try:
-            hik_server = HikCentralServer.objects.filter(enabled=True).first()
+            hik_server = get_default_server()
             if not hik_server:
                 all_servers = HikCentralServer.objects.all()
                 if all_servers.exists():
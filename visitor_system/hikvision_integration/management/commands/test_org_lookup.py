@@ -8,6 +8,7 @@ import logging
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from hikvision_integration.models import HikCentralServer
+from hikvision_integration.routing import get_default_server
 from hikvision_integration.services import HikCentralSession, find_org_by_name
 
 logger = logging.getLogger(__name__)
@@ -37,7 +38,7 @@ class Command(BaseCommand):
 
         # Получаем HikCentral сервер
         try:
-            hik_server = HikCentralServer.objects.filter(enabled=True).first()
+            hik_server = get_default_server()
             if not hik_server:
                 # Проверяем, есть ли вообще серверы
                 all_servers = HikCentralServer.objects.all()
@@ -8,7 +8,8 @@ Management command для тестирования загрузки фото г
 import logging
 from django.core.management.base import BaseCommand
 from visitors.models import Guest
-from hikvision_integration.models import HikCentralServer, HikPersonBinding
+from hikvision_integration.models import HikPersonBinding
+from hikvision_integration.routing import get_server_for_guest
 from hikvision_integration.services import HikCentralSession, upload_face_hikcentral
 
 logger = logging.getLogger(__name__)
@@ -112,7 +113,7 @@ class Command(BaseCommand):
 
         # Получаем HikCentral сервер
         try:
-            hik_server = HikCentralServer.objects.filter(enabled=True).first()
+            hik_server = get_server_for_guest(guest.id)
             if not hik_server:
                 self.stdout.write(self.style.ERROR('Ошибка: Не найден активный HikCentral сервер'))
                 return
@@ -14,7 +14,7 @@ import logging
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from visitors.models import Guest
-from hikvision_integration.models import HikCentralServer
+from hikvision_integration.routing import get_default_server
 from hikvision_integration.services import HikCentralSession, find_org_by_name
 
 logger = logging.getLogger(__name__)
@@ -44,7 +44,7 @@ class Command(BaseCommand):
 
         # Получаем HikCentral сервер
         try:
-            hik_server = HikCentralServer.objects.filter(enabled=True).first()
+            hik_server = get_default_server()
             if not hik_server:
                 self.stdout.write(self.style.ERROR('Ошибка: Не найден активный HikCentral сервер'))
                 return
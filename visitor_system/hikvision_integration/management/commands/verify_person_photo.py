@@ -6,7 +6,7 @@ Management command для проверки наличия фото у Person в
 """
 import logging
 from django.core.management.base import BaseCommand
-from hikvision_integration.models import HikCentralServer
+from hikvision_integration.routing import get_server_for_person
 from hikvision_integration.services import HikCentralSession
 
 logger = logging.getLogger(__name__)
@@ -31,7 +31,7 @@ class Command(BaseCommand):
 
         # Получаем HikCentral сервер
         try:
-            hik_server = HikCentralServer.objects.filter(enabled=True).first()
+            hik_server = get_server_for_person(person_id)
             if not hik_server:
                 self.stdout.write(self.style.ERROR('Ошибка: Не найден активный HikCentral сервер'))
                 return
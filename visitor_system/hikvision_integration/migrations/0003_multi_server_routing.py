@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('departments', '0003_alter_department_name'),
+        ('hikvision_integration', '0002_hikcentralserver'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hikcentralserver',
+            name='departments',
+            field=models.ManyToManyField(blank=True, related_name='hikcentral_servers', to='departments.department', verbose_name='Обслуживаемые департаменты'),
+        ),
+        migrations.AddField(
+            model_name='hikcentralserver',
+            name='is_default',
+            field=models.BooleanField(default=False, verbose_name='Сервер по умолчанию'),
+        ),
+        migrations.AddField(
+            model_name='hikcentralserver',
+            name='rate_limit_calls',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Лимит запросов в окне'),
+        ),
+        migrations.AddField(
+            model_name='hikcentralserver',
+            name='rate_limit_window',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Окно лимита (сек)'),
+        ),
+        migrations.AddField(
+            model_name='hikdevice',
+            name='server',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='devices', to='hikvision_integration.hikcentralserver', verbose_name='Сервер HikCentral'),
+        ),
+    ]
@@ -0,0 +1,433 @@
+"""
+Локальный mock-сервер HikCentral Professional (Artemis OpenAPI).
+
+Позволяет гонять интеграцию (HikCentralSession, сервисы и задачи) без
+реального HCP - в CI и для нагрузочных замеров:
+- проверяет подпись AK/SK (X-Ca-Signature) и Content-MD5 тем же кодом,
+  что и клиент (ArtemisSigner);
+- имитирует задержку ответа, HTTP 429 с Retry-After и постраничную выдачу;
+- хранит персоны и назначения access level в памяти;
+- генерирует события проходов (вход/выход) для персон с доступом.
+
+Запуск: python manage.py hcp_mock_server --port 9016
+"""
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from .signing import ArtemisSigner
+
+logger = logging.getLogger(__name__)
+
+ENTRY_EVENT = 1
+EXIT_EVENT = 2
+
+
+@dataclass
+class MockHCPConfig:
+    """Параметры поведения mock-сервера."""
+    integration_key: str = 'mock-key'
+    integration_secret: str = 'mock-secret'
+    stage: str = ''
+    latency_ms: float = 0.0        # Базовая задержка ответа
+    jitter_ms: float = 0.0         # Случайная добавка к задержке
+    rate_limit_429: float = 0.0    # Вероятность ответа 429 на запрос
+    retry_after: int = 1           # Значение Retry-After для 429
+    max_page_size: int = 500       # Максимальный pageSize, как у HCP
+    verify_signature: bool = True
+
+
+class MockHCPState:
+    """In-memory состояние HCP: персоны, access level группы, события."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.persons: Dict[str, Dict[str, Any]] = {}
+        self.person_by_code: Dict[str, str] = {}
+        self.privileges: Dict[str, set] = {}
+        self.events: List[Dict[str, Any]] = []
+        self.requests_total = 0
+        self.rejected_signatures = 0
+        self.throttled = 0
+        self._next_person_id = 1000
+
+    def add_person(self, payload: Dict[str, Any]) -> str:
+        with self.lock:
+            code = str(payload.get('personCode') or '')
+            if code and code in self.person_by_code:
+                return self.person_by_code[code]
+            self._next_person_id += 1
+            person_id = str(self._next_person_id)
+            self.persons[person_id] = {
+                'personId': person_id,
+                'personCode': code,
+                'personName': payload.get('personName', ''),
+                'orgIndexCode': payload.get('orgIndexCode', '1'),
+                'beginTime': payload.get('beginTime'),
+                'endTime': payload.get('endTime'),
+                'status': 1,
+            }
+            if code:
+                self.person_by_code[code] = person_id
+            return person_id
+
+    def generate_events(self, count: int, exit_ratio: float = 0.5) -> int:
+        """
+        Генерирует события проходов для персон, у которых есть доступ.
+
+        Returns:
+            Количество созданных событий
+        """
+        with self.lock:
+            person_ids = sorted({pid for group in self.privileges.values() for pid in group})
+            if not person_ids:
+                return 0
+            now = datetime.now(dt_timezone.utc)
+            for _ in range(count):
+                self.events.append({
+                    'eventId': str(len(self.events) + 1),
+                    'personId': random.choice(person_ids),
+                    'eventType': EXIT_EVENT if random.random() < exit_ratio else ENTRY_EVENT,
+                    'eventTime': now.isoformat(),
+                    'doorIndexCode': '1',
+                })
+            return count
+
+    def query_events(self, start: Optional[datetime], end: Optional[datetime]) -> List[Dict[str, Any]]:
+        with self.lock:
+            events = list(self.events)
+        if not start and not end:
+            return events
+        result = []
+        for event in events:
+            event_time = datetime.fromisoformat(event['eventTime'])
+            if start and event_time < start:
+                continue
+            if end and event_time > end:
+                continue
+            result.append(event)
+        return result
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+def _ok(data: Any = None) -> Dict[str, Any]:
+    return {'code': '0', 'msg': 'Success', 'data': data}
+
+
+def _error(code: str, msg: str) -> Dict[str, Any]:
+    return {'code': code, 'msg': msg, 'data': None}
+
+
+def _page(items: List[Any], body: Dict[str, Any], max_page_size: int) -> Dict[str, Any]:
+    page_no = max(int(body.get('pageNo') or 1), 1)
+    page_size = min(max(int(body.get('pageSize') or 100), 1), max_page_size)
+    offset = (page_no - 1) * page_size
+    return {
+        'total': len(items),
+        'pageNo': page_no,
+        'pageSize': page_size,
+        'list': items[offset:offset + page_size],
+    }
+
+
+class MockHCPRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик Artemis-запросов. Состояние берётся из self.server."""
+
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело пишутся отдельно - без TCP_NODELAY keep-alive
+    # соединение ловит задержку Nagle/delayed ACK (~40 мс на ответ)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):  # noqa: A002 - сигнатура базового класса
+        logger.debug("MockHCP: " + format, *args)
+
+    # --- транспорт ---------------------------------------------------------
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _check_signature(self, method: str, body: bytes) -> Optional[str]:
+        config: MockHCPConfig = self.server.config
+        signer: ArtemisSigner = self.server.signer
+        if self.headers.get('X-Ca-Key') != config.integration_key:
+            return 'unknown X-Ca-Key'
+        content_md5 = self.headers.get('Content-MD5', '')
+        if body and content_md5 != signer.content_md5(body):
+            return 'Content-MD5 mismatch'
+        string_to_sign = signer.string_to_sign(
+            method,
+            self.path,
+            self.headers.get('X-Ca-Timestamp', ''),
+            self.headers.get('X-Ca-Nonce', ''),
+            content_md5=content_md5,
+            content_type=self.headers.get('Content-Type', '') if body else '',
+            date_hdr=self.headers.get('Date', ''),
+        )
+        if signer.signature(string_to_sign) != self.headers.get('X-Ca-Signature'):
+            return 'signature mismatch'
+        return None
+
+    def _handle(self, method: str) -> None:
+        config: MockHCPConfig = self.server.config
+        state: MockHCPState = self.server.state
+        body = self._read_body()
+
+        with state.lock:
+            state.requests_total += 1
+
+        delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+        if config.rate_limit_429 and random.random() < config.rate_limit_429:
+            with state.lock:
+                state.throttled += 1
+            self._send_json(
+                429, _error('0x00000429', 'Too Many Requests'),
+                headers={'Retry-After': str(config.retry_after)},
+            )
+            return
+
+        if config.verify_signature:
+            error = self._check_signature(method, body)
+            if error:
+                with state.lock:
+                    state.rejected_signatures += 1
+                logger.warning("MockHCP: rejected %s %s: %s", method, self.path, error)
+                self._send_json(401, _error('0x00052101', error))
+                return
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            self._send_json(400, _error('0x00052102', 'invalid JSON body'))
+            return
+
+        route = self.server.routes.get(urlsplit(self.path).path)
+        if route is None:
+            self._send_json(404, _error('0x00052104', 'API not found'))
+            return
+        self._send_json(200, route(state, payload, config))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+# --- Artemis API ---------------------------------------------------------
+
+
+def _version(state, body, config):
+    return _ok({'softVersion': 'V2.6.0-mock', 'buildTime': '2025-01-01'})
+
+
+def _org_list(state, body, config):
+    return _ok(_page([{'orgIndexCode': '1', 'orgName': 'Visitor Management'}], body, config.max_page_size))
+
+
+def _person_by_code(state, body, config):
+    with state.lock:
+        person_id = state.person_by_code.get(str(body.get('personCode') or ''))
+        person = dict(state.persons[person_id]) if person_id else None
+    if person is None:
+        return _error('0x00052301', 'person does not exist')
+    return _ok(person)
+
+
+def _person_by_id(state, body, config):
+    with state.lock:
+        person = state.persons.get(str(body.get('personId') or ''))
+        person = dict(person) if person else None
+    if person is None:
+        return _error('0x00052301', 'person does not exist')
+    return _ok(person)
+
+
+def _person_add(state, body, config):
+    return _ok(state.add_person(body))
+
+
+def _person_update(state, body, config):
+    with state.lock:
+        person = state.persons.get(str(body.get('personId') or ''))
+        if person is None:
+            return _error('0x00052301', 'person does not exist')
+        for field in ('personName', 'orgIndexCode', 'beginTime', 'endTime'):
+            if field in body:
+                person[field] = body[field]
+    return _ok()
+
+
+def _person_list(state, body, config):
+    code = body.get('personCode')
+    with state.lock:
+        persons = [dict(p) for p in state.persons.values() if not code or p['personCode'] == str(code)]
+    return _ok(_page(persons, body, config.max_page_size))
+
+
+def _privilege_add(state, body, config):
+    group_id = str(body.get('privilegeGroupId') or '')
+    with state.lock:
+        group = state.privileges.setdefault(group_id, set())
+        for item in body.get('list') or []:
+            group.add(str(item.get('id')))
+    return _ok()
+
+
+def _privilege_delete(state, body, config):
+    group_id = str(body.get('privilegeGroupId') or '')
+    with state.lock:
+        group = state.privileges.setdefault(group_id, set())
+        for item in body.get('list') or []:
+            group.discard(str(item.get('id')))
+    return _ok()
+
+
+def _noop(state, body, config):
+    return _ok()
+
+
+def _door_events(state, body, config):
+    events = state.query_events(_parse_time(body.get('startTime')), _parse_time(body.get('endTime')))
+    return _ok(_page(events, body, config.max_page_size))
+
+
+DEFAULT_ROUTES = {
+    '/artemis/api/common/v1/version': _version,
+    '/artemis/api/common/v1/status': _noop,
+    '/artemis/api/resource/v1/org/advance/orgList': _org_list,
+    '/artemis/api/resource/v1/person/personCode/personInfo': _person_by_code,
+    '/artemis/api/resource/v1/person/personId/personInfo': _person_by_id,
+    '/artemis/api/resource/v1/person/single/add': _person_add,
+    '/artemis/api/resource/v1/person/single/update': _person_update,
+    '/artemis/api/resource/v1/person/personUpdate': _person_update,
+    '/artemis/api/resource/v1/person/advance/personList': _person_list,
+    '/artemis/api/resource/v1/person/face/update': _noop,
+    '/artemis/api/acs/v1/privilege/group/single/addPersons': _privilege_add,
+    '/artemis/api/acs/v1/privilege/group/single/deletePersons': _privilege_delete,
+    '/artemis/api/visitor/v1/auth/reapplication': _noop,
+    '/artemis/api/acs/v1/door/events': _door_events,
+}
+
+
+class MockHCPServer(ThreadingHTTPServer):
+    """
+    Многопоточный HTTP-сервер, имитирующий HikCentral Professional.
+
+    Example:
+        >>> server = MockHCPServer(('127.0.0.1', 0), MockHCPConfig())
+        >>> server.start()
+        >>> server.base_url
+        'http://127.0.0.1:54321'
+        >>> server.stop()
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, config: MockHCPConfig = None):
+        super().__init__(address, MockHCPRequestHandler)
+        self.config = config or MockHCPConfig()
+        self.state = MockHCPState()
+        self.routes = dict(DEFAULT_ROUTES)
+        self.signer = ArtemisSigner(
+            self.config.integration_key,
+            self.config.integration_secret,
+            stage=self.config.stage,
+        )
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        """Запускает сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-hcp', daemon=True)
+        self._thread.start()
+        logger.info("MockHCP listening on %s", self.base_url)
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def start_event_generator(self, events_per_minute: int, stop_event: threading.Event) -> threading.Thread:
+        """Периодически генерирует события проходов до установки stop_event."""
+        interval = 60.0 / events_per_minute if events_per_minute > 0 else 0
+
+        def _run():
+            while interval and not stop_event.wait(interval):
+                self.state.generate_events(1)
+
+        thread = threading.Thread(target=_run, name='mock-hcp-events', daemon=True)
+        thread.start()
+        return thread
+
+
+def make_server_model(mock: MockHCPServer, name: str = 'Mock HCP', **overrides):
+    """
+    Несохранённый HikCentralServer, указывающий на mock.
+
+    Лимит запросов по умолчанию снят, чтобы замер не упирался
+    в HIKCENTRAL_RATE_LIMIT_*.
+    """
+    from .models import HikCentralServer
+
+    fields = {
+        'name': name,
+        'base_url': mock.base_url,
+        'integration_key': mock.config.integration_key,
+        'integration_secret': mock.config.integration_secret,
+        'username': 'mock',
+        'password': 'mock',
+        'enabled': True,
+        'rate_limit_calls': 1_000_000,
+        'rate_limit_window': 1,
+    }
+    fields.update(overrides)
+    return HikCentralServer(**fields)
+
+
+def window_bounds(minutes: int = 5):
+    """Окно (start, end) в формате, который использует monitor_guest_passages_task."""
+    now = datetime.now(dt_timezone.utc)
+    return (now - timedelta(minutes=minutes)).isoformat(), now.isoformat()
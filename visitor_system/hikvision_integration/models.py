@@ -13,6 +13,22 @@ class HikCentralServer(models.Model):
     access_token = models.TextField(blank=True, null=True, verbose_name="Access Token")
     token_expires_at = models.DateTimeField(blank=True, null=True, verbose_name="Токен истекает")
     enabled = models.BooleanField(default=True, verbose_name="Включен")
+    # Маршрутизация: какие департаменты (кампусы) обслуживает сервер.
+    # Визиты департаментов без явного сервера уходят на сервер по умолчанию.
+    departments = models.ManyToManyField(
+        'departments.Department',
+        blank=True,
+        related_name='hikcentral_servers',
+        verbose_name="Обслуживаемые департаменты"
+    )
+    is_default = models.BooleanField(default=False, verbose_name="Сервер по умолчанию")
+    # Собственный бюджет запросов (пусто - HIKCENTRAL_RATE_LIMIT_* из settings)
+    rate_limit_calls = models.PositiveIntegerField(
+        blank=True, null=True, verbose_name="Лимит запросов в окне"
+    )
+    rate_limit_window = models.PositiveIntegerField(
+        blank=True, null=True, verbose_name="Окно лимита (сек)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -34,6 +50,14 @@ class HikDevice(models.Model):
     is_primary = models.BooleanField(default=True)
     doors_json = models.JSONField(default=list, blank=True)
     enabled = models.BooleanField(default=True)
+    server = models.ForeignKey(
+        HikCentralServer,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='devices',
+        verbose_name="Сервер HikCentral"
+    )
 
     def __str__(self) -> str:
         return f"{self.name} ({self.host}:{self.port})"
@@ -0,0 +1,184 @@
+"""
+Учёт гостей внутри здания (presence) в Redis.
+
+Множество visit_id гостей, которые прошли турникет на вход и ещё не вышли,
+поддерживается инкрементально: SADD при первом входе, SREM при выходе или
+отзыве доступа (события приходят из monitor_guest_passages_task и задач
+отзыва). Отдельные множества по департаментам нужны для дашбордов с
+ограниченной областью видимости.
+
+Количество гостей в здании - SCARD, O(1). Периодическая задача
+reconcile_guest_presence_task пересобирает множества по базе, исправляя
+пропущенные обновления (bulk update, сброс Redis и т.п.).
+"""
+import logging
+from typing import Iterable, Optional, Set
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_KEY = 'visitor_system:presence:guests_inside'
+PRESENCE_DEPT_KEY = 'visitor_system:presence:guests_inside:dept:{}'
+PRESENCE_DEPTS_KEY = 'visitor_system:presence:departments'
+PRESENCE_RECONCILED_KEY = 'visitor_system:presence:reconciled_at'
+
+
+def _dept_key(department_id) -> str:
+    return PRESENCE_DEPT_KEY.format(department_id)
+
+
+def _get_client():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception as e:
+        logger.warning("Presence: Redis unavailable: %s", e)
+        return None
+
+
+def is_inside(visit) -> bool:
+    """Гость внутри: доступ активен, вход зафиксирован, выхода не было."""
+    return bool(
+        visit.access_granted
+        and not visit.access_revoked
+        and visit.first_entry_detected
+        and not visit.first_exit_detected
+    )
+
+
+def inside_visits_qs():
+    """QuerySet визитов гостей в здании (источник истины для сверки)."""
+    from visitors.models import Visit
+    return Visit.objects.filter(
+        access_granted=True,
+        access_revoked=False,
+        first_entry_detected__isnull=False,
+        first_exit_detected__isnull=True
+    )
+
+
+def mark_entered(visit_id: int, department_id: Optional[int] = None) -> None:
+    client = _get_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.sadd(PRESENCE_KEY, visit_id)
+        if department_id:
+            pipe.sadd(_dept_key(department_id), visit_id)
+            pipe.sadd(PRESENCE_DEPTS_KEY, department_id)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Presence: failed to add visit %s: %s", visit_id, e)
+
+
+def mark_exited(visit_id: int, department_id: Optional[int] = None) -> None:
+    client = _get_client()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.srem(PRESENCE_KEY, visit_id)
+        if department_id:
+            pipe.srem(_dept_key(department_id), visit_id)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Presence: failed to remove visit %s: %s", visit_id, e)
+
+
+def sync_visit(visit) -> None:
+    """Приводит членство визита в множестве к его текущему состоянию."""
+    if is_inside(visit):
+        mark_entered(visit.pk, visit.department_id)
+    else:
+        mark_exited(visit.pk, visit.department_id)
+
+
+def guests_inside_count(department_id: Optional[int] = None) -> int:
+    """
+    Количество гостей в здании (SCARD).
+
+    Если множество ещё не собрано или Redis недоступен - считает по базе
+    (и при доступном Redis сразу собирает множество).
+    """
+    client = _get_client()
+    if client is not None:
+        try:
+            if not client.exists(PRESENCE_RECONCILED_KEY):
+                reconcile(client=client)
+            key = _dept_key(department_id) if department_id else PRESENCE_KEY
+            return int(client.scard(key))
+        except Exception as e:
+            logger.warning("Presence: SCARD failed, falling back to DB: %s", e)
+
+    qs = inside_visits_qs()
+    if department_id:
+        qs = qs.filter(department_id=department_id)
+    return qs.count()
+
+
+def guests_inside_ids(department_id: Optional[int] = None) -> Set[int]:
+    """visit_id гостей в здании (для списка «сейчас в здании»)."""
+    client = _get_client()
+    if client is not None:
+        try:
+            if not client.exists(PRESENCE_RECONCILED_KEY):
+                reconcile(client=client)
+            key = _dept_key(department_id) if department_id else PRESENCE_KEY
+            return {int(v) for v in client.smembers(key)}
+        except Exception as e:
+            logger.warning("Presence: SMEMBERS failed, falling back to DB: %s", e)
+
+    qs = inside_visits_qs()
+    if department_id:
+        qs = qs.filter(department_id=department_id)
+    return set(qs.values_list('id', flat=True))
+
+
+def _replace_set(pipe, key: str, members: Iterable[int]) -> None:
+    members = list(members)
+    tmp_key = f'{key}:rebuild'
+    pipe.delete(tmp_key)
+    if members:
+        pipe.sadd(tmp_key, *members)
+        pipe.rename(tmp_key, key)
+    else:
+        pipe.delete(key)
+
+
+def reconcile(client=None) -> int:
+    """
+    Пересобирает множества по базе (одна выборка id + department_id).
+
+    Каждое множество заменяется атомарно через RENAME временного ключа,
+    поэтому читатели не видят промежуточного пустого состояния.
+
+    Returns:
+        Количество гостей в здании или -1, если Redis недоступен
+    """
+    client = client or _get_client()
+    if client is None:
+        return -1
+
+    by_department = {}
+    all_ids = []
+    for visit_id, department_id in inside_visits_qs().values_list('id', 'department_id'):
+        all_ids.append(visit_id)
+        by_department.setdefault(department_id, []).append(visit_id)
+
+    known_departments = {int(d) for d in client.smembers(PRESENCE_DEPTS_KEY)}
+
+    pipe = client.pipeline(transaction=True)
+    _replace_set(pipe, PRESENCE_KEY, all_ids)
+    for department_id in known_departments | set(by_department):
+        _replace_set(pipe, _dept_key(department_id), by_department.get(department_id, []))
+    _replace_set(pipe, PRESENCE_DEPTS_KEY, by_department.keys())
+    pipe.set(PRESENCE_RECONCILED_KEY, timezone.now().isoformat())
+    pipe.execute()
+
+    logger.info(
+        "Presence: reconciled %d guests inside (%d departments)",
+        len(all_ids), len(by_department)
+    )
+    return len(all_ids)
@@ -7,7 +7,7 @@ Rate Limiter для HikCentral Professional API.
 import time
 import logging
 from threading import Lock
-from typing import Optional
+from typing import Any, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -121,20 +121,34 @@ class RateLimiter:
 # Можно переопределить через settings.HIKCENTRAL_RATE_LIMIT_*
 hcp_rate_limiter: Optional[RateLimiter] = None
 
+# Отдельные лимитеры для каждого HikCentralServer (ключ - server.pk),
+# чтобы нагрузка на один HCP не расходовала бюджет другого
+_server_rate_limiters: Dict[Any, RateLimiter] = {}
+_registry_lock = Lock()
 
-def get_rate_limiter(calls_per_window: int = 10, window_seconds: int = 60) -> RateLimiter:
+
+def get_rate_limiter(
+    calls_per_window: int = 10,
+    window_seconds: int = 60,
+    server=None,
+) -> RateLimiter:
     """
-    Получает глобальный rate limiter (singleton).
+    Получает rate limiter (singleton на процесс или на сервер).
     
     Args:
         calls_per_window: Лимит вызовов (используется только при первом создании)
         window_seconds: Размер окна в секундах (используется только при первом создании)
+        server: HikCentralServer - если передан, возвращается лимитер этого
+                сервера (его rate_limit_calls/rate_limit_window или settings)
         
     Returns:
-        Глобальный RateLimiter instance
+        RateLimiter instance
     """
     global hcp_rate_limiter
     
+    if server is not None:
+        return _get_server_rate_limiter(server, calls_per_window, window_seconds)
+    
     if hcp_rate_limiter is None:
         # Пытаемся получить из settings
         try:
@@ -151,3 +165,28 @@ def get_rate_limiter(calls_per_window: int = 10, window_seconds: int = 60) -> Ra
     
     return hcp_rate_limiter
 
+
+def _get_server_rate_limiter(server, calls_per_window: int, window_seconds: int) -> RateLimiter:
+    try:
+        from django.conf import settings
+        calls = getattr(settings, 'HIKCENTRAL_RATE_LIMIT_CALLS', calls_per_window)
+        window = getattr(settings, 'HIKCENTRAL_RATE_LIMIT_WINDOW', window_seconds)
+    except Exception:
+        calls, window = calls_per_window, window_seconds
+    calls = getattr(server, 'rate_limit_calls', None) or calls
+    window = getattr(server, 'rate_limit_window', None) or window
+
+    limiter = _server_rate_limiters.get(server.pk)
+    if limiter is None or limiter.calls != calls or limiter.window != window:
+        with _registry_lock:
+            limiter = _server_rate_limiters.get(server.pk)
+            if limiter is None or limiter.calls != calls or limiter.window != window:
+                limiter = RateLimiter(calls_per_window=calls, window_seconds=window)
+                _server_rate_limiters[server.pk] = limiter
+    return limiter
+
+
+def get_all_rate_limiters() -> Dict[Any, RateLimiter]:
+    """Возвращает копию реестра лимитеров по серверам (для дашбордов)."""
+    with _registry_lock:
+        return dict(_server_rate_limiters)
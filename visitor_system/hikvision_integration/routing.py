@@ -0,0 +1,135 @@
+"""
+Маршрутизация визитов между несколькими серверами HikCentral Professional.
+
+Каждый HikCentralServer обслуживает свой набор департаментов (кампусов).
+Визит закрепляется за сервером при создании персоны (Visit.hikcentral_server)
+и дальше все операции (назначение/отзыв доступа, мониторинг проходов)
+выполняются на том же сервере и его устройствах (HikDevice.server).
+Департаменты, не привязанные ни к одному серверу, обслуживаются сервером
+по умолчанию.
+"""
+import logging
+from typing import List, Optional
+
+from django.db.models import F, Q
+
+from .models import HikCentralServer, HikDevice
+
+logger = logging.getLogger(__name__)
+
+
+def get_enabled_servers() -> List[HikCentralServer]:
+    """Все включённые серверы, сервер по умолчанию - первым."""
+    return list(
+        HikCentralServer.objects.filter(enabled=True).order_by('-is_default', 'id')
+    )
+
+
+def get_default_server() -> Optional[HikCentralServer]:
+    """
+    Сервер по умолчанию.
+
+    Если ни один сервер не помечен is_default, берётся первый включённый -
+    так конфигурация с одним сервером работает без изменений.
+    """
+    return HikCentralServer.objects.filter(enabled=True).order_by('-is_default', 'id').first()
+
+
+def get_server_for_department(department_id: Optional[int]) -> Optional[HikCentralServer]:
+    """Сервер, обслуживающий департамент, либо сервер по умолчанию."""
+    if department_id:
+        server = HikCentralServer.objects.filter(
+            enabled=True, departments__id=department_id
+        ).order_by('id').first()
+        if server:
+            return server
+    return get_default_server()
+
+
+def get_server_for_visit(visit) -> Optional[HikCentralServer]:
+    """
+    Сервер, на котором живёт персона визита.
+
+    Args:
+        visit: Visit instance или id визита
+
+    Returns:
+        Закреплённый за визитом сервер (если он включён), иначе сервер
+        департамента визита, иначе сервер по умолчанию
+    """
+    if visit is None:
+        return get_default_server()
+    if not hasattr(visit, 'department_id'):
+        from visitors.models import Visit
+        visit = Visit.objects.filter(id=visit).only(
+            'id', 'department_id', 'hikcentral_server_id'
+        ).first()
+        if visit is None:
+            return get_default_server()
+
+    if visit.hikcentral_server_id:
+        server = HikCentralServer.objects.filter(
+            id=visit.hikcentral_server_id, enabled=True
+        ).first()
+        if server:
+            return server
+        logger.warning(
+            "Visit %s: pinned HikCentral server %s is disabled, rerouting by department",
+            visit.id, visit.hikcentral_server_id
+        )
+    return get_server_for_department(visit.department_id)
+
+
+def _latest_visit(**filters):
+    from visitors.models import Visit
+    return Visit.objects.filter(**filters).only(
+        'id', 'department_id', 'hikcentral_server_id'
+    ).order_by('-id').first()
+
+
+def get_server_for_guest(guest_id: Optional[int]) -> Optional[HikCentralServer]:
+    """Сервер последнего визита гостя (для диагностики по guest_id)."""
+    return get_server_for_visit(_latest_visit(guest_id=guest_id) if guest_id else None)
+
+
+def get_server_for_person(person_id: Optional[str]) -> Optional[HikCentralServer]:
+    """Сервер визита с данным personId HikCentral."""
+    return get_server_for_visit(_latest_visit(hikcentral_person_id=person_id) if person_id else None)
+
+
+def visits_for_server_q(server: HikCentralServer) -> Q:
+    """
+    Q-фильтр визитов, которые мониторит данный сервер.
+
+    Визиты с закреплённым сервером - по FK; визиты без него (созданные до
+    появления маршрутизации) - по департаменту, а для сервера по умолчанию
+    ещё и все визиты департаментов без своего сервера.
+    """
+    q = Q(hikcentral_server=server)
+    unpinned = Q(hikcentral_server__isnull=True)
+    q |= unpinned & Q(department__hikcentral_servers=server)
+
+    default = get_default_server()
+    if default is not None and default.pk == server.pk:
+        routed_departments = HikCentralServer.objects.filter(
+            enabled=True
+        ).exclude(departments=None).values_list('departments', flat=True)
+        q |= unpinned & ~Q(department_id__in=routed_departments)
+    return q
+
+
+def devices_for_server(server: Optional[HikCentralServer]):
+    """
+    Включённые устройства сервера и устройства без сервера (конфигурация
+    до маршрутизации подходит любому серверу); устройства, привязанные к
+    серверу, - первыми.
+    """
+    q = Q(server__isnull=True)
+    if server is not None:
+        q |= Q(server=server)
+    return HikDevice.objects.filter(q, enabled=True).order_by(F('server').asc(nulls_last=True), 'id')
+
+
+def get_device_for_server(server: Optional[HikCentralServer]) -> Optional[HikDevice]:
+    """Основное устройство сервера (устройство другого сервера не подставляется)."""
+    return devices_for_server(server).filter(is_primary=True).first()
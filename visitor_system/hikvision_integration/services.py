@@ -1,12 +1,18 @@
 ﻿import base64
 import logging
+import time
+from threading import Lock
 from typing import Any, Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from django.conf import settings
+from urllib.parse import urlencode
 from .models import HikDevice, HikCentralServer
+from .rate_limiter import get_rate_limiter
+from .signing import get_signer
 import urllib3
 
 # Отключаем предупреждения SSL для самоподписанных сертификатов
@@ -35,37 +41,77 @@ def escape_xml(text: str) -> str:
     return saxutils.escape(str(text))
 
 
+# Пулы HTTP-соединений по серверам: ключ - (server.pk, base_url).
+# Сессия создаётся один раз на процесс и переиспользуется всеми задачами.
+_http_sessions: Dict[tuple, requests.Session] = {}
+_http_sessions_lock = Lock()
+
+
+def _create_http_session(server: HikCentralServer) -> requests.Session:
+    session = requests.Session()
+    ca_bundle = getattr(settings, 'HIKCENTRAL_CA_BUNDLE', '').strip()
+    verify_tls = getattr(settings, 'HIKCENTRAL_VERIFY_TLS', not settings.DEBUG)
+    if ca_bundle:
+        session.verify = ca_bundle
+    else:
+        session.verify = verify_tls
+    if not session.verify:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        logger.warning(
+            'HikCentralSession for %s started with TLS verification disabled',
+            server.name
+        )
+
+    # Настройка connection pool для оптимальной производительности
+    pool_size = getattr(settings, 'HIKCENTRAL_POOL_MAXSIZE', 50)
+    adapter = HTTPAdapter(
+        pool_connections=getattr(settings, 'HIKCENTRAL_POOL_CONNECTIONS', 50),
+        pool_maxsize=pool_size,  # Максимальный размер каждого pool
+        max_retries=3,           # Автоматические retry для сетевых ошибок
+        pool_block=False         # Не блокировать при исчерпании pool
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_http_session(server: HikCentralServer) -> requests.Session:
+    """Возвращает пул соединений (requests.Session) для конкретного сервера."""
+    key = (server.pk, server.base_url)
+    session = _http_sessions.get(key)
+    if session is None:
+        with _http_sessions_lock:
+            session = _http_sessions.get(key)
+            if session is None:
+                # base_url сервера изменился - старый пул больше не нужен
+                for stale_key in [k for k in _http_sessions if k[0] == server.pk]:
+                    _http_sessions.pop(stale_key).close()
+                session = _create_http_session(server)
+                _http_sessions[key] = session
+    return session
+
+
+def close_http_sessions() -> None:
+    """Закрывает все пулы соединений (например, при остановке воркера)."""
+    with _http_sessions_lock:
+        for session in _http_sessions.values():
+            session.close()
+        _http_sessions.clear()
+
+
 class HikCentralSession:
     """Сессия для работы с HikCentral Professional OpenAPI (AK/SK подпись Artemis)."""
 
     def __init__(self, server: HikCentralServer):
         self.server = server
         self.base_url = server.base_url.rstrip('/')
-        self.session = requests.Session()
-        ca_bundle = getattr(settings, 'HIKCENTRAL_CA_BUNDLE', '').strip()
-        verify_tls = getattr(settings, 'HIKCENTRAL_VERIFY_TLS', not settings.DEBUG)
-        if ca_bundle:
-            self.session.verify = ca_bundle
-        else:
-            self.session.verify = verify_tls
-        if not self.session.verify:
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-            logger.warning(
-                'HikCentralSession for %s started with TLS verification disabled',
-                server.name
-            )
-        
-        # Настройка connection pool для оптимальной производительности
-        from requests.adapters import HTTPAdapter
-        adapter = HTTPAdapter(
-            pool_connections=50,  # Количество connection pools
-            pool_maxsize=50,      # Максимальный размер каждого pool
-            max_retries=3,        # Автоматические retry для сетевых ошибок
-            pool_block=False      # Не блокировать при исчерпании pool
-        )
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter)
-        
+        # Пул соединений и бюджет запросов - отдельные для каждого сервера
+        self.session = get_http_session(server)
+        self.rate_limiter = get_rate_limiter(server=server)
+
+        # Подписчик Artemis кэшируется на уровне сервера
+        self.signer = get_signer(server)
+
         logger.info(f"HikCentralSession initialized for {server.name}")
     
     def __enter__(self):
@@ -73,137 +119,27 @@ class HikCentralSession:
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit - автоматически закрывает сессию для предотвращения memory leak."""
-        if self.session:
-            self.session.close()
-            logger.debug(f"HikCentralSession closed for {self.server.name}")
-        return False  # Не подавляем exceptions
+        """Context manager exit.
 
-    @staticmethod
-    def _calc_content_md5(body_bytes: bytes | None) -> str:
-        import hashlib, base64 as b64
-        if not body_bytes:
-            return ''
-        md5 = hashlib.md5(body_bytes).digest()
-        return b64.b64encode(md5).decode('utf-8')
-
-    @staticmethod
-    def _canonical_headers(headers_for_sign: Dict[str, str]) -> tuple[str, str]:
-        # Имёна заголовков строчными, сортировка по имени, формат "name:value\n"
-        items = []
-        for k, v in headers_for_sign.items():
-            items.append((k.lower().strip(), ('' if v is None else str(v)).strip()))
-        items.sort(key=lambda x: x[0])
-        signed_names = ','.join([k for k, _ in items])
-        lines = ''.join([f"{k}:{v}\n" for k, v in items])
-        return signed_names, lines
-
-    def _build_string_to_sign(
-        self,
-        method: str,
-        accept: str | None,
-        content_md5: str | None,
-        content_type: str | None,
-        date_hdr: str | None,
-        headers_block: str,
-        uri_with_query: str,
-    ) -> str:
-        # Согласно спецификации: METHOD\nAccept\nContent-MD5\nContent-Type\nDate\nHeadersUri
-        # Если какого-либо из Accept/Content-MD5/Content-Type/Date нет в заголовках, строка для него НЕ добавляется.
-        parts: list[str] = [method.upper()]
-        if accept:
-            parts.append(accept)
-        if content_md5:
-            parts.append(content_md5)
-        if content_type:
-            parts.append(content_type)
-        if date_hdr:
-            parts.append(date_hdr)
-        string_to_sign = '\n'.join(parts) + '\n'
-        string_to_sign += headers_block
-        string_to_sign += uri_with_query
-        return string_to_sign
-
-    def _sign(self, string_to_sign: str) -> str:
-        import hmac, hashlib, base64 as b64
-        secret = (self.server.integration_secret or '').encode('utf-8')
-        msg = string_to_sign.encode('utf-8')
-        digest = hmac.new(secret, msg, hashlib.sha256).digest()
-        return b64.b64encode(digest).decode('utf-8')
+        HTTP-сессия принадлежит пулу сервера и переиспользуется следующими
+        задачами, поэтому здесь она не закрывается (см. close_http_sessions).
+        """
+        return False  # Не подавляем exceptions
 
     def _make_request(self, method: str, endpoint: str, data: Dict = None, params: Dict = None) -> requests.Response:
         """Выполняет запрос к HikCentral OpenAPI с подписью AK/SK."""
         # Rate limiting для предотвращения перегрузки HCP сервера
-        from .rate_limiter import get_rate_limiter
-        rate_limiter = get_rate_limiter()
-        rate_limiter.acquire()
-        
+        self.rate_limiter.acquire()
+
         # Собираем URL и URI+query
-        from urllib.parse import urlencode
         url = f"{self.base_url}{endpoint}"
         query_str = urlencode(params or {}, doseq=True)
         uri_with_query = endpoint + (f"?{query_str}" if query_str else '')
 
-        # Тело и заголовки для подписи
-        body_bytes = None
-        # Всегда задаём Accept явно
-        accept = 'application/json'
-        # Для GET без тела Content-Type и Content-MD5 не используются
-        content_type: str | None = None
-        content_md5: str | None = None
-        if data is not None:
-            import json as _json
-            body_bytes = _json.dumps(data, separators=(',', ':')).encode('utf-8')
-            content_md5 = self._calc_content_md5(body_bytes)
-            content_type = 'application/json;charset=UTF-8'
-
-        import time, uuid, email.utils
-        # Управляем включением Date через настройки
-        date_hdr = email.utils.formatdate(usegmt=True) if getattr(settings, 'HIKCENTRAL_INCLUDE_DATE', False) else None
-        x_ca_timestamp = str(int(time.time() * 1000))
-        x_ca_nonce = str(uuid.uuid4())
-
-        # Заголовки, участвующие в подписи
-        headers_for_sign = {
-            'x-ca-key': self.server.integration_key,
-            'x-ca-timestamp': x_ca_timestamp,
-            'x-ca-nonce': x_ca_nonce,
-        }
-        stage = getattr(settings, 'HIKCENTRAL_STAGE', '')
-        if stage:
-            headers_for_sign['x-ca-stage'] = stage
-        signed_names, headers_block = self._canonical_headers(headers_for_sign)
-
-        # Итоговая строка для подписи
-        string_to_sign = self._build_string_to_sign(
-            method=method,
-            accept=accept,
-            content_md5=content_md5,
-            content_type=content_type,
-            date_hdr=date_hdr,
-            headers_block=headers_block,
-            uri_with_query=uri_with_query,
+        # Тело, Content-MD5 и заголовки подписи - через предвычисленный signer
+        body_bytes, headers, string_to_sign = self.signer.sign(
+            method, uri_with_query, data
         )
-        signature = self._sign(string_to_sign)
-
-        # Финальные заголовки запроса
-        headers = {
-            'Accept': accept,
-            'X-Ca-Key': self.server.integration_key,
-            'X-Ca-Timestamp': x_ca_timestamp,
-            'X-Ca-Nonce': x_ca_nonce,
-            'X-Ca-Signature-Headers': signed_names,
-            'X-Ca-Signature': signature,
-            'X-Requested-With': 'XMLHttpRequest',
-        }
-        if content_type:
-            headers['Content-Type'] = content_type
-        if date_hdr:
-            headers['Date'] = date_hdr
-        if stage:
-            headers['X-Ca-Stage'] = stage
-        if content_md5:
-            headers['Content-MD5'] = content_md5
 
         max_retries_429 = 3
         for retry_attempt in range(max_retries_429):
@@ -234,7 +170,6 @@ class HikCentralSession:
                             "HCP rate limit exceeded (429), retry after %d seconds (attempt %d/%d)",
                             retry_after, retry_attempt + 1, max_retries_429
                         )
-                        import time
                         time.sleep(retry_after)
                         continue  # Retry
                     else:
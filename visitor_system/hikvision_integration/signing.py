@@ -0,0 +1,222 @@
+"""
+Подпись запросов HikCentral Professional OpenAPI (Artemis AK/SK).
+
+Всё, что не зависит от конкретного запроса (HMAC-ключ, имена подписываемых
+заголовков, x-ca-stage, флаг Date), вычисляется один раз при создании
+ArtemisSigner. На каждый запрос остаётся только сборка stringToSign и
+HMAC от уже инициализированного состояния (hmac.copy()).
+"""
+import base64
+import email.utils
+import hashlib
+import hmac
+import json
+import logging
+import time
+import uuid
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    def _dumps(data: Any) -> bytes:
+        return orjson.dumps(data)
+
+except ImportError:
+    # orjson не установлен - используем один заранее созданный encoder,
+    # чтобы не конструировать JSONEncoder на каждый вызов json.dumps()
+    _encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def _dumps(data: Any) -> bytes:
+        return _encoder.encode(data).encode('utf-8')
+
+
+ACCEPT = 'application/json'
+CONTENT_TYPE_JSON = 'application/json;charset=UTF-8'
+
+
+class ArtemisSigner:
+    """
+    Предвычисленный подписчик Artemis для одного HikCentralServer.
+
+    Args:
+        integration_key: Integration Partner Key (x-ca-key)
+        integration_secret: Integration Partner Secret (ключ HMAC-SHA256)
+        stage: Значение x-ca-stage ('' - заголовок не отправляется)
+        include_date: Включать ли заголовок Date в подпись
+
+    Example:
+        >>> signer = ArtemisSigner('key', 'secret')
+        >>> body, headers = signer.sign('POST', '/artemis/api/x', {'a': 1})
+    """
+
+    def __init__(
+        self,
+        integration_key: str,
+        integration_secret: str,
+        stage: str = '',
+        include_date: bool = False,
+    ):
+        self.key = (integration_key or '').strip()
+        self.stage = (stage or '').strip()
+        self.include_date = include_date
+
+        # HMAC с уже обработанным ключом: на запрос делается только copy()
+        self._mac = hmac.new(
+            (integration_secret or '').encode('utf-8'),
+            digestmod=hashlib.sha256,
+        )
+
+        # Подписываемые заголовки фиксированы, порядок по имени уже известен:
+        # x-ca-key < x-ca-nonce < x-ca-stage < x-ca-timestamp
+        names = ['x-ca-key', 'x-ca-nonce']
+        self._stage_line = ''
+        if self.stage:
+            names.append('x-ca-stage')
+            self._stage_line = f'x-ca-stage:{self.stage}\n'
+        names.append('x-ca-timestamp')
+        self.signed_names = ','.join(names)
+        self._key_line = f'x-ca-key:{self.key}\n'
+
+        # Статическая часть итоговых заголовков
+        self._static_headers = {
+            'Accept': ACCEPT,
+            'X-Ca-Key': self.key,
+            'X-Ca-Signature-Headers': self.signed_names,
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+        if self.stage:
+            self._static_headers['X-Ca-Stage'] = self.stage
+
+    @staticmethod
+    def dumps(data: Any) -> bytes:
+        """Компактная сериализация тела запроса в JSON (bytes)."""
+        return _dumps(data)
+
+    @staticmethod
+    def content_md5(body_bytes: Optional[bytes]) -> str:
+        if not body_bytes:
+            return ''
+        return base64.b64encode(hashlib.md5(body_bytes).digest()).decode('ascii')
+
+    def string_to_sign(
+        self,
+        method: str,
+        uri_with_query: str,
+        timestamp: str,
+        nonce: str,
+        content_md5: str = '',
+        content_type: str = '',
+        date_hdr: str = '',
+    ) -> str:
+        # METHOD\nAccept\nContent-MD5\nContent-Type\nDate\nHeaders+Uri
+        # Отсутствующие Content-MD5/Content-Type/Date в строку не попадают
+        parts = [method, ACCEPT]
+        if content_md5:
+            parts.append(content_md5)
+        if content_type:
+            parts.append(content_type)
+        if date_hdr:
+            parts.append(date_hdr)
+        parts.append(
+            f'{self._key_line}x-ca-nonce:{nonce}\n{self._stage_line}'
+            f'x-ca-timestamp:{timestamp}\n{uri_with_query}'
+        )
+        return '\n'.join(parts)
+
+    def signature(self, string_to_sign: str) -> str:
+        mac = self._mac.copy()
+        mac.update(string_to_sign.encode('utf-8'))
+        return base64.b64encode(mac.digest()).decode('ascii')
+
+    def sign(
+        self,
+        method: str,
+        uri_with_query: str,
+        data: Optional[Dict] = None,
+    ) -> Tuple[Optional[bytes], Dict[str, str], str]:
+        """
+        Сериализует тело и формирует подписанные заголовки запроса.
+
+        Returns:
+            (body_bytes или None, headers, string_to_sign)
+        """
+        method = method.upper()
+        body_bytes = None
+        content_md5 = ''
+        content_type = ''
+        if data is not None:
+            body_bytes = _dumps(data)
+            content_md5 = self.content_md5(body_bytes)
+            content_type = CONTENT_TYPE_JSON
+
+        date_hdr = email.utils.formatdate(usegmt=True) if self.include_date else ''
+        timestamp = str(int(time.time() * 1000))
+        nonce = str(uuid.uuid4())
+
+        string_to_sign = self.string_to_sign(
+            method, uri_with_query, timestamp, nonce,
+            content_md5=content_md5,
+            content_type=content_type,
+            date_hdr=date_hdr,
+        )
+
+        headers = dict(self._static_headers)
+        headers['X-Ca-Timestamp'] = timestamp
+        headers['X-Ca-Nonce'] = nonce
+        headers['X-Ca-Signature'] = self.signature(string_to_sign)
+        if content_type:
+            headers['Content-Type'] = content_type
+            headers['Content-MD5'] = content_md5
+        if date_hdr:
+            headers['Date'] = date_hdr
+        return body_bytes, headers, string_to_sign
+
+
+# Кэш подписчиков: один ArtemisSigner на сервер и набор учётных данных.
+# При смене ключа/секрета/stage создаётся новый экземпляр.
+_signers: Dict[tuple, ArtemisSigner] = {}
+_signers_lock = Lock()
+
+
+def get_signer(server) -> ArtemisSigner:
+    """
+    Возвращает ArtemisSigner для HikCentralServer (создаётся один раз).
+
+    Args:
+        server: HikCentralServer instance
+
+    Returns:
+        Закэшированный ArtemisSigner
+    """
+    from django.conf import settings
+
+    stage = getattr(settings, 'HIKCENTRAL_STAGE', '') or ''
+    include_date = bool(getattr(settings, 'HIKCENTRAL_INCLUDE_DATE', False))
+    cache_key = (
+        getattr(server, 'pk', None),
+        server.integration_key,
+        server.integration_secret,
+        stage,
+        include_date,
+    )
+    signer = _signers.get(cache_key)
+    if signer is None:
+        with _signers_lock:
+            signer = _signers.get(cache_key)
+            if signer is None:
+                # Старые подписчики этого сервера больше не нужны
+                for key in [k for k in _signers if k[0] == cache_key[0]]:
+                    del _signers[key]
+                signer = ArtemisSigner(
+                    server.integration_key,
+                    server.integration_secret,
+                    stage=stage,
+                    include_date=include_date,
+                )
+                _signers[cache_key] = signer
+                logger.debug("ArtemisSigner created for server %s", cache_key[0])
+    return signer
@@ -3,6 +3,15 @@ import logging
 from django.utils import timezone
 from django.conf import settings
 from .models import HikAccessTask, HikDevice, HikPersonBinding, HikCentralServer
+from .routing import (
+    get_default_server,
+    devices_for_server,
+    get_device_for_server,
+    get_enabled_servers,
+    get_server_for_visit,
+    visits_for_server_q,
+)
+from . import presence
 from .services import (
     HikSession,
     ensure_person,
@@ -22,16 +31,22 @@ def _get_device_session(device: HikDevice) -> HikSession:
     return HikSession(device)
 
 
-def _get_hikcentral_server():
-    """Получает активный HikCentral сервер для создания сессии.
+def _get_hikcentral_server(visit=None):
+    """Получает HikCentral сервер для создания сессии.
     
     Возвращает server object вместо сессии, чтобы сессию можно было
     создать в контексте 'with' statement для автоматического закрытия.
     
+    Args:
+        visit: Visit instance или visit_id - если передан, сервер выбирается
+               по маршрутизации визита (закреплённый сервер / департамент)
+    
     Returns:
         HikCentralServer instance или None
     """
-    return HikCentralServer.objects.filter(enabled=True).first()
+    if visit:
+        return get_server_for_visit(visit)
+    return get_default_server()
 
 
 @shared_task(queue='hikvision')
@@ -44,9 +59,11 @@ def enroll_face_task(task_id: int) -> None:
     task.attempts += 1
     task.save(update_fields=['status', 'attempts'])
     try:
-        device = task.device or HikDevice.objects.filter(
-            enabled=True, is_primary=True
-        ).first()
+        hc_server = _get_hikcentral_server(task.visit_id)
+        logger.info(
+            "Hik enroll: hc_server=%s", getattr(hc_server, 'name', None)
+        )
+        device = task.device or get_device_for_server(hc_server)
         if not device:
             raise RuntimeError('No active HikDevice configured')
         logger.info(
@@ -54,8 +71,6 @@ def enroll_face_task(task_id: int) -> None:
             getattr(device, 'id', None),
             getattr(device, 'name', None),
         )
-        hc_server = _get_hikcentral_server()
-        logger.info("Hik enroll: hc_server=%s", bool(hc_server))
         session = _get_device_session(device)
         payload = task.payload or {}
         employee_no = str(
@@ -208,8 +223,8 @@ def enroll_face_task(task_id: int) -> None:
                 try:
                     from .services import upload_face_isapi
                     
-                    # Загружаем фото на ВСЕ активные устройства
-                    all_devices = HikDevice.objects.filter(enabled=True)
+                    # Загружаем фото на все активные устройства сервера персоны
+                    all_devices = devices_for_server(hc_server)
                     success_count = 0
                     
                     for dev in all_devices:
@@ -283,8 +298,10 @@ def enroll_face_task(task_id: int) -> None:
         if task.visit_id:
             try:
                 from visitors.models import Visit
+                # Закрепляем визит за сервером, на котором создана персона
                 Visit.objects.filter(id=task.visit_id).update(
-                    hikcentral_person_id=str(person_id)
+                    hikcentral_person_id=str(person_id),
+                    hikcentral_server=hc_server,
                 )
                 logger.info(
                     "Hik enroll: Visit %s updated with person_id=%s",
@@ -313,12 +330,10 @@ def revoke_access_task(task_id: int) -> None:
     task.attempts += 1
     task.save(update_fields=['status', 'attempts'])
     try:
-        device = task.device or HikDevice.objects.filter(
-            enabled=True, is_primary=True
-        ).first()
+        hc_server = _get_hikcentral_server(task.visit_id)
+        device = task.device or get_device_for_server(hc_server)
         if not device:
             raise RuntimeError('No active HikDevice configured')
-        hc_server = _get_hikcentral_server()
         session = _get_device_session(device)
         payload = task.payload or {}
         person_id = payload.get('person_id') or ''
@@ -378,7 +393,7 @@ def assign_access_level_task(self, task_id: int) -> None:
     task.save(update_fields=['status', 'attempts'])
     
     try:
-        hc_server = _get_hikcentral_server()
+        hc_server = _get_hikcentral_server(task.visit_id)
         if not hc_server:
             raise RuntimeError('No HikCentral server available')
         
@@ -618,8 +633,8 @@ def revoke_access_level_task(self, visit_id: int) -> None:
             )
             return
         
-        # Получаем HikCentral server
-        hc_server = _get_hikcentral_server()
+        # Получаем HikCentral server, за которым закреплён визит
+        hc_server = _get_hikcentral_server(visit)
         if not hc_server:
             raise RuntimeError('No HikCentral server available')
         
@@ -650,6 +665,7 @@ def revoke_access_level_task(self, visit_id: int) -> None:
         # Помечаем visit.access_revoked=True
         visit.access_revoked = True
         visit.save(update_fields=['access_revoked'])
+        presence.mark_exited(visit.id, visit.department_id)
         
         # FIX #13: Метрики Prometheus
         try:
@@ -692,7 +708,7 @@ def revoke_access_level_task(self, visit_id: int) -> None:
 
 
 @shared_task
-def monitor_guest_passages_task() -> None:
+def monitor_guest_passages_task(server_id: int = None) -> None:
     """
     Периодическая задача для мониторинга проходов гостей через турникеты.
     
@@ -709,23 +725,51 @@ def monitor_guest_passages_task() -> None:
        - Отзывает доступ через revoke_access_level_from_person()
        - Помечает access_revoked=True
     
+    Несколько серверов HikCentral: вызов без server_id (из Celery Beat)
+    ставит по отдельной задаче на каждый включённый сервер, и они
+    выполняются параллельно со своими лимитами и пулами соединений.
+    
     Запускается каждые 5 минут через Celery Beat.
+    
+    Args:
+        server_id: ID HikCentralServer, визиты которого мониторить
     """
     from django.conf import settings
     from datetime import timedelta
     from .services import get_door_events, revoke_access_level_from_person
     
-    logger.info("HikCentral: monitor_guest_passages_task started")
+    if server_id is None:
+        servers = get_enabled_servers()
+        if not servers:
+            logger.error("HikCentral: No server available for monitoring")
+            return
+        if len(servers) > 1:
+            for server in servers:
+                monitor_guest_passages_task.delay(server_id=server.id)
+            logger.info(
+                "HikCentral: monitor_guest_passages_task fanned out to %d servers",
+                len(servers)
+            )
+            return
+        hc_server = servers[0]
+    else:
+        hc_server = HikCentralServer.objects.filter(id=server_id, enabled=True).first()
+        if not hc_server:
+            logger.error("HikCentral: Server %s is not available for monitoring", server_id)
+            return
+    
+    logger.info("HikCentral: monitor_guest_passages_task started (server=%s)", hc_server.name)
     
     try:
         from visitors.models import Visit
         
-        # Получаем активные визиты с предоставленным доступом
+        # Получаем активные визиты с предоставленным доступом на этом сервере
         active_visits = Visit.objects.filter(
+            visits_for_server_q(hc_server),
             access_granted=True,
             access_revoked=False,
             status__in=['EXPECTED', 'CHECKED_IN']  # Только активные визиты
-        ).select_related('guest')
+        ).select_related('guest').distinct()
         
         if not active_visits.exists():
             logger.info("HikCentral: No active visits to monitor")
@@ -733,11 +777,6 @@ def monitor_guest_passages_task() -> None:
         
         logger.info("HikCentral: Monitoring %d active visits", active_visits.count())
         
-        hc_server = _get_hikcentral_server()
-        if not hc_server:
-            logger.error("HikCentral: No server available for monitoring")
-            return
-        
         # Временной диапазон: последние 5 минут (для оперативного авто check-in/out)
         now = timezone.now()
         start_time = now - timedelta(minutes=5)
@@ -955,43 +994,14 @@ def monitor_guest_passages_task() -> None:
                                 visit.id
                             )
                             
-                            # Создаем SecurityIncident
-                            try:
-                                from visitors.models import SecurityIncident
-                                incident, created = SecurityIncident.objects.get_or_create(
-                                    visit=visit,
-                                    incident_type=SecurityIncident.INCIDENT_EXIT_WITHOUT_ENTRY,
-                                    defaults={
-                                        'description': f'Обнаружен выход через турникет без предварительного входа. '
-                                                      f'Exit time: {first_exit_time.strftime("%Y-%m-%d %H:%M:%S")}. '
-                                                      f'Возможная аномалия или выход через другой путь.',
-                                        'severity': SecurityIncident.SEVERITY_HIGH,
-                                        'metadata': {
-                                            'exit_time': first_exit_time.isoformat(),
-                                            'exit_count': new_exits,
-                                            'current_status': visit.status
-                                        }
-                                    }
-                                )
-                                if created:
-                                    logger.warning(
-                                        "Visit %s: SecurityIncident created (EXIT_WITHOUT_ENTRY)",
-                                        visit.id
-                                    )
-                                    # Планируем отправку alert
-                                    from .utils import send_security_alert_async
-                                    send_security_alert_async(incident.id)
-                            except Exception as incident_exc:
-                                logger.error(
-                                    "Visit %s: Failed to create SecurityIncident: %s",
-                                    visit.id, incident_exc
-                                )
+                            # SecurityIncident создаст ExitWithoutEntryRule
                     
                     visit.save(update_fields=[
                         'entry_count', 'exit_count',
                         'first_entry_detected', 'first_exit_detected',
                         'status', 'entry_time', 'exit_time'
                     ])
+                    presence.sync_visit(visit)
                     
                     logger.info(
                         "Visit %s: Updated counts - entries=%d, exits=%d",
@@ -1037,94 +1047,8 @@ def monitor_guest_passages_task() -> None:
                                 visit.id, notif_exc
                             )
                 
-                # АНОМАЛИЯ: Долгое пребывание (LONG_STAY)
-                if visit.status == 'CHECKED_IN' and visit.entry_time:
-                    # Проверяем сколько времени гость в здании
-                    time_inside = now - visit.entry_time
-                    max_stay_hours = getattr(settings, 'MAX_GUEST_STAY_HOURS', 8)
-                    
-                    if time_inside.total_seconds() > max_stay_hours * 3600:
-                        # Гость в здании слишком долго
-                        logger.warning(
-                            "Visit %s: ⚠️ LONG_STAY detected. Guest inside for %.1f hours",
-                            visit.id, time_inside.total_seconds() / 3600
-                        )
-                        
-                        # Проверяем, нет ли уже такого инцидента
-                        try:
-                            from visitors.models import SecurityIncident
-                            incident, created = SecurityIncident.objects.get_or_create(
-                                visit=visit,
-                                incident_type=SecurityIncident.INCIDENT_LONG_STAY,
-                                defaults={
-                                    'description': f'Гость находится в здании более {max_stay_hours} часов. '
-                                                  f'Entry time: {visit.entry_time.strftime("%Y-%m-%d %H:%M:%S")}. '
-                                                  f'Время пребывания: {time_inside.total_seconds() / 3600:.1f} часов.',
-                                    'severity': SecurityIncident.SEVERITY_MEDIUM,
-                                    'metadata': {
-                                        'entry_time': visit.entry_time.isoformat(),
-                                        'hours_inside': time_inside.total_seconds() / 3600,
-                                        'max_allowed_hours': max_stay_hours
-                                    }
-                                }
-                            )
-                            if created:
-                                logger.warning(
-                                    "Visit %s: SecurityIncident created (LONG_STAY)",
-                                    visit.id
-                                )
-                                # Планируем отправку alert
-                                from .utils import send_security_alert_async
-                                send_security_alert_async(incident.id)
-                        except Exception as incident_exc:
-                            logger.error(
-                                "Visit %s: Failed to create LONG_STAY incident: %s",
-                                visit.id, incident_exc
-                            )
-                
-                # АНОМАЛИЯ: Доступ в нерабочее время (SUSPICIOUS_TIME)
-                if visit.status == 'CHECKED_IN' and visit.entry_time:
-                    entry_hour = visit.entry_time.hour
-                    work_start = getattr(settings, 'WORK_HOURS_START', 6)
-                    work_end = getattr(settings, 'WORK_HOURS_END', 22)
-                    
-                    if entry_hour < work_start or entry_hour >= work_end:
-                        # Вход в нерабочее время
-                        logger.warning(
-                            "Visit %s: ⚠️ SUSPICIOUS_TIME detected. Entry at %02d:00 (work hours: %02d:00-%02d:00)",
-                            visit.id, entry_hour, work_start, work_end
-                        )
-                        
-                        try:
-                            from visitors.models import SecurityIncident
-                            incident, created = SecurityIncident.objects.get_or_create(
-                                visit=visit,
-                                incident_type=SecurityIncident.INCIDENT_SUSPICIOUS_TIME,
-                                defaults={
-                                    'description': f'Доступ в нерабочее время ({entry_hour:02d}:00). '
-                                                  f'Рабочие часы: {work_start:02d}:00-{work_end:02d}:00. '
-                                                  f'Entry time: {visit.entry_time.strftime("%Y-%m-%d %H:%M:%S")}.',
-                                    'severity': SecurityIncident.SEVERITY_MEDIUM,
-                                    'metadata': {
-                                        'entry_time': visit.entry_time.isoformat(),
-                                        'entry_hour': entry_hour,
-                                        'work_hours': f'{work_start:02d}:00-{work_end:02d}:00'
-                                    }
-                                }
-                            )
-                            if created:
-                                logger.warning(
-                                    "Visit %s: SecurityIncident created (SUSPICIOUS_TIME)",
-                                    visit.id
-                                )
-                                # Планируем отправку alert
-                                from .utils import send_security_alert_async
-                                send_security_alert_async(incident.id)
-                        except Exception as incident_exc:
-                            logger.error(
-                                "Visit %s: Failed to create SUSPICIOUS_TIME incident: %s",
-                                visit.id, incident_exc
-                            )
+                # Аномалии (LONG_STAY, SUSPICIOUS_TIME, EXIT_WITHOUT_ENTRY)
+                # проверяет evaluate_anomaly_rules_task по всем визитам сразу
                 
                 # ВАРИАНТ В: Блокируем после первого выхода
                 if visit.first_exit_detected and not visit.access_revoked:
@@ -1151,6 +1075,7 @@ def monitor_guest_passages_task() -> None:
                     if success:
                         visit.access_revoked = True
                         visit.save(update_fields=['access_revoked'])
+                        presence.mark_exited(visit.id, visit.department_id)
                         logger.info(
                             "Visit %s: Access revoked successfully after first exit",
                             visit.id
@@ -1171,13 +1096,9 @@ def monitor_guest_passages_task() -> None:
         
         # FIX #13: Обновляем gauge количества гостей в здании
         try:
+            # SCARD множества presence вместо COUNT(*) по таблице визитов
             from .metrics import hikcentral_guests_inside
-            guests_count = Visit.objects.filter(
-                access_granted=True,
-                access_revoked=False,
-                first_entry_detected__isnull=False,
-                first_exit_detected__isnull=True
-            ).count()
+            guests_count = presence.guests_inside_count()
             hikcentral_guests_inside.set(guests_count)
             logger.info("HikCentral: Guests inside building: %d", guests_count)
         except Exception as metric_exc:
@@ -1239,8 +1160,8 @@ def update_person_validity_task(self, visit_id: int) -> None:
             )
             return
         
-        # Получаем HikCentral server
-        hc_server = _get_hikcentral_server()
+        # Получаем HikCentral server, за которым закреплён визит
+        hc_server = _get_hikcentral_server(visit)
         if not hc_server:
             raise RuntimeError('No HikCentral server available')
         
@@ -1372,3 +1293,41 @@ def send_security_alert_task(self, incident_id: int):
                 f"Max retries reached for send_security_alert_task, incident_id={incident_id}"
             )
 
+
+@shared_task
+def reconcile_guest_presence_task() -> None:
+    """
+    Периодическая сверка множества гостей в здании (Redis) с базой.
+
+    Инкрементальные SADD/SREM из monitor_guest_passages_task могут
+    разойтись с базой (ручная правка визита в админке, bulk update,
+    перезапуск Redis) - задача пересобирает множества и обновляет gauge.
+    """
+    guests_count = presence.reconcile()
+    if guests_count < 0:
+        logger.warning("Presence: reconciliation skipped, Redis unavailable")
+        return
+
+    try:
+        from .metrics import hikcentral_guests_inside
+        hikcentral_guests_inside.set(guests_count)
+    except Exception as metric_exc:
+        logger.warning("Failed to update guests_inside metric: %s", metric_exc)
+
+
+@shared_task
+def evaluate_anomaly_rules_task() -> None:
+    """
+    Прогон правил обнаружения аномалий по всем визитам.
+
+    Каждое правило - один SQL-запрос и один bulk_create, поэтому проверка
+    не зависит от того, были ли у визита проходы за последние минуты.
+    """
+    from .anomalies import evaluate_rules
+
+    results = evaluate_rules()
+    total = sum(results.values())
+    if total:
+        logger.warning("Anomaly rules: %d new incident(s) %s", total, results)
+    else:
+        logger.info("Anomaly rules: no new incidents")
@@ -1,45 +1,15 @@
 from django.contrib import admin
 from django.utils.html import format_html
 import json
-from .models import DashboardMetric, RealtimeEvent, DashboardWidget
+from .models import DashboardLayout, MetricPoint, RealtimeEvent
 
 
-@admin.register(DashboardMetric)
-class DashboardMetricAdmin(admin.ModelAdmin):
-    list_display = [
-        'metric_type', 'timestamp', 'is_active', 'value_preview'
-    ]
-    list_filter = ['metric_type', 'is_active', 'timestamp']
-    search_fields = ['metric_type']
-    readonly_fields = ['timestamp', 'value_formatted']
-    
-    fieldsets = (
-        ('Основная информация', {
-            'fields': ('metric_type', 'is_active', 'timestamp')
-        }),
-        ('Данные', {
-            'fields': ('value', 'value_formatted',),
-            'classes': ('collapse',)
-        }),
-    )
-    
-    def value_preview(self, obj):
-        if isinstance(obj.value, dict):
-            # Показываем краткую информацию
-            preview = {}
-            for key, value in list(obj.value.items())[:3]:
-                if isinstance(value, (int, float, str)):
-                    preview[key] = value
-            return json.dumps(preview, ensure_ascii=False)[:50] + '...'
-        return str(obj.value)[:50] + '...'
-    value_preview.short_description = 'Предварительный просмотр'
-    
-    def value_formatted(self, obj):
-        if obj.value:
-            formatted = json.dumps(obj.value, indent=2, ensure_ascii=False)
-            return format_html('<pre>{}</pre>', formatted)
-        return '-'
-    value_formatted.short_description = 'Значение (форматированное)'
+@admin.register(MetricPoint)
+class MetricPointAdmin(admin.ModelAdmin):
+    list_display = ['metric', 'labels', 'resolution', 'bucket', 'value', 'min_value', 'max_value', 'samples']
+    list_filter = ['resolution', 'metric']
+    search_fields = ['metric', 'labels']
+    date_hierarchy = 'bucket'
 
 
 @admin.register(RealtimeEvent)
@@ -88,48 +58,27 @@ class RealtimeEventAdmin(admin.ModelAdmin):
     data_formatted.short_description = 'Дополнительные данные'
 
 
-@admin.register(DashboardWidget)
-class DashboardWidgetAdmin(admin.ModelAdmin):
-    list_display = [
-        'title', 'widget_type', 'position_info', 'size_info', 
-        'is_active', 'refresh_interval', 'created_by'
-    ]
-    list_select_related = ('created_by',)  # Оптимизация запросов
-    list_filter = ['widget_type', 'is_active', 'created_at']
-    search_fields = ['name', 'title', 'description']
-    readonly_fields = ['created_at', 'updated_at', 'config_formatted']
-    
-    fieldsets = (
-        ('Основная информация', {
-            'fields': ('name', 'widget_type', 'title', 'description', 'is_active')
-        }),
-        ('Позиционирование', {
-            'fields': ('position_x', 'position_y', 'width', 'height')
-        }),
-        ('Настройки', {
-            'fields': ('refresh_interval', 'config_formatted')
-        }),
-        ('Метаданные', {
-            'fields': ('created_by', 'created_at', 'updated_at')
-        }),
-    )
-    
-    def position_info(self, obj):
-        return f"({obj.position_x}, {obj.position_y})"
-    position_info.short_description = 'Позиция (X, Y)'
-    
-    def size_info(self, obj):
-        return f"{obj.width}×{obj.height}"
-    size_info.short_description = 'Размер'
+@admin.register(DashboardLayout)
+class DashboardLayoutAdmin(admin.ModelAdmin):
+    list_display = ['user', 'base_version', 'updated_at']
+    list_select_related = ('user',)
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['updated_at', 'overrides_formatted']
     
-    def config_formatted(self, obj):
-        if obj.config:
-            formatted = json.dumps(obj.config, indent=2, ensure_ascii=False)
+    def overrides_formatted(self, obj):
+        if obj.overrides:
+            formatted = json.dumps(obj.overrides, indent=2, ensure_ascii=False)
             return format_html('<pre>{}</pre>', formatted)
         return '-'
-    config_formatted.short_description = 'Конфигурация'
-    
+    overrides_formatted.short_description = 'Переопределения (форматированные)'
+
     def save_model(self, request, obj, form, change):
-        if not change:  # Новый объект
-            obj.created_by = request.user
         super().save_model(request, obj, form, change)
+        from .widget_layout import invalidate
+        invalidate(obj.user_id)
+
+    def delete_model(self, request, obj):
+        user_id = obj.user_id
+        super().delete_model(request, obj)
+        from .widget_layout import invalidate
+        invalidate(user_id)
@@ -3,4 +3,13 @@ from django.apps import AppConfig
 class RealtimeDashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'realtime_dashboard'
-    verbose_name = 'Дашборд в реальном времени'
\ No newline at end of file
+    verbose_name = 'Дашборд в реальном времени'
+
+    def ready(self):
+        # Push счётчиков дашборда сотрудника при изменении визитов
+        import realtime_dashboard.counter_signals  # noqa: F401
+        # Почасовые/дневные агрегаты визитов для графиков (после counter_signals:
+        # используют запомненное им состояние визита)
+        import realtime_dashboard.rollup_signals  # noqa: F401
+        # События визитов в ленту дашборда (буфер event_buffer.py)
+        import realtime_dashboard.signals  # noqa: F401
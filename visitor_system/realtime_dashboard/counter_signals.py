@@ -0,0 +1,75 @@
+"""
+Сигналы рассылки счётчиков дашборда сотрудника по WebSocket.
+
+Перед сохранением визита запоминается часть состояния, влияющая на
+счётчики; после коммита, если она изменилась (создание, check-in/out,
+отмена, смена департамента), в Celery ставится задача, которая
+пересчитывает снимок департамента и рассылает его в группу.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from visitors.models import StudentVisit, Visit
+from .counters import COUNTER_FIELDS, counter_state, schedule_publish_counters
+
+logger = logging.getLogger(__name__)
+
+
+def _remember_counter_state(sender, instance, update_fields=None, **kwargs):
+    """Запоминает состояние визита до сохранения (для определения перехода)."""
+    instance._counter_state_before = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not (
+        {field.replace('_id', '') for field in COUNTER_FIELDS} & set(update_fields)
+    ):
+        # Сохраняются поля, не влияющие на счётчики (например, entry_count)
+        instance._counter_state_before = counter_state(instance)
+        return
+    previous = sender.objects.filter(pk=instance.pk).values_list(*COUNTER_FIELDS).first()
+    instance._counter_state_before = tuple(previous) if previous else None
+
+
+def _schedule_counters_push(instance, previous_department_id=None):
+    # У StudentVisit нет принимающего сотрудника: сотрудники без департамента
+    # видят все студенческие визиты и получают counters_refresh
+    employee_id = getattr(instance, 'employee_id', None)
+    student = isinstance(instance, StudentVisit)
+    department_ids = sorted({instance.department_id, previous_department_id} - {None}) or [None]
+
+    transaction.on_commit(lambda: schedule_publish_counters(department_ids, employee_id, student))
+
+
+@receiver(pre_save, sender=Visit)
+@receiver(pre_save, sender=StudentVisit)
+def remember_visit_counter_state(sender, instance, **kwargs):
+    try:
+        _remember_counter_state(sender, instance, **kwargs)
+    except Exception as e:
+        logger.error("Error reading visit counter state: %s", e)
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_save, sender=StudentVisit)
+def push_counters_on_visit_change(sender, instance, created, **kwargs):
+    """Создание, check-in/out, отмена - рассылаем счётчики департамента."""
+    try:
+        before = getattr(instance, '_counter_state_before', None)
+        if not created and before == counter_state(instance):
+            return
+        previous_department_id = before[COUNTER_FIELDS.index('department_id')] if before else None
+        _schedule_counters_push(instance, previous_department_id)
+    except Exception as e:
+        logger.error("Error scheduling counters push: %s", e)
+
+
+@receiver(post_delete, sender=Visit)
+@receiver(post_delete, sender=StudentVisit)
+def push_counters_on_visit_delete(sender, instance, **kwargs):
+    try:
+        _schedule_counters_push(instance)
+    except Exception as e:
+        logger.error("Error scheduling counters push: %s", e)
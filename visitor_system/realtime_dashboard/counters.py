@@ -0,0 +1,154 @@
+"""
+Push-обновления счётчиков дашборда сотрудника через WebSocket.
+
+Вместо опроса get_counters_api каждые 5 секунд клиент подписывается на
+DashboardConsumer и получает снимок счётчиков своего департамента при
+каждом изменении визита (создание, check-in/out, отмена).
+
+Группы каналов повторяют области видимости get_scoped_visits_qs:
+- dashboard_updates - все события (администраторы и ресепшн);
+- dashboard_dept_<id> - счётчики и события своего департамента;
+- dashboard_user_<id> - счётчики сотрудника без департамента;
+- dashboard_no_dept - все сотрудники без департамента: их счётчики включают
+  студенческие визиты всех департаментов, поэтому изменение StudentVisit
+  рассылается сюда сигналом counters_refresh, и каждое соединение
+  пересчитывает свой снимок.
+
+Пересчёт и рассылка выполняются задачей publish_counters_task после
+коммита, а не в потоке запроса.
+"""
+import logging
+from typing import List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_GROUP = 'dashboard_updates'
+NO_DEPARTMENT_GROUP = 'dashboard_no_dept'
+
+# Поля, изменение которых влияет на счётчики (status, время, департамент)
+COUNTER_FIELDS = ('status', 'entry_time', 'exit_time', 'department_id')
+
+
+def department_group(department_id: int) -> str:
+    return f'dashboard_dept_{department_id}'
+
+
+def user_group(user_id: int) -> str:
+    return f'dashboard_user_{user_id}'
+
+
+def resolve_scope(user) -> dict:
+    """
+    Область видимости пользователя для WS-подписки.
+
+    Returns:
+        {'is_global': bool, 'department_id': int|None}
+    """
+    from visitors.access import get_access_scope
+
+    access_scope = get_access_scope(user)
+    is_global = access_scope.sees_all
+    department_id = access_scope.department_id
+    return {'is_global': is_global, 'department_id': department_id}
+
+
+def groups_for_scope(user_id: int, scope: dict) -> List[str]:
+    groups = []
+    if scope['is_global']:
+        groups.append(GLOBAL_GROUP)
+    if scope['department_id']:
+        groups.append(department_group(scope['department_id']))
+    else:
+        groups.append(user_group(user_id))
+        groups.append(NO_DEPARTMENT_GROUP)
+    return groups
+
+
+def counter_state(instance) -> tuple:
+    """Часть состояния визита, от которой зависят счётчики."""
+    return tuple(getattr(instance, field, None) for field in COUNTER_FIELDS)
+
+
+def _group_send(group: str, event: dict) -> None:
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(group, event)
+
+
+def _send(group: str, message: dict) -> None:
+    _group_send(group, {'type': 'dashboard_broadcast', 'message': message})
+
+
+def _has_department(user_id: int) -> bool:
+    from visitors.models import EmployeeProfile
+    return EmployeeProfile.objects.filter(user_id=user_id, department__isnull=False).exists()
+
+
+def publish_counters(department_id: Optional[int], employee_id: Optional[int] = None) -> None:
+    """
+    Пересчитывает снимок счётчиков и рассылает его подписчикам.
+
+    Снимок сбрасывается и строится заново (два агрегирующих запроса),
+    поэтому get_counters_api и WS отдают одно и то же значение.
+    """
+    from visitors.counters import get_counter_snapshot, invalidate_counters
+
+    targets = []
+    if department_id:
+        targets.append((department_id, None, department_group(department_id)))
+    if employee_id and not _has_department(employee_id):
+        # Сотрудник без департамента видит счётчики своих официальных визитов
+        targets.append((None, employee_id, user_group(employee_id)))
+
+    for dept_id, user_id, group in targets:
+        try:
+            invalidate_counters(dept_id, user_id)
+            snapshot = get_counter_snapshot(dept_id, user_id)
+            _send(group, {
+                'type': 'counters',
+                'data': snapshot['counters'],
+                'etag': snapshot['etag'],
+            })
+        except Exception as e:
+            logger.warning("WS counters publish to %s failed: %s", group, e)
+
+
+def publish_counters_refresh() -> None:
+    """Изменился студенческий визит: сотрудники без департамента пересчитывают счётчики."""
+    try:
+        _group_send(NO_DEPARTMENT_GROUP, {'type': 'counters_refresh'})
+    except Exception as e:
+        logger.warning("WS counters refresh broadcast failed: %s", e)
+
+
+def schedule_publish_counters(department_ids: List[Optional[int]], employee_id: Optional[int] = None,
+                              student: bool = False) -> None:
+    """
+    Ставит рассылку счётчиков в Celery (вызывается из on_commit).
+
+    Если брокер недоступен, счётчики рассылаются сразу - в потоке запроса.
+    """
+    try:
+        from .tasks import publish_counters_task
+        publish_counters_task.delay(list(department_ids), employee_id, student)
+        return
+    except Exception as e:
+        logger.warning("WS counters task scheduling failed: %s", e)
+    for department_id in department_ids:
+        publish_counters(department_id, employee_id)
+    if student:
+        publish_counters_refresh()
+
+
+def publish_department_event(department_id: Optional[int], data: dict) -> None:
+    """Событие визита в группу департамента (сотрудники без глобального доступа)."""
+    if not department_id:
+        return
+    try:
+        _send(department_group(department_id), {'type': 'event', 'data': data})
+    except Exception as e:
+        logger.warning("WS department event broadcast failed: %s", e)
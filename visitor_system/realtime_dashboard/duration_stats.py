@@ -0,0 +1,88 @@
+"""
+Статистика длительности завершённых визитов, посчитанная в PostgreSQL.
+
+Раньше get_avg_visit_duration и get_duration_distribution загружали все
+завершённые визиты за период и считали среднее/гистограмму в Python.
+Теперь один запрос по UNION ALL официальных и студенческих визитов
+возвращает количество, среднее, перцентили (percentile_cont) и
+гистограмму (width_bucket по границам DURATION_BUCKETS).
+
+Перцентили и гистограмма требуют длительности каждого визита, поэтому
+считаются по исходным таблицам (диапазон entry_time - по индексу), а не
+по агрегатам rollups.py.
+"""
+from datetime import datetime
+from typing import Optional
+
+from django.db import connection
+
+from visitors.models import StudentVisit, Visit
+
+# (ключ, нижняя граница в минутах, подпись); верхняя граница - начало следующего
+DURATION_BUCKETS = (
+    ('<15min', 0, 'До 15 мин'),
+    ('15-30min', 15, '15-30 мин'),
+    ('30-60min', 30, '30-60 мин'),
+    ('1-2h', 60, '1-2 часа'),
+    ('2-4h', 120, '2-4 часа'),
+    ('4-8h', 240, '4-8 часов'),
+    ('>8h', 480, 'Более 8 часов'),
+)
+
+PERCENTILES = (0.5, 0.9, 0.99)
+
+# Границы для width_bucket: значение < 15 -> 0, [15, 30) -> 1, ..., >= 480 -> 6
+_THRESHOLDS = [float(lower) for _, lower, _ in DURATION_BUCKETS[1:]]
+
+_SOURCE_SQL = (
+    "SELECT (EXTRACT(EPOCH FROM exit_time - entry_time) / 60.0)::float8 AS minutes FROM {table} "
+    "WHERE entry_time >= %s AND exit_time IS NOT NULL{department}"
+)
+
+_STATS_SQL = """
+    SELECT COUNT(*),
+           AVG(minutes),
+           percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY minutes),
+           {histogram}
+    FROM (
+        {sources}
+    ) durations
+"""
+
+
+def duration_stats(start_dt: datetime, department_id: Optional[int] = None) -> dict:
+    """
+    Длительность визитов с entry_time >= start_dt, завершённых (exit_time задан).
+
+    Returns:
+        {'count', 'avg_minutes', 'percentiles': {0.5: ..., 0.9: ..., 0.99: ...},
+         'histogram': [количество по DURATION_BUCKETS]}
+    """
+    department_sql = ' AND department_id = %s' if department_id else ''
+    sources, source_params = [], []
+    for model in (Visit, StudentVisit):
+        sources.append(_SOURCE_SQL.format(table=model._meta.db_table, department=department_sql))
+        source_params.append(start_dt)
+        if department_id:
+            source_params.append(department_id)
+
+    histogram_sql = ',\n           '.join(
+        f"COUNT(*) FILTER (WHERE width_bucket(minutes, %s::float8[]) = {index})"
+        for index in range(len(DURATION_BUCKETS))
+    )
+    sql = _STATS_SQL.format(
+        histogram=histogram_sql,
+        sources='\n        UNION ALL\n        '.join(sources),
+    )
+    params = [list(PERCENTILES)] + [_THRESHOLDS] * len(DURATION_BUCKETS) + source_params
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        count, avg_minutes, percentile_values, *histogram = cursor.fetchone()
+
+    percentile_values = percentile_values or [None] * len(PERCENTILES)
+    return {
+        'count': count or 0,
+        'avg_minutes': float(avg_minutes or 0),
+        'percentiles': {p: float(value or 0) for p, value in zip(PERCENTILES, percentile_values)},
+        'histogram': list(histogram),
+    }
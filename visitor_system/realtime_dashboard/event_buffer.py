@@ -0,0 +1,268 @@
+"""
+Буферизованная запись и рассылка событий дашборда (RealtimeEvent).
+
+Раньше каждое событие визита на потоке запроса делало INSERT и
+async_to_sync(group_send) - в том числе при массовых сохранениях. Теперь:
+- enqueue() только регистрирует transaction.on_commit: после коммита
+  событие (JSON) дописывается в Redis-список EVENT_BUFFER_KEY, при откате
+  транзакции событие не появляется;
+- первое событие пачки ставит задачу flush_realtime_events_task с
+  задержкой REALTIME_EVENT_FLUSH_DELAY (флаг SET NX - одна задача на пачку);
+- задача забирает список пачками, делает bulk_create и отправляет одно
+  WS-сообщение {'type': 'events', 'data': [...]} в общую группу и по одному
+  в группы департаментов.
+
+Без Redis событие записывается и рассылается сразу (как раньше, но уже
+после коммита). Если постановка задачи не удалась, флаг снимается и
+задачу поставит следующее событие; периодическая задача (раз в минуту)
+подбирает события, если следующего не будет.
+
+Источник событий - сигналы визитов (signals.py).
+
+Пачка, которую не удалось записать, делится пополам до отдельных событий;
+событие, не записанное REALTIME_EVENT_MAX_ATTEMPTS раз, переносится в
+список EVENT_DEAD_LETTER_KEY, чтобы не блокировать буфер.
+"""
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import RealtimeEvent
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUFFER_KEY = 'visitor_system:realtime_events:buffer'
+FLUSH_SCHEDULED_KEY = 'visitor_system:realtime_events:flush_scheduled'
+EVENT_DEAD_LETTER_KEY = 'visitor_system:realtime_events:dead_letter'
+
+
+def _flush_delay() -> float:
+    return getattr(settings, 'REALTIME_EVENT_FLUSH_DELAY', 1)
+
+
+def _batch_size() -> int:
+    return getattr(settings, 'REALTIME_EVENT_BATCH_SIZE', 500)
+
+
+def _retry_delay() -> float:
+    return getattr(settings, 'REALTIME_EVENT_RETRY_DELAY', 30)
+
+
+def _max_attempts() -> int:
+    return getattr(settings, 'REALTIME_EVENT_MAX_ATTEMPTS', 3)
+
+
+def _dead_letter_size() -> int:
+    return getattr(settings, 'REALTIME_EVENT_DEAD_LETTER_SIZE', 1000)
+
+
+def _get_client():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception as e:
+        logger.warning("Realtime events: Redis unavailable: %s", e)
+        return None
+
+
+def enqueue(event_type: str, title: str, message: str, priority: str = 'normal',
+            user_id: Optional[int] = None, visit_id: Optional[int] = None,
+            department_id: Optional[int] = None, data: Optional[dict] = None) -> None:
+    """
+    Ставит событие в буфер после коммита текущей транзакции.
+
+    Время события фиксируется сейчас, а не при записи пачки.
+    """
+    record = {
+        'event_type': event_type,
+        'title': title,
+        'message': message,
+        'priority': priority,
+        'user_id': user_id,
+        'visit_id': visit_id,
+        'department_id': department_id,
+        'data': data or {},
+        'created_at': timezone.now().isoformat(),
+    }
+    transaction.on_commit(lambda: _push(record))
+
+
+def _push(record: dict) -> None:
+    client = _get_client()
+    if client is not None:
+        try:
+            client.rpush(EVENT_BUFFER_KEY, json.dumps(record, default=str))
+        except Exception as e:
+            logger.warning("Realtime events: buffer push failed: %s", e)
+            client = None
+    if client is None:
+        write_batch([record])
+        return
+    _schedule_flush(client)
+
+
+def _schedule_flush(client, delay: Optional[float] = None) -> None:
+    delay = _flush_delay() if delay is None else delay
+    try:
+        # Флаг живёт дольше задержки: задача снимает его перед чтением буфера
+        if not client.set(FLUSH_SCHEDULED_KEY, 1, nx=True, ex=int(delay) + 60):
+            return
+    except Exception as e:
+        logger.warning("Realtime events: flush flag failed: %s", e)
+        return
+    try:
+        from .tasks import flush_realtime_events_task
+        flush_realtime_events_task.apply_async(countdown=delay)
+    except Exception as e:
+        # События остаются в буфере до периодической задачи
+        logger.warning("Realtime events: flush scheduling failed: %s", e)
+        try:
+            client.delete(FLUSH_SCHEDULED_KEY)
+        except Exception:
+            pass
+
+
+def _pop(client, limit: int) -> List[dict]:
+    pipe = client.pipeline(transaction=True)
+    pipe.lrange(EVENT_BUFFER_KEY, 0, limit - 1)
+    pipe.ltrim(EVENT_BUFFER_KEY, limit, -1)
+    raw, _ = pipe.execute()
+    records = []
+    for item in raw:
+        try:
+            records.append(json.loads(item))
+        except (TypeError, ValueError) as e:
+            logger.warning("Realtime events: malformed buffer entry skipped: %s", e)
+    return records
+
+
+def flush() -> int:
+    """
+    Записывает и рассылает все события из буфера (вызывается Celery-задачей).
+
+    Returns:
+        Количество записанных событий
+    """
+    client = _get_client()
+    if client is None:
+        return 0
+    # События, пришедшие во время записи, поставят следующую задачу
+    client.delete(FLUSH_SCHEDULED_KEY)
+    written = 0
+    failed: List[dict] = []
+    limit = _batch_size()
+    while True:
+        records = _pop(client, limit)
+        if not records:
+            break
+        written += _write_or_split(records, failed)
+        if len(records) < limit:
+            break
+    if failed:
+        _requeue(client, failed)
+    return written
+
+
+def _write_or_split(records: List[dict], failed: List[dict]) -> int:
+    """
+    Записывает пачку; при ошибке делит её пополам, пока не останутся
+    отдельные события - они попадают в failed.
+
+    Returns:
+        Количество записанных событий
+    """
+    try:
+        write_batch(records)
+        return len(records)
+    except Exception as e:
+        if len(records) == 1:
+            records[0]['_error'] = str(e)[:500]
+            failed.append(records[0])
+            return 0
+    middle = len(records) // 2
+    return _write_or_split(records[:middle], failed) + _write_or_split(records[middle:], failed)
+
+
+def _requeue(client, records: List[dict]) -> None:
+    """Неудачные события - в конец буфера (следующая задача) или в dead-letter."""
+    retry, dead = [], []
+    for record in records:
+        record['_attempts'] = record.get('_attempts', 0) + 1
+        (dead if record['_attempts'] >= _max_attempts() else retry).append(record)
+    try:
+        if dead:
+            for record in dead:
+                logger.error(
+                    "Realtime event %s moved to dead letter after %d attempts: %s",
+                    record.get('event_type'), record['_attempts'], record.get('_error'),
+                )
+            pipe = client.pipeline()
+            pipe.rpush(EVENT_DEAD_LETTER_KEY, *[json.dumps(r, default=str) for r in dead])
+            pipe.ltrim(EVENT_DEAD_LETTER_KEY, -_dead_letter_size(), -1)
+            pipe.execute()
+        if retry:
+            logger.warning("Realtime events: %d events will be retried", len(retry))
+            client.rpush(EVENT_BUFFER_KEY, *[json.dumps(r, default=str) for r in retry])
+            _schedule_flush(client, _retry_delay())
+    except Exception as e:
+        logger.error("Realtime events: failed to requeue %d events: %s", len(records), e)
+
+
+def _payload(event: RealtimeEvent) -> dict:
+    return {
+        "id": event.id,
+        "event_type": event.event_type,
+        "title": event.title,
+        "message": event.message,
+        "priority": event.priority,
+        "timestamp": event.created_at.isoformat(),
+    }
+
+
+def write_batch(records: List[dict]) -> List[RealtimeEvent]:
+    """Одна вставка bulk_create и одно WS-сообщение на группу."""
+    events = [
+        RealtimeEvent(
+            event_type=record['event_type'],
+            title=record['title'],
+            message=record['message'],
+            priority=record.get('priority') or 'normal',
+            user_id=record.get('user_id'),
+            visit_id=record.get('visit_id'),
+            data=record.get('data') or {},
+            created_at=parse_datetime(record.get('created_at') or '') or timezone.now(),
+        )
+        for record in records
+    ]
+    events = RealtimeEvent.objects.bulk_create(events)
+    logger.info("Realtime events written: %d", len(events))
+
+    by_department: Dict[int, List[dict]] = defaultdict(list)
+    payloads = []
+    for record, event in zip(records, events):
+        payload = _payload(event)
+        payloads.append(payload)
+        if record.get('department_id'):
+            by_department[record['department_id']].append(payload)
+    broadcast(payloads, by_department)
+    return events
+
+
+def broadcast(payloads: List[dict], by_department: Dict[int, List[dict]]) -> None:
+    from .counters import GLOBAL_GROUP, _send, department_group
+
+    groups = [(GLOBAL_GROUP, payloads)]
+    groups += [(department_group(dept_id), items) for dept_id, items in by_department.items()]
+    for group, items in groups:
+        if not items:
+            continue
+        try:
+            _send(group, {'type': 'events', 'data': items})
+        except Exception as e:
+            logger.warning("WS events broadcast to %s failed: %s", group, e)
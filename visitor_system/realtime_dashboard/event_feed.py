@@ -0,0 +1,111 @@
+"""
+Лента событий дашборда (RealtimeEvent) с фильтрами в ORM и keyset-пагинацией.
+
+Раньше dashboard_events_api брал 1000 последних событий и фильтровал их
+по типу/приоритету/времени в Python, а страницы резал из списка в памяти.
+Теперь фильтры уходят в запрос (event_type + created_at - по индексу
+(event_type, created_at)), страница выбирается условием «строго старше
+курсора» по (created_at, id), поэтому стоимость не зависит от длины ленты.
+"""
+import base64
+import datetime
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import RealtimeEvent
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at: datetime.datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime.datetime, int]]:
+    """Разбирает курсор; для некорректного значения возвращает None (первая страница)."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_time, raw_pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        created_at = datetime.datetime.fromisoformat(raw_time)
+        if timezone.is_naive(created_at):
+            return None
+        return created_at, int(raw_pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def parse_since(value: Optional[str]) -> Optional[datetime.datetime]:
+    """ISO-8601 время; без часового пояса - в TIME_ZONE; некорректное - None."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is None:
+        return None
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def serialize(event: RealtimeEvent) -> dict:
+    return {
+        'id': event.id,
+        'type': event.event_type,
+        'title': event.title,
+        'message': event.message,
+        'priority': event.priority,
+        'timestamp': event.created_at.isoformat(),
+        'is_read': event.is_read,
+    }
+
+
+@dataclass
+class EventPage:
+    events: List[dict]
+    page_size: int
+    next_cursor: Optional[str] = None
+
+    @property
+    def pagination(self) -> dict:
+        return {
+            'page_size': self.page_size,
+            'next_cursor': self.next_cursor,
+            'has_next': self.next_cursor is not None,
+        }
+
+
+def events_page(event_type: Optional[str] = None, priority: Optional[str] = None,
+                since: Optional[datetime.datetime] = None, after: Optional[str] = None,
+                limit: int = 20) -> EventPage:
+    """
+    Страница событий от новых к старым.
+
+    Args:
+        after: Курсор (next_cursor предыдущей страницы)
+        limit: Размер страницы (1..MAX_PAGE_SIZE)
+    """
+    page_size = max(1, min(MAX_PAGE_SIZE, limit))
+    qs = RealtimeEvent.objects.all()
+    if event_type:
+        qs = qs.filter(event_type=event_type)
+    if priority:
+        qs = qs.filter(priority=priority)
+    if since:
+        qs = qs.filter(created_at__gte=since)
+    cursor = decode_cursor(after)
+    if cursor is not None:
+        created_at, pk = cursor
+        qs = qs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+    rows = list(qs.order_by('-created_at', '-id')[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more and rows else None
+    return EventPage(events=[serialize(event) for event in rows], page_size=page_size, next_cursor=next_cursor)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from realtime_dashboard import partitions
+
+
+class Command(BaseCommand):
+    help = 'Создаёт будущие и удаляет просроченные секции журнальных таблиц. Использование: manage_partitions --premake 14 --dry-run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--table', choices=sorted(partitions.PARTITIONED_TABLES), action='append',
+            help='Таблица (по умолчанию все секционированные)',
+        )
+        parser.add_argument('--premake', type=int, help='Сколько интервалов создать вперёд (по умолчанию PARTITION_PREMAKE)')
+        parser.add_argument('--retention-days', type=int, help='Срок хранения в днях (по умолчанию из настроек таблицы)')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет создано и удалено')
+
+    def handle(self, *args, **options):
+        for key in options['table'] or sorted(partitions.PARTITIONED_TABLES):
+            spec = partitions.PARTITIONED_TABLES[key]
+            if not partitions.is_partitioned(spec):
+                raise CommandError(f"Таблица {spec.table} не секционирована (примените миграции)")
+            result = partitions.maintain(
+                spec,
+                premake=options['premake'],
+                retention_days=options['retention_days'],
+                dry_run=options['dry_run'],
+            )
+            prefix = '[dry-run] ' if options['dry_run'] else ''
+            for name in result['created']:
+                self.stdout.write(f"{prefix}+ {name}")
+            for name in result['dropped']:
+                self.stdout.write(f"{prefix}- {name}")
+            self.stdout.write(self.style.SUCCESS(
+                f"{prefix}{spec.table}: создано {len(result['created'])}, удалено {len(result['dropped'])} секций"
+            ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from realtime_dashboard.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты визитов (VisitRollupHourly/Daily) из исходных таблиц. Использование: rebuild_visit_rollups --days 365'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=35, help='Глубина пересчёта в днях (по умолчанию 35)')
+
+    def handle(self, *args, **options):
+        result = rebuild(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Агрегаты визитов пересчитаны: {result['hourly']} почасовых, {result['daily']} дневных строк"
+        ))
@@ -0,0 +1,158 @@
+"""
+Реестр метрик дашборда.
+
+Раньше get_current_metrics всегда считал все 12 разделов, даже когда
+виджету или CSV-выгрузке нужен один. Теперь каждая метрика описана в
+METRICS отдельно:
+- считается только запрошенная (get_metrics(names=...), ?metrics=a,b в API);
+- кэшируется отдельно (metrics_cache, stale-while-revalidate) со своим
+  временем свежести, а ключ учитывает только те фильтры, от которых
+  метрика зависит (department_stats общий для всех фильтров);
+- версионируется: version в описании меняется при изменении формата.
+
+Отдельных кэшей внутри методов DashboardMetricsService нет: актуальность
+значения определяется только fresh_ttl метрики.
+"""
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from django.utils import timezone
+
+from . import metrics_cache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MetricContext:
+    department_id: Optional[int]
+    period: str
+    start_dt: datetime
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    name: str
+    # (service, MetricContext) -> значение
+    compute: Callable[[Any, MetricContext], Any]
+    # Сколько секунд значение считается свежим
+    fresh_ttl: int = 60
+    by_department: bool = False
+    by_period: bool = False
+    # Версия формата значения (меняется вместе с кодом расчёта)
+    version: int = 1
+
+
+METRICS: Dict[str, MetricSpec] = {spec.name: spec for spec in (
+    MetricSpec('visitors_count', lambda s, c: s.get_visitors_count(start_dt=c.start_dt),
+               fresh_ttl=30, by_period=True),
+    MetricSpec('active_visits', lambda s, c: s.get_active_visits(department_id=c.department_id),
+               fresh_ttl=10, by_department=True),
+    MetricSpec('today_registrations', lambda s, c: s.get_today_registrations(start_dt=c.start_dt),
+               fresh_ttl=30, by_period=True),
+    MetricSpec('avg_visit_duration', lambda s, c: s.get_avg_visit_duration(start_dt=c.start_dt),
+               fresh_ttl=300, by_period=True),
+    MetricSpec('department_stats', lambda s, c: s.get_department_stats(), fresh_ttl=300),
+    MetricSpec('hourly_stats', lambda s, c: s.get_hourly_stats(), fresh_ttl=60),
+    MetricSpec('recent_events', lambda s, c: s.get_recent_events(), fresh_ttl=5),
+    MetricSpec('security_alerts', lambda s, c: s.get_security_alerts(), fresh_ttl=30),
+    MetricSpec('status_distribution',
+               lambda s, c: s.get_status_distribution(department_id=c.department_id, period=c.period),
+               fresh_ttl=60, by_department=True, by_period=True),
+    MetricSpec('weekly_trend', lambda s, c: s.get_weekly_trend(department_id=c.department_id),
+               fresh_ttl=900, by_department=True),
+    MetricSpec('duration_distribution',
+               lambda s, c: s.get_duration_distribution(department_id=c.department_id, period=c.period),
+               fresh_ttl=300, by_department=True, by_period=True),
+    MetricSpec('visitor_type_comparison',
+               lambda s, c: s.get_visitor_type_comparison(department_id=c.department_id, period=c.period),
+               fresh_ttl=300, by_department=True, by_period=True),
+)}
+
+
+def normalize_period(period: Optional[str]) -> str:
+    return (period or '24h').lower()
+
+
+def period_start(period: str, now: Optional[datetime] = None) -> datetime:
+    """Начало периода фильтра дашборда."""
+    now = now or timezone.now()
+    if period == 'today':
+        return timezone.make_aware(datetime.combine(now.date(), datetime.min.time()))
+    if period in ('7d', 'week'):
+        return now - timedelta(days=7)
+    if period in ('30d', 'month'):
+        return now - timedelta(days=30)
+    return now - timedelta(hours=24)
+
+
+def parse_names(value: Optional[str]) -> Optional[List[str]]:
+    """?metrics=a,b -> известные имена; None - параметр не передан (все метрики)."""
+    if not value:
+        return None
+    names = [name.strip() for name in value.split(',')]
+    return [name for name in dict.fromkeys(names) if name in METRICS]
+
+
+def cache_key(spec: MetricSpec, department_id: Optional[int], period: str) -> str:
+    department = (department_id or 'all') if spec.by_department else '-'
+    period_part = period if spec.by_period else '-'
+    return f"dash:metric:{spec.name}:v{spec.version}:dep={department}:period={period_part}"
+
+
+def compute(service, name: str, department_id: Optional[int] = None, period: Optional[str] = None) -> Any:
+    """Расчёт одной метрики без кэша."""
+    period = normalize_period(period)
+    return METRICS[name].compute(service, MetricContext(department_id, period, period_start(period)))
+
+
+def refresh(service, name: str, department_id: Optional[int] = None, period: Optional[str] = None,
+            lock_token: Optional[str] = None) -> Optional[Any]:
+    """Пересчитывает одну метрику в кэше (None - пересчёт уже идёт)."""
+    spec = METRICS[name]
+    period = normalize_period(period)
+    key = cache_key(spec, department_id, period)
+    return metrics_cache.refresh(
+        key, lambda: compute(service, name, department_id, period), lock_token, fresh_ttl=spec.fresh_ttl,
+    )
+
+
+def get_metrics(service, names: Optional[Iterable[str]] = None, department_id: Optional[int] = None,
+                period: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Запрошенные метрики (None - все) + 'timestamp'.
+
+    Каждая метрика берётся из своего кэша; устаревшие пересчитываются
+    фоновой задачей refresh_metric_task, отсутствующие - сразу.
+    """
+    now = timezone.now()
+    period = normalize_period(period)
+    names = [name for name in (names if names is not None else METRICS) if name in METRICS]
+    context = MetricContext(department_id, period, period_start(period, now))
+
+    result: Dict[str, Any] = {}
+    for name in names:
+        spec = METRICS[name]
+
+        def schedule_refresh(lock_token, name=name):
+            from .tasks import refresh_metric_task
+            refresh_metric_task.delay(name, department_id, period, lock_token)
+
+        try:
+            result[name] = metrics_cache.get_or_compute(
+                cache_key(spec, department_id, period),
+                lambda spec=spec: spec.compute(service, context),
+                schedule_refresh=schedule_refresh,
+                params={
+                    'metric': name,
+                    'department_id': department_id if spec.by_department else None,
+                    'period': period if spec.by_period else None,
+                },
+                fresh_ttl=spec.fresh_ttl,
+            )
+        except Exception as e:
+            logger.error("Error computing dashboard metric %s: %s", name, e)
+    result['timestamp'] = now.isoformat()
+    return result
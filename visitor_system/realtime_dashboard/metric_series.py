@@ -0,0 +1,217 @@
+"""
+Временные ряды метрик дашборда (MetricPoint).
+
+Раньше save_metrics_snapshot каждые 5 минут писал JSON-снимок каждой
+метрики в DashboardMetric и удалял всё старше суток: таблица постоянно
+перезаписывалась, а по JSON нельзя было построить график. Теперь:
+- из снимка извлекаются числовые ряды (SERIES) и пишутся точками
+  (metric, labels, bucket, value) с разрешением 5 минут; повторный замер в
+  том же интервале уточняет среднее/минимум/максимум (INSERT ... ON CONFLICT);
+- задача downsample_metric_series_task раз в час сворачивает 5-минутные
+  точки в часовые, часовые - в дневные (INSERT ... SELECT, идемпотентно)
+  и удаляет точки старше срока хранения своего разрешения;
+- series() отдаёт ряд для графика, выбирая разрешение по длине периода.
+
+Точки пишутся по возрастанию времени, поэтому очистка по bucket идёт по
+BRIN-индексу, а чтение ряда - по уникальному ключу.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import MetricPoint
+
+logger = logging.getLogger(__name__)
+
+RAW = MetricPoint.RESOLUTION_RAW
+HOURLY = MetricPoint.RESOLUTION_HOURLY
+DAILY = MetricPoint.RESOLUTION_DAILY
+
+RAW_STEP = timedelta(minutes=5)
+
+# (ряд, метки, значение)
+Sample = Tuple[str, str, float]
+
+
+def _retention() -> Dict[str, timedelta]:
+    return {
+        RAW: timedelta(hours=getattr(settings, 'METRIC_SERIES_RAW_RETENTION_HOURS', 48)),
+        HOURLY: timedelta(days=getattr(settings, 'METRIC_SERIES_HOURLY_RETENTION_DAYS', 90)),
+        DAILY: timedelta(days=getattr(settings, 'METRIC_SERIES_DAILY_RETENTION_DAYS', 730)),
+    }
+
+
+def labels_string(**labels) -> str:
+    """Каноническая строка меток: 'department=3' (ключи по алфавиту)."""
+    return ','.join(f'{key}={value}' for key, value in sorted(labels.items()) if value not in (None, ''))
+
+
+def _fields(metric: str, *fields: str) -> Callable[[dict], Iterable[Sample]]:
+    def extract(value: dict) -> Iterable[Sample]:
+        for field in fields:
+            number = value.get(field)
+            if isinstance(number, (int, float)) and not isinstance(number, bool):
+                yield f'{metric}.{field}', '', float(number)
+    return extract
+
+
+def _department_stats(value) -> Iterable[Sample]:
+    for row in value or []:
+        labels = labels_string(department=row.get('department_id'))
+        for field in ('total_visits', 'active_visits'):
+            if isinstance(row.get(field), (int, float)):
+                yield f'department_stats.{field}', labels, float(row[field])
+
+
+# Метрика снимка -> извлечение числовых рядов
+SERIES: Dict[str, Callable[..., Iterable[Sample]]] = {
+    'visitors_count': _fields('visitors_count', 'total_all', 'total_visits', 'total_student_visits', 'unique_guests'),
+    'active_visits': _fields('active_visits', 'count', 'official_count', 'student_count'),
+    'today_registrations': _fields('today_registrations', 'total_today', 'official_today', 'student_today'),
+    'avg_visit_duration': _fields(
+        'avg_visit_duration', 'avg_duration_minutes', 'completed_visits_count',
+        'p50_duration_minutes', 'p90_duration_minutes', 'p99_duration_minutes',
+    ),
+    'department_stats': _department_stats,
+}
+
+
+def samples(metrics: dict) -> List[Sample]:
+    """Числовые ряды из снимка get_current_metrics()."""
+    result = []
+    for name, extract in SERIES.items():
+        if name not in metrics:
+            continue
+        try:
+            result.extend(extract(metrics[name]))
+        except Exception as e:
+            logger.warning("Metric series: cannot extract %s: %s", name, e)
+    return result
+
+
+def raw_bucket(value: datetime) -> datetime:
+    value = value.replace(second=0, microsecond=0)
+    return value - timedelta(minutes=value.minute % (RAW_STEP.seconds // 60))
+
+
+_RECORD_SQL = """
+    INSERT INTO {table} AS p (metric, labels, resolution, bucket, value, min_value, max_value, samples)
+    VALUES {values}
+    ON CONFLICT (metric, labels, resolution, bucket) DO UPDATE SET
+        value = (p.value * p.samples + EXCLUDED.value) / (p.samples + 1),
+        min_value = LEAST(p.min_value, EXCLUDED.min_value),
+        max_value = GREATEST(p.max_value, EXCLUDED.max_value),
+        samples = p.samples + 1
+"""
+
+
+def record(metrics: dict, now: Optional[datetime] = None) -> int:
+    """
+    Пишет замер снимка в 5-минутные точки (один INSERT на снимок).
+
+    Returns:
+        Количество рядов в замере
+    """
+    rows = samples(metrics)
+    if not rows:
+        return 0
+    bucket = raw_bucket(now or timezone.now())
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s, 1)'] * len(rows))
+    params = []
+    for metric, labels, value in rows:
+        params.extend([metric, labels, RAW, bucket, value, value, value])
+    with connection.cursor() as cursor:
+        cursor.execute(_RECORD_SQL.format(table=MetricPoint._meta.db_table, values=values), params)
+    return len(rows)
+
+
+# Свёртка точек разрешения source в target; пересчитанные интервалы заменяются
+_DOWNSAMPLE_SQL = """
+    INSERT INTO {table} (metric, labels, resolution, bucket, value, min_value, max_value, samples)
+    SELECT metric, labels, %s, date_trunc(%s, bucket AT TIME ZONE %s) AT TIME ZONE %s,
+           SUM(value * samples) / SUM(samples), MIN(min_value), MAX(max_value), SUM(samples)
+    FROM {table}
+    WHERE resolution = %s AND bucket >= %s AND bucket < %s
+    GROUP BY 1, 2, 4
+    ON CONFLICT (metric, labels, resolution, bucket) DO UPDATE SET
+        value = EXCLUDED.value,
+        min_value = EXCLUDED.min_value,
+        max_value = EXCLUDED.max_value,
+        samples = EXCLUDED.samples
+"""
+
+
+def _hour_start(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _day_start(value: datetime) -> datetime:
+    local = timezone.localtime(value)
+    return local.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def downsample(now: Optional[datetime] = None, hours: int = 3, days: int = 2) -> Dict[str, int]:
+    """
+    Сворачивает последние hours часов в часовые точки и days дней в дневные.
+
+    Текущий (незавершённый) интервал тоже пересчитывается - при следующем
+    запуске он будет заменён полным значением.
+
+    Returns:
+        {'1h': строк, '1d': строк}
+    """
+    now = now or timezone.now()
+    table = MetricPoint._meta.db_table
+    tz_name = settings.TIME_ZONE
+    result = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for source, target, unit, since in (
+            (RAW, HOURLY, 'hour', _hour_start(now) - timedelta(hours=hours)),
+            (HOURLY, DAILY, 'day', _day_start(now) - timedelta(days=days)),
+        ):
+            cursor.execute(
+                _DOWNSAMPLE_SQL.format(table=table),
+                [target, unit, tz_name, tz_name, source, since, now + RAW_STEP],
+            )
+            result[target] = cursor.rowcount
+    return result
+
+
+def prune(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Удаляет точки старше срока хранения их разрешения."""
+    now = now or timezone.now()
+    result = {}
+    for resolution, keep in _retention().items():
+        deleted, _ = MetricPoint.objects.filter(resolution=resolution, bucket__lt=now - keep).delete()
+        result[resolution] = deleted
+    return result
+
+
+def resolution_for(start: datetime, end: datetime) -> str:
+    """Самое подробное разрешение, которое ещё хранится для начала периода."""
+    age = timezone.now() - start
+    retention = _retention()
+    if end - start <= timedelta(days=2) and age <= retention[RAW]:
+        return RAW
+    if end - start <= timedelta(days=31) and age <= retention[HOURLY]:
+        return HOURLY
+    return DAILY
+
+
+def series(metric: str, start: datetime, end: Optional[datetime] = None,
+           labels: str = '', resolution: Optional[str] = None) -> List[dict]:
+    """Точки ряда для графика: [{'timestamp', 'value', 'min', 'max'}, ...]."""
+    end = end or timezone.now()
+    resolution = resolution or resolution_for(start, end)
+    rows = MetricPoint.objects.filter(
+        metric=metric, labels=labels, resolution=resolution,
+        bucket__gte=start, bucket__lt=end,
+    ).order_by('bucket').values_list('bucket', 'value', 'min_value', 'max_value')
+    return [
+        {'timestamp': bucket.isoformat(), 'value': value, 'min': min_value, 'max': max_value}
+        for bucket, value, min_value, max_value in rows
+    ]
@@ -0,0 +1,235 @@
+"""
+Кэш метрик дашборда с защитой от «штормов» пересчёта (stale-while-revalidate).
+
+Раньше полный набор метрик (get_current_metrics) жил в кэше 10 секунд, и
+после истечения каждый одновременный запрос и каждое новое подключение
+DashboardConsumer пересчитывали его заново. Теперь для каждой метрики:
+- запись хранит значение и время расчёта; свежей она считается
+  fresh_ttl секунд (свой у каждой метрики, metric_registry.py), но
+  остаётся в кэше ещё DASHBOARD_METRICS_STALE_TTL секунд;
+- устаревшая запись отдаётся сразу, а обновление запускает только тот,
+  кто взял блокировку в Redis (cache.add = SET NX) - фоновой задачей;
+- при холодном кэше считает один процесс, остальные ждут его результат;
+- задача update_dashboard_metrics (beat) заранее пересчитывает все
+  недавно запрошенные метрики и сочетания фильтров, поэтому открытие
+  страницы не платит за полный пересчёт.
+"""
+import json
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Недавно запрошенные ключи: hash Redis {key: JSON {'params': ..., 'requested_at': ts}}
+REGISTRY_KEY = 'visitor_system:dashboard:metrics_registry'
+
+WAIT_POLL_INTERVAL = 0.1
+
+
+def _fresh_ttl() -> int:
+    return getattr(settings, 'DASHBOARD_METRICS_FRESH_TTL', 30)
+
+
+def _stale_ttl() -> int:
+    return getattr(settings, 'DASHBOARD_METRICS_STALE_TTL', 900)
+
+
+def _lock_ttl() -> int:
+    return getattr(settings, 'DASHBOARD_METRICS_LOCK_TTL', 60)
+
+
+def _wait_timeout() -> float:
+    return getattr(settings, 'DASHBOARD_METRICS_WAIT_TIMEOUT', 5)
+
+
+def _registry_ttl() -> int:
+    return getattr(settings, 'DASHBOARD_METRICS_REGISTRY_TTL', 3600)
+
+
+def _get_client():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception as e:
+        logger.warning("Metrics cache: Redis unavailable: %s", e)
+        return None
+
+
+def _lock_key(key: str) -> str:
+    return f'{key}:lock'
+
+
+def _read(key: str) -> Optional[dict]:
+    try:
+        entry = cache.get(key)
+    except Exception as e:
+        logger.warning("Metrics cache read failed for %s: %s", key, e)
+        return None
+    if isinstance(entry, dict) and 'computed_at' in entry:
+        return entry
+    return None
+
+
+def _is_fresh(entry: dict) -> bool:
+    return time.time() - entry['computed_at'] < entry.get('fresh_ttl', _fresh_ttl())
+
+
+def _write(key: str, value: Any, fresh_ttl: Optional[int] = None) -> None:
+    fresh_ttl = fresh_ttl if fresh_ttl is not None else _fresh_ttl()
+    entry = {'value': value, 'computed_at': time.time(), 'fresh_ttl': fresh_ttl}
+    try:
+        cache.set(key, entry, fresh_ttl + _stale_ttl())
+    except Exception as e:
+        logger.warning("Metrics cache write failed for %s: %s", key, e)
+
+
+def acquire(key: str) -> Optional[str]:
+    """Single-flight блокировка пересчёта ключа; возвращает токен владельца или None."""
+    token = uuid.uuid4().hex
+    try:
+        return token if cache.add(_lock_key(key), token, _lock_ttl()) else None
+    except Exception as e:
+        logger.warning("Metrics cache lock failed for %s: %s", key, e)
+        # Без Redis блокировку не взять - считаем сами, как до кэша
+        return token
+
+
+def release(key: str, token: Optional[str] = None) -> None:
+    """Снимает блокировку (только свою, если передан токен)."""
+    try:
+        if token is None or cache.get(_lock_key(key)) == token:
+            cache.delete(_lock_key(key))
+    except Exception as e:
+        logger.warning("Metrics cache unlock failed for %s: %s", key, e)
+
+
+def refresh(key: str, compute: Callable[[], Any], token: Optional[str] = None,
+            fresh_ttl: Optional[int] = None) -> Optional[Any]:
+    """
+    Пересчитывает значение под блокировкой.
+
+    Args:
+        token: Блокировка уже взята вызывающим (фоновая задача после
+            get_or_compute); None - взять её здесь
+        fresh_ttl: Время свежести значения (по умолчанию DASHBOARD_METRICS_FRESH_TTL)
+
+    Returns:
+        Новое значение или None, если пересчёт уже идёт в другом процессе
+    """
+    if token is None:
+        token = acquire(key)
+        if token is None:
+            return None
+    try:
+        value = compute()
+        _write(key, value, fresh_ttl)
+        return value
+    finally:
+        release(key, token)
+
+
+def register(key: str, params: Dict[str, Any]) -> None:
+    """
+    Запоминает ключ для проактивного обновления задачей update_dashboard_metrics.
+
+    HSET пишет только своё поле, поэтому одновременные регистрации не
+    затирают друг друга.
+    """
+    client = _get_client()
+    if client is None:
+        return
+    try:
+        item = json.dumps({'params': params, 'requested_at': time.time()})
+        pipe = client.pipeline()
+        pipe.hset(REGISTRY_KEY, key, item)
+        pipe.expire(REGISTRY_KEY, _registry_ttl())
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Metrics cache registry update failed: %s", e)
+
+
+def registered() -> Dict[str, dict]:
+    """Ключи, запрошенные за последние DASHBOARD_METRICS_REGISTRY_TTL секунд."""
+    client = _get_client()
+    if client is None:
+        return {}
+    try:
+        raw = client.hgetall(REGISTRY_KEY)
+    except Exception as e:
+        logger.warning("Metrics cache registry read failed: %s", e)
+        return {}
+    cutoff = time.time() - _registry_ttl()
+    result, expired = {}, []
+    for field, value in raw.items():
+        key = field.decode() if isinstance(field, bytes) else field
+        try:
+            item = json.loads(value)
+        except (TypeError, ValueError):
+            item = {}
+        if item.get('requested_at', 0) >= cutoff:
+            result[key] = item
+        else:
+            expired.append(field)
+    if expired:
+        try:
+            client.hdel(REGISTRY_KEY, *expired)
+        except Exception as e:
+            logger.warning("Metrics cache registry cleanup failed: %s", e)
+    return result
+
+
+def get_or_compute(key: str, compute: Callable[[], Any],
+                   schedule_refresh: Optional[Callable[[str], None]] = None,
+                   params: Optional[Dict[str, Any]] = None,
+                   fresh_ttl: Optional[int] = None) -> Any:
+    """
+    Значение из кэша; пересчёт - не более одного одновременно на ключ.
+
+    Args:
+        compute: Полный расчёт значения
+        schedule_refresh: Запускает фоновый пересчёт устаревшей записи
+            (получает токен блокировки); None - пересчёт в текущем процессе
+        params: Параметры ключа для проактивного обновления (register)
+        fresh_ttl: Время свежести значения (по умолчанию DASHBOARD_METRICS_FRESH_TTL)
+    """
+    entry = _read(key)
+    if entry is not None and _is_fresh(entry):
+        return entry['value']
+
+    if params is not None:
+        register(key, params)
+
+    if entry is not None:
+        # Устаревшее значение отдаём сразу, обновляет владелец блокировки
+        token = acquire(key)
+        if token is not None:
+            try:
+                if schedule_refresh is not None:
+                    schedule_refresh(token)
+                else:
+                    refresh(key, compute, token, fresh_ttl)
+            except Exception as e:
+                logger.warning("Metrics refresh scheduling failed for %s: %s", key, e)
+                release(key, token)
+        return entry['value']
+
+    # Холодный кэш: считает владелец блокировки, остальные ждут результат
+    token = acquire(key)
+    if token is not None:
+        return refresh(key, compute, token, fresh_ttl)
+
+    deadline = time.monotonic() + _wait_timeout()
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_POLL_INTERVAL)
+        entry = _read(key)
+        if entry is not None:
+            return entry['value']
+    logger.warning("Metrics cache wait timed out for %s, computing locally", key)
+    value = compute()
+    _write(key, value, fresh_ttl)
+    return value
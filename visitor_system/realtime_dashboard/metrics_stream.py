@@ -0,0 +1,279 @@
+"""
+Поток метрик дашборда по WebSocket: снимок + JSON Patch дельты.
+
+Раньше каждое обновление рассылало всем подписчикам dashboard_updates
+полный словарь метрик (включая список активных визитов), а каждое
+подключение DashboardConsumer получало его ещё раз. Теперь:
+- поток - метрики для пары (департамент, период); у него есть эпоха
+  epoch, номер версии seq, последнее опубликованное состояние и журнал
+  последних DASHBOARD_STREAM_LOG_SIZE дельт (в кэше);
+- seq растёт только внутри эпохи: если состояние потока пропало из кэша
+  (вытеснение, TTL, очистка dash:*), publish() начинает новую эпоху с
+  seq=1 и рассылает metrics_reset - подписчики получают свежий снимок
+  вместо того, чтобы отбрасывать «старые» seq;
+- publish() сравнивает новое состояние с опубликованным и рассылает в
+  группу потока только дельту (RFC 6902: add/remove/replace) с seq;
+- клиент подписывается сообщением subscribe (департамент, период, набор
+  метрик, since) и получает снимок или, если since ещё в журнале, только
+  пропущенные дельты;
+- DashboardConsumer отбрасывает операции по метрикам, на которые клиент
+  не подписан, поэтому трафик зависит от изменений, а не от размера
+  состояния;
+- потоки с подписчиками хранятся в отдельном sorted set Redis (score -
+  время последнего продления); подписка продлевает регистрацию по
+  таймеру, независимо от того, приходят ли дельты.
+"""
+import logging
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metric_registry, metrics_cache
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 2
+
+PERIODS = ('today', '24h', '1d', '7d', 'week', '30d', 'month')
+
+STATE_KEY = 'dash:stream:{}'
+
+# Потоки с подписчиками: sorted set {stream_id: время продления}
+STREAMS_KEY = 'visitor_system:dashboard:streams'
+
+
+def _log_size() -> int:
+    return getattr(settings, 'DASHBOARD_STREAM_LOG_SIZE', 100)
+
+
+def _state_ttl() -> int:
+    return getattr(settings, 'DASHBOARD_STREAM_STATE_TTL', 24 * 3600)
+
+
+def _registration_ttl() -> int:
+    return getattr(settings, 'DASHBOARD_STREAM_REGISTRATION_TTL', 1800)
+
+
+def _get_client():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception as e:
+        logger.warning("Dashboard streams: Redis unavailable: %s", e)
+        return None
+
+
+def stream_id(department_id: Optional[int], period: Optional[str]) -> str:
+    period = metric_registry.normalize_period(period)
+    if period not in PERIODS:
+        period = '24h'
+    return f"{'dept' + str(department_id) if department_id else 'all'}_{period}"
+
+
+def stream_group(sid: str) -> str:
+    return f'dashboard_metrics_{sid}'
+
+
+def _parse_stream_id(sid: str):
+    department, period = sid.split('_', 1)
+    return (int(department[4:]) if department.startswith('dept') else None), period
+
+
+# ==================== JSON PATCH ====================
+
+def _escape(token) -> str:
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+
+def make_patch(old: Any, new: Any, path: str = '') -> List[dict]:
+    """
+    Минимальный JSON Patch (RFC 6902) от old к new.
+
+    Словари сравниваются по ключам, списки одинаковой длины - поэлементно,
+    списки разной длины и значения разных типов заменяются целиком.
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old.keys() - new.keys():
+            ops.append({'op': 'remove', 'path': f'{path}/{_escape(key)}'})
+        for key, value in new.items():
+            child = f'{path}/{_escape(key)}'
+            if key not in old:
+                ops.append({'op': 'add', 'path': child, 'value': value})
+            else:
+                ops.extend(make_patch(old[key], value, child))
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            ops.extend(make_patch(old_item, new_item, f'{path}/{index}'))
+        return ops
+    return [{'op': 'replace', 'path': path, 'value': new}]
+
+
+def op_metric(op: dict) -> str:
+    """Имя метрики, которую затрагивает операция (первый сегмент пути)."""
+    return op['path'].split('/', 2)[1].replace('~1', '/').replace('~0', '~')
+
+
+def filter_ops(ops: Iterable[dict], metrics: Optional[Iterable[str]]) -> List[dict]:
+    if metrics is None:
+        return list(ops)
+    wanted = set(metrics)
+    return [op for op in ops if op_metric(op) in wanted]
+
+
+def filter_state(state: Dict[str, Any], metrics: Optional[Iterable[str]]) -> Dict[str, Any]:
+    if metrics is None:
+        return dict(state)
+    return {name: value for name, value in state.items() if name in set(metrics)}
+
+
+# ==================== STATE ====================
+
+def _read_state(sid: str) -> Optional[dict]:
+    try:
+        return cache.get(STATE_KEY.format(sid))
+    except Exception as e:
+        logger.warning("Dashboard stream %s state read failed: %s", sid, e)
+        return None
+
+
+def register_stream(sid: str) -> None:
+    """
+    Поток с подписчиками публикуется задачей publish_dashboard_metrics_task.
+
+    ZADD обновляет время только своего потока - без чтения и перезаписи
+    общего словаря, поэтому одновременные регистрации не теряются.
+    """
+    client = _get_client()
+    if client is None:
+        return
+    try:
+        client.zadd(STREAMS_KEY, {sid: time.time()})
+    except Exception as e:
+        logger.warning("Dashboard stream %s registration failed: %s", sid, e)
+
+
+def registered_streams() -> List[str]:
+    """Потоки, продлённые за последние DASHBOARD_STREAM_REGISTRATION_TTL секунд."""
+    sids = {stream_id(None, '24h')}
+    client = _get_client()
+    if client is None:
+        return sorted(sids)
+    cutoff = time.time() - _registration_ttl()
+    try:
+        pipe = client.pipeline()
+        pipe.zremrangebyscore(STREAMS_KEY, '-inf', cutoff)
+        pipe.zrange(STREAMS_KEY, 0, -1)
+        _, members = pipe.execute()
+    except Exception as e:
+        logger.warning("Dashboard streams registry read failed: %s", e)
+        return sorted(sids)
+    for member in members:
+        sids.add(member.decode() if isinstance(member, bytes) else member)
+    return sorted(sids)
+
+
+def _current_metrics(service, sid: str) -> Dict[str, Any]:
+    department_id, period = _parse_stream_id(sid)
+    metrics = service.get_current_metrics(department_id=department_id, period=period)
+    metrics.pop('timestamp', None)
+    return metrics
+
+
+def snapshot(service, sid: str) -> dict:
+    """Текущее состояние потока {'epoch', 'seq', 'metrics'}; публикует его, если потока ещё нет."""
+    state = _read_state(sid)
+    if state is None or 'epoch' not in state:
+        publish(service, sid)
+        state = _read_state(sid)
+    if state is None:
+        # Кэш недоступен - отдаём состояние без истории
+        return {'epoch': None, 'seq': 0, 'metrics': _current_metrics(service, sid)}
+    return state
+
+
+def deltas_since(sid: str, since: int, epoch: Optional[str]) -> Optional[List[dict]]:
+    """
+    Дельты после since в эпохе epoch.
+
+    None - эпоха сменилась или журнал уже не покрывает since (нужен снимок).
+    """
+    state = _read_state(sid)
+    if state is None or not epoch or state.get('epoch') != epoch or since > state['seq']:
+        return None
+    log = [entry for entry in state.get('log', []) if entry['seq'] > since]
+    expected = state['seq'] - since
+    if len(log) != expected:
+        return None
+    return log
+
+
+def publish(service, sid: str) -> Optional[int]:
+    """
+    Публикует изменения потока: дельта к опубликованному состоянию.
+
+    Если состояния нет (первая публикация или оно пропало из кэша),
+    начинается новая эпоха: подписчики получают metrics_reset и
+    запрашивают снимок.
+
+    Returns:
+        Новый seq или None (нет изменений / публикация уже идёт)
+    """
+    key = STATE_KEY.format(sid)
+    token = metrics_cache.acquire(key)
+    if token is None:
+        return None
+    try:
+        metrics = _current_metrics(service, sid)
+        state = _read_state(sid)
+        reset = state is None or 'epoch' not in state
+        if reset:
+            state = {'epoch': uuid.uuid4().hex, 'seq': 0, 'metrics': {}, 'log': []}
+            ops = []  # снимок новой эпохи - без дельты, клиенты получают его целиком
+        else:
+            ops = make_patch(state['metrics'], metrics)
+            if not ops:
+                return None
+        epoch = state['epoch']
+        seq = state['seq'] + 1
+        log = (state.get('log', []) + ([{'seq': seq, 'ops': ops}] if ops else []))[-_log_size():]
+        try:
+            cache.set(key, {'epoch': epoch, 'seq': seq, 'metrics': metrics, 'log': log}, _state_ttl())
+        except Exception as e:
+            logger.warning("Dashboard stream %s state write failed: %s", sid, e)
+            return None
+    finally:
+        metrics_cache.release(key, token)
+
+    if reset:
+        message = {'type': 'metrics_reset', 'stream': sid, 'epoch': epoch, 'seq': seq}
+    else:
+        message = {'type': 'metrics_delta', 'stream': sid, 'epoch': epoch, 'seq': seq, 'ops': ops}
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(channel_layer.group_send)(stream_group(sid), message)
+    except Exception as e:
+        logger.warning("Dashboard stream %s broadcast failed: %s", sid, e)
+    return seq
+
+
+def publish_registered(service) -> int:
+    """Публикует все потоки с недавними подписчиками; возвращает число дельт."""
+    published = 0
+    for sid in registered_streams():
+        try:
+            if publish(service, sid) is not None:
+                published += 1
+        except Exception as e:
+            logger.warning("Dashboard stream %s publish failed: %s", sid, e)
+    return published
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+DURATION_SQL = "COALESCE(SUM(GREATEST(0, FLOOR(EXTRACT(EPOCH FROM exit_time - entry_time))))::bigint, 0)"
+
+SOURCES = (
+    ('official', 'visitors_visit'),
+    ('student', 'visitors_studentvisit'),
+)
+
+
+def backfill_rollups(apps, schema_editor):
+    """Заполняет агрегаты по всей истории визитов."""
+    with schema_editor.connection.cursor() as cursor:
+        for kind, table in SOURCES:
+            cursor.execute(
+                "INSERT INTO realtime_dashboard_visitrolluphourly "
+                "(bucket, department_id, kind, status, visits, completed, duration_seconds) "
+                "SELECT date_trunc('hour', entry_time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', "
+                f"department_id, %s, status, COUNT(*), COUNT(exit_time), {DURATION_SQL} "
+                f"FROM {table} WHERE entry_time IS NOT NULL AND department_id IS NOT NULL "
+                "GROUP BY 1, 2, 4",
+                [kind],
+            )
+            cursor.execute(
+                "INSERT INTO realtime_dashboard_visitrollupdaily "
+                "(day, department_id, kind, status, visits, completed, duration_seconds) "
+                "SELECT (entry_time AT TIME ZONE %s)::date, "
+                f"department_id, %s, status, COUNT(*), COUNT(exit_time), {DURATION_SQL} "
+                f"FROM {table} WHERE entry_time IS NOT NULL AND department_id IS NOT NULL "
+                "GROUP BY 1, 2, 4",
+                [settings.TIME_ZONE, kind],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('departments', '0003_alter_department_name'),
+        ('realtime_dashboard', '0005_alter_dashboardmetric_metric_type'),
+        ('visitors', '0048_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitRollupDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('official', 'Официальный'), ('student', 'Студенческий')], max_length=10, verbose_name='Тип визита')),
+                ('status', models.CharField(max_length=20, verbose_name='Статус')),
+                ('visits', models.IntegerField(default=0, verbose_name='Визитов')),
+                ('completed', models.IntegerField(default=0, verbose_name='Завершённых визитов')),
+                ('duration_seconds', models.BigIntegerField(default=0, help_text='Сумма (exit_time - entry_time) завершённых визитов', verbose_name='Суммарная длительность, с')),
+                ('day', models.DateField(verbose_name='День (локальная дата)')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='departments.department', verbose_name='Департамент')),
+            ],
+            options={
+                'verbose_name': 'Дневной агрегат визитов',
+                'verbose_name_plural': 'Дневные агрегаты визитов',
+                'indexes': [models.Index(fields=['department', 'day'], name='rollup_daily_dept_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'department', 'kind', 'status'), name='rollup_daily_unique_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitRollupHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('official', 'Официальный'), ('student', 'Студенческий')], max_length=10, verbose_name='Тип визита')),
+                ('status', models.CharField(max_length=20, verbose_name='Статус')),
+                ('visits', models.IntegerField(default=0, verbose_name='Визитов')),
+                ('completed', models.IntegerField(default=0, verbose_name='Завершённых визитов')),
+                ('duration_seconds', models.BigIntegerField(default=0, help_text='Сумма (exit_time - entry_time) завершённых визитов', verbose_name='Суммарная длительность, с')),
+                ('bucket', models.DateTimeField(verbose_name='Час (начало, UTC)')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='departments.department', verbose_name='Департамент')),
+            ],
+            options={
+                'verbose_name': 'Почасовой агрегат визитов',
+                'verbose_name_plural': 'Почасовые агрегаты визитов',
+                'indexes': [models.Index(fields=['department', 'bucket'], name='rollup_hourly_dept_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'department', 'kind', 'status'), name='rollup_hourly_unique_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realtime_dashboard', '0006_visit_rollups'),
+        ('visitors', '0048_exportjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='realtimeevent',
+            index=models.Index(fields=['created_at', 'id'], name='rt_event_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-19 22:05
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realtime_dashboard', '0007_realtimeevent_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=64, verbose_name='Ряд')),
+                ('labels', models.CharField(blank=True, default='', max_length=100, verbose_name='Метки')),
+                ('resolution', models.CharField(choices=[('5m', '5 минут'), ('1h', 'Час'), ('1d', 'День')], max_length=2, verbose_name='Интервал')),
+                ('bucket', models.DateTimeField(verbose_name='Начало интервала')),
+                ('value', models.FloatField(verbose_name='Среднее значение')),
+                ('min_value', models.FloatField(verbose_name='Минимум')),
+                ('max_value', models.FloatField(verbose_name='Максимум')),
+                ('samples', models.PositiveIntegerField(default=1, verbose_name='Замеров')),
+            ],
+            options={
+                'verbose_name': 'Точка метрики дашборда',
+                'verbose_name_plural': 'Точки метрик дашборда',
+            },
+        ),
+        migrations.DeleteModel(
+            name='DashboardMetric',
+        ),
+        migrations.AddIndex(
+            model_name='metricpoint',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['bucket'], name='metric_point_bucket_brin'),
+        ),
+        migrations.AddConstraint(
+            model_name='metricpoint',
+            constraint=models.UniqueConstraint(fields=('metric', 'labels', 'resolution', 'bucket'), name='metric_point_unique_key'),
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.1 on 2026-10-19 22:40
+
+from datetime import datetime, timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+TABLE = 'realtime_dashboard_realtimeevent'
+OLD_TABLE = f'{TABLE}_old'
+SEQUENCE = f'{TABLE}_part_id_seq'
+PREMAKE_DAYS = 7
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def partition_events(apps, schema_editor):
+    """
+    Пересоздаёт таблицу событий как PARTITION BY RANGE (created_at) с
+    секциями по локальным суткам (имена и границы - как в partitions.py).
+
+    Первичный ключ секционированной таблицы обязан включать ключ
+    секционирования: (id, created_at). Индексы и внешние ключи переносятся
+    со старой таблицы с прежними именами.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = %s::regclass AND NOT indisprimary",
+            [TABLE],
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT MIN(created_at), COALESCE(MAX(id), 0) FROM "{TABLE}"')
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+        cursor.execute(f'ALTER TABLE "{OLD_TABLE}" RENAME CONSTRAINT "{TABLE}_pkey" TO "{OLD_TABLE}_pkey"')
+        cursor.execute(f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}") PARTITION BY RANGE (created_at)')
+        cursor.execute(f'CREATE SEQUENCE "{SEQUENCE}" OWNED BY "{TABLE}".id')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN id SET DEFAULT nextval(\'"{SEQUENCE}"\')')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_pkey" PRIMARY KEY (id, created_at)')
+        cursor.execute(f'CREATE TABLE "{TABLE}_default" PARTITION OF "{TABLE}" DEFAULT')
+
+        today = timezone.localdate()
+        day = timezone.localtime(oldest).date() if oldest else today
+        while day <= today + timedelta(days=PREMAKE_DAYS):
+            lower, upper = _midnight(day), _midnight(day + timedelta(days=1))
+            cursor.execute(
+                f'CREATE TABLE "{TABLE}_p{day:%Y%m%d}" PARTITION OF "{TABLE}" '
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            day += timedelta(days=1)
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"')
+        if max_id:
+            cursor.execute("SELECT setval(%s, %s)", [SEQUENCE, max_id])
+        cursor.execute(f'DROP TABLE "{OLD_TABLE}"')
+
+        for definition in index_defs:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+
+def unpartition_events(apps, schema_editor):
+    """Обратно в обычную таблицу (строки всех секций, включая DEFAULT)."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = %s::regclass AND NOT indisprimary",
+            [TABLE],
+        )
+        index_defs = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{OLD_TABLE}"')
+        cursor.execute(f'ALTER TABLE "{OLD_TABLE}" RENAME CONSTRAINT "{TABLE}_pkey" TO "{OLD_TABLE}_pkey"')
+        cursor.execute(f'CREATE TABLE "{TABLE}" (LIKE "{OLD_TABLE}")')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_pkey" PRIMARY KEY (id)')
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{OLD_TABLE}"')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{TABLE}\"', 'id'), "
+            f'COALESCE((SELECT MAX(id) FROM "{TABLE}"), 0) + 1, false)'
+        )
+        cursor.execute(f'DROP TABLE "{OLD_TABLE}" CASCADE')
+
+        for definition in index_defs:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realtime_dashboard', '0008_metric_points'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_events, unpartition_events),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.1 on 2026-10-19 23:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Умолчания LAYOUT_VERSION 1 на момент миграции:
+# имя -> (title, position_x, position_y, width, height, config); refresh_interval - 30
+DEFAULT_WIDGETS = {
+    'visitors_counter': ('Всего посетителей', 0, 0, 3, 2, {'metric': 'visitors_count', 'color': 'blue'}),
+    'active_visits': ('В здании сейчас', 3, 0, 3, 2, {'metric': 'active_visits', 'color': 'green'}),
+    'today_registrations': ('Регистраций сегодня', 6, 0, 3, 2, {'metric': 'today_registrations', 'color': 'orange'}),
+    'avg_duration': ('Средняя длительность', 9, 0, 3, 2, {'metric': 'avg_visit_duration', 'color': 'purple'}),
+    'hourly_chart': ('Посещения по часам', 0, 2, 8, 4, {'metric': 'hourly_stats', 'chart_type': 'line'}),
+    'department_chart': ('По департаментам', 8, 2, 4, 4, {'metric': 'department_stats', 'chart_type': 'pie'}),
+    'recent_events': ('Последние события', 0, 6, 6, 4, {'metric': 'recent_events', 'limit': 10}),
+    'active_visits_table': ('Активные визиты', 6, 6, 6, 4, {'metric': 'active_visits', 'show_table': True}),
+    'status_distribution': ('Статусы визитов', 0, 10, 4, 4, {'metric': 'status_distribution', 'chart_type': 'pie'}),
+    'weekly_trend': ('Визиты по дням недели', 4, 10, 8, 4, {'metric': 'weekly_trend', 'chart_type': 'bar'}),
+    'duration_distribution': ('Распределение по длительности', 0, 14, 6, 4, {'metric': 'duration_distribution', 'chart_type': 'bar'}),
+    'visitor_type_comparison': ('Официальные vs Студенты', 6, 14, 6, 4, {'metric': 'visitor_type_comparison', 'chart_type': 'line'}),
+}
+DEFAULT_REFRESH_INTERVAL = 30
+INT_FIELDS = ('position_x', 'position_y', 'width', 'height', 'refresh_interval')
+
+
+def _widget_overrides(widget):
+    """Отличия строки DashboardWidget от умолчания (в формате DashboardLayout.overrides)."""
+    title, position_x, position_y, width, height, config = DEFAULT_WIDGETS[widget.name]
+    defaults = {
+        'title': title, 'position_x': position_x, 'position_y': position_y,
+        'width': width, 'height': height, 'refresh_interval': DEFAULT_REFRESH_INTERVAL,
+    }
+    item = {}
+    if widget.title and widget.title != title:
+        item['title'] = widget.title
+    for field in INT_FIELDS:
+        value = getattr(widget, field)
+        if value != defaults[field] and value >= 0:
+            item[field] = value
+    if isinstance(widget.config, dict):
+        changed = {key: value for key, value in widget.config.items() if config.get(key) != value}
+        if changed:
+            item['config'] = changed
+    return item
+
+
+def migrate_widget_edits(apps, schema_editor):
+    """
+    Переносит правки общих строк DashboardWidget в DashboardLayout.
+
+    Строки были одни на всех, поэтому их отличия от умолчаний записываются
+    каждому активному пользователю - видимая раскладка после миграции не
+    меняется. Пользователи, созданные позже, получают умолчания из кода.
+    Виджеты с именами не из умолчаний перенести некуда - они не переносятся.
+    """
+    DashboardWidget = apps.get_model('realtime_dashboard', 'DashboardWidget')
+    DashboardLayout = apps.get_model('realtime_dashboard', 'DashboardLayout')
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+    overrides = {}
+    widgets = DashboardWidget.objects.filter(
+        is_active=True, name__in=list(DEFAULT_WIDGETS),
+    ).order_by('position_y', 'position_x', 'id')
+    for widget in widgets:
+        # Дубликаты имени: показывался первый по позиции
+        if widget.name in overrides:
+            continue
+        overrides[widget.name] = _widget_overrides(widget)
+    overrides = {name: item for name, item in overrides.items() if item}
+    if not overrides:
+        return
+
+    user_ids = User.objects.filter(is_active=True).values_list('id', flat=True)
+    DashboardLayout.objects.bulk_create(
+        (DashboardLayout(user_id=user_id, overrides=overrides, base_version=1) for user_id in user_ids.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('realtime_dashboard', '0009_partition_realtimeevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('overrides', models.JSONField(blank=True, default=dict, help_text='{имя виджета: {title, position_x, position_y, width, height, refresh_interval, hidden, config}}', verbose_name='Переопределения виджетов')),
+                ('base_version', models.PositiveIntegerField(default=1, help_text='LAYOUT_VERSION, действовавшая при сохранении настроек', verbose_name='Версия раскладки по умолчанию')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dashboard_layout', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Раскладка дашборда пользователя',
+                'verbose_name_plural': 'Раскладки дашборда пользователей',
+            },
+        ),
+        migrations.RunPython(migrate_widget_edits, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='DashboardWidget',
+        ),
+    ]
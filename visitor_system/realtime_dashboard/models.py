@@ -1,64 +1,63 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 
-class DashboardMetric(models.Model):
+class MetricPoint(models.Model):
     """
-    Модель для хранения метрик дашборда
+    Точка временного ряда метрики дашборда (metric_series.py).
+
+    Ряд задаётся именем (например, 'active_visits.count') и строкой меток
+    ('department=3' или пусто). Снимки пишутся в интервалы по 5 минут и
+    прореживаются до часовых и дневных; в каждой точке - среднее, минимум,
+    максимум и число исходных замеров.
     """
-    METRIC_TYPES = [
-        ('visitors_count', 'Количество посетителей'),
-        ('active_visits', 'Активные визиты'),
-        ('today_registrations', 'Регистрации за сегодня'),
-        ('avg_visit_duration', 'Средняя длительность визита'),
-        ('department_stats', 'Статистика по департаментам'),
-        ('hourly_stats', 'Почасовая статистика'),
-        ('security_alerts', 'Предупреждения безопасности'),
-        ('status_distribution', 'Распределение по статусам'),
-        ('weekly_trend', 'Тренд по дням недели'),
-        ('duration_distribution', 'Распределение по длительности'),
-        ('visitor_type_comparison', 'Сравнение типов посетителей'),
+    RESOLUTION_RAW = '5m'
+    RESOLUTION_HOURLY = '1h'
+    RESOLUTION_DAILY = '1d'
+
+    RESOLUTION_CHOICES = [
+        (RESOLUTION_RAW, '5 минут'),
+        (RESOLUTION_HOURLY, 'Час'),
+        (RESOLUTION_DAILY, 'День'),
     ]
 
-    metric_type = models.CharField(
-        max_length=50,
-        choices=METRIC_TYPES,
-        verbose_name="Тип метрики"
-    )
-
-    value = models.JSONField(
-        default=dict,
-        verbose_name="Значение метрики",
-        help_text="JSON данные с метрикой"
-    )
-
-    timestamp = models.DateTimeField(
-        default=timezone.now,
-        verbose_name="Время записи"
-    )
-
-    is_active = models.BooleanField(
-        default=True,
-        verbose_name="Активная метрика"
-    )
+    metric = models.CharField(max_length=64, verbose_name="Ряд")
+    labels = models.CharField(max_length=100, blank=True, default='', verbose_name="Метки")
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES, verbose_name="Интервал")
+    bucket = models.DateTimeField(verbose_name="Начало интервала")
+    value = models.FloatField(verbose_name="Среднее значение")
+    min_value = models.FloatField(verbose_name="Минимум")
+    max_value = models.FloatField(verbose_name="Максимум")
+    samples = models.PositiveIntegerField(default=1, verbose_name="Замеров")
 
     class Meta:
-        verbose_name = "Метрика дашборда"
-        verbose_name_plural = "Метрики дашборда"
-        ordering = ['-timestamp']
+        verbose_name = "Точка метрики дашборда"
+        verbose_name_plural = "Точки метрик дашборда"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['metric', 'labels', 'resolution', 'bucket'],
+                name='metric_point_unique_key',
+            ),
+        ]
         indexes = [
-            models.Index(fields=['metric_type', 'timestamp']),
-            models.Index(fields=['is_active']),
+            # Точки пишутся по возрастанию времени: BRIN для очистки по bucket
+            BrinIndex(fields=['bucket'], name='metric_point_bucket_brin'),
         ]
 
     def __str__(self):
-        return f"{self.get_metric_type_display()} - {self.timestamp.strftime('%H:%M:%S')}"
+        labels = f"{{{self.labels}}}" if self.labels else ''
+        return f"{self.metric}{labels} {self.resolution} {self.bucket:%Y-%m-%d %H:%M}: {self.value}"
 
 
 class RealtimeEvent(models.Model):
     """
     Модель для событий в реальном времени
+
+    В PostgreSQL таблица секционирована по created_at (сутки, миграция 0009):
+    первичный ключ в БД - (id, created_at), секции создаёт и удаляет
+    partitions.py.
     """
     EVENT_TYPES = [
         ('visit_created', 'Новый визит'),
@@ -136,6 +135,8 @@ class RealtimeEvent(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['event_type', 'created_at']),
+            # Лента событий без фильтра по типу: keyset по (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='rt_event_created_id_idx'),
             models.Index(fields=['priority']),
             models.Index(fields=['is_read']),
         ]
@@ -149,114 +150,120 @@ class RealtimeEvent(models.Model):
         self.save(update_fields=['is_read'])
 
 
-class DashboardWidget(models.Model):
-    """
-    Модель для виджетов дашборда
+class DashboardLayout(models.Model):
     """
-    WIDGET_TYPES = [
-        ('counter', 'Счетчик'),
-        ('chart_line', 'Линейный график'),
-        ('chart_bar', 'Столбчатый график'),
-        ('chart_pie', 'Круговая диаграмма'),
-        ('table', 'Таблица'),
-        ('map', 'Карта'),
-        ('activity_feed', 'Лента активности'),
-        ('alert_list', 'Список предупреждений'),
-    ]
+    Отличия раскладки дашборда пользователя от виджетов по умолчанию.
 
-    name = models.CharField(
-        max_length=100,
-        verbose_name="Название виджета"
+    Виджеты по умолчанию описаны в коде (widget_layout.DEFAULT_WIDGETS);
+    здесь хранятся только переопределённые поля: {имя виджета: {поле: значение}}.
+    Пользователь без настроек строки не имеет.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='dashboard_layout',
+        verbose_name="Пользователь"
     )
 
-    widget_type = models.CharField(
-        max_length=30,
-        choices=WIDGET_TYPES,
-        verbose_name="Тип виджета"
+    overrides = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Переопределения виджетов",
+        help_text="{имя виджета: {title, position_x, position_y, width, height, refresh_interval, hidden, config}}"
     )
 
-    title = models.CharField(
-        max_length=200,
-        verbose_name="Заголовок"
+    base_version = models.PositiveIntegerField(
+        default=1,
+        verbose_name="Версия раскладки по умолчанию",
+        help_text="LAYOUT_VERSION, действовавшая при сохранении настроек"
     )
 
-    description = models.TextField(
-        blank=True,
-        verbose_name="Описание"
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Обновлено"
     )
 
-    config = models.JSONField(
-        default=dict,
-        verbose_name="Конфигурация виджета",
-        help_text="JSON настройки виджета"
-    )
+    class Meta:
+        verbose_name = "Раскладка дашборда пользователя"
+        verbose_name_plural = "Раскладки дашборда пользователей"
 
-    position_x = models.IntegerField(
-        default=0,
-        verbose_name="Позиция X"
-    )
+    def __str__(self):
+        return f"{self.user} ({len(self.overrides or {})} виджетов)"
 
-    position_y = models.IntegerField(
+
+class VisitRollupBase(models.Model):
+    """
+    Предагрегированные визиты: департамент × тип × статус × интервал.
+
+    Визит попадает в интервал своего entry_time (визиты без входа не
+    учитываются - как и в прежних агрегатах по entry_time). Строки
+    обновляются инкрементально сигналами (rollup_signals.py) и
+    периодически пересчитываются из исходных таблиц (rollups.repair).
+    """
+
+    KIND_OFFICIAL = 'official'
+    KIND_STUDENT = 'student'
+
+    KIND_CHOICES = [
+        (KIND_OFFICIAL, 'Официальный'),
+        (KIND_STUDENT, 'Студенческий'),
+    ]
+
+    department = models.ForeignKey(
+        'departments.Department',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name="Департамент"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Тип визита")
+    status = models.CharField(max_length=20, verbose_name="Статус")
+    visits = models.IntegerField(default=0, verbose_name="Визитов")
+    completed = models.IntegerField(default=0, verbose_name="Завершённых визитов")
+    duration_seconds = models.BigIntegerField(
         default=0,
-        verbose_name="Позиция Y"
+        verbose_name="Суммарная длительность, с",
+        help_text="Сумма (exit_time - entry_time) завершённых визитов"
     )
 
-    width = models.IntegerField(
-        default=4,
-        verbose_name="Ширина (в колонках)"
-    )
+    class Meta:
+        abstract = True
 
-    height = models.IntegerField(
-        default=3,
-        verbose_name="Высота (в строках)"
-    )
 
-    is_active = models.BooleanField(
-        default=True,
-        verbose_name="Активен"
-    )
+class VisitRollupHourly(VisitRollupBase):
+    bucket = models.DateTimeField(verbose_name="Час (начало, UTC)")
 
-    refresh_interval = models.IntegerField(
-        default=30,
-        verbose_name="Интервал обновления (секунды)"
-    )
+    class Meta:
+        verbose_name = "Почасовой агрегат визитов"
+        verbose_name_plural = "Почасовые агрегаты визитов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket', 'department', 'kind', 'status'],
+                name='rollup_hourly_unique_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['department', 'bucket'], name='rollup_hourly_dept_idx'),
+        ]
 
-    created_by = models.ForeignKey(
-        User,
-        on_delete=models.SET_NULL,
-        null=True,
-        verbose_name="Создал"
-    )
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:00} {self.department_id} {self.kind} {self.status}: {self.visits}"
 
-    created_at = models.DateTimeField(
-        default=timezone.now,
-        verbose_name="Создан"
-    )
 
-    updated_at = models.DateTimeField(
-        auto_now=True,
-        verbose_name="Обновлен"
-    )
+class VisitRollupDaily(VisitRollupBase):
+    day = models.DateField(verbose_name="День (локальная дата)")
 
     class Meta:
-        verbose_name = "Виджет дашборда"
-        verbose_name_plural = "Виджеты дашборда"
-        ordering = ['position_y', 'position_x']
+        verbose_name = "Дневной агрегат визитов"
+        verbose_name_plural = "Дневные агрегаты визитов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'department', 'kind', 'status'],
+                name='rollup_daily_unique_key',
+            ),
+        ]
         indexes = [
-            models.Index(fields=['is_active']),
-            models.Index(fields=['position_y', 'position_x']),
+            models.Index(fields=['department', 'day'], name='rollup_daily_dept_idx'),
         ]
 
     def __str__(self):
-        return f"{self.title} ({self.get_widget_type_display()})"
-        
-    def get_metric_name(self):
-        """Получить имя метрики из конфигурации виджета"""
-        return self.config.get('metric', '')
-        
-    def get_css_classes(self):
-        """Получить CSS классы для виджета"""
-        classes = [f"grid-w-{self.width}", f"grid-h-{self.height}"]
-        if self.config.get('color'):
-            classes.append(f"color-{self.config['color']}")
-        return " ".join(classes)
\ No newline at end of file
+        return f"{self.day} {self.department_id} {self.kind} {self.status}: {self.visits}"
@@ -0,0 +1,209 @@
+"""
+Секционирование журнальных таблиц по времени (PostgreSQL, PARTITION BY RANGE).
+
+RealtimeEvent только дописывается и хранится REALTIME_EVENT_RETENTION_DAYS
+дней. Раньше cleanup_old_events удалял старые строки одним большим DELETE,
+конкурируя со вставками и раздувая индексы. Теперь таблица секционирована
+по локальным суткам (миграция 0009):
+- ensure_partitions заранее создаёт секции на premake интервалов вперёд;
+- drop_expired удаляет секции целиком (DROP TABLE - без перебора строк);
+- секция DEFAULT принимает строки, для которых секция не была создана
+  вовремя, - вставки не падают, а maintain чистит её обычным DELETE.
+
+Обслуживание: management-команда manage_partitions и ежедневная задача
+cleanup_old_events. Новые журнальные таблицы описываются в PARTITIONED_TABLES.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_DAY = 'day'
+INTERVAL_WEEK = 'week'
+
+_SUFFIX_RE = re.compile(r'_p(\d{8})$')
+
+
+def _event_retention_days() -> int:
+    return getattr(settings, 'REALTIME_EVENT_RETENTION_DAYS', 7)
+
+
+def _premake() -> int:
+    return getattr(settings, 'PARTITION_PREMAKE', 7)
+
+
+@dataclass(frozen=True)
+class PartitionedTable:
+    table: str
+    # Ключ секционирования (DateTimeField)
+    column: str
+    interval: str
+    retention_days: Callable[[], int]
+
+    @property
+    def default_partition(self) -> str:
+        return f'{self.table}_default'
+
+
+PARTITIONED_TABLES: Dict[str, PartitionedTable] = {
+    'realtime_events': PartitionedTable(
+        'realtime_dashboard_realtimeevent', 'created_at', INTERVAL_DAY, _event_retention_days,
+    ),
+}
+
+
+def period_start(spec: PartitionedTable, day: date) -> date:
+    if spec.interval == INTERVAL_WEEK:
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def next_period(spec: PartitionedTable, start: date) -> date:
+    return start + timedelta(days=7 if spec.interval == INTERVAL_WEEK else 1)
+
+
+def partition_name(spec: PartitionedTable, start: date) -> str:
+    return f'{spec.table}_p{start:%Y%m%d}'
+
+
+def bounds(start: date, end: date) -> Tuple[datetime, datetime]:
+    """Границы секции: локальная полночь (TIME_ZONE) начала и конца."""
+    def midnight(day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return midnight(start), midnight(end)
+
+
+def is_partitioned(spec: PartitionedTable) -> bool:
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [spec.table],
+        )
+        return cursor.fetchone() is not None
+
+
+def existing_partitions(spec: PartitionedTable) -> Dict[str, date]:
+    """{имя секции: начало интервала} (секция DEFAULT не входит)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND pg_table_is_visible(p.oid)",
+            [spec.table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    result = {}
+    for name in names:
+        match = _SUFFIX_RE.search(name)
+        if match:
+            result[name] = datetime.strptime(match.group(1), '%Y%m%d').date()
+    return result
+
+
+def _create_partition(spec: PartitionedTable, name: str, lower: datetime, upper: datetime) -> None:
+    """
+    Создаёт секцию [lower, upper).
+
+    Если строки этого интервала уже попали в DEFAULT, они переносятся в
+    новую секцию в той же транзакции (иначе PostgreSQL не даст её создать).
+    """
+    values = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    in_range = f'"{spec.column}" >= %s AND "{spec.column}" < %s'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{spec.default_partition}" WHERE {in_range})',
+            [lower, upper],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{spec.table}" {values}')
+            return
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{spec.table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{spec.default_partition}" WHERE {in_range} RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [lower, upper],
+        )
+        logger.warning("Moved %d rows from %s to %s", cursor.rowcount, spec.default_partition, name)
+        cursor.execute(f'ALTER TABLE "{spec.table}" ATTACH PARTITION "{name}" {values}')
+
+
+def ensure_partitions(spec: PartitionedTable, premake: Optional[int] = None,
+                      today: Optional[date] = None, dry_run: bool = False) -> List[str]:
+    """
+    Создаёт недостающие секции от текущего интервала на premake интервалов вперёд.
+
+    Returns:
+        Имена созданных (при dry_run - недостающих) секций
+    """
+    premake = _premake() if premake is None else premake
+    today = today or timezone.localdate()
+    existing = set(existing_partitions(spec))
+    created = []
+    start = period_start(spec, today)
+    for _ in range(premake + 1):
+        end = next_period(spec, start)
+        name = partition_name(spec, start)
+        if name not in existing:
+            if not dry_run:
+                _create_partition(spec, name, *bounds(start, end))
+            created.append(name)
+        start = end
+    if created and not dry_run:
+        logger.info("Partitions created for %s: %s", spec.table, ', '.join(created))
+    return created
+
+
+def drop_expired(spec: PartitionedTable, retention_days: Optional[int] = None,
+                 today: Optional[date] = None, dry_run: bool = False) -> List[str]:
+    """
+    Удаляет секции, целиком вышедшие за срок хранения, и старые строки из DEFAULT.
+
+    Returns:
+        Имена удалённых (при dry_run - подлежащих удалению) секций
+    """
+    retention_days = spec.retention_days() if retention_days is None else retention_days
+    today = today or timezone.localdate()
+    cutoff = today - timedelta(days=retention_days)
+    dropped = []
+    for name, start in sorted(existing_partitions(spec).items(), key=lambda item: item[1]):
+        if next_period(spec, start) > cutoff:
+            continue
+        if not dry_run:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS "{name}"')
+        dropped.append(name)
+
+    if not dry_run:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM "{spec.default_partition}" WHERE "{spec.column}" < %s',
+                [bounds(cutoff, cutoff)[0]],
+            )
+            if cursor.rowcount:
+                logger.warning(
+                    "Deleted %d expired rows from %s: partitions were not created in time",
+                    cursor.rowcount, spec.default_partition,
+                )
+    if dropped and not dry_run:
+        logger.info("Partitions dropped for %s: %s", spec.table, ', '.join(dropped))
+    return dropped
+
+
+def maintain(spec: PartitionedTable, premake: Optional[int] = None,
+             retention_days: Optional[int] = None, dry_run: bool = False) -> Dict[str, List[str]]:
+    """Создание будущих и удаление просроченных секций."""
+    return {
+        'created': ensure_partitions(spec, premake=premake, dry_run=dry_run),
+        'dropped': drop_expired(spec, retention_days=retention_days, dry_run=dry_run),
+    }
@@ -0,0 +1,52 @@
+"""
+Инкрементальное обновление агрегатов визитов (rollups.py).
+
+Состояние визита до сохранения запоминает counter_signals
+(_counter_state_before); после коммита вклад визита переносится из
+прежних строк агрегатов в новые. Пропущенные изменения (bulk update,
+queryset.update()) исправляет периодический repair_visit_rollups_task.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from visitors.models import StudentVisit, Visit
+from .counters import counter_state
+from .rollups import apply_change, kind_for_model
+
+logger = logging.getLogger(__name__)
+
+
+def _schedule_rollup_change(sender, before, after):
+    if before == after:
+        return
+    kind = kind_for_model(sender)
+
+    def apply():
+        try:
+            apply_change(kind, before, after)
+        except Exception as e:
+            logger.warning("Visit rollup update failed (%s): %s", kind, e)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_save, sender=StudentVisit)
+def update_rollups_on_visit_save(sender, instance, created, **kwargs):
+    try:
+        before = None if created else getattr(instance, '_counter_state_before', None)
+        _schedule_rollup_change(sender, before, counter_state(instance))
+    except Exception as e:
+        logger.error("Error scheduling visit rollup update: %s", e)
+
+
+@receiver(post_delete, sender=Visit)
+@receiver(post_delete, sender=StudentVisit)
+def update_rollups_on_visit_delete(sender, instance, **kwargs):
+    try:
+        _schedule_rollup_change(sender, counter_state(instance), None)
+    except Exception as e:
+        logger.error("Error scheduling visit rollup update: %s", e)
@@ -0,0 +1,273 @@
+"""
+Предагрегированные визиты для графиков дашборда (VisitRollupHourly/Daily).
+
+Раньше каждый график на промахе кэша заново агрегировал Visit и
+StudentVisit (get_today_registrations - 48 COUNT-запросов). Теперь:
+- при изменении визита (создание, check-in/out, смена статуса/департамента)
+  сигнал rollup_signals.py после коммита вычитает прежний вклад визита из
+  его строк агрегатов и добавляет новый (INSERT ... ON CONFLICT DO UPDATE);
+- задача repair_visit_rollups_task ежечасно пересчитывает недавнее окно
+  целиком из исходных таблиц (bulk update, queryset.update() и потерянные
+  on_commit-обновления сигналы не видят), а deep_repair_visit_rollups_task
+  раз в сутки - всё окно, которое читают графики (год дневных агрегатов
+  для get_visitor_type_comparison, месяц часовых для counts_since);
+- management-команда rebuild_visit_rollups пересчитывает произвольный период.
+
+Часовой интервал - час entry_time в UTC, дневной - локальная дата
+(TIME_ZONE) entry_time.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from visitors.models import StudentVisit, Visit
+from .models import VisitRollupBase, VisitRollupDaily, VisitRollupHourly
+
+logger = logging.getLogger(__name__)
+
+KIND_OFFICIAL = VisitRollupBase.KIND_OFFICIAL
+KIND_STUDENT = VisitRollupBase.KIND_STUDENT
+
+SOURCES = (
+    (KIND_OFFICIAL, Visit),
+    (KIND_STUDENT, StudentVisit),
+)
+
+
+def _deep_repair_days() -> int:
+    return getattr(settings, 'ROLLUP_DEEP_REPAIR_DAYS', 366)
+
+
+def _deep_repair_hours() -> int:
+    return getattr(settings, 'ROLLUP_DEEP_REPAIR_HOURS', 31 * 24)
+
+
+def kind_for_model(model) -> str:
+    return KIND_STUDENT if model is StudentVisit else KIND_OFFICIAL
+
+
+def hour_bucket(value: datetime) -> datetime:
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def local_day(value: datetime) -> date:
+    return timezone.localtime(value).date()
+
+
+# ==================== INCREMENTAL UPDATES ====================
+
+def contribution(state) -> Optional[Tuple[tuple, tuple]]:
+    """
+    Вклад визита в агрегаты.
+
+    Args:
+        state: (status, entry_time, exit_time, department_id)
+
+    Returns:
+        ((status, entry_time, department_id), (visits, completed, duration_seconds))
+        или None, если визит в агрегаты не попадает
+    """
+    if state is None:
+        return None
+    status, entry_time, exit_time, department_id = state
+    if entry_time is None or department_id is None:
+        return None
+    if exit_time is not None:
+        duration = max(0, int((exit_time - entry_time).total_seconds()))
+        values = (1, 1, duration)
+    else:
+        values = (1, 0, 0)
+    return (status, entry_time, department_id), values
+
+
+def _upsert_sql(table: str, bucket_column: str) -> str:
+    return (
+        f"INSERT INTO {table} AS r ({bucket_column}, department_id, kind, status, "
+        f"visits, completed, duration_seconds) VALUES %s "
+        f"ON CONFLICT ({bucket_column}, department_id, kind, status) DO UPDATE SET "
+        f"visits = r.visits + EXCLUDED.visits, "
+        f"completed = r.completed + EXCLUDED.completed, "
+        f"duration_seconds = r.duration_seconds + EXCLUDED.duration_seconds"
+    )
+
+
+def _add(model, bucket_column: str, deltas: Dict[tuple, list]) -> None:
+    rows = [key + tuple(values) for key, values in deltas.items() if any(values)]
+    if not rows:
+        return
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = [value for row in rows for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(_upsert_sql(model._meta.db_table, bucket_column) % placeholders, params)
+
+
+def apply_change(kind: str, before, after) -> None:
+    """
+    Переносит вклад визита из состояния before в after (любое может быть None).
+
+    Дельты сворачиваются по ключу, поэтому смена статуса внутри одного
+    интервала - одна строка на таблицу.
+    """
+    old, new = contribution(before), contribution(after)
+    if old == new:
+        return
+    hourly: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0])
+    daily: Dict[tuple, list] = defaultdict(lambda: [0, 0, 0])
+    for item, sign in ((old, -1), (new, 1)):
+        if item is None:
+            continue
+        (status, entry_time, department_id), values = item
+        for target, key in (
+            (hourly, (hour_bucket(entry_time), department_id, kind, status)),
+            (daily, (local_day(entry_time), department_id, kind, status)),
+        ):
+            for i, value in enumerate(values):
+                target[key][i] += sign * value
+    with transaction.atomic():
+        _add(VisitRollupHourly, 'bucket', hourly)
+        _add(VisitRollupDaily, 'day', daily)
+
+
+# ==================== REPAIR ====================
+
+_REPAIR_HOURLY_SQL = """
+    INSERT INTO {rollup} (bucket, department_id, kind, status, visits, completed, duration_seconds)
+    SELECT date_trunc('hour', entry_time AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           department_id, %s, status, COUNT(*),
+           COUNT(exit_time),
+           COALESCE(SUM(GREATEST(0, FLOOR(EXTRACT(EPOCH FROM exit_time - entry_time))))::bigint, 0)
+    FROM {source}
+    WHERE entry_time >= %s AND entry_time < %s AND department_id IS NOT NULL
+    GROUP BY 1, 2, 4
+"""
+
+_REPAIR_DAILY_SQL = """
+    INSERT INTO {rollup} (day, department_id, kind, status, visits, completed, duration_seconds)
+    SELECT (entry_time AT TIME ZONE %s)::date,
+           department_id, %s, status, COUNT(*),
+           COUNT(exit_time),
+           COALESCE(SUM(GREATEST(0, FLOOR(EXTRACT(EPOCH FROM exit_time - entry_time))))::bigint, 0)
+    FROM {source}
+    WHERE entry_time >= %s AND entry_time < %s AND department_id IS NOT NULL
+    GROUP BY 1, 2, 4
+"""
+
+
+def _day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def repair(hours: int = 48, days: int = 35, now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Пересчитывает последние hours часов и days дней из Visit/StudentVisit.
+
+    Окно удаляется и заполняется заново в одной транзакции (INSERT ... SELECT
+    с GROUP BY), поэтому читатели не видят частично пересчитанных данных.
+
+    Returns:
+        {'hourly': строк, 'daily': строк}
+    """
+    now = now or timezone.now()
+    # Визиты с entry_time в будущем (ошибки ввода) тоже попадают в окно
+    until = now + timedelta(days=1)
+    hour_since = hour_bucket(now) - timedelta(hours=hours)
+    day_since = local_day(now) - timedelta(days=days)
+    day_since_dt = _day_start(day_since)
+    until_day = local_day(until) + timedelta(days=1)
+
+    result = {'hourly': 0, 'daily': 0}
+    with transaction.atomic(), connection.cursor() as cursor:
+        VisitRollupHourly.objects.filter(bucket__gte=hour_since).delete()
+        VisitRollupDaily.objects.filter(day__gte=day_since).delete()
+        for kind, model in SOURCES:
+            cursor.execute(
+                _REPAIR_HOURLY_SQL.format(rollup=VisitRollupHourly._meta.db_table, source=model._meta.db_table),
+                [kind, hour_since, until],
+            )
+            result['hourly'] += cursor.rowcount
+            cursor.execute(
+                _REPAIR_DAILY_SQL.format(rollup=VisitRollupDaily._meta.db_table, source=model._meta.db_table),
+                [settings.TIME_ZONE, kind, day_since_dt, _day_start(until_day)],
+            )
+            result['daily'] += cursor.rowcount
+    logger.info(
+        "Visit rollups repaired since %s / %s: %d hourly, %d daily rows",
+        hour_since.isoformat(), day_since.isoformat(), result['hourly'], result['daily'],
+    )
+    return result
+
+
+def deep_repair(now: Optional[datetime] = None) -> Dict[str, int]:
+    """Пересчёт всего окна, которое читают графики (самый длинный период - год)."""
+    return repair(hours=_deep_repair_hours(), days=_deep_repair_days(), now=now)
+
+
+def rebuild(days: int) -> Dict[str, int]:
+    """Полный пересчёт за days дней (часовые агрегаты - за тот же период)."""
+    return repair(hours=days * 24, days=days)
+
+
+# ==================== READ ====================
+
+def _dept(qs, department_id):
+    return qs.filter(department_id=department_id) if department_id else qs
+
+
+def _raw_counts(start: datetime, end: datetime, department_id, *fields) -> Iterable[dict]:
+    """Точные счётчики по исходным таблицам для неполного часа."""
+    for kind, model in SOURCES:
+        qs = _dept(model.objects.filter(entry_time__gte=start, entry_time__lt=end), department_id)
+        for row in qs.values(*fields).annotate(visits=Count('id')).order_by():
+            row['kind'] = kind
+            yield row
+
+
+def counts_since(start_dt: datetime, department_id: Optional[int] = None,
+                 by: Tuple[str, ...] = ('kind',)) -> Dict[tuple, int]:
+    """
+    Количество визитов с entry_time >= start_dt, сгруппированное по полям by
+    ('kind', 'status').
+
+    Полные часы читаются из VisitRollupHourly, начало неполного первого
+    часа досчитывается по исходным таблицам (узкий диапазон по индексу).
+    """
+    first_full_hour = hour_bucket(start_dt)
+    if first_full_hour < start_dt:
+        first_full_hour += timedelta(hours=1)
+
+    totals: Dict[tuple, int] = defaultdict(int)
+    rows = _dept(VisitRollupHourly.objects.filter(bucket__gte=first_full_hour), department_id)
+    for row in rows.values(*by).annotate(total=Sum('visits')).order_by():
+        totals[tuple(row[field] for field in by)] += row['total'] or 0
+
+    if first_full_hour > start_dt:
+        raw_fields = [field for field in by if field != 'kind']
+        for row in _raw_counts(start_dt, first_full_hour, department_id, *raw_fields):
+            totals[tuple(row[field] for field in by)] += row['visits']
+    return dict(totals)
+
+
+def hourly_series(start: datetime, end: datetime,
+                  department_id: Optional[int] = None) -> Dict[Tuple[datetime, str], int]:
+    """{(час, kind): визитов} для часов [start, end)."""
+    rows = _dept(VisitRollupHourly.objects.filter(bucket__gte=start, bucket__lt=end), department_id)
+    return {
+        (row['bucket'], row['kind']): row['total'] or 0
+        for row in rows.values('bucket', 'kind').annotate(total=Sum('visits')).order_by()
+    }
+
+
+def daily_series(start: date, end: date,
+                 department_id: Optional[int] = None) -> Dict[Tuple[date, str], int]:
+    """{(день, kind): визитов} для дней [start, end]."""
+    rows = _dept(VisitRollupDaily.objects.filter(day__gte=start, day__lte=end), department_id)
+    return {
+        (row['day'], row['kind']): row['total'] or 0
+        for row in rows.values('day', 'kind').annotate(total=Sum('visits')).order_by()
+    }
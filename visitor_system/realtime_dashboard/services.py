@@ -1,10 +1,12 @@
+from collections import defaultdict
 from django.db.models import Count
-from django.utils import timezone
+from django.utils import dateformat, timezone
 from datetime import timedelta, datetime
-from django.core.cache import cache
 from visitors.models import Visit, StudentVisit, Guest
 from departments.models import Department
-from .models import DashboardMetric, RealtimeEvent
+from .models import RealtimeEvent
+from . import metric_registry, rollups
+from .duration_stats import DURATION_BUCKETS, duration_stats
 import logging
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
@@ -26,58 +28,30 @@ class DashboardMetricsService:
     Сервис для сбора и обновления метрик дашборда
     """
     
-    def get_current_metrics(self, department_id: int | None = None, period: str | None = None):
-        """Получение текущих метрик с учётом фильтров"""
-        now = timezone.now()
-        # P1: короткий кеш на 5-10 секунд, ключ учитывает фильтры
-        cache_key = f"dash:metrics:dep={department_id or 'all'}:period={(period or '24h').lower()}"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        period = (period or '24h').lower()
-
-        # Определяем временную границу
-        if period == 'today':
-            start_dt = timezone.make_aware(datetime.combine(now.date(), datetime.min.time()))
-        elif period in ('24h', '1d'):
-            start_dt = now - timedelta(hours=24)
-        elif period in ('7d', 'week'):
-            start_dt = now - timedelta(days=7)
-        elif period in ('30d', 'month'):
-            start_dt = now - timedelta(days=30)
-        else:
-            start_dt = now - timedelta(hours=24)
+    def get_current_metrics(self, department_id: int | None = None, period: str | None = None,
+                            metrics: list[str] | None = None):
+        """
+        Текущие метрики с учётом фильтров.
 
-        metrics = {
-            'visitors_count': self.get_visitors_count(start_dt=start_dt),
-            'active_visits': self.get_active_visits(department_id=department_id),
-            'today_registrations': self.get_today_registrations(start_dt=start_dt),
-            'avg_visit_duration': self.get_avg_visit_duration(start_dt=start_dt),
-            'department_stats': self.get_department_stats(),
-            'hourly_stats': self.get_hourly_stats(),
-            'recent_events': self.get_recent_events(),
-            'security_alerts': self.get_security_alerts(),
-            # Новые метрики
-            'status_distribution': self.get_status_distribution(department_id=department_id, period=period),
-            'weekly_trend': self.get_weekly_trend(department_id=department_id),
-            'duration_distribution': self.get_duration_distribution(department_id=department_id, period=period),
-            'visitor_type_comparison': self.get_visitor_type_comparison(department_id=department_id, period=period),
-            'timestamp': now.isoformat()
-        }
+        Args:
+            metrics: Имена нужных метрик (metric_registry.METRICS); None - все
 
-        # Короткое кеширование
-        cache.set(cache_key, metrics, timeout=10)
-        return metrics
+        Каждая метрика считается и кэшируется отдельно (metric_registry):
+        устаревшее значение возвращается сразу, а пересчитывает его одна
+        фоновая задача (refresh_metric_task).
+        """
+        return metric_registry.get_metrics(self, metrics, department_id=department_id, period=period)
     
     def get_visitors_count(self, start_dt: datetime | None = None):
         """Общее количество посетителей"""
-        qs_v = Visit.objects.all()
-        qs_sv = StudentVisit.objects.all()
         if start_dt:
-            qs_v = qs_v.filter(entry_time__gte=start_dt)
-            qs_sv = qs_sv.filter(entry_time__gte=start_dt)
-        total_visits = qs_v.count()
-        total_student_visits = qs_sv.count()
+            # Агрегаты VisitRollupHourly + точный досчёт неполного первого часа
+            counts = rollups.counts_since(start_dt)
+            total_visits = counts.get((rollups.KIND_OFFICIAL,), 0)
+            total_student_visits = counts.get((rollups.KIND_STUDENT,), 0)
+        else:
+            total_visits = Visit.objects.count()
+            total_student_visits = StudentVisit.objects.count()
         unique_guests = Guest.objects.count()
         
         return {
@@ -154,26 +128,19 @@ class DashboardMetricsService:
         # День, по которому строим часовую разбивку
         today = (start_dt or now).date()
         
-        today_visits = Visit.objects.filter(entry_time__gte=start_dt).count()
-        today_student_visits = StudentVisit.objects.filter(entry_time__gte=start_dt).count()
+        counts = rollups.counts_since(start_dt)
+        today_visits = counts.get((rollups.KIND_OFFICIAL,), 0)
+        today_student_visits = counts.get((rollups.KIND_STUDENT,), 0)
         
-        # Почасовая статистика за сегодня
+        # Почасовая статистика за сегодня (один запрос к VisitRollupHourly)
         hourly_data = []
         # Старт дня (aware)
         day_start = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        series = rollups.hourly_series(day_start, day_start + timedelta(hours=24))
         for hour in range(24):
             hour_start = day_start + timedelta(hours=hour)
-            hour_end = hour_start + timedelta(hours=1)
-            
-            visits_count = Visit.objects.filter(
-                entry_time__gte=hour_start,
-                entry_time__lt=hour_end
-            ).count()
-            
-            student_visits_count = StudentVisit.objects.filter(
-                entry_time__gte=hour_start,
-                entry_time__lt=hour_end
-            ).count()
+            visits_count = series.get((hour_start, rollups.KIND_OFFICIAL), 0)
+            student_visits_count = series.get((hour_start, rollups.KIND_STUDENT), 0)
             
             hourly_data.append({
                 'hour': hour_start.strftime('%H:00'),
@@ -194,38 +161,18 @@ class DashboardMetricsService:
         # Завершенные визиты за период (по умолчанию 30 дней)
         thirty_days_ago = start_dt or (timezone.now() - timedelta(days=30))
         
-        completed_visits = Visit.objects.filter(
-            entry_time__gte=thirty_days_ago,
-            exit_time__isnull=False
-        )
-        
-        completed_student_visits = StudentVisit.objects.filter(
-            entry_time__gte=thirty_days_ago,
-            exit_time__isnull=False
-        )
-        
-        # Вычисляем среднюю длительность
-        total_duration_minutes = 0
-        total_count = 0
-        
-        for visit in completed_visits:
-            if visit.entry_time and visit.exit_time:
-                duration = visit.exit_time - visit.entry_time
-                total_duration_minutes += duration.total_seconds() / 60
-                total_count += 1
-        
-        for visit in completed_student_visits:
-            if visit.entry_time and visit.exit_time:
-                duration = visit.exit_time - visit.entry_time
-                total_duration_minutes += duration.total_seconds() / 60
-                total_count += 1
-        
-        avg_duration = total_duration_minutes / total_count if total_count > 0 else 0
+        # Среднее и перцентили считает PostgreSQL одним запросом
+        stats = duration_stats(thirty_days_ago)
+        avg_duration = stats['avg_minutes']
+        percentiles = stats['percentiles']
         
         result = {
             'avg_duration_minutes': round(avg_duration, 1),
             'avg_duration_hours': round(avg_duration / 60, 1),
-            'completed_visits_count': total_count
+            'completed_visits_count': stats['count'],
+            'p50_duration_minutes': round(percentiles[0.5], 1),
+            'p90_duration_minutes': round(percentiles[0.9], 1),
+            'p99_duration_minutes': round(percentiles[0.99], 1),
         }
         try:
             if AVG_VISIT_DURATION_MIN:
@@ -246,12 +193,7 @@ class DashboardMetricsService:
         return count_official
     
     def get_department_stats(self):
-        """Статистика по департаментам с кэшированием"""
-        cache_key = "dash:department_stats"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-            
+        """Статистика по департаментам"""
         # Оптимизированный запрос с агрегацией
         from django.db.models import Q, Case, When, IntegerField
         
@@ -287,44 +229,20 @@ class DashboardMetricsService:
         
         # Сортируем по общему количеству визитов
         stats.sort(key=lambda x: x['total_visits'], reverse=True)
-        
-        cache.set(cache_key, stats, timeout=300)  # 5 минут
         return stats
     
     def get_hourly_stats(self):
-        """Почасовая статистика за последние 24 часа с кэшированием."""
+        """Почасовая статистика за последние 24 часа."""
         now = timezone.now().replace(minute=0, second=0, microsecond=0)
-        cache_key = f"dash:hourly_stats:{now.hour}"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-            
         start = now - timedelta(hours=23)
 
-        from django.db.models.functions import TruncHour
-
-        visit_agg = (
-            Visit.objects.filter(entry_time__gte=start, entry_time__lte=now + timedelta(hours=1))
-            .annotate(h=TruncHour('entry_time'))
-            .values('h')
-            .annotate(cnt=Count('id'))
-        )
-        student_agg = (
-            StudentVisit.objects.filter(entry_time__gte=start, entry_time__lte=now + timedelta(hours=1))
-            .annotate(h=TruncHour('entry_time'))
-            .values('h')
-            .annotate(cnt=Count('id'))
-        )
-
-        # Приводим к словарям для быстрого объединения
-        v_map = {row['h']: row['cnt'] for row in visit_agg}
-        sv_map = {row['h']: row['cnt'] for row in student_agg}
+        series = rollups.hourly_series(start, now + timedelta(hours=1))
 
         stats = []
         for i in range(24):
             hour = start + timedelta(hours=i)
-            v = v_map.get(hour, 0)
-            sv = sv_map.get(hour, 0)
+            v = series.get((hour, rollups.KIND_OFFICIAL), 0)
+            sv = series.get((hour, rollups.KIND_STUDENT), 0)
             stats.append({
                 'hour': hour.strftime('%H:00'),
                 'timestamp': hour.isoformat(),
@@ -332,17 +250,10 @@ class DashboardMetricsService:
                 'student_visits': sv,
                 'total': v + sv,
             })
-        
-        cache.set(cache_key, stats, timeout=1800)  # 30 минут
         return stats
     
     def get_recent_events(self, limit=10):
         """Последние события"""
-        cache_key = f"dash:events:limit={limit}"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-
         events = RealtimeEvent.objects.filter(
             created_at__gte=timezone.now() - timedelta(hours=24)
         ).order_by('-created_at')[:limit]
@@ -359,7 +270,6 @@ class DashboardMetricsService:
             }
             for event in events
         ]
-        cache.set(cache_key, data, timeout=5)
         return data
     
     def get_security_alerts(self):
@@ -383,11 +293,6 @@ class DashboardMetricsService:
     
     def get_status_distribution(self, department_id=None, period=None):
         """Распределение визитов по статусам"""
-        cache_key = f"dash:status_distribution:dep={department_id or 'all'}:period={(period or '24h').lower()}"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
         # Определяем временную границу
         now = timezone.now()
         if period == 'today':
@@ -404,21 +309,10 @@ class DashboardMetricsService:
         # Добавляем логирование для отладки
         logger.info(f"Status distribution period: {period}, start_dt: {start_dt}")
         
-        # Базовые фильтры
-        visit_filter = {}
-        student_filter = {}
-        
-        # Применяем фильтры по времени и департаменту
-        if start_dt:
-            visit_filter['entry_time__gte'] = start_dt
-            student_filter['entry_time__gte'] = start_dt
-        if department_id:
-            visit_filter['department_id'] = department_id
-            student_filter['department_id'] = department_id
-        
-        # Получаем статистику по статусам
-        official_stats = dict(Visit.objects.filter(**visit_filter).values('status').annotate(count=Count('id')).values_list('status', 'count'))
-        student_stats = dict(StudentVisit.objects.filter(**student_filter).values('status').annotate(count=Count('id')).values_list('status', 'count'))
+        # Статистика по статусам из агрегатов (департамент × тип × статус)
+        counts = rollups.counts_since(start_dt, department_id, by=('kind', 'status'))
+        official_stats = {status: total for (kind, status), total in counts.items() if kind == rollups.KIND_OFFICIAL}
+        student_stats = {status: total for (kind, status), total in counts.items() if kind == rollups.KIND_STUDENT}
         
         # Объединяем статистику
         all_statuses = set(official_stats.keys()) | set(student_stats.keys())
@@ -446,46 +340,20 @@ class DashboardMetricsService:
         
         # Сортировка по общему количеству
         combined.sort(key=lambda x: x['total'], reverse=True)
-        
-        cache.set(cache_key, combined, timeout=300)  # 5 минут
         return combined
         
     def get_weekly_trend(self, department_id=None):
         """Тренд посещений по дням недели"""
-        cache_key = f"dash:weekly_trend:dep={department_id or 'all'}"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
         # Последние 4 недели для точной статистики
-        four_weeks_ago = timezone.now() - timedelta(days=28)
-        
-        from django.db.models.functions import ExtractWeekDay
-        
-        # Базовые фильтры
-        visit_filter = {'entry_time__gte': four_weeks_ago}
-        student_filter = {'entry_time__gte': four_weeks_ago}
-        
-        if department_id:
-            visit_filter['department_id'] = department_id
-            student_filter['department_id'] = department_id
+        today = timezone.localdate()
+        series = rollups.daily_series(today - timedelta(days=27), today, department_id)
         
         # Агрегация по дням недели (1=понедельник, 7=воскресенье)
-        official_by_day = dict(
-            Visit.objects.filter(**visit_filter)
-            .annotate(weekday=ExtractWeekDay('entry_time'))
-            .values('weekday')
-            .annotate(count=Count('id'))
-            .values_list('weekday', 'count')
-        )
-        
-        student_by_day = dict(
-            StudentVisit.objects.filter(**student_filter)
-            .annotate(weekday=ExtractWeekDay('entry_time'))
-            .values('weekday')
-            .annotate(count=Count('id'))
-            .values_list('weekday', 'count')
-        )
+        official_by_day = defaultdict(int)
+        student_by_day = defaultdict(int)
+        for (day, kind), count in series.items():
+            target = official_by_day if kind == rollups.KIND_OFFICIAL else student_by_day
+            target[day.isoweekday()] += count
         
         # Дни недели на русском языке
         days = {
@@ -511,17 +379,10 @@ class DashboardMetricsService:
                 'student_count': student_count,
                 'total': official_count + student_count
             })
-        
-        cache.set(cache_key, result, timeout=3600)  # 1 час
         return result
         
     def get_duration_distribution(self, department_id=None, period=None):
         """Распределение визитов по длительности"""
-        cache_key = f"dash:duration_distribution:dep={department_id or 'all'}:period={(period or '30d').lower()}"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
         # Определяем временную границу
         now = timezone.now()
         if period == 'today':
@@ -535,138 +396,69 @@ class DashboardMetricsService:
         else:
             start_dt = now - timedelta(days=30)  # По умолчанию 30 дней
         
-        # Базовые фильтры для завершенных визитов
-        visit_filter = {
-            'entry_time__gte': start_dt,
-            'exit_time__isnull': False
-        }
-        student_filter = {
-            'entry_time__gte': start_dt,
-            'exit_time__isnull': False
-        }
-        
-        if department_id:
-            visit_filter['department_id'] = department_id
-            student_filter['department_id'] = department_id
-        
-        # Получаем данные о визитах
-        completed_visits = list(Visit.objects.filter(**visit_filter).values('entry_time', 'exit_time'))
-        completed_student_visits = list(StudentVisit.objects.filter(**student_filter).values('entry_time', 'exit_time'))
-        
-        # Группировка по интервалам (в минутах)
-        intervals = {
-            '<15min': {'min': 0, 'max': 15, 'count': 0, 'label': 'До 15 мин'},
-            '15-30min': {'min': 15, 'max': 30, 'count': 0, 'label': '15-30 мин'},
-            '30-60min': {'min': 30, 'max': 60, 'count': 0, 'label': '30-60 мин'},
-            '1-2h': {'min': 60, 'max': 120, 'count': 0, 'label': '1-2 часа'},
-            '2-4h': {'min': 120, 'max': 240, 'count': 0, 'label': '2-4 часа'},
-            '4-8h': {'min': 240, 'max': 480, 'count': 0, 'label': '4-8 часов'},
-            '>8h': {'min': 480, 'max': float('inf'), 'count': 0, 'label': 'Более 8 часов'}
-        }
-        
-        # Функция для определения интервала
-        def get_interval_key(minutes):
-            for key, interval in intervals.items():
-                if interval['min'] <= minutes < interval['max']:
-                    return key
-            return '>8h'  # Фолбэк для длительностей >8ч
-        
-        # Заполняем распределение
-        for visit in completed_visits + completed_student_visits:
-            if visit['entry_time'] and visit['exit_time']:
-                duration = (visit['exit_time'] - visit['entry_time']).total_seconds() / 60
-                interval_key = get_interval_key(duration)
-                intervals[interval_key]['count'] += 1
+        # Гистограмма по интервалам считается в БД (width_bucket)
+        histogram = duration_stats(start_dt, department_id)['histogram']
+        bounds = [lower for _, lower, _ in DURATION_BUCKETS[1:]] + [None]
         
         # Преобразуем в список для фронтенда
         result = [
             {
                 'interval': key,
-                'count': data['count'],
-                'min_minutes': data['min'],
-                'max_minutes': data['max'] if data['max'] != float('inf') else None,
-                'label': data['label']
+                'count': count,
+                'min_minutes': lower,
+                'max_minutes': upper,
+                'label': label
             }
-            for key, data in intervals.items()
+            for (key, lower, label), upper, count in zip(DURATION_BUCKETS, bounds, histogram)
         ]
-        
-        cache.set(cache_key, result, timeout=3600)  # 1 час
         return result
         
     def get_visitor_type_comparison(self, department_id=None, period='month'):
         """Сравнение типов посетителей (официальные vs студенты) по времени"""
-        cache_key = f"dash:visitor_type_comparison:{period}:dep={department_id or 'all'}"
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
         now = timezone.now()
         
+        today = timezone.localdate(now)
+        
         if period == 'week':
             # Последние 7 дней
-            start_date = now - timedelta(days=7)
+            start_date = today - timedelta(days=7)
             date_format = 'D (j.m)'  # День недели + дата
             date_trunc = 'day'
         elif period == 'month':
             # Последние 30 дней
-            start_date = now - timedelta(days=30)
+            start_date = today - timedelta(days=30)
             date_format = 'j.m'  # День месяца
             date_trunc = 'day'
         else:  # 'year'
             # Последние 12 месяцев
-            start_date = now - timedelta(days=365)
+            start_date = today - timedelta(days=365)
             date_format = 'M Y'  # Месяц и год
             date_trunc = 'month'
         
-        from django.db.models.functions import TruncDay, TruncMonth
-        
-        trunc_func = TruncDay if date_trunc == 'day' else TruncMonth
-        
-        # Базовые фильтры
-        visit_filter = {'entry_time__gte': start_date}
-        student_filter = {'entry_time__gte': start_date}
-        
-        if department_id:
-            visit_filter['department_id'] = department_id
-            student_filter['department_id'] = department_id
-        
-        official_data = (
-            Visit.objects.filter(**visit_filter)
-            .annotate(date=trunc_func('entry_time'))
-            .values('date')
-            .annotate(count=Count('id'))
-            .order_by('date')
-        )
-        
-        student_data = (
-            StudentVisit.objects.filter(**student_filter)
-            .annotate(date=trunc_func('entry_time'))
-            .values('date')
-            .annotate(count=Count('id'))
-            .order_by('date')
-        )
-        
-        # Создаем словари для быстрого доступа
-        official_dict = {item['date']: item['count'] for item in official_data}
-        student_dict = {item['date']: item['count'] for item in student_data}
+        # Дневные агрегаты; для года сворачиваем в месяцы
+        official_dict = defaultdict(int)
+        student_dict = defaultdict(int)
+        for (day, kind), count in rollups.daily_series(start_date, today, department_id).items():
+            key = day if date_trunc == 'day' else day.replace(day=1)
+            target = official_dict if kind == rollups.KIND_OFFICIAL else student_dict
+            target[key] += count
         
         # Объединяем все даты
         all_dates = sorted(set(official_dict.keys()) | set(student_dict.keys()))
         
         result = []
-        for date in all_dates:
-            official_count = official_dict.get(date, 0)
-            student_count = student_dict.get(date, 0)
+        for day in all_dates:
+            official_count = official_dict.get(day, 0)
+            student_count = student_dict.get(day, 0)
+            date = timezone.make_aware(datetime.combine(day, datetime.min.time()))
             
             result.append({
-                'date': date.strftime(date_format),
+                'date': dateformat.format(date, date_format),
                 'timestamp': date.isoformat(),
                 'official_count': official_count,
                 'student_count': student_count,
                 'total': official_count + student_count
             })
-        
-        cache.set(cache_key, result, timeout=1800)  # 30 минут
         return result
     
     def calculate_duration_minutes(self, start_time):
@@ -678,39 +470,31 @@ class DashboardMetricsService:
         return int(duration.total_seconds() / 60)
     
     def save_metrics_snapshot(self):
-        """Сохранение снимка метрик в БД"""
+        """
+        Сохранение замера метрик во временные ряды (MetricPoint).
+
+        Значения пересчитываются, а не берутся из кэша: устаревшее значение
+        (stale-while-revalidate) попало бы в ряд с чужим временем.
+        """
         try:
-            metrics = self.get_current_metrics()
-            
-            # Сохраняем основные метрики
-            for metric_type in ['visitors_count', 'active_visits', 'today_registrations', 
-                              'avg_visit_duration', 'department_stats', 'hourly_stats']:
-                if metric_type in metrics:
-                    DashboardMetric.objects.create(
-                        metric_type=metric_type,
-                        value=metrics[metric_type]
-                    )
-            
-            # Очищаем старые метрики (старше 24 часов)
-            old_threshold = timezone.now() - timedelta(hours=24)
-            DashboardMetric.objects.filter(timestamp__lt=old_threshold).delete()
+            from . import metric_series
+
+            metrics = {}
+            for name in metric_series.SERIES:
+                value = metric_registry.refresh(self, name)
+                if value is None:
+                    # Метрику уже пересчитывает другой процесс - считаем сами
+                    value = metric_registry.compute(self, name)
+                metrics[name] = value
+            metric_series.record(metrics)
             
             logger.info("Dashboard metrics snapshot saved successfully")
-            # Отправляем обновленные метрики подписчикам по WS
+            # Подписчикам по WS уходят только изменения (JSON Patch, metrics_stream)
             try:
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    "dashboard_updates",
-                    {
-                        "type": "dashboard_broadcast",
-                        "message": {
-                            "type": "metrics",
-                            "data": metrics,
-                        },
-                    },
-                )
+                from .metrics_stream import publish_registered
+                publish_registered(self)
             except Exception as ws_err:
-                logger.warning("WS metrics broadcast failed: %s", ws_err)
+                logger.warning("WS metrics publish failed: %s", ws_err)
             
         except Exception as e:
             logger.error("Error saving dashboard metrics: %s", e)
@@ -723,7 +507,7 @@ class RealtimeEventService:
     
     @staticmethod
     def create_event(event_type, title, message, priority='normal', user=None, visit=None, data=None):
-        """Создание нового события"""
+        """Создание нового события (синхронно: запись и рассылка сразу, событие возвращается)"""
         try:
             event = RealtimeEvent.objects.create(
                 event_type=event_type,
@@ -736,6 +520,14 @@ class RealtimeEventService:
             )
             
             logger.info("Realtime event created: %s", event.title)
+            payload = {
+                "id": event.id,
+                "event_type": event.event_type,
+                "title": event.title,
+                "message": event.message,
+                "priority": event.priority,
+                "timestamp": event.created_at.isoformat(),
+            }
             # Транслируем событие по WS
             try:
                 channel_layer = get_channel_layer()
@@ -745,29 +537,52 @@ class RealtimeEventService:
                         "type": "dashboard_broadcast",
                         "message": {
                             "type": "event",
-                            "data": {
-                                "id": event.id,
-                                "event_type": event.event_type,
-                                "title": event.title,
-                                "message": event.message,
-                                "priority": event.priority,
-                                "timestamp": event.created_at.isoformat(),
-                            },
+                            "data": payload,
                         },
                     },
                 )
             except Exception as ws_err:
                 logger.warning("WS broadcast failed: %s", ws_err)
+            
+            # Сотрудники без глобального доступа получают события своего департамента
+            if visit is not None:
+                from .counters import publish_department_event
+                publish_department_event(getattr(visit, 'department_id', None), payload)
             return event
             
         except Exception as e:
             logger.error("Error creating realtime event: %s", e)
             return None
     
+    @staticmethod
+    def enqueue_event(event_type, title, message, priority='normal', user=None, visit=None, data=None,
+                      department_id=None):
+        """
+        Событие без ожидания: запись и WS-рассылка пачкой после коммита
+        (event_buffer.py). Для потока запроса вместо create_event.
+
+        department_id - группа рассылки, если визита нет (студенческий визит).
+        """
+        from . import event_buffer
+
+        try:
+            event_buffer.enqueue(
+                event_type=event_type,
+                title=title,
+                message=message,
+                priority=priority,
+                user_id=getattr(user, 'pk', None),
+                visit_id=getattr(visit, 'pk', None),
+                department_id=department_id or getattr(visit, 'department_id', None),
+                data=data,
+            )
+        except Exception as e:
+            logger.error("Error enqueueing realtime event: %s", e)
+
     @staticmethod
     def notify_visit_created(visit):
         """Уведомление о создании визита"""
-        RealtimeEventService.create_event(
+        RealtimeEventService.enqueue_event(
             event_type='visit_created',
             title='Новый визит зарегистрирован',
             message=f'Гость {visit.guest.full_name} зарегистрирован для посещения {visit.department.name}',
@@ -783,7 +598,7 @@ class RealtimeEventService:
     @staticmethod
     def notify_visit_checked_in(visit):
         """Уведомление о входе посетителя"""
-        RealtimeEventService.create_event(
+        RealtimeEventService.enqueue_event(
             event_type='visit_checked_in',
             title='Посетитель вошел в здание',
             message=f'{visit.guest.full_name} вошел в здание',
@@ -798,7 +613,7 @@ class RealtimeEventService:
     @staticmethod
     def notify_visit_checked_out(visit):
         """Уведомление о выходе посетителя"""
-        RealtimeEventService.create_event(
+        RealtimeEventService.enqueue_event(
             event_type='visit_checked_out',
             title='Посетитель покинул здание',
             message=f'{visit.guest.full_name} покинул здание',
@@ -813,7 +628,7 @@ class RealtimeEventService:
     @staticmethod
     def notify_security_alert(title, message, data=None):
         """Предупреждение безопасности"""
-        RealtimeEventService.create_event(
+        RealtimeEventService.enqueue_event(
             event_type='security_alert',
             title=title,
             message=message,
@@ -1,11 +1,30 @@
-from django.db.models.signals import post_save, post_delete
+"""
+События дашборда (RealtimeEvent) при изменении визитов.
+
+События ставятся в буфер (event_buffer.py) и записываются/рассылаются
+пачкой после коммита. Вход и выход определяются по смене статуса:
+состояние визита до сохранения запоминает counter_signals
+(_counter_state_before), поэтому повторные сохранения визита в том же
+статусе событий не порождают.
+"""
+from django.db.models.signals import post_save
 from django.dispatch import receiver
-from visitors.models import Visit, StudentVisit
+from visitors.models import Visit, StudentVisit, STATUS_CHECKED_IN, STATUS_CHECKED_OUT
+from .counters import COUNTER_FIELDS
 from .services import event_service
 import logging
 
 logger = logging.getLogger(__name__)
 
+_STATUS_INDEX = COUNTER_FIELDS.index('status')
+
+
+def _status_transition(instance):
+    """Новый статус визита, если он изменился при сохранении (иначе None)."""
+    before = getattr(instance, '_counter_state_before', None)
+    previous_status = before[_STATUS_INDEX] if before else None
+    return instance.status if instance.status != previous_status else None
+
 
 @receiver(post_save, sender=Visit)
 def handle_visit_events(instance, created, **kwargs):
@@ -14,12 +33,13 @@ def handle_visit_events(instance, created, **kwargs):
         if created:
             # Новый визит создан
             event_service.notify_visit_created(instance)
-        else:
-            # Визит обновлен - проверяем изменения статуса
-            if instance.status == 'CHECKED_IN' and instance.entry_time:
-                event_service.notify_visit_checked_in(instance)
-            elif instance.status == 'CHECKED_OUT' and instance.exit_time:
-                event_service.notify_visit_checked_out(instance)
+            return
+        # Визит обновлен - событие только при смене статуса
+        status = _status_transition(instance)
+        if status == STATUS_CHECKED_IN and instance.entry_time:
+            event_service.notify_visit_checked_in(instance)
+        elif status == STATUS_CHECKED_OUT and instance.exit_time:
+            event_service.notify_visit_checked_out(instance)
     except Exception as e:
         logger.error("Error handling visit event: %s", e)
 
@@ -28,44 +48,48 @@ def handle_visit_events(instance, created, **kwargs):
 def handle_student_visit_events(instance, created, **kwargs):
     """Обработка событий студенческих визитов"""
     try:
+        # RealtimeEvent.visit ссылается на Visit - студенческий визит
+        # передаётся только департаментом (для рассылки в его группу)
+        common = {'priority': 'normal', 'department_id': instance.department_id}
         if created:
             # Новый студенческий визит создан
-            event_service.create_event(
+            event_service.enqueue_event(
                 event_type='visit_created',
                 title='Новый визит студента',
                 message=f'Студент {instance.guest.full_name} зарегистрирован для посещения {instance.department.name}',
-                priority='normal',
                 data={
                     'visit_type': 'student',
                     'guest_name': instance.guest.full_name,
                     'department': instance.department.name
-                }
+                },
+                **common
+            )
+            return
+        # Студенческий визит обновлен - событие только при смене статуса
+        status = _status_transition(instance)
+        if status == STATUS_CHECKED_IN and instance.entry_time:
+            event_service.enqueue_event(
+                event_type='visit_checked_in',
+                title='Студент вошел в здание',
+                message=f'Студент {instance.guest.full_name} вошел в здание',
+                data={
+                    'visit_type': 'student',
+                    'guest_name': instance.guest.full_name,
+                    'entry_time': instance.entry_time.isoformat()
+                },
+                **common
+            )
+        elif status == STATUS_CHECKED_OUT and instance.exit_time:
+            event_service.enqueue_event(
+                event_type='visit_checked_out',
+                title='Студент покинул здание',
+                message=f'Студент {instance.guest.full_name} покинул здание',
+                data={
+                    'visit_type': 'student',
+                    'guest_name': instance.guest.full_name,
+                    'exit_time': instance.exit_time.isoformat()
+                },
+                **common
             )
-        else:
-            # Студенческий визит обновлен
-            if instance.status == 'CHECKED_IN' and instance.entry_time:
-                event_service.create_event(
-                    event_type='visit_checked_in',
-                    title='Студент вошел в здание',
-                    message=f'Студент {instance.guest.full_name} вошел в здание',
-                    priority='normal',
-                    data={
-                        'visit_type': 'student',
-                        'guest_name': instance.guest.full_name,
-                        'entry_time': instance.entry_time.isoformat() if instance.entry_time else None
-                    }
-                )
-            elif instance.status == 'CHECKED_OUT' and instance.exit_time:
-                event_service.create_event(
-                    event_type='visit_checked_out',
-                    title='Студент покинул здание',
-                    message=f'Студент {instance.guest.full_name} покинул здание',
-                    priority='normal',
-                    data={
-                        'visit_type': 'student',
-                        'guest_name': instance.guest.full_name,
-                        'exit_time': instance.exit_time.isoformat() if instance.exit_time else None
-                    }
-                )
     except Exception as e:
         logger.error("Error handling student visit event: %s", e)
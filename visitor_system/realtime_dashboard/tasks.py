@@ -1,5 +1,4 @@
 from celery import shared_task
-from django.core.cache import cache
 import logging
 
 from .services import DashboardMetricsService
@@ -9,47 +8,103 @@ logger = logging.getLogger(__name__)
 
 @shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
 def update_dashboard_metrics():
-    """Обновляет метрики дашборда и очищает кэш"""
+    """Обновляет метрики дашборда в кэше"""
     try:
         service = DashboardMetricsService()
         
-        # Очищаем кэш метрик
-        cache_keys_to_delete = [
-            'dash:department_stats',
-            'dash:events:limit=10',
-            'dash:security_alerts',
-        ]
+        # Заранее пересчитываем все метрики без фильтров и недавно
+        # запрошенные с фильтрами, чтобы запросы страниц получали готовое значение
+        from . import metric_registry, metrics_cache
+        targets = {(name, None, '24h') for name in metric_registry.METRICS}
+        for item in metrics_cache.registered().values():
+            params = item['params']
+            if params.get('metric') in metric_registry.METRICS:
+                targets.add((params['metric'], params.get('department_id'), params.get('period') or '24h'))
+        refreshed = 0
+        for name, department_id, period in sorted(targets, key=str):
+            try:
+                if metric_registry.refresh(service, name, department_id, period) is not None:
+                    refreshed += 1
+            except Exception as e:
+                logger.warning("Error refreshing dashboard metric %s: %s", name, e)
         
-        # Очищаем кэш по часам для hourly stats
-        from django.utils import timezone
-        current_hour = timezone.now().hour
-        for hour in range(24):
-            cache_keys_to_delete.append(f'dash:hourly_stats:{hour}')
-        
-        cache.delete_many(cache_keys_to_delete)
-        
-        # Прогреваем кэш основных метрик
-        service.get_current_metrics()
-        service.get_department_stats()
-        service.get_hourly_stats()
-        
-        logger.info("Dashboard metrics updated and cache refreshed")
-        return {'status': 'success', 'cleared_keys': len(cache_keys_to_delete)}
+        logger.info("Dashboard metrics updated and cache refreshed (%d metrics)", refreshed)
+        return {'status': 'success', 'refreshed': refreshed}
         
     except Exception as e:
         logger.error("Error updating dashboard metrics: %s", e)
         raise
 
 
+@shared_task
+def refresh_metric_task(name, department_id=None, period=None, lock_token=None):
+    """Фоновый пересчёт устаревшей метрики (блокировку взял запрос, поставивший задачу)"""
+    from . import metric_registry
+
+    try:
+        metric_registry.refresh(DashboardMetricsService(), name, department_id, period, lock_token)
+    except Exception as e:
+        logger.error("Error refreshing dashboard metric %s: %s", name, e)
+
+
+@shared_task
+def publish_dashboard_metrics_task():
+    """Рассылает изменения метрик подписчикам WS-потоков (JSON Patch дельты)"""
+    from .metrics_stream import publish_registered
+
+    try:
+        return {'published': publish_registered(DashboardMetricsService())}
+    except Exception as e:
+        logger.error("Error publishing dashboard metrics: %s", e)
+        raise
+
+
+@shared_task
+def publish_counters_task(department_ids, employee_id=None, student=False):
+    """Пересчёт и WS-рассылка счётчиков дашборда сотрудника после изменения визита"""
+    from .counters import publish_counters, publish_counters_refresh
+
+    for department_id in department_ids:
+        try:
+            publish_counters(department_id, employee_id)
+        except Exception as e:
+            logger.error("Error publishing counters for department %s: %s", department_id, e)
+    if student:
+        publish_counters_refresh()
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
+def flush_realtime_events_task():
+    """Записывает накопленные события дашборда пачкой и рассылает одним WS-сообщением"""
+    from .event_buffer import flush
+
+    try:
+        return {'written': flush()}
+    except Exception as e:
+        logger.error("Error flushing realtime events: %s", e)
+        raise
+
+
 @shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
 def cleanup_old_events():
-    """Очищает старые события дашборда (старше 7 дней)"""
+    """Создаёт будущие и удаляет просроченные секции событий дашборда"""
     from django.utils import timezone
     from datetime import timedelta
+    from . import partitions
     from .models import RealtimeEvent
     
     try:
-        cutoff_date = timezone.now() - timedelta(days=7)
+        spec = partitions.PARTITIONED_TABLES['realtime_events']
+        if partitions.is_partitioned(spec):
+            result = partitions.maintain(spec)
+            logger.info(
+                "Realtime event partitions: %d created, %d dropped",
+                len(result['created']), len(result['dropped']),
+            )
+            return result
+        
+        # Таблица ещё не секционирована (миграция 0009 не применена)
+        cutoff_date = timezone.now() - timedelta(days=spec.retention_days())
         deleted_count, _ = RealtimeEvent.objects.filter(
             created_at__lt=cutoff_date
         ).delete()
@@ -60,3 +115,45 @@ def cleanup_old_events():
     except Exception as e:
         logger.error("Error cleaning up old events: %s", e)
         raise
+
+
+@shared_task
+def record_metric_series_task():
+    """Записывает замер метрик дашборда во временные ряды"""
+    DashboardMetricsService().save_metrics_snapshot()
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
+def downsample_metric_series_task():
+    """Прореживает временные ряды метрик до часовых/дневных и удаляет устаревшие точки"""
+    from . import metric_series
+
+    try:
+        return {'downsampled': metric_series.downsample(), 'pruned': metric_series.prune()}
+    except Exception as e:
+        logger.error("Error downsampling metric series: %s", e)
+        raise
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
+def repair_visit_rollups_task(hours=48, days=35):
+    """Пересчитывает недавнее окно агрегатов визитов (пропущенные сигналами изменения)"""
+    from .rollups import repair
+
+    try:
+        return repair(hours=hours, days=days)
+    except Exception as e:
+        logger.error("Error repairing visit rollups: %s", e)
+        raise
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
+def deep_repair_visit_rollups_task():
+    """Пересчитывает агрегаты визитов за всё окно графиков (год дневных, месяц часовых)"""
+    from .rollups import deep_repair
+
+    try:
+        return deep_repair()
+    except Exception as e:
+        logger.error("Error deep-repairing visit rollups: %s", e)
+        raise
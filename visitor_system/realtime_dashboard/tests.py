@@ -0,0 +1,392 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from departments.models import Department
+from visitors.models import Guest, StudentVisit, Visit, STATUS_CANCELLED, STATUS_CHECKED_IN, STATUS_CHECKED_OUT
+
+from . import counters, event_buffer, metrics_stream, rollups, signals
+from .ws_consumers import DashboardConsumer
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class MakePatchTests(SimpleTestCase):
+    def test_equal_values_give_no_ops(self):
+        self.assertEqual(metrics_stream.make_patch({'a': [1, 2]}, {'a': [1, 2]}), [])
+
+    def test_dict_keys_added_removed_replaced(self):
+        ops = metrics_stream.make_patch({'a': 1, 'b': 2}, {'a': 3, 'c': 4})
+        self.assertCountEqual(ops, [
+            {'op': 'remove', 'path': '/b'},
+            {'op': 'replace', 'path': '/a', 'value': 3},
+            {'op': 'add', 'path': '/c', 'value': 4},
+        ])
+
+    def test_lists_of_same_length_are_patched_by_index(self):
+        ops = metrics_stream.make_patch({'h': [1, 2, 3]}, {'h': [1, 5, 3]})
+        self.assertEqual(ops, [{'op': 'replace', 'path': '/h/1', 'value': 5}])
+
+    def test_lists_of_different_length_are_replaced(self):
+        ops = metrics_stream.make_patch({'h': [1]}, {'h': [1, 2]})
+        self.assertEqual(ops, [{'op': 'replace', 'path': '/h', 'value': [1, 2]}])
+
+    def test_path_tokens_are_escaped(self):
+        ops = metrics_stream.make_patch({}, {'a/b~c': 1})
+        self.assertEqual(ops, [{'op': 'add', 'path': '/a~1b~0c', 'value': 1}])
+        self.assertEqual(metrics_stream.op_metric(ops[0]), 'a/b~c')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StreamStateTests(SimpleTestCase):
+    sid = 'all_24h'
+
+    def setUp(self):
+        cache.clear()
+        self.metrics = {'active_visits': 1, 'hourly_stats': [0, 0]}
+        patcher = mock.patch.object(metrics_stream, '_current_metrics', side_effect=lambda *a: dict(self.metrics))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.channel_layer = mock.MagicMock()
+        self.sent = []
+
+        async def group_send(group, message):
+            self.sent.append(message)
+        self.channel_layer.group_send = group_send
+        patcher = mock.patch.object(metrics_stream, 'get_channel_layer', return_value=self.channel_layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def publish(self, **changes):
+        self.metrics.update(changes)
+        return metrics_stream.publish(None, self.sid)
+
+    def test_first_publish_starts_epoch(self):
+        self.assertEqual(self.publish(), 1)
+        state = metrics_stream.snapshot(None, self.sid)
+        self.assertTrue(state['epoch'])
+        self.assertEqual(state['metrics'], self.metrics)
+        self.assertEqual(self.sent[-1]['type'], 'metrics_reset')
+
+    def test_unchanged_metrics_are_not_published(self):
+        self.publish()
+        self.assertIsNone(self.publish())
+
+    def test_deltas_since_returns_missed_ops(self):
+        self.publish()
+        epoch = metrics_stream.snapshot(None, self.sid)['epoch']
+        self.publish(active_visits=2)
+        self.publish(hourly_stats=[0, 3])
+        deltas = metrics_stream.deltas_since(self.sid, 1, epoch)
+        self.assertEqual([entry['seq'] for entry in deltas], [2, 3])
+        self.assertEqual(deltas[1]['ops'], [{'op': 'replace', 'path': '/hourly_stats/1', 'value': 3}])
+        self.assertEqual(metrics_stream.deltas_since(self.sid, 3, epoch), [])
+
+    def test_deltas_since_requires_snapshot(self):
+        self.publish()
+        epoch = metrics_stream.snapshot(None, self.sid)['epoch']
+        self.assertIsNone(metrics_stream.deltas_since(self.sid, 5, epoch))
+        self.assertIsNone(metrics_stream.deltas_since(self.sid, 1, 'other'))
+        with override_settings(DASHBOARD_STREAM_LOG_SIZE=1):
+            self.publish(active_visits=2)
+            self.publish(active_visits=3)
+        self.assertIsNone(metrics_stream.deltas_since(self.sid, 1, epoch))
+
+    def test_lost_state_starts_new_epoch(self):
+        self.publish()
+        self.publish(active_visits=2)
+        old_epoch = metrics_stream.snapshot(None, self.sid)['epoch']
+        cache.delete(metrics_stream.STATE_KEY.format(self.sid))
+
+        self.assertEqual(self.publish(active_visits=3), 1)
+        state = metrics_stream.snapshot(None, self.sid)
+        self.assertNotEqual(state['epoch'], old_epoch)
+        self.assertEqual(self.sent[-1], {
+            'type': 'metrics_reset', 'stream': self.sid, 'epoch': state['epoch'], 'seq': 1,
+        })
+        self.assertIsNone(metrics_stream.deltas_since(self.sid, 2, old_epoch))
+
+
+class ConsumerStreamTests(SimpleTestCase):
+    def make_consumer(self, metrics=None):
+        consumer = DashboardConsumer()
+        consumer.stream = {'id': 'all_24h', 'metrics': metrics, 'epoch': 'e1', 'seq': 5, 'sent_seq': 5}
+        consumer.sent = []
+
+        async def send_json(content):
+            consumer.sent.append(content)
+        consumer.send_json = send_json
+        return consumer
+
+    def delta(self, consumer, epoch, seq, ops):
+        async_to_sync(consumer.metrics_delta)({
+            'type': 'metrics_delta', 'stream': 'all_24h', 'epoch': epoch, 'seq': seq, 'ops': ops,
+        })
+
+    def test_old_seq_is_dropped(self):
+        consumer = self.make_consumer()
+        self.delta(consumer, 'e1', 5, [{'op': 'replace', 'path': '/a', 'value': 1}])
+        self.assertEqual(consumer.sent, [])
+
+    def test_prev_seq_follows_sent_deltas(self):
+        consumer = self.make_consumer(metrics=['a'])
+        self.delta(consumer, 'e1', 6, [{'op': 'replace', 'path': '/b', 'value': 1}])
+        self.delta(consumer, 'e1', 7, [{'op': 'replace', 'path': '/a', 'value': 2}])
+        self.assertEqual(len(consumer.sent), 1)
+        self.assertEqual(consumer.sent[0]['seq'], 7)
+        self.assertEqual(consumer.sent[0]['prev_seq'], 5)
+
+    def test_new_epoch_sends_snapshot(self):
+        consumer = self.make_consumer()
+        state = {'epoch': 'e2', 'seq': 1, 'metrics': {'a': 3}}
+        with mock.patch.object(metrics_stream, 'snapshot', return_value=state):
+            self.delta(consumer, 'e2', 2, [{'op': 'replace', 'path': '/a', 'value': 4}])
+        self.assertEqual(consumer.sent[0]['type'], 'metrics_snapshot')
+        self.assertEqual(consumer.sent[0]['epoch'], 'e2')
+        self.assertEqual(consumer.stream['seq'], 1)
+        self.delta(consumer, 'e2', 2, [{'op': 'replace', 'path': '/a', 'value': 4}])
+        self.assertEqual(consumer.sent[1]['type'], 'metrics_delta')
+        self.assertEqual(consumer.sent[1]['prev_seq'], 1)
+
+
+class EventBufferFlushTests(SimpleTestCase):
+    def records(self, count):
+        return [{'event_type': f'e{i}', 'title': '', 'message': ''} for i in range(count)]
+
+    def test_failing_record_does_not_block_batch(self):
+        written = []
+
+        def write_batch(records):
+            if any(record['event_type'] == 'e5' for record in records):
+                raise ValueError('bad record')
+            written.extend(records)
+        failed = []
+        with mock.patch.object(event_buffer, 'write_batch', side_effect=write_batch):
+            self.assertEqual(event_buffer._write_or_split(self.records(8), failed), 7)
+        self.assertEqual([record['event_type'] for record in failed], ['e5'])
+        self.assertEqual(len(written), 7)
+
+    @override_settings(REALTIME_EVENT_MAX_ATTEMPTS=2)
+    def test_requeue_then_dead_letter(self):
+        client = mock.MagicMock()
+        record = {'event_type': 'e1'}
+        with mock.patch.object(event_buffer, '_schedule_flush') as schedule:
+            event_buffer._requeue(client, [record])
+            self.assertEqual(client.rpush.call_args[0][0], event_buffer.EVENT_BUFFER_KEY)
+            schedule.assert_called_once()
+            event_buffer._requeue(client, [record])
+        self.assertEqual(record['_attempts'], 2)
+        pipe = client.pipeline.return_value
+        self.assertEqual(pipe.rpush.call_args[0][0], event_buffer.EVENT_DEAD_LETTER_KEY)
+
+
+class CountersPublishTests(SimpleTestCase):
+    def test_groups_for_user_without_department(self):
+        groups = counters.groups_for_scope(7, {'is_global': False, 'department_id': None})
+        self.assertEqual(groups, [counters.user_group(7), counters.NO_DEPARTMENT_GROUP])
+
+    def test_publish_is_queued_to_celery(self):
+        with mock.patch('realtime_dashboard.tasks.publish_counters_task.delay') as delay, \
+                mock.patch.object(counters, 'publish_counters') as publish:
+            counters.schedule_publish_counters([3], 7, student=True)
+        delay.assert_called_once_with([3], 7, True)
+        publish.assert_not_called()
+
+    def test_publish_falls_back_when_broker_is_down(self):
+        with mock.patch('realtime_dashboard.tasks.publish_counters_task.delay', side_effect=OSError), \
+                mock.patch.object(counters, 'publish_counters') as publish, \
+                mock.patch.object(counters, 'publish_counters_refresh') as refresh:
+            counters.schedule_publish_counters([3, 4], 7, student=True)
+        self.assertEqual(publish.call_args_list, [mock.call(3, 7), mock.call(4, 7)])
+        refresh.assert_called_once_with()
+
+    def test_refresh_recomputes_own_snapshot(self):
+        consumer = DashboardConsumer()
+        consumer.access_scope = {'is_global': False, 'department_id': None}
+        consumer.user_id = 7
+        consumer.sent = []
+
+        async def send_json(content):
+            consumer.sent.append(content)
+        consumer.send_json = send_json
+        snapshot = {'counters': {'active_visits_count': 1}, 'etag': 'x'}
+        with mock.patch('visitors.counters.invalidate_counters') as invalidate, \
+                mock.patch('visitors.counters.get_counter_snapshot', return_value=snapshot):
+            async_to_sync(consumer.counters_refresh)({'type': 'counters_refresh'})
+        invalidate.assert_called_once_with(None, 7)
+        self.assertEqual(consumer.sent, [{'type': 'counters', 'data': snapshot['counters'], 'etag': 'x'}])
+
+
+class WidgetMigrationTests(SimpleTestCase):
+    migration = import_module('realtime_dashboard.migrations.0010_dashboard_layout')
+
+    def widget(self, **changes):
+        fields = dict(
+            name='hourly_chart', title='Посещения по часам', position_x=0, position_y=2,
+            width=8, height=4, refresh_interval=30, config={'metric': 'hourly_stats', 'chart_type': 'line'},
+        )
+        fields.update(changes)
+        return SimpleNamespace(**fields)
+
+    def test_default_row_gives_no_overrides(self):
+        self.assertEqual(self.migration._widget_overrides(self.widget()), {})
+
+    def test_admin_edits_become_overrides(self):
+        widget = self.widget(title='По часам', width=12, refresh_interval=60,
+                             config={'metric': 'hourly_stats', 'chart_type': 'bar'})
+        self.assertEqual(self.migration._widget_overrides(widget), {
+            'title': 'По часам', 'width': 12, 'refresh_interval': 60, 'config': {'chart_type': 'bar'},
+        })
+
+
+class VisitRollupTests(TestCase):
+    """Агрегаты после apply_change/repair совпадают с COUNT по исходным таблицам (PostgreSQL)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('rollup-host')
+        cls.dept_a = Department.objects.create(name='Rollup A')
+        cls.dept_b = Department.objects.create(name='Rollup B')
+        cls.guest = Guest.objects.create(full_name='Иванов Иван')
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.since = self.now - timedelta(days=2)
+
+    # Визиты пишутся мимо сигналов (bulk_create/update), дельты - явно
+
+    def create(self, model=Visit, apply=True, **fields):
+        values = {
+            'guest': self.guest, 'department': self.dept_a, 'purpose': 'rollups',
+            'registered_by': self.user, 'status': STATUS_CHECKED_IN,
+            'entry_time': self.now - timedelta(hours=5, minutes=20),
+        }
+        if model is Visit:
+            values['employee'] = self.user
+        values.update(fields)
+        visit = model.objects.bulk_create([model(**values)])[0]
+        if apply:
+            rollups.apply_change(rollups.kind_for_model(model), None, counters.counter_state(visit))
+        return visit
+
+    def change(self, visit, apply=True, **fields):
+        before = counters.counter_state(visit)
+        type(visit).objects.filter(pk=visit.pk).update(**fields)
+        visit.refresh_from_db()
+        if apply:
+            rollups.apply_change(rollups.kind_for_model(type(visit)), before, counters.counter_state(visit))
+
+    def delete(self, visit):
+        before = counters.counter_state(visit)
+        type(visit).objects.filter(pk=visit.pk).delete()
+        rollups.apply_change(rollups.kind_for_model(type(visit)), before, None)
+
+    def raw_counts(self, start, department_id=None):
+        expected = defaultdict(int)
+        for kind, model in rollups.SOURCES:
+            qs = model.objects.filter(entry_time__gte=start)
+            if department_id:
+                qs = qs.filter(department_id=department_id)
+            for row in qs.values('status').annotate(total=Count('id')).order_by():
+                expected[(kind, row['status'])] += row['total']
+        return dict(expected)
+
+    def assertMatchesRaw(self, start=None):
+        start = start or self.since
+        for department_id in (None, self.dept_a.pk, self.dept_b.pk):
+            counts = rollups.counts_since(start, department_id, by=('kind', 'status'))
+            self.assertEqual(
+                {key: total for key, total in counts.items() if total},
+                self.raw_counts(start, department_id),
+            )
+
+    def test_create(self):
+        self.create()
+        self.create(StudentVisit)
+        self.create(entry_time=self.now - timedelta(minutes=10))
+        self.assertMatchesRaw()
+
+    def test_status_change(self):
+        visit = self.create()
+        student = self.create(StudentVisit)
+        self.change(visit, status=STATUS_CHECKED_OUT, exit_time=self.now)
+        self.change(student, status=STATUS_CANCELLED)
+        self.assertMatchesRaw()
+
+    def test_department_change(self):
+        visit = self.create()
+        self.change(visit, department=self.dept_b)
+        self.assertMatchesRaw()
+
+    def test_delete(self):
+        visit = self.create()
+        self.create(StudentVisit)
+        self.delete(visit)
+        self.assertMatchesRaw()
+
+    def test_partial_first_hour_is_counted_from_source(self):
+        self.create(entry_time=self.now - timedelta(hours=1))
+        self.assertMatchesRaw(start=self.now - timedelta(hours=1, minutes=30))
+
+    def test_repair_fixes_missed_changes(self):
+        visit = self.create()
+        self.create(StudentVisit, apply=False)
+        self.change(visit, apply=False, status=STATUS_CHECKED_OUT, department=self.dept_b)
+        rollups.repair(now=self.now)
+        self.assertMatchesRaw()
+
+    def test_deep_repair_covers_year_view(self):
+        day = timezone.localdate() - timedelta(days=200)
+        entry_time = timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=12)
+        self.create(apply=False, entry_time=entry_time)
+
+        rollups.repair(now=self.now)
+        self.assertEqual(rollups.daily_series(day, day), {})
+        rollups.deep_repair(now=self.now)
+        self.assertEqual(rollups.daily_series(day, day), {(day, rollups.KIND_OFFICIAL): 1})
+
+
+class VisitEventSignalTests(SimpleTestCase):
+    def visit(self, status, before_status, department_id=3):
+        now = timezone.now()
+        return SimpleNamespace(
+            status=status, entry_time=now, exit_time=now, department_id=department_id,
+            guest=SimpleNamespace(full_name='Иванов Иван'), department=SimpleNamespace(name='Rollup A'),
+            _counter_state_before=(before_status, None, None, department_id),
+        )
+
+    def test_event_only_on_status_change(self):
+        with mock.patch.object(signals, 'event_service') as service:
+            signals.handle_visit_events(self.visit(STATUS_CHECKED_IN, 'AWAITING'), created=False)
+            signals.handle_visit_events(self.visit(STATUS_CHECKED_IN, STATUS_CHECKED_IN), created=False)
+            signals.handle_visit_events(self.visit(STATUS_CHECKED_OUT, STATUS_CHECKED_IN), created=False)
+        service.notify_visit_checked_in.assert_called_once()
+        service.notify_visit_checked_out.assert_called_once()
+
+    def test_student_events_are_buffered_by_department(self):
+        with mock.patch.object(signals, 'event_service') as service:
+            signals.handle_student_visit_events(self.visit(STATUS_CHECKED_IN, 'AWAITING'), created=False)
+            signals.handle_student_visit_events(self.visit(STATUS_CHECKED_IN, STATUS_CHECKED_IN), created=False)
+        service.create_event.assert_not_called()
+        service.enqueue_event.assert_called_once()
+        kwargs = service.enqueue_event.call_args.kwargs
+        self.assertEqual(kwargs['event_type'], 'visit_checked_in')
+        self.assertEqual(kwargs['department_id'], 3)
+        self.assertNotIn('visit', kwargs)
+
+    def test_enqueue_event_uses_explicit_department(self):
+        from .services import RealtimeEventService
+
+        with mock.patch.object(event_buffer, 'enqueue') as enqueue:
+            RealtimeEventService.enqueue_event('visit_created', 't', 'm', department_id=5)
+        self.assertEqual(enqueue.call_args.kwargs['department_id'], 5)
+        self.assertIsNone(enqueue.call_args.kwargs['visit_id'])
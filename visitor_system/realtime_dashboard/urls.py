@@ -9,10 +9,12 @@ urlpatterns = [
     
     # AJAX API
     path('api/metrics/', views.dashboard_metrics_api, name='metrics_api'),
+    path('api/metrics/series/', views.metric_series_api, name='metric_series_api'),
     path('api/metrics/test/', views.dashboard_metrics_test_api, name='metrics_test_api'),
     path('api/events/', views.dashboard_events_api, name='events_api'),
     path('api/events/<int:event_id>/read/', views.mark_event_read, name='mark_event_read'),
-    path('api/widgets/<int:widget_id>/data/', views.widget_data_api, name='widget_data_api'),
+    path('api/widgets/<slug:widget_id>/data/', views.widget_data_api, name='widget_data_api'),
+    path('api/layout/', views.widget_layout_api, name='widget_layout_api'),
     # Экспорт CSV активных визитов
     path('api/active_visits.csv', views.active_visits_csv, name='active_visits_csv'),
     path('api/active_visits/', views.active_visits_csv, name='active_visits_csv_alt'),
@@ -13,10 +13,14 @@ try:
     REST_FRAMEWORK_AVAILABLE = True
 except ImportError:
     REST_FRAMEWORK_AVAILABLE = False
+import json
 import logging
+from dataclasses import asdict
+from datetime import timedelta
 
+from . import event_feed, metric_registry, metric_series, widget_layout
 from .services import dashboard_service, event_service
-from .models import RealtimeEvent, DashboardWidget
+from .models import MetricPoint, RealtimeEvent
 
 logger = logging.getLogger(__name__)
 
@@ -39,7 +43,6 @@ def dashboard_view(request):
     # Проверяем параметр recreate_widgets
     recreate_widgets = request.GET.get('recreate_widgets') == '1'
     clear_cache = request.GET.get('clear_cache') == '1'
-    update_widgets = request.GET.get('update_widgets') == '1'
     debug_mode = request.GET.get('debug') == '1'
     
     # Очищаем кэш, с опцией сохранения кэша департаментов
@@ -65,39 +68,18 @@ def dashboard_view(request):
             
         logger.info("Dashboard widgets cache cleared by user %s", request.user)
     
-    # Удаляем существующие виджеты если нужно пересоздать
-    if recreate_widgets:
-        DashboardWidget.objects.filter(is_active=True).delete()
-        logger.info("Dashboard widgets recreated by user %s", request.user)
+    # Сбрасываем настройки раскладки пользователя к умолчаниям
+    if recreate_widgets and request.user.is_authenticated:
+        widget_layout.reset(request.user)
+        logger.info("Dashboard layout reset by user %s", request.user)
     
-    # Получаем активные виджеты для пользователя
-    widgets = DashboardWidget.objects.filter(is_active=True).order_by('position_y', 'position_x')
-    
-    # Если виджетов нет, создаем базовые
-    if not widgets.exists():
-        _create_default_widgets(request.user)
-        widgets = DashboardWidget.objects.filter(is_active=True).order_by('position_y', 'position_x')
-        logger.info("Created default widgets for user %s", request.user)
-    else:
-        # Проверяем, есть ли новые виджеты, которые нужно создать
-        existing_names = set(widgets.values_list('name', flat=True))
-        created_count = _ensure_all_widgets_exist(request.user, existing_names)
-        
-        if created_count > 0 or update_widgets:
-            # Если были созданы новые виджеты или запрошено обновление,
-            # очищаем только кэш виджетов, но не департаментов
-            cache_keys = cache.keys("dash:*")
-            department_cache_key = "dash:department_stats"
-            for key in cache_keys:
-                if key != department_cache_key:
-                    cache.delete(key)
-            logger.info("Created %d new widgets for user %s", created_count, request.user)
-            widgets = DashboardWidget.objects.filter(is_active=True).order_by('position_y', 'position_x')
+    # Умолчания из кода + настройки пользователя (кэш, без записей в БД)
+    widgets = widget_layout.layout_for(request.user)
     
     context = {
         'widgets': widgets,
         'title': 'Дашборд в реальном времени',
-        'has_new_widgets': request.session.pop('has_new_widgets', False) or created_count > 0,
+        'has_new_widgets': request.session.pop('has_new_widgets', False),
         'debug_mode': debug_mode
     }
     
@@ -119,7 +101,7 @@ def dashboard_view(request):
             metrics = dashboard_service.get_current_metrics()
             
             context['debug_info'] = {
-                'widget_count': widgets.count(),
+                'widget_count': len(widgets),
                 'widgets': widget_debug_info,
                 'metrics_keys': list(metrics.keys() if metrics else {}),
                 'metrics_timestamp': metrics.get('timestamp', '') if metrics else '',
@@ -147,7 +129,10 @@ def dashboard_metrics_api(request):
             dep_id_int = int(department_id) if department_id else None
         except ValueError:
             dep_id_int = None
-        metrics = dashboard_service.get_current_metrics(department_id=dep_id_int, period=period)
+        # ?metrics=a,b - только нужные виджету метрики
+        metric_names = metric_registry.parse_names(request.GET.get('metrics'))
+        metrics = dashboard_service.get_current_metrics(
+            department_id=dep_id_int, period=period, metrics=metric_names)
         resp = JsonResponse({
             'success': True,
             'data': metrics,
@@ -168,46 +153,23 @@ def dashboard_metrics_api(request):
 def dashboard_events_api(request):
     """API для получения событий в реальном времени"""
     try:
-        # Параметры фильтрации/пагинации
-        limit = int(request.GET.get('limit', 20))
-        page = int(request.GET.get('page', 1))
-        event_type = request.GET.get('event_type')
-        priority = request.GET.get('priority')
-        since = request.GET.get('since')  # ISO-8601 timestamp
-
-        # Базовые события
-        events = dashboard_service.get_recent_events(limit=1000)
-
-        # Фильтрация в памяти (упрощённо). Для больших объёмов — перенести в ORM.
-        if event_type:
-            events = [e for e in events if e.get('type') == event_type]
-        if priority:
-            events = [e for e in events if e.get('priority') == priority]
-        if since:
-            try:
-                from datetime import datetime
-                from django.utils.dateparse import parse_datetime
-                since_dt = parse_datetime(since) or datetime.fromisoformat(since)
-                events = [e for e in events if e.get('timestamp') and (parse_datetime(e['timestamp']) or datetime.fromisoformat(e['timestamp'])) >= since_dt]
-            except Exception:
-                pass
-
-        # Пагинация
-        total = len(events)
-        page_size = max(1, min(100, limit))
-        start = (page - 1) * page_size
-        end = start + page_size
-        page_items = events[start:end]
+        # Параметры фильтрации/пагинации (after - курсор next_cursor)
+        try:
+            limit = int(request.GET.get('limit', 20))
+        except ValueError:
+            limit = 20
+        page = event_feed.events_page(
+            event_type=request.GET.get('event_type'),
+            priority=request.GET.get('priority'),
+            since=event_feed.parse_since(request.GET.get('since')),  # ISO-8601 timestamp
+            after=request.GET.get('after'),
+            limit=limit,
+        )
         
         resp = JsonResponse({
             'success': True,
-            'events': page_items,
-            'pagination': {
-                'page': page,
-                'page_size': page_size,
-                'total': total,
-                'pages': (total + page_size - 1) // page_size,
-            }
+            'events': page.events,
+            'pagination': page.pagination,
         })
         return _apply_no_store_headers(resp)
     except Exception as e:
@@ -219,6 +181,36 @@ def dashboard_events_api(request):
         return _apply_no_store_headers(resp)
 
 
+@login_required
+@require_http_methods(["GET"])
+def metric_series_api(request):
+    """API временного ряда метрики (график долгосрочного тренда)"""
+    metric = request.GET.get('metric', '')
+    resolution = request.GET.get('resolution') or None
+    if not metric or resolution not in (None, *dict(MetricPoint.RESOLUTION_CHOICES)):
+        return JsonResponse({'success': False, 'error': 'Некорректные параметры'}, status=400)
+    try:
+        try:
+            days = max(1, min(int(request.GET.get('days', 7)), 730))
+        except ValueError:
+            days = 7
+        start = event_feed.parse_since(request.GET.get('since')) or timezone.now() - timedelta(days=days)
+        points = metric_series.series(
+            metric, start,
+            labels=request.GET.get('labels', ''),
+            resolution=resolution,
+        )
+        resp = JsonResponse({'success': True, 'metric': metric, 'points': points})
+        return _apply_no_store_headers(resp)
+    except Exception as e:
+        logger.error("Error getting metric series %s: %s", metric, e)
+        resp = JsonResponse({
+            'success': False,
+            'error': 'Ошибка получения ряда метрики'
+        }, status=500)
+        return _apply_no_store_headers(resp)
+
+
 @login_required
 @require_http_methods(["POST"])
 def mark_event_read(request, event_id):
@@ -249,7 +241,13 @@ def mark_event_read(request, event_id):
 def widget_data_api(request, widget_id):
     """API для получения данных конкретного виджета"""
     try:
-        widget = DashboardWidget.objects.get(id=widget_id, is_active=True)
+        widget = widget_layout.widget_for(request.user, widget_id)
+        if widget is None:
+            resp = JsonResponse({
+                'success': False,
+                'error': 'Виджет не найден'
+            }, status=404)
+            return _apply_no_store_headers(resp)
         
         # Получаем данные в зависимости от типа виджета
         dep_id = request.GET.get('department_id')
@@ -267,12 +265,6 @@ def widget_data_api(request, widget_id):
             'last_updated': data.get('timestamp')
         })
         return _apply_no_store_headers(resp)
-    except DashboardWidget.DoesNotExist:
-        resp = JsonResponse({
-            'success': False,
-            'error': 'Виджет не найден'
-        }, status=404)
-        return _apply_no_store_headers(resp)
     except Exception as e:
         logger.error("Error getting widget data: %s", e)
         resp = JsonResponse({
@@ -282,50 +274,91 @@ def widget_data_api(request, widget_id):
         return _apply_no_store_headers(resp)
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def widget_layout_api(request):
+    """API раскладки виджетов: GET - текущая, POST - сохранить отличия от умолчаний"""
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Некорректный JSON'}, status=400)
+        if not isinstance(payload, dict):
+            return JsonResponse({'success': False, 'error': 'Некорректный JSON'}, status=400)
+        try:
+            if payload.get('reset'):
+                widget_layout.reset(request.user)
+            else:
+                widget_layout.save_overrides(request.user, payload.get('overrides'))
+        except Exception as e:
+            logger.error("Error saving dashboard layout for %s: %s", request.user, e)
+            return JsonResponse({'success': False, 'error': 'Ошибка сохранения раскладки'}, status=500)
+    
+    resp = JsonResponse({
+        'success': True,
+        'version': widget_layout.LAYOUT_VERSION,
+        'overrides': widget_layout.get_overrides(request.user),
+        'widgets': [asdict(widget) for widget in widget_layout.layout_for(request.user, include_hidden=True)],
+    })
+    return _apply_no_store_headers(resp)
+
+
+def build_active_visits_csv(user, params):
+    """
+    CSV активных визитов с учетом фильтров department_id/period.
+
+    Returns:
+        (content, filename, content_type)
+    """
+    dep_id = params.get('department_id')
+    period = params.get('period')
+    try:
+        dep_id_int = int(dep_id) if dep_id else None
+    except ValueError:
+        dep_id_int = None
+
+    metrics = dashboard_service.get_current_metrics(
+        department_id=dep_id_int, period=period, metrics=['active_visits'])
+    active = metrics.get('active_visits', {})
+    visits = active.get('visits', [])
+
+    # Формируем CSV (UTF-8 с BOM, разделитель ';', кавычки для безопасного импорта в Excel)
+    import io, csv, datetime as _dt
+    buf = io.StringIO()
+    # Строка для Excel, указываем разделитель
+    buf.write('sep=;\n')
+    writer = csv.writer(buf, delimiter=';', quoting=csv.QUOTE_ALL, lineterminator='\n')
+    headers = ['id', 'type', 'guest_name', 'department', 'employee', 'entry_time', 'duration_minutes']
+    writer.writerow(headers)
+    for v in visits:
+        writer.writerow([
+            v.get('id', ''),
+            v.get('type', ''),
+            v.get('guest_name', ''),
+            v.get('department', ''),
+            v.get('employee', ''),
+            v.get('entry_time', ''),
+            v.get('duration_minutes', 0),
+        ])
+
+    # Выбор кодировки (по умолчанию cp1251 для совместимости с Excel на Windows)
+    enc = (params.get('encoding') or 'cp1251').lower()
+    if enc in ('utf8', 'utf-8', 'utf-8-sig'):
+        content = buf.getvalue().encode('utf-8-sig')
+        resp_ct = 'text/csv; charset=utf-8'
+    else:
+        content = buf.getvalue().encode('cp1251', errors='replace')
+        resp_ct = 'text/csv; charset=windows-1251'
+    filename = f"active_visits_{_dt.datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+    return content, filename, resp_ct
+
+
 @login_required
 @require_http_methods(["GET"])
 def active_visits_csv(request):
     """Экспорт CSV активных визитов с учетом фильтров department_id/period"""
     try:
-        dep_id = request.GET.get('department_id')
-        period = request.GET.get('period')
-        try:
-            dep_id_int = int(dep_id) if dep_id else None
-        except ValueError:
-            dep_id_int = None
-
-        metrics = dashboard_service.get_current_metrics(department_id=dep_id_int, period=period)
-        active = metrics.get('active_visits', {})
-        visits = active.get('visits', [])
-
-        # Формируем CSV (UTF-8 с BOM, разделитель ';', кавычки для безопасного импорта в Excel)
-        import io, csv, datetime as _dt
-        buf = io.StringIO()
-        # Строка для Excel, указываем разделитель
-        buf.write('sep=;\n')
-        writer = csv.writer(buf, delimiter=';', quoting=csv.QUOTE_ALL, lineterminator='\n')
-        headers = ['id', 'type', 'guest_name', 'department', 'employee', 'entry_time', 'duration_minutes']
-        writer.writerow(headers)
-        for v in visits:
-            writer.writerow([
-                v.get('id', ''),
-                v.get('type', ''),
-                v.get('guest_name', ''),
-                v.get('department', ''),
-                v.get('employee', ''),
-                v.get('entry_time', ''),
-                v.get('duration_minutes', 0),
-            ])
-
-        # Выбор кодировки (по умолчанию cp1251 для совместимости с Excel на Windows)
-        enc = (request.GET.get('encoding') or 'cp1251').lower()
-        if enc in ('utf8', 'utf-8', 'utf-8-sig'):
-            content = buf.getvalue().encode('utf-8-sig')
-            resp_ct = 'text/csv; charset=utf-8'
-        else:
-            content = buf.getvalue().encode('cp1251', errors='replace')
-            resp_ct = 'text/csv; charset=windows-1251'
-        filename = f"active_visits_{_dt.datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+        content, filename, resp_ct = build_active_visits_csv(request.user, request.GET)
         resp = HttpResponse(content, content_type=resp_ct)
         resp['Content-Disposition'] = f'attachment; filename="{filename}"'
         return _apply_no_store_headers(resp)
@@ -342,10 +375,11 @@ if REST_FRAMEWORK_AVAILABLE:
         throttle_classes = [UserRateThrottle]
         schema = None  # Автосхема от drf-spectacular через DEFAULT_SCHEMA_CLASS
         
-        def get(self):
-            """Получение всех метрик"""
+        def get(self, request):
+            """Получение метрик (?metrics=a,b - только перечисленные)"""
             try:
-                metrics = dashboard_service.get_current_metrics()
+                metrics = dashboard_service.get_current_metrics(
+                    metrics=metric_registry.parse_names(request.query_params.get('metrics')))
                 return Response({
                     'success': True,
                     'data': metrics
@@ -367,41 +401,18 @@ if REST_FRAMEWORK_AVAILABLE:
         def get(self, request):
             """Получение событий"""
             try:
-                limit = int(request.query_params.get('limit', 20))
-                page = int(request.query_params.get('page', 1))
-                event_type = request.query_params.get('event_type')
-                priority = request.query_params.get('priority')
-                since = request.query_params.get('since')
-
-                events = dashboard_service.get_recent_events(limit=1000)
-                if event_type:
-                    events = [e for e in events if e.get('type') == event_type]
-                if priority:
-                    events = [e for e in events if e.get('priority') == priority]
-                if since:
-                    from datetime import datetime
-                    from django.utils.dateparse import parse_datetime
-                    try:
-                        since_dt = parse_datetime(since) or datetime.fromisoformat(since)
-                        events = [e for e in events if e.get('timestamp') and (parse_datetime(e['timestamp']) or datetime.fromisoformat(e['timestamp'])) >= since_dt]
-                    except Exception:
-                        pass
-
-                total = len(events)
-                page_size = max(1, min(100, limit))
-                start = (page - 1) * page_size
-                end = start + page_size
-                page_items = events[start:end]
+                page = event_feed.events_page(
+                    event_type=request.query_params.get('event_type'),
+                    priority=request.query_params.get('priority'),
+                    since=event_feed.parse_since(request.query_params.get('since')),
+                    after=request.query_params.get('after'),
+                    limit=int(request.query_params.get('limit', 20)),
+                )
                 
                 return Response({
                     'success': True,
-                    'events': page_items,
-                    'pagination': {
-                        'page': page,
-                        'page_size': page_size,
-                        'total': total,
-                        'pages': (total + page_size - 1) // page_size,
-                    }
+                    'events': page.events,
+                    'pagination': page.pagination,
                 }, status=status.HTTP_200_OK)
             except Exception as e:
                 logger.error("API error getting events: %s", e)
@@ -451,249 +462,13 @@ else:
         pass
 
 
-def _create_default_widgets(user):
-    """Создание виджетов по умолчанию"""
-    default_widgets = [
-        {
-            'name': 'visitors_counter',
-            'widget_type': 'counter',
-            'title': 'Всего посетителей',
-            'position_x': 0, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'visitors_count', 'color': 'blue'}
-        },
-        {
-            'name': 'active_visits',
-            'widget_type': 'counter',
-            'title': 'В здании сейчас',
-            'position_x': 3, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'active_visits', 'color': 'green'}
-        },
-        {
-            'name': 'today_registrations',
-            'widget_type': 'counter',
-            'title': 'Регистраций сегодня',
-            'position_x': 6, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'today_registrations', 'color': 'orange'}
-        },
-        {
-            'name': 'avg_duration',
-            'widget_type': 'counter',
-            'title': 'Средняя длительность',
-            'position_x': 9, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'avg_visit_duration', 'color': 'purple'}
-        },
-        {
-            'name': 'hourly_chart',
-            'widget_type': 'chart_line',
-            'title': 'Посещения по часам',
-            'position_x': 0, 'position_y': 2,
-            'width': 8, 'height': 4,
-            'config': {'metric': 'hourly_stats', 'chart_type': 'line'}
-        },
-        {
-            'name': 'department_chart',
-            'widget_type': 'chart_pie',
-            'title': 'По департаментам',
-            'position_x': 8, 'position_y': 2,
-            'width': 4, 'height': 4,
-            'config': {'metric': 'department_stats', 'chart_type': 'pie'}
-        },
-        {
-            'name': 'recent_events',
-            'widget_type': 'activity_feed',
-            'title': 'Последние события',
-            'position_x': 0, 'position_y': 6,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'recent_events', 'limit': 10}
-        },
-        {
-            'name': 'active_visits_table',
-            'widget_type': 'table',
-            'title': 'Активные визиты',
-            'position_x': 6, 'position_y': 6,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'active_visits', 'show_table': True}
-        },
-        # Новые виджеты
-        {
-            'name': 'status_distribution',
-            'widget_type': 'chart_pie',
-            'title': 'Статусы визитов',
-            'position_x': 0, 'position_y': 10,
-            'width': 4, 'height': 4,
-            'config': {'metric': 'status_distribution', 'chart_type': 'pie'}
-        },
-        {
-            'name': 'weekly_trend',
-            'widget_type': 'chart_bar',
-            'title': 'Визиты по дням недели',
-            'position_x': 4, 'position_y': 10,
-            'width': 8, 'height': 4,
-            'config': {'metric': 'weekly_trend', 'chart_type': 'bar'}
-        },
-        {
-            'name': 'duration_distribution',
-            'widget_type': 'chart_bar',
-            'title': 'Распределение по длительности',
-            'position_x': 0, 'position_y': 14,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'duration_distribution', 'chart_type': 'bar'}
-        },
-        {
-            'name': 'visitor_type_comparison',
-            'widget_type': 'chart_line',
-            'title': 'Официальные vs Студенты',
-            'position_x': 6, 'position_y': 14,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'visitor_type_comparison', 'chart_type': 'line'}
-        }
-    ]
-    
-    for widget_config in default_widgets:
-        DashboardWidget.objects.create(
-            created_by=user,
-            **widget_config
-        )
-
-def _ensure_all_widgets_exist(user, existing_names):
-    """Создание отсутствующих виджетов для существующего пользователя"""
-    # Получаем список всех дефолтных виджетов
-    default_widgets = [
-        {
-            'name': 'visitors_counter',
-            'widget_type': 'counter',
-            'title': 'Всего посетителей',
-            'position_x': 0, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'visitors_count', 'color': 'blue'}
-        },
-        {
-            'name': 'active_visits',
-            'widget_type': 'counter',
-            'title': 'В здании сейчас',
-            'position_x': 3, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'active_visits', 'color': 'green'}
-        },
-        {
-            'name': 'today_registrations',
-            'widget_type': 'counter',
-            'title': 'Регистраций сегодня',
-            'position_x': 6, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'today_registrations', 'color': 'orange'}
-        },
-        {
-            'name': 'avg_duration',
-            'widget_type': 'counter',
-            'title': 'Средняя длительность',
-            'position_x': 9, 'position_y': 0,
-            'width': 3, 'height': 2,
-            'config': {'metric': 'avg_visit_duration', 'color': 'purple'}
-        },
-        {
-            'name': 'hourly_chart',
-            'widget_type': 'chart_line',
-            'title': 'Посещения по часам',
-            'position_x': 0, 'position_y': 2,
-            'width': 8, 'height': 4,
-            'config': {'metric': 'hourly_stats', 'chart_type': 'line'}
-        },
-        {
-            'name': 'department_chart',
-            'widget_type': 'chart_pie',
-            'title': 'По департаментам',
-            'position_x': 8, 'position_y': 2,
-            'width': 4, 'height': 4,
-            'config': {'metric': 'department_stats', 'chart_type': 'pie'}
-        },
-        {
-            'name': 'recent_events',
-            'widget_type': 'activity_feed',
-            'title': 'Последние события',
-            'position_x': 0, 'position_y': 6,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'recent_events', 'limit': 10}
-        },
-        {
-            'name': 'active_visits_table',
-            'widget_type': 'table',
-            'title': 'Активные визиты',
-            'position_x': 6, 'position_y': 6,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'active_visits', 'show_table': True}
-        },
-        # Новые виджеты
-        {
-            'name': 'status_distribution',
-            'widget_type': 'chart_pie',
-            'title': 'Статусы визитов',
-            'position_x': 0, 'position_y': 10,
-            'width': 4, 'height': 4,
-            'config': {'metric': 'status_distribution', 'chart_type': 'pie'}
-        },
-        {
-            'name': 'weekly_trend',
-            'widget_type': 'chart_bar',
-            'title': 'Визиты по дням недели',
-            'position_x': 4, 'position_y': 10,
-            'width': 8, 'height': 4,
-            'config': {'metric': 'weekly_trend', 'chart_type': 'bar'}
-        },
-        {
-            'name': 'duration_distribution',
-            'widget_type': 'chart_bar',
-            'title': 'Распределение по длительности',
-            'position_x': 0, 'position_y': 14,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'duration_distribution', 'chart_type': 'bar'}
-        },
-        {
-            'name': 'visitor_type_comparison',
-            'widget_type': 'chart_line',
-            'title': 'Официальные vs Студенты',
-            'position_x': 6, 'position_y': 14,
-            'width': 6, 'height': 4,
-            'config': {'metric': 'visitor_type_comparison', 'chart_type': 'line'}
-        }
-    ]
-    
-    # Создаем только отсутствующие виджеты
-    created_count = 0
-    for widget_config in default_widgets:
-        name = widget_config['name']
-        if name not in existing_names:
-            DashboardWidget.objects.create(
-                created_by=user,
-                **widget_config
-            )
-            created_count += 1
-    
-    if created_count > 0:
-        logger.info("Created %d new widgets for user %s", created_count, user)
-        # Set session variable to notify about new widgets
-        try:
-            # This is assuming the view has access to request object through the user object
-            # If this doesn't work, you might need to modify this approach
-            request = getattr(user, '_request', None)
-            if request and hasattr(request, 'session'):
-                request.session['has_new_widgets'] = True
-                request.session.modified = True
-        except Exception as e:
-            logger.warning("Failed to set session variable for new widgets: %s", e)
-    
-    return created_count
-
-
 def _get_widget_data(widget, department_id=None, period=None):
     """Получение данных для виджета"""
-    metrics = dashboard_service.get_current_metrics(department_id=department_id, period=period)
-    
     metric_name = widget.config.get('metric', '')
+    # Считаем только метрику виджета
+    metrics = dashboard_service.get_current_metrics(
+        department_id=department_id, period=period,
+        metrics=[metric_name] if metric_name in metric_registry.METRICS else [])
     
     if metric_name in metrics:
         # Метрика найдена в данных
@@ -764,7 +539,8 @@ def dashboard_metrics_test_api(request):
             dep_id_int = None
         
         metrics = dashboard_service.get_current_metrics(
-            department_id=dep_id_int, period=period)
+            department_id=dep_id_int, period=period,
+            metrics=metric_registry.parse_names(request.GET.get('metrics')))
         
         resp = JsonResponse({
             'success': True,
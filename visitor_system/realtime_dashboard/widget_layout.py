@@ -0,0 +1,228 @@
+"""
+Раскладка виджетов дашборда: версионированные умолчания + разреженные
+настройки пользователя.
+
+Раньше dashboard_view на каждой загрузке проверял и досоздавал строки
+DashboardWidget, а widget_data_api читал определение виджета из БД на
+каждый опрос. Теперь:
+- виджеты по умолчанию описаны в коде (DEFAULT_WIDGETS); при их изменении
+  увеличивается LAYOUT_VERSION - ключи кэша меняются, и все пользователи
+  сразу получают новую раскладку без миграций и записей;
+- пользователь хранит только отличия от умолчаний - одна JSON-строка
+  DashboardLayout ({имя виджета: {поле: значение}}), которой может не быть;
+- настройки пользователя кэшируются (в том числе их отсутствие), поэтому
+  загрузка дашборда и опрос виджетов не пишут в БД и читают её не более
+  одного раза на промахе кэша.
+"""
+import logging
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+
+from .models import DashboardLayout
+
+logger = logging.getLogger(__name__)
+
+# Увеличивать при любом изменении DEFAULT_WIDGETS
+LAYOUT_VERSION = 1
+
+LAYOUT_CACHE_TTL = 3600
+
+WIDGET_TYPES = {
+    'counter': 'Счетчик',
+    'chart_line': 'Линейный график',
+    'chart_bar': 'Столбчатый график',
+    'chart_pie': 'Круговая диаграмма',
+    'table': 'Таблица',
+    'map': 'Карта',
+    'activity_feed': 'Лента активности',
+    'alert_list': 'Список предупреждений',
+}
+
+# Поля, которые пользователь может переопределить (config - слиянием)
+OVERRIDABLE_FIELDS = {
+    'title': str,
+    'position_x': int,
+    'position_y': int,
+    'width': int,
+    'height': int,
+    'refresh_interval': int,
+    'hidden': bool,
+    'config': dict,
+}
+
+
+@dataclass(frozen=True)
+class Widget:
+    name: str
+    widget_type: str
+    title: str
+    position_x: int
+    position_y: int
+    width: int
+    height: int
+    config: dict = field(default_factory=dict)
+    refresh_interval: int = 30
+    description: str = ''
+    hidden: bool = False
+
+    @property
+    def id(self) -> str:
+        """Идентификатор в разметке и URL виджета - его имя."""
+        return self.name
+
+    def get_widget_type_display(self) -> str:
+        return WIDGET_TYPES.get(self.widget_type, self.widget_type)
+
+    def get_metric_name(self):
+        """Получить имя метрики из конфигурации виджета"""
+        return self.config.get('metric', '')
+
+    def get_css_classes(self):
+        """Получить CSS классы для виджета"""
+        classes = [f"grid-w-{self.width}", f"grid-h-{self.height}"]
+        if self.config.get('color'):
+            classes.append(f"color-{self.config['color']}")
+        return " ".join(classes)
+
+
+DEFAULT_WIDGETS = (
+    Widget('visitors_counter', 'counter', 'Всего посетителей', 0, 0, 3, 2,
+           {'metric': 'visitors_count', 'color': 'blue'}),
+    Widget('active_visits', 'counter', 'В здании сейчас', 3, 0, 3, 2,
+           {'metric': 'active_visits', 'color': 'green'}),
+    Widget('today_registrations', 'counter', 'Регистраций сегодня', 6, 0, 3, 2,
+           {'metric': 'today_registrations', 'color': 'orange'}),
+    Widget('avg_duration', 'counter', 'Средняя длительность', 9, 0, 3, 2,
+           {'metric': 'avg_visit_duration', 'color': 'purple'}),
+    Widget('hourly_chart', 'chart_line', 'Посещения по часам', 0, 2, 8, 4,
+           {'metric': 'hourly_stats', 'chart_type': 'line'}),
+    Widget('department_chart', 'chart_pie', 'По департаментам', 8, 2, 4, 4,
+           {'metric': 'department_stats', 'chart_type': 'pie'}),
+    Widget('recent_events', 'activity_feed', 'Последние события', 0, 6, 6, 4,
+           {'metric': 'recent_events', 'limit': 10}),
+    Widget('active_visits_table', 'table', 'Активные визиты', 6, 6, 6, 4,
+           {'metric': 'active_visits', 'show_table': True}),
+    Widget('status_distribution', 'chart_pie', 'Статусы визитов', 0, 10, 4, 4,
+           {'metric': 'status_distribution', 'chart_type': 'pie'}),
+    Widget('weekly_trend', 'chart_bar', 'Визиты по дням недели', 4, 10, 8, 4,
+           {'metric': 'weekly_trend', 'chart_type': 'bar'}),
+    Widget('duration_distribution', 'chart_bar', 'Распределение по длительности', 0, 14, 6, 4,
+           {'metric': 'duration_distribution', 'chart_type': 'bar'}),
+    Widget('visitor_type_comparison', 'chart_line', 'Официальные vs Студенты', 6, 14, 6, 4,
+           {'metric': 'visitor_type_comparison', 'chart_type': 'line'}),
+)
+
+DEFAULTS_BY_NAME: Dict[str, Widget] = {widget.name: widget for widget in DEFAULT_WIDGETS}
+
+
+def _cache_key(user_id: int) -> str:
+    return f'dash:layout:v{LAYOUT_VERSION}:user:{user_id}'
+
+
+def clean_overrides(raw) -> Dict[str, dict]:
+    """
+    Оставляет только известные виджеты и поля с корректными типами.
+
+    Значения, совпадающие с умолчанием, отбрасываются - хранятся только отличия.
+    """
+    if not isinstance(raw, dict):
+        return {}
+    cleaned = {}
+    for name, fields in raw.items():
+        default = DEFAULTS_BY_NAME.get(name)
+        if default is None or not isinstance(fields, dict):
+            continue
+        item = {}
+        for key, value in fields.items():
+            expected = OVERRIDABLE_FIELDS.get(key)
+            if expected is None or type(value) is not expected:
+                continue
+            if key == 'config':
+                value = {k: v for k, v in value.items() if default.config.get(k) != v}
+                if not value:
+                    continue
+            elif value == getattr(default, key):
+                continue
+            if expected is int and value < 0:
+                continue
+            item[key] = value
+        if item:
+            cleaned[name] = item
+    return cleaned
+
+
+def get_overrides(user) -> Dict[str, dict]:
+    """Настройки пользователя (кэш; отсутствие строки тоже кэшируется)."""
+    if not getattr(user, 'is_authenticated', False):
+        return {}
+    key = _cache_key(user.pk)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.warning("Dashboard layout cache read failed: %s", e)
+        cached = None
+    if cached is not None:
+        return cached
+    overrides = (
+        DashboardLayout.objects.filter(user_id=user.pk).values_list('overrides', flat=True).first()
+    )
+    overrides = clean_overrides(overrides)
+    try:
+        cache.set(key, overrides, LAYOUT_CACHE_TTL)
+    except Exception as e:
+        logger.warning("Dashboard layout cache write failed: %s", e)
+    return overrides
+
+
+def _apply(widget: Widget, fields: dict) -> Widget:
+    if not fields:
+        return widget
+    changes = {key: value for key, value in fields.items() if key != 'config'}
+    if 'config' in fields:
+        changes['config'] = {**widget.config, **fields['config']}
+    return replace(widget, **changes)
+
+
+def layout_for(user, include_hidden: bool = False) -> List[Widget]:
+    """Виджеты пользователя в порядке отображения (строка, колонка)."""
+    overrides = get_overrides(user)
+    widgets = [_apply(widget, overrides.get(widget.name)) for widget in DEFAULT_WIDGETS]
+    if not include_hidden:
+        widgets = [widget for widget in widgets if not widget.hidden]
+    return sorted(widgets, key=lambda widget: (widget.position_y, widget.position_x))
+
+
+def widget_for(user, name: str) -> Optional[Widget]:
+    """Видимый виджет пользователя по имени (None - нет такого или скрыт)."""
+    default = DEFAULTS_BY_NAME.get(name)
+    if default is None:
+        return None
+    widget = _apply(default, get_overrides(user).get(name))
+    return None if widget.hidden else widget
+
+
+def save_overrides(user, raw) -> Dict[str, dict]:
+    """Сохраняет отличия пользователя от умолчаний (пустые - удаляют строку)."""
+    overrides = clean_overrides(raw)
+    if overrides:
+        DashboardLayout.objects.update_or_create(
+            user=user, defaults={'overrides': overrides, 'base_version': LAYOUT_VERSION},
+        )
+    else:
+        DashboardLayout.objects.filter(user=user).delete()
+    invalidate(user.pk)
+    return overrides
+
+
+def reset(user) -> None:
+    """Возвращает пользователю раскладку по умолчанию."""
+    save_overrides(user, {})
+
+
+def invalidate(user_id: int) -> None:
+    try:
+        cache.delete(_cache_key(user_id))
+    except Exception as e:
+        logger.warning("Dashboard layout cache invalidation failed: %s", e)
@@ -1,33 +1,197 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
+from . import metric_registry, metrics_stream
+from .counters import GLOBAL_GROUP, groups_for_scope, resolve_scope
 from .services import dashboard_service
 
+# Как часто активная подписка продлевает регистрацию потока (секунды);
+# должно быть заметно меньше DASHBOARD_STREAM_REGISTRATION_TTL
+STREAM_REGISTER_INTERVAL = 300
+
 
 class DashboardConsumer(AsyncWebsocketConsumer):
-    group_name = "dashboard_updates"
+    group_name = GLOBAL_GROUP
 
     async def connect(self):
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            # Без пользователя нет области видимости (как в get_scoped_visits_qs)
+            await self.close()
+            return
+
+        # Группы по области видимости: все события - только администраторам
+        # и ресепшн, остальным - события и счётчики своего департамента
+        self.access_scope = await sync_to_async(resolve_scope)(user)
+        self.groups_joined = groups_for_scope(user.id, self.access_scope)
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        # Метрики больше не отправляются целиком при подключении:
+        # клиент подписывается на поток сообщением subscribe
+        self.stream = None
+        self.user_id = user.id
         await self.accept()
-        # Отправляем начальные метрики (не блокируем event loop)
-        metrics = await sync_to_async(dashboard_service.get_current_metrics)()
+        await self._send_counters()
+
+    async def _send_counters(self, invalidate=False):
+        from visitors.counters import get_counter_snapshot, invalidate_counters
+        department_id = self.access_scope["department_id"]
+        if invalidate:
+            await sync_to_async(invalidate_counters)(department_id, self.user_id)
+        snapshot = await sync_to_async(get_counter_snapshot)(department_id, self.user_id)
         await self.send_json({
-            "type": "initial",
-            "data": metrics,
+            "type": "counters",
+            "data": snapshot["counters"],
+            "etag": snapshot["etag"],
         })
 
-    async def disconnect(self):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+    async def disconnect(self, code=None):
+        for group in getattr(self, "groups_joined", []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        await self._leave_stream()
 
     async def receive(self, text_data=None):
         try:
             message = json.loads(text_data or "{}")
         except Exception:
             message = {}
-        # Пока: поддерживаем ping
         if message.get("type") == "ping":
             await self.send_json({"type": "pong"})
+        elif message.get("type") == "subscribe":
+            await self._subscribe(message)
+        elif message.get("type") == "unsubscribe":
+            await self._leave_stream()
+
+    # ==================== Поток метрик ====================
+
+    async def _subscribe(self, message):
+        """
+        {"type": "subscribe", "department_id": 3, "period": "24h",
+         "metrics": ["active_visits", ...], "epoch": "...", "since": 42}
+
+        department_id - только для администраторов и ресепшн, остальным
+        всегда их департамент; metrics - подмножество метрик (по умолчанию
+        все); epoch и since - эпоха и последний полученный seq
+        (продолжение после переподключения).
+        """
+        if self.access_scope["is_global"]:
+            try:
+                department_id = int(message.get("department_id") or 0) or None
+            except (TypeError, ValueError):
+                department_id = None
+        else:
+            department_id = self.access_scope["department_id"]
+            if not department_id:
+                await self.send_json({"type": "error", "error": "metrics_unavailable"})
+                return
+
+        metrics = message.get("metrics")
+        if isinstance(metrics, list):
+            metrics = [name for name in metrics if name in metric_registry.METRICS]
+        else:
+            metrics = None
+
+        await self._leave_stream()
+        sid = metrics_stream.stream_id(department_id, message.get("period"))
+        # seq - последняя обработанная дельта, sent_seq - последняя
+        # отправленная клиенту (дельты без подписанных метрик не отправляются)
+        self.stream = {"id": sid, "metrics": metrics, "epoch": None, "seq": 0, "sent_seq": 0}
+        # Сначала вступаем в группу, затем читаем состояние: дельты, пришедшие
+        # в это время, отбрасываются по seq
+        await self.channel_layer.group_add(metrics_stream.stream_group(sid), self.channel_name)
+        await sync_to_async(metrics_stream.register_stream)(sid)
+        self.stream_renewal = asyncio.ensure_future(self._renew_stream(sid))
+
+        since, epoch = message.get("since"), message.get("epoch")
+        deltas = None
+        if isinstance(since, int) and since > 0 and isinstance(epoch, str):
+            deltas = await sync_to_async(metrics_stream.deltas_since)(sid, since, epoch)
+        if deltas is not None:
+            self.stream.update(epoch=epoch, seq=since, sent_seq=since)
+            for entry in deltas:
+                await self._send_delta(epoch, entry["seq"], entry["ops"])
+            await self.send_json({
+                "type": "metrics_resumed", "version": metrics_stream.PROTOCOL_VERSION,
+                "stream": sid, "epoch": epoch, "seq": self.stream["sent_seq"],
+            })
+            return
+
+        await self._send_snapshot()
+
+    async def _send_snapshot(self):
+        stream = self.stream
+        state = await sync_to_async(metrics_stream.snapshot)(dashboard_service, stream["id"])
+        if self.stream is not stream:
+            return
+        stream.update(epoch=state.get("epoch"), seq=state["seq"], sent_seq=state["seq"])
+        await self.send_json({
+            "type": "metrics_snapshot",
+            "version": metrics_stream.PROTOCOL_VERSION,
+            "stream": stream["id"],
+            "epoch": stream["epoch"],
+            "seq": state["seq"],
+            "data": metrics_stream.filter_state(state["metrics"], stream["metrics"]),
+        })
+
+    async def _renew_stream(self, sid):
+        """Продлевает регистрацию потока, пока клиент подписан (даже без дельт)."""
+        while True:
+            await asyncio.sleep(STREAM_REGISTER_INTERVAL)
+            await sync_to_async(metrics_stream.register_stream)(sid)
+
+    async def _leave_stream(self):
+        renewal = getattr(self, "stream_renewal", None)
+        if renewal is not None:
+            renewal.cancel()
+            self.stream_renewal = None
+        stream = getattr(self, "stream", None)
+        if stream:
+            await self.channel_layer.group_discard(metrics_stream.stream_group(stream["id"]), self.channel_name)
+        self.stream = None
+
+    async def _send_delta(self, epoch, seq, ops):
+        """
+        Дельта клиенту; операции по неподписанным метрикам отбрасываются.
+
+        Дельта другой эпохи означает, что состояние потока было создано
+        заново: клиент получает новый снимок.
+        """
+        stream = self.stream
+        if stream is None:
+            return
+        if epoch != stream["epoch"]:
+            await self._send_snapshot()
+            return
+        if seq <= stream["seq"]:
+            return
+        stream["seq"] = seq
+        ops = metrics_stream.filter_ops(ops, stream["metrics"])
+        if not ops:
+            return
+        prev_seq = stream["sent_seq"]
+        stream["sent_seq"] = seq
+        await self.send_json({
+            "type": "metrics_delta",
+            "stream": stream["id"],
+            "epoch": epoch,
+            "seq": seq,
+            "prev_seq": prev_seq,
+            "ops": ops,
+        })
+
+    async def metrics_delta(self, event):
+        stream = self.stream
+        if stream is None or event.get("stream") != stream["id"]:
+            return
+        await self._send_delta(event.get("epoch"), event["seq"], event["ops"])
+
+    async def metrics_reset(self, event):
+        """Состояние потока создано заново (новая эпоха) - отправляем снимок."""
+        stream = self.stream
+        if stream is None or event.get("stream") != stream["id"] or event.get("epoch") == stream["epoch"]:
+            return
+        await self._send_snapshot()
 
     async def send_json(self, content):
         await self.send(text_data=json.dumps(content, ensure_ascii=False))
@@ -36,4 +200,6 @@ class DashboardConsumer(AsyncWebsocketConsumer):
     async def dashboard_broadcast(self, event):
         await self.send_json(event.get("message", {}))
 
-
+    async def counters_refresh(self, event):
+        # Студенческий визит изменился - снимок сотрудника без департамента устарел
+        await self._send_counters(invalidate=True)
@@ -51,6 +51,50 @@ app.conf.beat_schedule = {
         'task': 'hikvision_integration.tasks.monitor_guest_passages_task',
         'schedule': crontab(minute='*/5'),  # Каждые 5 минут (для авто check-in/out)
     },
+    'evaluate-anomaly-rules': {
+        'task': 'hikvision_integration.tasks.evaluate_anomaly_rules_task',
+        'schedule': crontab(minute='*/5'),  # Долгое пребывание, нерабочее время, выход без входа
+    },
+    'reconcile-guest-presence': {
+        'task': 'hikvision_integration.tasks.reconcile_guest_presence_task',
+        'schedule': crontab(minute='*/30'),  # Сверка Redis-множества гостей в здании с БД
+    },
+    'publish-dashboard-metrics': {
+        'task': 'realtime_dashboard.tasks.publish_dashboard_metrics_task',
+        'schedule': crontab(minute='*'),  # Каждую минуту: дельты метрик подписчикам WebSocket
+    },
+    'flush-realtime-events': {
+        'task': 'realtime_dashboard.tasks.flush_realtime_events_task',
+        'schedule': crontab(minute='*'),  # Страховка: события, для которых не поставилась задача записи
+    },
+    'cleanup-export-jobs': {
+        'task': 'visitors.tasks.cleanup_export_jobs_task',
+        'schedule': crontab(minute=15),  # Каждый час: просроченные файлы выгрузок
+    },
+    'repair-visit-rollups': {
+        'task': 'realtime_dashboard.tasks.repair_visit_rollups_task',
+        'schedule': crontab(minute=7),  # Каждый час: сверка агрегатов визитов с исходными таблицами
+    },
+    'rebuild-visit-timeline': {
+        'task': 'visitors.tasks.rebuild_visit_timeline_task',
+        'schedule': crontab(hour=3, minute=10),  # Ежедневно: сверка ленты визитов (календарь, история) с исходными таблицами
+    },
+    'deep-repair-visit-rollups': {
+        'task': 'realtime_dashboard.tasks.deep_repair_visit_rollups_task',
+        'schedule': crontab(hour=3, minute=40),  # Ежедневно: сверка агрегатов визитов за год (окно графиков)
+    },
+    'maintain-event-partitions': {
+        'task': 'realtime_dashboard.tasks.cleanup_old_events',
+        'schedule': crontab(hour=0, minute=20),  # Ежедневно: секции событий дашборда на неделю вперёд, удаление старых
+    },
+    'record-metric-series': {
+        'task': 'realtime_dashboard.tasks.record_metric_series_task',
+        'schedule': crontab(minute='*/5'),  # Каждые 5 минут: замер метрик во временные ряды
+    },
+    'downsample-metric-series': {
+        'task': 'realtime_dashboard.tasks.downsample_metric_series_task',
+        'schedule': crontab(minute=12),  # Каждый час: часовые/дневные точки и очистка рядов
+    },
     'backup-database': {
         'task': 'visitors.tasks.backup_database_task',
         'schedule': crontab(hour=3, minute=0),  # Ежедневно в 3:00
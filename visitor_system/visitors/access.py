@@ -0,0 +1,133 @@
+"""
+Область доступа пользователя к визитам (AccessScope).
+
+Роль (staff / ресепшн) и департамент сотрудника раньше определялись
+заново в каждой view, API и экспорте: запрос к auth_user_groups плюс
+запрос к EmployeeProfile. Теперь они вычисляются один раз:
+- на время запроса - объект запоминается на request.user;
+- между запросами - в кэше на ACCESS_SCOPE_TTL секунд.
+
+Кэш сбрасывается сигналами (visitors/signals.py) при изменении групп
+пользователя, флага is_staff или профиля сотрудника.
+"""
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Имя группы для сотрудников ресепшн
+RECEPTION_GROUP = "Reception"
+
+# Атрибут request.user, в котором хранится область на время запроса
+_USER_ATTR = '_access_scope'
+
+
+def _ttl() -> int:
+    return getattr(settings, 'ACCESS_SCOPE_TTL', 60)
+
+
+def scope_cache_key(user_id: int) -> str:
+    return f'access_scope:{user_id}'
+
+
+@dataclass(frozen=True)
+class AccessScope:
+    """
+    Что пользователь видит в истории, на дашбордах и в экспорте.
+
+    - sees_all: администраторы (is_staff) и ресепшн видят все визиты;
+    - остальные видят визиты своего департамента (department_id);
+    - без профиля или департамента - ничего.
+    """
+    user_id: Optional[int]
+    is_authenticated: bool = False
+    is_staff: bool = False
+    is_reception: bool = False
+    department_id: Optional[int] = None
+
+    @property
+    def sees_all(self) -> bool:
+        return self.is_staff or self.is_reception
+
+    def filter_visits(self, qs, field: str = 'department'):
+        """Ограничивает QuerySet визитов (Visit, StudentVisit, GroupInvitation) областью."""
+        if self.sees_all:
+            return qs
+        if not self.is_authenticated or self.department_id is None:
+            return qs.none()
+        return qs.filter(**{f'{field}_id': self.department_id})
+
+
+ANONYMOUS_SCOPE = AccessScope(user_id=None)
+
+
+def compute_access_scope(user) -> AccessScope:
+    """Два запроса: группа ресепшн и департамент из EmployeeProfile."""
+    from .models import EmployeeProfile
+
+    if user is None or not user.is_authenticated or user.pk is None:
+        return ANONYMOUS_SCOPE
+    department_id = EmployeeProfile.objects.filter(user_id=user.pk).values_list(
+        'department_id', flat=True
+    ).first()
+    return AccessScope(
+        user_id=user.pk,
+        is_authenticated=True,
+        is_staff=bool(user.is_staff),
+        is_reception=user.groups.filter(name=RECEPTION_GROUP).exists(),
+        department_id=department_id,
+    )
+
+
+def get_access_scope(user) -> AccessScope:
+    """
+    Область доступа пользователя (запрос -> кэш -> БД).
+
+    Принимает пользователя или request; повторные вызовы в рамках
+    одного запроса не обращаются ни к кэшу, ни к БД.
+    """
+    if hasattr(user, 'user') and hasattr(user, 'META'):
+        user = user.user  # передан request
+    if user is None or not user.is_authenticated or user.pk is None:
+        return ANONYMOUS_SCOPE
+
+    scope = getattr(user, _USER_ATTR, None)
+    if scope is not None:
+        return scope
+
+    key = scope_cache_key(user.pk)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.warning("Access scope cache read failed: %s", e)
+        cached = None
+
+    if cached is not None:
+        scope = AccessScope(**cached)
+        # is_staff уже загружен вместе с пользователем - берём актуальный
+        if scope.is_staff != bool(user.is_staff):
+            scope = None
+    if scope is None:
+        scope = compute_access_scope(user)
+        try:
+            cache.set(key, asdict(scope), _ttl())
+        except Exception as e:
+            logger.warning("Access scope cache write failed: %s", e)
+
+    setattr(user, _USER_ATTR, scope)
+    return scope
+
+
+def invalidate_access_scope(*user_ids: int) -> None:
+    """Сбрасывает кэшированную область (смена групп, is_staff или профиля)."""
+    keys = [scope_cache_key(user_id) for user_id in user_ids if user_id]
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning("Access scope cache invalidation failed: %s", e)
@@ -149,12 +149,9 @@ def auto_checkin_dashboard(request):
         detected_at__lte=end_date
     ).count()
     
-    # Текущие гости в здании
-    guests_inside = Visit.objects.filter(
-        status='CHECKED_IN',
-        access_granted=True,
-        access_revoked=False
-    ).count()
+    # Текущие гости в здании (Redis-множество presence, O(1))
+    from hikvision_integration.presence import guests_inside_count
+    guests_inside = guests_inside_count()
     
     # Статистика по типам инцидентов
     incident_stats = SecurityIncident.objects.filter(
@@ -360,7 +357,9 @@ def hikcentral_dashboard(request):
     # Rate limiter status (если есть доступ к метрикам)
     try:
         from hikvision_integration.rate_limiter import get_rate_limiter
-        rate_limiter = get_rate_limiter()
+        from hikvision_integration.routing import get_default_server
+        # У каждого сервера свой бюджет - показываем сервер по умолчанию
+        rate_limiter = get_rate_limiter(server=get_default_server())
         rate_limit_status = {
             'calls_limit': rate_limiter.calls,
             'window_seconds': rate_limiter.window,
@@ -0,0 +1,263 @@
+"""
+Префиксный индекс активных сотрудников для автокомплита.
+
+employee_autocomplete_view вызывается на каждое нажатие клавиши. Вместо
+запроса к auth_user ответ строится из индекса в памяти процесса:
+- индекс собирается одним запросом (активные пользователи + департамент
+  профиля) и кладётся в кэш (Redis), чтобы все воркеры делили одну сборку;
+- каждый процесс держит свою копию и раз в EMPLOYEE_INDEX_CHECK_INTERVAL
+  секунд сверяет версию с кэшем;
+- сигналы (visitors/signals.py) сбрасывают версию при изменении пользователя
+  или профиля сотрудника, и индекс пересобирается при следующем запросе;
+- пересобирает его один процесс (блокировка cache.add), остальные до
+  появления новой версии отвечают старой копией или запросом к БД.
+
+Поиск - по началу слов ФИО и email с учётом транслитерации (search.py):
+bisect по отсортированному списку токенов департамента. Если по началу
+слов ничего не нашлось, ответ строит search_employees (вхождение подстроки
+и триграммное ранжирование, как до индекса) - «ова» находит «Иванову».
+"""
+import bisect
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from .search import name_variants, to_cyrillic, to_latin
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'employee_index:version'
+DATA_KEY = 'employee_index:data'
+BUILD_LOCK_KEY = 'employee_index:build_lock'
+
+# Ключ «все департаменты» в словаре токенов
+ALL_DEPARTMENTS = 0
+
+_local = {'version': None, 'index': None, 'checked_at': 0.0}
+_lock = threading.Lock()
+
+
+def _check_interval() -> float:
+    return getattr(settings, 'EMPLOYEE_INDEX_CHECK_INTERVAL', 5)
+
+
+def _build_lock_ttl() -> int:
+    return getattr(settings, 'EMPLOYEE_INDEX_BUILD_LOCK_TTL', 30)
+
+
+def _tokens(*values: str) -> set:
+    """Слова ФИО/email в нижнем регистре + их транслитерация."""
+    tokens = set()
+    for value in values:
+        if not value:
+            continue
+        value = value.lower()
+        words = value.replace('@', ' ').replace('.', ' ').split()
+        if '@' in value:
+            words.append(value)  # email целиком
+        for word in words:
+            tokens.update((word, to_latin(word), to_cyrillic(word)))
+    tokens.discard('')
+    return tokens
+
+
+class EmployeeIndex:
+    """
+    Снимок активных сотрудников.
+
+    entries: user_id -> (text, sort_key, department_id)
+    tokens: department_id -> отсортированный список (token, user_id)
+    """
+
+    def __init__(self, entries: Dict[int, Tuple[str, tuple, Optional[int]]],
+                 tokens: Dict[int, List[Tuple[str, int]]]):
+        self.entries = entries
+        self.tokens = tokens
+        self.ordered = {
+            dept_id: sorted({user_id for _, user_id in pairs}, key=lambda pk: entries[pk][1])
+            for dept_id, pairs in tokens.items()
+        }
+
+    @classmethod
+    def build(cls) -> 'EmployeeIndex':
+        rows = User.objects.filter(is_active=True).values_list(
+            'id', 'username', 'first_name', 'last_name', 'email',
+            'employee_profile__department_id',
+        )
+        return cls.from_rows(rows.iterator(chunk_size=2000))
+
+    @classmethod
+    def from_rows(cls, rows) -> 'EmployeeIndex':
+        """rows: (id, username, first_name, last_name, email, department_id)"""
+        entries = {}
+        tokens: Dict[int, List[Tuple[str, int]]] = {ALL_DEPARTMENTS: []}
+        for user_id, username, first_name, last_name, email, dept_id in rows:
+            full_name = f"{first_name} {last_name}".strip()
+            entries[user_id] = (
+                f"{full_name or username} ({email})",
+                (last_name.lower(), first_name.lower(), user_id),
+                dept_id,
+            )
+            # Как и прежний поиск - только ФИО и email, без логина
+            pairs = [(token, user_id) for token in _tokens(first_name, last_name, email)]
+            tokens[ALL_DEPARTMENTS].extend(pairs)
+            if dept_id:
+                tokens.setdefault(dept_id, []).extend(pairs)
+        for pairs in tokens.values():
+            pairs.sort()
+        return cls(entries, tokens)
+
+    def search(self, term: str, department_id: Optional[int] = None,
+               limit: int = 20) -> List[dict]:
+        """Результаты в формате автокомплита: [{'id', 'text'}, ...]."""
+        key = department_id or ALL_DEPARTMENTS
+        pairs = self.tokens.get(key, [])
+        variants = [variant.lower() for variant in name_variants(term)]
+        if not variants:
+            ids = self.ordered.get(key, [])[:limit]
+        else:
+            found = set()
+            for variant in variants:
+                start = bisect.bisect_left(pairs, (variant,))
+                for token, user_id in pairs[start:]:
+                    if not token.startswith(variant):
+                        break
+                    found.add(user_id)
+            ids = sorted(found, key=lambda pk: self.entries[pk][1])[:limit]
+        return [{'id': pk, 'text': self.entries[pk][0]} for pk in ids]
+
+
+def _load_shared(version: str) -> Optional[EmployeeIndex]:
+    try:
+        data = cache.get(DATA_KEY)
+    except Exception as e:
+        logger.warning("Employee index cache read failed: %s", e)
+        return None
+    if not data or data.get('version') != version:
+        return None
+    # Кэш сериализуется в JSON: ключи словарей и кортежи восстанавливаем
+    entries = {
+        user_id: (text, tuple(sort_key), dept_id)
+        for user_id, text, sort_key, dept_id in data['entries']
+    }
+    tokens = {
+        dept_id: [tuple(pair) for pair in pairs]
+        for dept_id, pairs in data['tokens']
+    }
+    return EmployeeIndex(entries, tokens)
+
+
+def _store_shared(index: EmployeeIndex) -> str:
+    version = uuid.uuid4().hex
+    try:
+        cache.set_many({
+            DATA_KEY: {
+                'version': version,
+                'entries': [[user_id, *entry] for user_id, entry in index.entries.items()],
+                'tokens': list(index.tokens.items()),
+            },
+            VERSION_KEY: version,
+        }, None)
+    except Exception as e:
+        logger.warning("Employee index cache write failed: %s", e)
+    return version
+
+
+def _acquire_build() -> Optional[str]:
+    """Блокировка сборки между процессами; токен владельца или None."""
+    token = uuid.uuid4().hex
+    try:
+        return token if cache.add(BUILD_LOCK_KEY, token, _build_lock_ttl()) else None
+    except Exception as e:
+        logger.warning("Employee index build lock failed: %s", e)
+        # Без Redis блокировку не взять - собираем сами
+        return token
+
+
+def _release_build(token: str) -> None:
+    try:
+        if cache.get(BUILD_LOCK_KEY) == token:
+            cache.delete(BUILD_LOCK_KEY)
+    except Exception as e:
+        logger.warning("Employee index build unlock failed: %s", e)
+
+
+def get_index() -> Optional[EmployeeIndex]:
+    """
+    Индекс текущего процесса (с проверкой версии не чаще раза в интервал).
+
+    Returns:
+        None - общего индекса нет, его собирает другой процесс, а своей
+        копии ещё нет (ответ нужно строить запросом к БД)
+    """
+    now = time.monotonic()
+    if _local['index'] is not None and now - _local['checked_at'] < _check_interval():
+        return _local['index']
+
+    with _lock:
+        try:
+            version = cache.get(VERSION_KEY)
+        except Exception as e:
+            logger.warning("Employee index version read failed: %s", e)
+            version = _local['version']
+
+        if version is None or version != _local['version'] or _local['index'] is None:
+            index = _load_shared(version) if version else None
+            if index is None:
+                token = _acquire_build()
+                if token is None:
+                    # Собирает другой процесс: до новой версии - старая копия
+                    _local['checked_at'] = now
+                    return _local['index']
+                try:
+                    index = EmployeeIndex.build()
+                    version = _store_shared(index)
+                finally:
+                    _release_build(token)
+            _local['index'] = index
+            _local['version'] = version
+        _local['checked_at'] = now
+        return _local['index']
+
+
+def invalidate() -> None:
+    """Сбрасывает общий индекс; процессы пересоберут его при следующем запросе."""
+    _local['checked_at'] = 0.0
+    try:
+        cache.delete_many([VERSION_KEY, DATA_KEY])
+    except Exception as e:
+        logger.warning("Employee index invalidation failed: %s", e)
+
+
+def _search_db(term: str, department_id: Optional[int], limit: int) -> List[dict]:
+    """Поиск по вхождению подстроки с триграммным ранжированием (search.py)."""
+    from .search import search_employees
+
+    return [
+        {'id': user.id, 'text': f"{user.get_full_name() or user.username} ({user.email})"}
+        for user in search_employees(term, department_id, limit=limit)
+    ]
+
+
+def search(term: str, department_id: Optional[int] = None, limit: int = 20) -> List[dict]:
+    """
+    Автокомплит сотрудников: совпадения по началу слов из индекса, иначе БД.
+
+    Строка, которая не является началом слова («ова», «vanova»), ищется
+    search_employees по вхождению - как до индекса.
+    """
+    try:
+        index = get_index()
+    except Exception as e:
+        logger.warning("Employee index unavailable, falling back to DB: %s", e)
+        index = None
+    results = index.search(term, department_id, limit) if index is not None else []
+    if results or (index is not None and not term):
+        return results
+    return _search_db(term, department_id, limit)
@@ -0,0 +1,337 @@
+"""
+Фоновые выгрузки (ExportJob).
+
+Тяжёлые выгрузки больше не держат gunicorn-воркер: представление создаёт
+ExportJob и ставит Celery-задачу render_export_job_task, которая пишет файл
+в хранилище и обновляет прогресс. Страница опрашивает статус через HTMX и
+по готовности получает подписанную ссылку на скачивание.
+
+Одинаковые запросы (тип + параметры + область доступа) в течение
+EXPORT_DEDUPE_TTL секунд получают ту же задачу: кэш filter_hash -> job id.
+PDF-отчёты содержат имя сотрудника, поэтому их область - сам пользователь.
+
+Типы выгрузок описаны в EXPORT_KINDS. История визитов формируется
+напрямую (history_export, с настоящим прогрессом по строкам), остальные
+выгрузки вызывают те же build_* функции (user, params), что и синхронные
+представления; права проверяются при постановке задачи.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.signing import BadSignature, SignatureExpired, TimestampSigner
+from django.db import transaction
+from django.http import QueryDict
+from django.utils import timezone
+
+from .access import get_access_scope
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_SALT = 'visitors.export_job.download'
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _dedupe_ttl() -> int:
+    return getattr(settings, 'EXPORT_DEDUPE_TTL', 300)
+
+
+def _retention() -> timedelta:
+    return timedelta(hours=getattr(settings, 'EXPORT_RETENTION_HOURS', 24))
+
+
+def _link_max_age() -> int:
+    return getattr(settings, 'EXPORT_LINK_MAX_AGE', 3600)
+
+
+class ExportError(Exception):
+    """Выгрузку не удалось сформировать."""
+
+
+@dataclass(frozen=True)
+class ExportKind:
+    label: str
+    # Проверка прав пользователя при постановке задачи
+    allowed: Callable
+    # Формирует файл: (job, progress) -> (fileobj|bytes, filename, content_type)
+    render: Callable
+    # Зависит ли содержимое от области доступа (департамента) пользователя
+    scoped: bool = False
+    # Содержимое персонально (имя сотрудника в отчёте): задача не
+    # переиспользуется и не доступна другим пользователям
+    personal: bool = False
+
+
+# ==================== RENDERERS ====================
+
+def _render_visit_history(job: ExportJob, progress: Callable[[int, int], None]):
+    from .history_export import export_querysets, write_visits_xlsx
+
+    official_qs, student_qs = export_querysets(job.user, _query_dict(job.params))
+    total = official_qs.count() + student_qs.count()
+    progress(0, total)
+
+    tmp = tempfile.TemporaryFile()
+    try:
+        rows = write_visits_xlsx(
+            official_qs, student_qs, tmp,
+            progress=lambda done: progress(done, total),
+        )
+    except Exception:
+        tmp.close()
+        raise
+    job.rows = rows
+    filename = f"visit_history_{timezone.localtime().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    return tmp, filename, XLSX_CONTENT_TYPE
+
+
+def _builder_renderer(import_path: str) -> Callable:
+    """
+    Выгрузка через build_* функцию синхронного экспорта (PDF/Excel дашбордов, CSV).
+
+    Функция получает пользователя задачи и её параметры и возвращает
+    (content, filename, content_type) - как для ответа представления.
+    """
+    def render(job: ExportJob, progress: Callable[[int, int], None]):
+        from django.utils.module_loading import import_string
+
+        build = import_string(import_path)
+        return build(job.user, _query_dict(job.params))
+    return render
+
+
+def _has_history_export_perm(user) -> bool:
+    return user.is_staff or user.has_perm('visitors.can_view_visit_statistics')
+
+
+def _perm(codename: str) -> Callable:
+    return lambda user: user.has_perm(codename)
+
+
+EXPORT_KINDS: Dict[str, ExportKind] = {
+    'visit_history_xlsx': ExportKind(
+        'История визитов (Excel)', _has_history_export_perm, _render_visit_history, scoped=True,
+    ),
+    'auto_checkin_pdf': ExportKind(
+        'Auto Check-in (PDF)', _perm('visitors.view_visit'),
+        _builder_renderer('visitors.exports.build_auto_checkin_pdf'), personal=True,
+    ),
+    'auto_checkin_excel': ExportKind(
+        'Auto Check-in (Excel)', _perm('visitors.view_visit'),
+        _builder_renderer('visitors.exports.build_auto_checkin_excel'),
+    ),
+    'security_incidents_pdf': ExportKind(
+        'Инциденты безопасности (PDF)', _perm('visitors.view_securityincident'),
+        _builder_renderer('visitors.exports.build_security_incidents_pdf'), personal=True,
+    ),
+    'security_incidents_excel': ExportKind(
+        'Инциденты безопасности (Excel)', _perm('visitors.view_securityincident'),
+        _builder_renderer('visitors.exports.build_security_incidents_excel'),
+    ),
+    'hikcentral_pdf': ExportKind(
+        'HikCentral (PDF)', _perm('visitors.view_visit'),
+        _builder_renderer('visitors.exports.build_hikcentral_pdf'), personal=True,
+    ),
+    'hikcentral_excel': ExportKind(
+        'HikCentral (Excel)', _perm('visitors.view_visit'),
+        _builder_renderer('visitors.exports.build_hikcentral_excel'),
+    ),
+    'active_visits_csv': ExportKind(
+        'Активные визиты (CSV)', lambda user: user.is_authenticated,
+        _builder_renderer('realtime_dashboard.views.build_active_visits_csv'),
+    ),
+}
+
+
+# ==================== JOBS ====================
+
+def _normalize_params(params) -> Dict[str, list]:
+    """QueryDict/dict -> {key: [values]} без служебных и пустых значений."""
+    if isinstance(params, QueryDict):
+        items = params.lists()
+    else:
+        items = ((key, value if isinstance(value, list) else [value]) for key, value in (params or {}).items())
+    normalized = {}
+    for key, values in items:
+        if key in ('csrfmiddlewaretoken', 'page', 'after', 'before'):
+            continue
+        values = [str(value) for value in values if value not in (None, '')]
+        if values:
+            normalized[key] = values
+    return dict(sorted(normalized.items()))
+
+
+def _query_dict(params: Dict[str, list]) -> QueryDict:
+    query = QueryDict(mutable=True)
+    for key, values in (params or {}).items():
+        query.setlist(key, values)
+    query._mutable = False
+    return query
+
+
+def scope_key(user, kind: ExportKind) -> str:
+    if kind.personal:
+        return f'user:{user.pk}'
+    if not kind.scoped:
+        return 'all'
+    scope = get_access_scope(user)
+    if scope.sees_all:
+        return 'all'
+    return f'dept:{scope.department_id}' if scope.department_id else f'user:{user.pk}'
+
+
+def filter_hash(kind_name: str, params: Dict[str, list], scope: str) -> str:
+    payload = json.dumps({'kind': kind_name, 'params': params, 'scope': scope}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _dedupe_key(digest: str) -> str:
+    return f'export_job:{digest}'
+
+
+def _reusable(job: Optional[ExportJob]) -> bool:
+    if job is None or job.status == ExportJob.STATUS_FAILED or job.is_expired:
+        return False
+    return job.status != ExportJob.STATUS_DONE or bool(job.file)
+
+
+def can_access(user, job: ExportJob) -> bool:
+    """Доступ к задаче: автор или пользователь с теми же правами и областью."""
+    if job.user_id == user.pk:
+        return True
+    kind = EXPORT_KINDS.get(job.kind)
+    return kind is not None and kind.allowed(user) and scope_key(user, kind) == job.scope_key
+
+
+def start_export(user, kind_name: str, params) -> Tuple[ExportJob, bool]:
+    """
+    Создаёт задачу выгрузки или возвращает недавнюю с теми же параметрами.
+
+    Returns:
+        (job, created)
+
+    Raises:
+        KeyError: неизвестный тип выгрузки
+        PermissionError: у пользователя нет прав на выгрузку
+    """
+    kind = EXPORT_KINDS[kind_name]
+    if not kind.allowed(user):
+        raise PermissionError(kind_name)
+
+    params = _normalize_params(params)
+    scope = scope_key(user, kind)
+    digest = filter_hash(kind_name, params, scope)
+
+    try:
+        job_id = cache.get(_dedupe_key(digest))
+    except Exception as e:
+        logger.warning("Export dedupe cache read failed: %s", e)
+        job_id = None
+    if job_id:
+        job = ExportJob.objects.filter(pk=job_id).first()
+        if _reusable(job):
+            return job, False
+
+    job = ExportJob.objects.create(
+        user=user, kind=kind_name, params=params, scope_key=scope, filter_hash=digest,
+    )
+    try:
+        cache.set(_dedupe_key(digest), str(job.pk), _dedupe_ttl())
+    except Exception as e:
+        logger.warning("Export dedupe cache write failed: %s", e)
+
+    from .tasks import render_export_job_task
+    transaction.on_commit(lambda: render_export_job_task.delay(str(job.pk)))
+    return job, True
+
+
+def _progress_updater(job: ExportJob) -> Callable[[int, int], None]:
+    def update(done: int, total: int) -> None:
+        percent = min(99, int(done * 100 / total)) if total else 0
+        if percent != job.progress:
+            job.progress = percent
+            ExportJob.objects.filter(pk=job.pk).update(progress=percent, rows=done)
+    return update
+
+
+def run_export(job_id) -> Optional[ExportJob]:
+    """Формирует файл задачи (вызывается Celery-задачей)."""
+    job = ExportJob.objects.select_related('user').filter(pk=job_id).first()
+    if job is None or job.is_finished:
+        return job
+
+    job.status = ExportJob.STATUS_RUNNING
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    kind = EXPORT_KINDS.get(job.kind)
+    try:
+        if kind is None:
+            raise ExportError(f"Неизвестный тип выгрузки: {job.kind}")
+        content, filename, content_type = kind.render(job, _progress_updater(job))
+        if isinstance(content, bytes):
+            content = ContentFile(content)
+        else:
+            content.seek(0)
+            content = File(content)
+        try:
+            job.file.save(filename, content, save=False)
+        finally:
+            content.close()
+        job.filename = filename
+        job.content_type = content_type
+        job.status = ExportJob.STATUS_DONE
+        job.progress = 100
+    except Exception as e:
+        logger.error("Export job %s (%s) failed: %s", job.pk, job.kind, e, exc_info=True)
+        job.status = ExportJob.STATUS_FAILED
+        job.error = str(e)[:2000]
+        try:
+            cache.delete(_dedupe_key(job.filter_hash))
+        except Exception:
+            pass
+
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + _retention()
+    job.save(update_fields=[
+        'status', 'progress', 'rows', 'file', 'filename', 'content_type',
+        'error', 'finished_at', 'expires_at',
+    ])
+    return job
+
+
+def download_token(job: ExportJob) -> str:
+    return TimestampSigner(salt=DOWNLOAD_SALT).sign(str(job.pk))
+
+
+def job_id_from_token(token: str) -> Optional[str]:
+    """ID задачи из подписанной ссылки; None - подпись неверна или истекла."""
+    try:
+        return TimestampSigner(salt=DOWNLOAD_SALT).unsign(token, max_age=_link_max_age())
+    except (BadSignature, SignatureExpired):
+        return None
+
+
+def cleanup_expired(limit: int = 500) -> int:
+    """Удаляет просроченные задачи вместе с файлами."""
+    removed = 0
+    expired = ExportJob.objects.filter(expires_at__lte=timezone.now()).order_by('expires_at')[:limit]
+    for job in expired:
+        if job.file:
+            try:
+                job.file.delete(save=False)
+            except Exception as e:
+                logger.warning("Export file %s delete failed: %s", job.file.name, e)
+        job.delete()
+        removed += 1
+    return removed
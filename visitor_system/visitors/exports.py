@@ -6,19 +6,62 @@ import logging
 from datetime import datetime, timedelta
 from io import BytesIO
 
-from django.http import HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import render
 from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
 from django.db.models import Count, Q
 from django.contrib.auth.decorators import login_required, permission_required
+from django.views.decorators.http import require_GET, require_POST
 
-from visitors.models import Visit, AuditLog, SecurityIncident
+from visitors import export_jobs
+from visitors.models import Visit, AuditLog, SecurityIncident, ExportJob
 
 logger = logging.getLogger(__name__)
 
 
 # ==================== HELPER FUNCTIONS ====================
 
+def _file_response(content, filename, content_type):
+    """Ответ-вложение с файлом, сформированным build_* функцией."""
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def visits_for_logs(*log_lists):
+    """
+    Визиты для записей AuditLog одним запросом (in_bulk по object_id).
+
+    Returns:
+        {visit_id: Visit}
+    """
+    ids = {
+        int(log.object_id)
+        for logs in log_lists for log in logs
+        if str(log.object_id).isdigit()
+    }
+    if not ids:
+        return {}
+    return Visit.objects.select_related('guest', 'employee', 'department').in_bulk(ids)
+
+
+def _log_visit(visits, log):
+    object_id = str(log.object_id)
+    return visits.get(int(object_id)) if object_id.isdigit() else None
+
+
+def _visit_log_row(log, visit, time_format):
+    return [
+        log.created_at.strftime(time_format),
+        visit.guest.full_name if visit.guest else '-',
+        visit.employee.get_full_name() if visit.employee else '-',
+        visit.department.name if visit.department else '-',
+    ]
+
+
 def get_auto_checkin_data(days=7):
     """
     Получение данных для Auto Check-in Dashboard.
@@ -111,15 +154,15 @@ def get_security_incidents_data(days=30, status=None, incident_type=None, severi
 
 def get_hikcentral_data():
     """
-    Получение данных для HikCentral Dashboard.
+    Получение данных для HikCentral Dashboard (по всем включённым серверам).
     """
-    from hikvision_integration.services import HikCentralServer
+    from hikvision_integration.routing import get_enabled_servers
     from django.conf import settings
     
     try:
-        hc_server = HikCentralServer.objects.first()
+        hc_servers = get_enabled_servers()
         
-        if not hc_server:
+        if not hc_servers:
             return {'error': 'HikCentral server not configured'}
         
         # Статистика за последние 24 часа
@@ -127,9 +170,15 @@ def get_hikcentral_data():
         
         # Статистика за последние 24 часа (упрощенная версия)
         stats = {
-            'server_name': hc_server.name,
-            'server_url': hc_server.base_url,
-            'is_active': hc_server.is_active,
+            'servers': [
+                {
+                    'name': server.name,
+                    'url': server.base_url,
+                    'is_active': server.enabled,
+                    'is_default': server.is_default,
+                }
+                for server in hc_servers
+            ],
             'faces_enrolled_24h': Visit.objects.filter(
                 hikcentral_person_id__isnull=False,
                 registered_at__gte=last_24h
@@ -155,154 +204,149 @@ def get_hikcentral_data():
 
 # ==================== PDF EXPORT VIEWS ====================
 
-@login_required
-@permission_required('visitors.view_visit', raise_exception=True)
-def export_auto_checkin_pdf(request):
+def build_auto_checkin_pdf(user, params):
     """
-    Экспорт Auto Check-in Dashboard в PDF.
+    PDF отчёт Auto Check-in.
+
+    Returns:
+        (content, filename, content_type)
     """
-    try:
-        from reportlab.lib.pagesizes import letter, A4
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from io import BytesIO
-        
-        days = int(request.GET.get('days', 7))
-        data = get_auto_checkin_data(days=days)
-        
-        # Обрабатываем AuditLog данные для PDF
-        processed_checkins = []
-        for log in data['auto_checkins']:
-            try:
-                visit = Visit.objects.select_related('guest', 'employee', 'department').get(id=log.object_id)
-                processed_checkins.append([
-                    log.created_at.strftime('%d.%m.%Y %H:%M'),
-                    visit.guest.full_name if visit.guest else '-',
-                    visit.employee.get_full_name() if visit.employee else '-',
-                    visit.department.name if visit.department else '-',
-                ])
-            except Visit.DoesNotExist:
-                pass
-        
-        processed_checkouts = []
-        for log in data['auto_checkouts']:
-            try:
-                visit = Visit.objects.select_related('guest', 'employee', 'department').get(id=log.object_id)
-                processed_checkouts.append([
-                    log.created_at.strftime('%d.%m.%Y %H:%M'),
-                    visit.guest.full_name if visit.guest else '-',
-                    visit.employee.get_full_name() if visit.employee else '-',
-                    visit.department.name if visit.department else '-',
-                ])
-            except Visit.DoesNotExist:
-                pass
-        
-        # Создаем PDF
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Заголовок
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1,  # CENTER
-        )
-        story.append(Paragraph('📊 Auto Check-in Dashboard Report', title_style))
-        
-        # Метаданные
-        meta_style = ParagraphStyle(
-            'Meta',
-            parent=styles['Normal'],
-            fontSize=10,
-            spaceAfter=20,
-            alignment=1,  # CENTER
-        )
-        meta_text = f"""
-        <b>Период:</b> {data['start_date'].strftime('%d.%m.%Y %H:%M')} - {data['end_date'].strftime('%d.%m.%Y %H:%M')} ({data['days']} дней)<br/>
-        <b>Сгенерировано:</b> {timezone.now().strftime('%d.%m.%Y %H:%M:%S')}<br/>
-        <b>Сотрудник:</b> {request.user.get_full_name() or request.user.username}
-        """
-        story.append(Paragraph(meta_text, meta_style))
-        
-        # Статистика
-        stats_data = [
-            ['Метрика', 'Значение'],
-            ['Автоматических входов', str(data['total_auto_checkins'])],
-            ['Автоматических выходов', str(data['total_auto_checkouts'])],
-            ['Аномалий обнаружено', str(len(data['incidents']))],
-        ]
-        
-        stats_table = Table(stats_data, colWidths=[3*inch, 2*inch])
-        stats_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    from reportlab.lib.pagesizes import letter, A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    
+    days = int(params.get('days', 7))
+    data = get_auto_checkin_data(days=days)
+    
+    # Обрабатываем AuditLog данные для PDF (визиты - одним запросом)
+    auto_checkins = list(data['auto_checkins'])
+    auto_checkouts = list(data['auto_checkouts'])
+    visits = visits_for_logs(auto_checkins, auto_checkouts)
+
+    processed_checkins = [
+        _visit_log_row(log, visit, '%d.%m.%Y %H:%M')
+        for log in auto_checkins
+        if (visit := _log_visit(visits, log)) is not None
+    ]
+    processed_checkouts = [
+        _visit_log_row(log, visit, '%d.%m.%Y %H:%M')
+        for log in auto_checkouts
+        if (visit := _log_visit(visits, log)) is not None
+    ]
+    
+    # Создаем PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    story = []
+    
+    # Заголовок
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,  # CENTER
+    )
+    story.append(Paragraph('📊 Auto Check-in Dashboard Report', title_style))
+    
+    # Метаданные
+    meta_style = ParagraphStyle(
+        'Meta',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=20,
+        alignment=1,  # CENTER
+    )
+    meta_text = f"""
+    <b>Период:</b> {data['start_date'].strftime('%d.%m.%Y %H:%M')} - {data['end_date'].strftime('%d.%m.%Y %H:%M')} ({data['days']} дней)<br/>
+    <b>Сгенерировано:</b> {timezone.now().strftime('%d.%m.%Y %H:%M:%S')}<br/>
+    <b>Сотрудник:</b> {user.get_full_name() or user.username}
+    """
+    story.append(Paragraph(meta_text, meta_style))
+    
+    # Статистика
+    stats_data = [
+        ['Метрика', 'Значение'],
+        ['Автоматических входов', str(data['total_auto_checkins'])],
+        ['Автоматических выходов', str(data['total_auto_checkouts'])],
+        ['Аномалий обнаружено', str(len(data['incidents']))],
+    ]
+    
+    stats_table = Table(stats_data, colWidths=[3*inch, 2*inch])
+    stats_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    story.append(Paragraph('<b>📈 Статистика</b>', styles['Heading2']))
+    story.append(stats_table)
+    story.append(Spacer(1, 20))
+    
+    # Таблица Check-ins
+    if processed_checkins:
+        story.append(Paragraph('<b>✅ Автоматические Check-ins</b>', styles['Heading2']))
+        checkins_data = [['Дата/Время', 'Гость', 'Принимающий', 'Департамент']] + processed_checkins[:50]
+        
+        checkins_table = Table(checkins_data, colWidths=[1.5*inch, 2*inch, 2*inch, 1.5*inch])
+        checkins_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
             ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
-        
-        story.append(Paragraph('<b>📈 Статистика</b>', styles['Heading2']))
-        story.append(stats_table)
+        story.append(checkins_table)
         story.append(Spacer(1, 20))
-        
-        # Таблица Check-ins
-        if processed_checkins:
-            story.append(Paragraph('<b>✅ Автоматические Check-ins</b>', styles['Heading2']))
-            checkins_data = [['Дата/Время', 'Гость', 'Принимающий', 'Департамент']] + processed_checkins[:50]
-            
-            checkins_table = Table(checkins_data, colWidths=[1.5*inch, 2*inch, 2*inch, 1.5*inch])
-            checkins_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(checkins_table)
-            story.append(Spacer(1, 20))
-        
-        # Таблица Check-outs
-        if processed_checkouts:
-            story.append(Paragraph('<b>🚪 Автоматические Check-outs</b>', styles['Heading2']))
-            checkouts_data = [['Дата/Время', 'Гость', 'Принимающий', 'Департамент']] + processed_checkouts[:50]
-            
-            checkouts_table = Table(checkouts_data, colWidths=[1.5*inch, 2*inch, 2*inch, 1.5*inch])
-            checkouts_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightcoral),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(checkouts_table)
-        
-        # Генерируем PDF
-        doc.build(story)
-        pdf = buffer.getvalue()
-        buffer.close()
-        
-        # Отправляем response
-        response = HttpResponse(pdf, content_type='application/pdf')
-        filename = f'auto_checkin_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
+    
+    # Таблица Check-outs
+    if processed_checkouts:
+        story.append(Paragraph('<b>🚪 Автоматические Check-outs</b>', styles['Heading2']))
+        checkouts_data = [['Дата/Время', 'Гость', 'Принимающий', 'Департамент']] + processed_checkouts[:50]
+        
+        checkouts_table = Table(checkouts_data, colWidths=[1.5*inch, 2*inch, 2*inch, 1.5*inch])
+        checkouts_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightcoral),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(checkouts_table)
+    
+    # Генерируем PDF
+    doc.build(story)
+    pdf = buffer.getvalue()
+    buffer.close()
+
+    filename = f'auto_checkin_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    return pdf, filename, 'application/pdf'
+
+
+@login_required
+@permission_required('visitors.view_visit', raise_exception=True)
+def export_auto_checkin_pdf(request):
+    """
+    Экспорт Auto Check-in Dashboard в PDF.
+    """
+    try:
+        response = _file_response(*build_auto_checkin_pdf(request.user, request.GET))
         logger.info(f"Auto Check-in PDF exported by {request.user.username}")
         return response
         
@@ -317,6 +361,128 @@ def export_auto_checkin_pdf(request):
         return HttpResponse(f"Ошибка при экспорте PDF: {e}", status=500)
 
 
+def build_security_incidents_pdf(user, params):
+    """
+    PDF отчёт по инцидентам безопасности.
+
+    Returns:
+        (content, filename, content_type)
+    """
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    
+    days = int(params.get('days', 30))
+    status = params.get('status')
+    incident_type = params.get('incident_type')
+    severity = params.get('severity')
+    
+    data = get_security_incidents_data(
+        days=days,
+        status=status,
+        incident_type=incident_type,
+        severity=severity
+    )
+    
+    # Создаем PDF (landscape для широких таблиц)
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4))
+    styles = getSampleStyleSheet()
+    story = []
+    
+    # Заголовок
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,  # CENTER
+    )
+    story.append(Paragraph('🚨 Security Incidents Report', title_style))
+    
+    # Метаданные
+    meta_style = ParagraphStyle(
+        'Meta',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=20,
+        alignment=1,  # CENTER
+    )
+    meta_text = f"""
+    <b>Период:</b> {data['start_date'].strftime('%d.%m.%Y %H:%M')} - {data['end_date'].strftime('%d.%m.%Y %H:%M')} ({data['days']} дней)<br/>
+    <b>Сгенерировано:</b> {timezone.now().strftime('%d.%m.%Y %H:%M:%S')}<br/>
+    <b>Сотрудник:</b> {user.get_full_name() or user.username}
+    """
+    story.append(Paragraph(meta_text, meta_style))
+    
+    # Статистика
+    stats_data = [
+        ['Метрика', 'Значение'],
+        ['Всего инцидентов', str(data['stats']['total'])],
+    ]
+    
+    for stat in data['stats']['by_severity']:
+        stats_data.append([f"Уровень {stat['severity'].upper()}", str(stat['count'])])
+    
+    stats_table = Table(stats_data, colWidths=[3*inch, 2*inch])
+    stats_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.red),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    
+    story.append(Paragraph('<b>📊 Общая статистика</b>', styles['Heading2']))
+    story.append(stats_table)
+    story.append(Spacer(1, 20))
+    
+    # Таблица инцидентов
+    if data['incidents']:
+        story.append(Paragraph('<b>📋 Детальный список инцидентов</b>', styles['Heading2']))
+        
+        incidents_data = [['Дата', 'Тип', 'Уровень', 'Статус', 'Гость', 'Принимающий', 'Описание']]
+        
+        for incident in data['incidents'][:100]:  # Ограничиваем 100 записями
+            incidents_data.append([
+                incident.detected_at.strftime('%d.%m.%y %H:%M'),
+                incident.get_incident_type_display(),
+                incident.get_severity_display(),
+                incident.get_status_display(),
+                incident.visit.guest.full_name if incident.visit and incident.visit.guest else '-',
+                incident.visit.employee.get_full_name() if incident.visit and incident.visit.employee else '-',
+                incident.description[:50] + '...' if len(incident.description) > 50 else incident.description,
+            ])
+        
+        incidents_table = Table(incidents_data, colWidths=[1*inch, 1.5*inch, 1*inch, 1*inch, 1.5*inch, 1.5*inch, 2.5*inch])
+        incidents_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.red),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('FONTSIZE', (0, 1), (-1, -1), 7),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        story.append(incidents_table)
+    
+    # Генерируем PDF
+    doc.build(story)
+    pdf = buffer.getvalue()
+    buffer.close()
+
+    filename = f'security_incidents_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    return pdf, filename, 'application/pdf'
+
+
 @login_required
 @permission_required('visitors.view_securityincident', raise_exception=True)
 def export_security_incidents_pdf(request):
@@ -324,68 +490,116 @@ def export_security_incidents_pdf(request):
     Экспорт Security Incidents Dashboard в PDF.
     """
     try:
-        from reportlab.lib.pagesizes import A4, landscape
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from io import BytesIO
-        
-        days = int(request.GET.get('days', 30))
-        status = request.GET.get('status')
-        incident_type = request.GET.get('incident_type')
-        severity = request.GET.get('severity')
-        
-        data = get_security_incidents_data(
-            days=days,
-            status=status,
-            incident_type=incident_type,
-            severity=severity
-        )
-        
-        # Создаем PDF (landscape для широких таблиц)
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(A4))
-        styles = getSampleStyleSheet()
-        story = []
+        response = _file_response(*build_security_incidents_pdf(request.user, request.GET))
+        logger.info(f"Security Incidents PDF exported by {request.user.username}")
+        return response
         
-        # Заголовок
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1,  # CENTER
+    except ImportError:
+        return HttpResponse(
+            "ReportLab не установлен. Запустите: poetry run pip install reportlab",
+            status=500
         )
-        story.append(Paragraph('🚨 Security Incidents Report', title_style))
-        
-        # Метаданные
-        meta_style = ParagraphStyle(
-            'Meta',
+    except Exception as e:
+        logger.error(f"Error exporting Security Incidents PDF: {e}", exc_info=True)
+        return HttpResponse(f"Ошибка при экспорте PDF: {e}", status=500)
+
+
+def build_hikcentral_pdf(user, params):
+    """
+    PDF отчёт о статусе HikCentral.
+
+    Returns:
+        (content, filename, content_type)
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    
+    data = get_hikcentral_data()
+    
+    # Создаем PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    story = []
+    
+    # Заголовок
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=18,
+        spaceAfter=30,
+        alignment=1,  # CENTER
+    )
+    story.append(Paragraph('🔌 HikCentral Status Report', title_style))
+    
+    # Метаданные
+    meta_style = ParagraphStyle(
+        'Meta',
+        parent=styles['Normal'],
+        fontSize=10,
+        spaceAfter=20,
+        alignment=1,  # CENTER
+    )
+    meta_text = f"""
+    <b>Сгенерировано:</b> {timezone.now().strftime('%d.%m.%Y %H:%M:%S')}<br/>
+    <b>Сотрудник:</b> {user.get_full_name() or user.username}
+    """
+    story.append(Paragraph(meta_text, meta_style))
+    
+    if 'error' in data:
+        # Ошибка
+        error_style = ParagraphStyle(
+            'Error',
             parent=styles['Normal'],
-            fontSize=10,
+            fontSize=12,
             spaceAfter=20,
             alignment=1,  # CENTER
+            textColor=colors.red,
         )
-        meta_text = f"""
-        <b>Период:</b> {data['start_date'].strftime('%d.%m.%Y %H:%M')} - {data['end_date'].strftime('%d.%m.%Y %H:%M')} ({data['days']} дней)<br/>
-        <b>Сгенерировано:</b> {timezone.now().strftime('%d.%m.%Y %H:%M:%S')}<br/>
-        <b>Сотрудник:</b> {request.user.get_full_name() or request.user.username}
-        """
-        story.append(Paragraph(meta_text, meta_style))
+        story.append(Paragraph(f'⚠️ Ошибка: {data["error"]}', error_style))
+    else:
+        # Информация о серверах
+        story.append(Paragraph('<b>🖥️ Серверы HikCentral</b>', styles['Heading2']))
+        
+        server_data = [['Имя сервера', 'URL', 'Статус']] + [
+            [
+                server['name'] + (' (по умолчанию)' if server['is_default'] else ''),
+                server['url'],
+                'Активен' if server['is_active'] else 'Неактивен',
+            ]
+            for server in data.get('servers', [])
+        ]
         
-        # Статистика
-        stats_data = [
+        server_table = Table(server_data, colWidths=[2.5*inch, 3*inch, 1.5*inch])
+        server_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(server_table)
+        story.append(Spacer(1, 20))
+        
+        # Активность за 24 часа
+        story.append(Paragraph('<b>📊 Активность за последние 24 часа</b>', styles['Heading2']))
+        
+        activity_data = [
             ['Метрика', 'Значение'],
-            ['Всего инцидентов', str(data['stats']['total'])],
+            ['Лиц зарегистрировано', str(data.get('faces_enrolled_24h', 0))],
+            ['Доступов выдано', str(data.get('access_granted_24h', 0))],
+            ['Автоматических действий', str(data.get('auto_actions_24h', 0))],
         ]
         
-        for stat in data['stats']['by_severity']:
-            stats_data.append([f"Уровень {stat['severity'].upper()}", str(stat['count'])])
-        
-        stats_table = Table(stats_data, colWidths=[3*inch, 2*inch])
-        stats_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.red),
+        activity_table = Table(activity_data, colWidths=[3*inch, 2*inch])
+        activity_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
             ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
             ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
@@ -394,64 +608,36 @@ def export_security_incidents_pdf(request):
             ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
-        
-        story.append(Paragraph('<b>📊 Общая статистика</b>', styles['Heading2']))
-        story.append(stats_table)
+        story.append(activity_table)
         story.append(Spacer(1, 20))
         
-        # Таблица инцидентов
-        if data['incidents']:
-            story.append(Paragraph('<b>📋 Детальный список инцидентов</b>', styles['Heading2']))
-            
-            incidents_data = [['Дата', 'Тип', 'Уровень', 'Статус', 'Гость', 'Принимающий', 'Описание']]
-            
-            for incident in data['incidents'][:100]:  # Ограничиваем 100 записями
-                incidents_data.append([
-                    incident.detected_at.strftime('%d.%m.%y %H:%M'),
-                    incident.get_incident_type_display(),
-                    incident.get_severity_display(),
-                    incident.get_status_display(),
-                    incident.visit.guest.full_name if incident.visit and incident.visit.guest else '-',
-                    incident.visit.employee.get_full_name() if incident.visit and incident.visit.employee else '-',
-                    incident.description[:50] + '...' if len(incident.description) > 50 else incident.description,
-                ])
-            
-            incidents_table = Table(incidents_data, colWidths=[1*inch, 1.5*inch, 1*inch, 1*inch, 1.5*inch, 1.5*inch, 2.5*inch])
-            incidents_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.red),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                ('FONTSIZE', (0, 1), (-1, -1), 7),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ]))
-            story.append(incidents_table)
-        
-        # Генерируем PDF
-        doc.build(story)
-        pdf = buffer.getvalue()
-        buffer.close()
-        
-        # Отправляем response
-        response = HttpResponse(pdf, content_type='application/pdf')
-        filename = f'security_incidents_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        logger.info(f"Security Incidents PDF exported by {request.user.username}")
-        return response
-        
-    except ImportError:
-        return HttpResponse(
-            "ReportLab не установлен. Запустите: poetry run pip install reportlab",
-            status=500
+        # Информационный блок
+        info_style = ParagraphStyle(
+            'Info',
+            parent=styles['Normal'],
+            fontSize=10,
+            spaceAfter=20,
+            leftIndent=20,
+            rightIndent=20,
+            borderColor=colors.lightblue,
+            borderWidth=1,
+            borderPadding=10,
         )
-    except Exception as e:
-        logger.error(f"Error exporting Security Incidents PDF: {e}", exc_info=True)
-        return HttpResponse(f"Ошибка при экспорте PDF: {e}", status=500)
+        info_text = """
+        <b>ℹ️ Информация:</b><br/>
+        Данный отчет показывает текущий статус интеграции с HikCentral Professional.<br/>
+        Статистика включает только действия за последние 24 часа.<br/>
+        Для полной диагностики используйте веб-интерфейс HikCentral Dashboard.
+        """
+        story.append(Paragraph(info_text, info_style))
+    
+    # Генерируем PDF
+    doc.build(story)
+    pdf = buffer.getvalue()
+    buffer.close()
+
+    filename = f'hikcentral_status_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+    return pdf, filename, 'application/pdf'
 
 
 @login_required
@@ -461,135 +647,7 @@ def export_hikcentral_pdf(request):
     Экспорт HikCentral Dashboard в PDF.
     """
     try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib import colors
-        from reportlab.lib.units import inch
-        from io import BytesIO
-        
-        data = get_hikcentral_data()
-        
-        # Создаем PDF
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Заголовок
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            alignment=1,  # CENTER
-        )
-        story.append(Paragraph('🔌 HikCentral Status Report', title_style))
-        
-        # Метаданные
-        meta_style = ParagraphStyle(
-            'Meta',
-            parent=styles['Normal'],
-            fontSize=10,
-            spaceAfter=20,
-            alignment=1,  # CENTER
-        )
-        meta_text = f"""
-        <b>Сгенерировано:</b> {timezone.now().strftime('%d.%m.%Y %H:%M:%S')}<br/>
-        <b>Сотрудник:</b> {request.user.get_full_name() or request.user.username}
-        """
-        story.append(Paragraph(meta_text, meta_style))
-        
-        if 'error' in data:
-            # Ошибка
-            error_style = ParagraphStyle(
-                'Error',
-                parent=styles['Normal'],
-                fontSize=12,
-                spaceAfter=20,
-                alignment=1,  # CENTER
-                textColor=colors.red,
-            )
-            story.append(Paragraph(f'⚠️ Ошибка: {data["error"]}', error_style))
-        else:
-            # Информация о сервере
-            story.append(Paragraph('<b>🖥️ Информация о сервере</b>', styles['Heading2']))
-            
-            server_data = [
-                ['Параметр', 'Значение'],
-                ['Имя сервера', data.get('server_name', '-')],
-                ['URL', data.get('server_url', '-')],
-                ['Статус', 'Активен' if data.get('is_active') else 'Неактивен'],
-            ]
-            
-            server_table = Table(server_data, colWidths=[3*inch, 3*inch])
-            server_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(server_table)
-            story.append(Spacer(1, 20))
-            
-            # Активность за 24 часа
-            story.append(Paragraph('<b>📊 Активность за последние 24 часа</b>', styles['Heading2']))
-            
-            activity_data = [
-                ['Метрика', 'Значение'],
-                ['Лиц зарегистрировано', str(data.get('faces_enrolled_24h', 0))],
-                ['Доступов выдано', str(data.get('access_granted_24h', 0))],
-                ['Автоматических действий', str(data.get('auto_actions_24h', 0))],
-            ]
-            
-            activity_table = Table(activity_data, colWidths=[3*inch, 2*inch])
-            activity_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(activity_table)
-            story.append(Spacer(1, 20))
-            
-            # Информационный блок
-            info_style = ParagraphStyle(
-                'Info',
-                parent=styles['Normal'],
-                fontSize=10,
-                spaceAfter=20,
-                leftIndent=20,
-                rightIndent=20,
-                borderColor=colors.lightblue,
-                borderWidth=1,
-                borderPadding=10,
-            )
-            info_text = """
-            <b>ℹ️ Информация:</b><br/>
-            Данный отчет показывает текущий статус интеграции с HikCentral Professional.<br/>
-            Статистика включает только действия за последние 24 часа.<br/>
-            Для полной диагностики используйте веб-интерфейс HikCentral Dashboard.
-            """
-            story.append(Paragraph(info_text, info_style))
-        
-        # Генерируем PDF
-        doc.build(story)
-        pdf = buffer.getvalue()
-        buffer.close()
-        
-        # Отправляем response
-        response = HttpResponse(pdf, content_type='application/pdf')
-        filename = f'hikcentral_status_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
+        response = _file_response(*build_hikcentral_pdf(request.user, request.GET))
         logger.info(f"HikCentral PDF exported by {request.user.username}")
         return response
         
@@ -605,6 +663,71 @@ def export_hikcentral_pdf(request):
 
 # ==================== EXCEL EXPORT VIEWS ====================
 
+def build_auto_checkin_excel(user, params):
+    """
+    Excel отчёт Auto Check-in.
+
+    Визиты для всех записей журнала загружаются одним in_bulk(), строки
+    пишутся в книгу openpyxl напрямую (без pandas).
+
+    Returns:
+        (content, filename, content_type)
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    days = int(params.get('days', 7))
+    data = get_auto_checkin_data(days=days)
+
+    auto_checkins = list(data['auto_checkins'])
+    auto_checkouts = list(data['auto_checkouts'])
+    visits = visits_for_logs(auto_checkins, auto_checkouts)
+
+    wb = Workbook()
+    wb.remove(wb.active)
+    bold = Font(bold=True)
+
+    def add_sheet(title, headers, rows):
+        ws = wb.create_sheet(title)
+        ws.append(headers)
+        for cell in ws[1]:
+            cell.font = bold
+        for row in rows:
+            ws.append(row)
+
+    # Sheets 1-2: Auto Check-ins / Check-outs
+    log_headers = ['Дата/Время', 'Гость', 'Принимающий', 'Департамент', 'Событие']
+    for title, logs, event in (
+        ('Check-ins', auto_checkins, 'Вход'),
+        ('Check-outs', auto_checkouts, 'Выход'),
+    ):
+        add_sheet(title, log_headers, (
+            _visit_log_row(log, visit, '%Y-%m-%d %H:%M:%S') + [event]
+            for log in logs
+            if (visit := _log_visit(visits, log)) is not None
+        ))
+
+    # Sheet 3: Security Incidents
+    add_sheet(
+        'Incidents',
+        ['Дата обнаружения', 'Тип', 'Уровень', 'Статус', 'Гость', 'Описание'],
+        ([
+            incident.detected_at.strftime('%Y-%m-%d %H:%M:%S'),
+            incident.get_incident_type_display(),
+            incident.get_severity_display(),
+            incident.get_status_display(),
+            incident.visit.guest.full_name if incident.visit and incident.visit.guest else '-',
+            incident.description,
+        ] for incident in data['incidents']),
+    )
+
+    output = BytesIO()
+    wb.save(output)
+
+    filename = f'auto_checkin_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    return output.getvalue(), filename, export_jobs.XLSX_CONTENT_TYPE
+
+
 @login_required
 @permission_required('visitors.view_visit', raise_exception=True)
 def export_auto_checkin_excel(request):
@@ -612,90 +735,14 @@ def export_auto_checkin_excel(request):
     Экспорт Auto Check-in Dashboard в Excel.
     """
     try:
-        import pandas as pd
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment
-        
-        days = int(request.GET.get('days', 7))
-        data = get_auto_checkin_data(days=days)
-        
-        # Создаем Excel workbook
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Sheet 1: Auto Check-ins
-            checkins_data = []
-            for log in data['auto_checkins']:
-                # Получаем Visit объект по object_id
-                try:
-                    visit = Visit.objects.select_related('guest', 'employee', 'department').get(id=log.object_id)
-                    checkins_data.append({
-                        'Дата/Время': log.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                        'Гость': visit.guest.full_name if visit.guest else '-',
-                        'Принимающий': visit.employee.get_full_name() if visit.employee else '-',
-                        'Департамент': visit.department.name if visit.department else '-',
-                        'Событие': 'Вход',
-                    })
-                except Visit.DoesNotExist:
-                    pass
-            
-            if checkins_data:
-                df_checkins = pd.DataFrame(checkins_data)
-                df_checkins.to_excel(writer, sheet_name='Check-ins', index=False)
-            
-            # Sheet 2: Auto Check-outs
-            checkouts_data = []
-            for log in data['auto_checkouts']:
-                # Получаем Visit объект по object_id
-                try:
-                    visit = Visit.objects.select_related('guest', 'employee', 'department').get(id=log.object_id)
-                    checkouts_data.append({
-                        'Дата/Время': log.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                        'Гость': visit.guest.full_name if visit.guest else '-',
-                        'Принимающий': visit.employee.get_full_name() if visit.employee else '-',
-                        'Департамент': visit.department.name if visit.department else '-',
-                        'Событие': 'Выход',
-                    })
-                except Visit.DoesNotExist:
-                    pass
-            
-            if checkouts_data:
-                df_checkouts = pd.DataFrame(checkouts_data)
-                df_checkouts.to_excel(writer, sheet_name='Check-outs', index=False)
-            
-            # Sheet 3: Security Incidents
-            incidents_data = []
-            for incident in data['incidents']:
-                incidents_data.append({
-                    'Дата обнаружения': incident.detected_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    'Тип': incident.get_incident_type_display(),
-                    'Уровень': incident.get_severity_display(),
-                    'Статус': incident.get_status_display(),
-                    'Гость': incident.visit.guest.full_name if incident.visit and incident.visit.guest else '-',
-                    'Описание': incident.description,
-                })
-            
-            if incidents_data:
-                df_incidents = pd.DataFrame(incidents_data)
-                df_incidents.to_excel(writer, sheet_name='Incidents', index=False)
-        
-        output.seek(0)
-        
-        # Отправляем response
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        filename = f'auto_checkin_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
+        response = _file_response(*build_auto_checkin_excel(request.user, request.GET))
         logger.info(f"Auto Check-in Excel exported by {request.user.username}")
         return response
         
     except ImportError as e:
         logger.error(f"Required library not installed: {e}")
         return HttpResponse(
-            f"Необходимая библиотека не установлена: {e}. Запустите: poetry run pip install pandas openpyxl",
+            f"Необходимая библиотека не установлена: {e}. Запустите: poetry run pip install openpyxl",
             status=500
         )
     except Exception as e:
@@ -703,6 +750,58 @@ def export_auto_checkin_excel(request):
         return HttpResponse(f"Ошибка при экспорте Excel: {e}", status=500)
 
 
+def build_security_incidents_excel(user, params):
+    """
+    Excel отчёт по инцидентам безопасности.
+
+    Returns:
+        (content, filename, content_type)
+    """
+    import pandas as pd
+    
+    days = int(params.get('days', 30))
+    status = params.get('status')
+    incident_type = params.get('incident_type')
+    severity = params.get('severity')
+    
+    data = get_security_incidents_data(
+        days=days,
+        status=status,
+        incident_type=incident_type,
+        severity=severity
+    )
+    
+    # Создаем DataFrame
+    incidents_data = []
+    for incident in data['incidents']:
+        incidents_data.append({
+            'ID': incident.id,
+            'Дата обнаружения': incident.detected_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'Тип инцидента': incident.get_incident_type_display(),
+            'Уровень важности': incident.get_severity_display(),
+            'Статус': incident.get_status_display(),
+            'Гость': incident.visit.guest.full_name if incident.visit and incident.visit.guest else '-',
+            'Принимающий': incident.visit.employee.get_full_name() if incident.visit and incident.visit.employee else '-',
+            'Департамент': incident.visit.department.name if incident.visit and incident.visit.department else '-',
+            'Описание': incident.description,
+            'Назначен': incident.assigned_to.get_full_name() if incident.assigned_to else '-',
+            'Дата решения': incident.resolved_at.strftime('%Y-%m-%d %H:%M:%S') if incident.resolved_at else '-',
+            'Заметки': incident.resolution_notes or '-',
+        })
+    
+    df = pd.DataFrame(incidents_data)
+    
+    # Создаем Excel файл
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Security Incidents', index=False)
+    
+    output.seek(0)
+
+    filename = f'security_incidents_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    return output.getvalue(), filename, export_jobs.XLSX_CONTENT_TYPE
+
+
 @login_required
 @permission_required('visitors.view_securityincident', raise_exception=True)
 def export_security_incidents_excel(request):
@@ -710,55 +809,7 @@ def export_security_incidents_excel(request):
     Экспорт Security Incidents Dashboard в Excel.
     """
     try:
-        import pandas as pd
-        
-        days = int(request.GET.get('days', 30))
-        status = request.GET.get('status')
-        incident_type = request.GET.get('incident_type')
-        severity = request.GET.get('severity')
-        
-        data = get_security_incidents_data(
-            days=days,
-            status=status,
-            incident_type=incident_type,
-            severity=severity
-        )
-        
-        # Создаем DataFrame
-        incidents_data = []
-        for incident in data['incidents']:
-            incidents_data.append({
-                'ID': incident.id,
-                'Дата обнаружения': incident.detected_at.strftime('%Y-%m-%d %H:%M:%S'),
-                'Тип инцидента': incident.get_incident_type_display(),
-                'Уровень важности': incident.get_severity_display(),
-                'Статус': incident.get_status_display(),
-                'Гость': incident.visit.guest.full_name if incident.visit and incident.visit.guest else '-',
-                'Принимающий': incident.visit.employee.get_full_name() if incident.visit and incident.visit.employee else '-',
-                'Департамент': incident.visit.department.name if incident.visit and incident.visit.department else '-',
-                'Описание': incident.description,
-                'Назначен': incident.assigned_to.get_full_name() if incident.assigned_to else '-',
-                'Дата решения': incident.resolved_at.strftime('%Y-%m-%d %H:%M:%S') if incident.resolved_at else '-',
-                'Заметки': incident.resolution_notes or '-',
-            })
-        
-        df = pd.DataFrame(incidents_data)
-        
-        # Создаем Excel файл
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Security Incidents', index=False)
-        
-        output.seek(0)
-        
-        # Отправляем response
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        filename = f'security_incidents_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
+        response = _file_response(*build_security_incidents_excel(request.user, request.GET))
         logger.info(f"Security Incidents Excel exported by {request.user.username}")
         return response
         
@@ -772,6 +823,46 @@ def export_security_incidents_excel(request):
         return HttpResponse(f"Ошибка при экспорте Excel: {e}", status=500)
 
 
+def build_hikcentral_excel(user, params):
+    """
+    Excel отчёт о статусе HikCentral.
+
+    Returns:
+        (content, filename, content_type)
+    """
+    import pandas as pd
+    
+    data = get_hikcentral_data()
+    
+    if 'error' in data:
+        raise ValueError(data['error'])
+    
+    # Создаем DataFrame со статистикой
+    stats_data = [
+        {
+            'Метрика': f"Сервер {server['name']}",
+            'Значение': f"{server['url']} ({'Активен' if server['is_active'] else 'Неактивен'})",
+        }
+        for server in data.get('servers', [])
+    ] + [
+        {'Метрика': 'Лица зарегистрированы (24ч)', 'Значение': data.get('faces_enrolled_24h', 0)},
+        {'Метрика': 'Доступ выдан (24ч)', 'Значение': data.get('access_granted_24h', 0)},
+        {'Метрика': 'Автоматические действия (24ч)', 'Значение': data.get('auto_actions_24h', 0)},
+    ]
+    
+    df = pd.DataFrame(stats_data)
+    
+    # Создаем Excel файл
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='HikCentral Status', index=False)
+    
+    output.seek(0)
+
+    filename = f'hikcentral_status_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    return output.getvalue(), filename, export_jobs.XLSX_CONTENT_TYPE
+
+
 @login_required
 @permission_required('visitors.view_visit', raise_exception=True)
 def export_hikcentral_excel(request):
@@ -779,40 +870,7 @@ def export_hikcentral_excel(request):
     Экспорт HikCentral Dashboard в Excel.
     """
     try:
-        import pandas as pd
-        
-        data = get_hikcentral_data()
-        
-        if 'error' in data:
-            return HttpResponse(f"Ошибка: {data['error']}", status=500)
-        
-        # Создаем DataFrame со статистикой
-        stats_data = [
-            {'Метрика': 'Сервер', 'Значение': data.get('server_name', '-')},
-            {'Метрика': 'URL', 'Значение': data.get('server_url', '-')},
-            {'Метрика': 'Статус', 'Значение': 'Активен' if data.get('is_active') else 'Неактивен'},
-            {'Метрика': 'Лица зарегистрированы (24ч)', 'Значение': data.get('faces_enrolled_24h', 0)},
-            {'Метрика': 'Доступ выдан (24ч)', 'Значение': data.get('access_granted_24h', 0)},
-            {'Метрика': 'Автоматические действия (24ч)', 'Значение': data.get('auto_actions_24h', 0)},
-        ]
-        
-        df = pd.DataFrame(stats_data)
-        
-        # Создаем Excel файл
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='HikCentral Status', index=False)
-        
-        output.seek(0)
-        
-        # Отправляем response
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        filename = f'hikcentral_status_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
+        response = _file_response(*build_hikcentral_excel(request.user, request.GET))
         logger.info(f"HikCentral Excel exported by {request.user.username}")
         return response
         
@@ -825,3 +883,73 @@ def export_hikcentral_excel(request):
         logger.error(f"Error exporting HikCentral Excel: {e}", exc_info=True)
         return HttpResponse(f"Ошибка при экспорте Excel: {e}", status=500)
 
+
+
+# ==================== BACKGROUND EXPORT JOBS ====================
+
+def _export_job_context(job):
+    context = {
+        'job': job,
+        'kind_label': export_jobs.EXPORT_KINDS[job.kind].label if job.kind in export_jobs.EXPORT_KINDS else job.kind,
+        'status_url': reverse('export_job_status', args=[job.pk]),
+        'download_url': None,
+    }
+    if job.status == ExportJob.STATUS_DONE and job.file and not job.is_expired:
+        context['download_url'] = reverse(
+            'export_job_download', args=[export_jobs.download_token(job)]
+        )
+    return context
+
+
+def _render_export_job(request, job):
+    template = 'visitors/_export_job_status.html' if request.htmx else 'visitors/export_job.html'
+    return render(request, template, _export_job_context(job))
+
+
+@login_required
+@require_POST
+def start_export_job(request, kind):
+    """
+    Ставит выгрузку в очередь Celery и возвращает блок прогресса.
+
+    Параметры выгрузки - GET-параметры URL (как у синхронных экспортов).
+    """
+    try:
+        job, created = export_jobs.start_export(request.user, kind, request.GET)
+    except KeyError:
+        raise Http404("Неизвестный тип выгрузки")
+    except PermissionError:
+        raise PermissionDenied
+    logger.info(
+        "Export job %s (%s) %s for %s",
+        job.pk, kind, 'queued' if created else 'reused', request.user.username,
+    )
+    return _render_export_job(request, job)
+
+
+@login_required
+@require_GET
+def export_job_status(request, job_id):
+    """Статус выгрузки; блок сам перезапрашивает себя, пока задача не завершена."""
+    job = ExportJob.objects.filter(pk=job_id).first()
+    if job is None or not export_jobs.can_access(request.user, job):
+        raise Http404("Выгрузка не найдена")
+    return _render_export_job(request, job)
+
+
+@login_required
+@require_GET
+def download_export_job(request, token):
+    """Скачивание готового файла по подписанной ссылке (EXPORT_LINK_MAX_AGE)."""
+    job_id = export_jobs.job_id_from_token(token)
+    if job_id is None:
+        raise Http404("Ссылка недействительна или устарела")
+    job = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_DONE).first()
+    if job is None or not job.file or job.is_expired or not export_jobs.can_access(request.user, job):
+        raise Http404("Выгрузка не найдена")
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=job.filename,
+        content_type=job.content_type or None,
+    )
@@ -0,0 +1,252 @@
+"""
+Объединённая история визитов (официальные, студенческие, групповые).
+
+Три QuerySet'а сводятся в один SQL-запрос UNION ALL с вычисляемым ключом
+сортировки sort_time (фактическое время входа > планируемое > время
+группового визита). Пагинация - keyset по (sort_time, kind, id): страница
+выбирается условием «строго после курсора», поэтому её стоимость не
+зависит от длины истории. Объекты моделей подгружаются только для строк
+страницы (in_bulk по каждому типу).
+"""
+import base64
+import datetime
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from django.db.models import Count, DateTimeField, IntegerField, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (
+    GroupGuest,
+    GroupInvitation,
+    StudentVisit,
+    Visit,
+    STATUS_AWAITING_ARRIVAL,
+    STATUS_CHECKED_IN,
+    STATUS_CHECKED_OUT,
+)
+
+KIND_OFFICIAL = 'official'
+KIND_STUDENT = 'student'
+KIND_GROUP = 'group'
+
+# Порядок типов внутри одинакового sort_time (часть ключа keyset)
+KIND_RANKS = {KIND_OFFICIAL: 0, KIND_STUDENT: 1, KIND_GROUP: 2}
+RANK_KINDS = {rank: kind for kind, rank in KIND_RANKS.items()}
+
+# Визиты без времени идут в самом конце истории (как в прежней сортировке)
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode_cursor(sort_time: datetime.datetime, rank: int, pk: int) -> str:
+    raw = f"{sort_time.isoformat()}|{rank}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime.datetime, int, int]]:
+    """Разбирает курсор; для некорректного значения возвращает None (первая страница)."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_time, raw_rank, raw_pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        sort_time = datetime.datetime.fromisoformat(raw_time)
+        rank = int(raw_rank)
+        if rank not in RANK_KINDS or timezone.is_naive(sort_time):
+            return None
+        return sort_time, rank, int(raw_pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+@dataclass
+class HistoryPage:
+    """Страница истории: итерируется как page_obj Paginator'а."""
+    object_list: List[Any]
+    per_page: int
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+    keys: List[Tuple] = field(default_factory=list, repr=False)
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _branch(qs, kind: str, *time_fields: str):
+    """Строки (id, rank, sort_time) одного типа визитов для UNION ALL."""
+    rows = qs.order_by().prefetch_related(None).annotate(
+        sort_time=Coalesce(*time_fields, Value(EPOCH), output_field=DateTimeField()),
+        kind_rank=Value(KIND_RANKS[kind], output_field=IntegerField()),
+    ).values_list('id', 'kind_rank', 'sort_time')
+    if kind == KIND_GROUP:
+        # Фильтры по гостям группы (guests__...) размножают строки JOIN'ом
+        rows = rows.distinct()
+    return rows
+
+
+def _keyset_filter(rows, rank: int, cursor, backward: bool):
+    """
+    Условие «после курсора» для ветки с постоянным rank.
+
+    Внутри ветки kind фиксирован, поэтому кортежное сравнение
+    (sort_time, rank, id) сводится к простому фильтру по sort_time и id.
+    """
+    if cursor is None:
+        return rows
+    c_time, c_rank, c_pk = cursor
+    if not backward:
+        if rank < c_rank:
+            return rows.filter(sort_time__lte=c_time)
+        if rank > c_rank:
+            return rows.filter(sort_time__lt=c_time)
+        return rows.filter(Q(sort_time__lt=c_time) | Q(sort_time=c_time, id__lt=c_pk))
+    if rank > c_rank:
+        return rows.filter(sort_time__gte=c_time)
+    if rank < c_rank:
+        return rows.filter(sort_time__gt=c_time)
+    return rows.filter(Q(sort_time__gt=c_time) | Q(sort_time=c_time, id__gt=c_pk))
+
+
+def _page_query(official_qs, student_qs, group_qs, per_page, cursor, backward):
+    """
+    Запрос ключей страницы: UNION ALL непустых веток (None - выбирать нечего).
+
+    Ветки .none() (фильтр visit_type, нет доступа) отбрасываются заранее:
+    union() сам выкидывает пустые QuerySet'ы и возвращает единственную
+    оставшуюся ветку, уже отсортированную и обрезанную, - повторный
+    order_by() на ней падает.
+    """
+    ordering = ('sort_time', 'kind_rank', 'id') if backward else ('-sort_time', '-kind_rank', '-id')
+    limit = per_page + 1
+    branches = []
+    for qs, kind, time_fields in (
+        (official_qs, KIND_OFFICIAL, ('entry_time', 'expected_entry_time')),
+        (student_qs, KIND_STUDENT, ('entry_time',)),
+        (group_qs, KIND_GROUP, ('visit_time',)),
+    ):
+        if qs is None or qs.query.is_empty():
+            continue
+        rows = _keyset_filter(_branch(qs, kind, *time_fields), KIND_RANKS[kind], cursor, backward)
+        # Каждая ветка ограничена той же выборкой limit, чтобы UNION ALL
+        # сортировал не больше 3 * limit строк
+        branches.append(rows.order_by(*ordering)[:limit])
+
+    if not branches:
+        return None
+    if len(branches) == 1:
+        return branches[0]
+    return branches[0].union(*branches[1:], all=True).order_by(*ordering)[:limit]
+
+
+def _page_keys(official_qs, student_qs, group_qs, per_page, cursor, backward):
+    query = _page_query(official_qs, student_qs, group_qs, per_page, cursor, backward)
+    return [] if query is None else list(query)
+
+
+def _hydrate(keys) -> List[Any]:
+    """Загружает объекты для строк страницы и готовит атрибуты шаблона."""
+    ids_by_kind = {KIND_OFFICIAL: [], KIND_STUDENT: [], KIND_GROUP: []}
+    for pk, rank, _ in keys:
+        ids_by_kind[RANK_KINDS[rank]].append(pk)
+
+    objects = {
+        KIND_OFFICIAL: Visit.objects.select_related(
+            'guest', 'department', 'employee'
+        ).in_bulk(ids_by_kind[KIND_OFFICIAL]) if ids_by_kind[KIND_OFFICIAL] else {},
+        KIND_STUDENT: StudentVisit.objects.select_related(
+            'guest', 'department', 'registered_by'
+        ).in_bulk(ids_by_kind[KIND_STUDENT]) if ids_by_kind[KIND_STUDENT] else {},
+        KIND_GROUP: GroupInvitation.objects.select_related(
+            'department', 'employee'
+        ).annotate(
+            guests_total=Count('guests')
+        ).in_bulk(ids_by_kind[KIND_GROUP]) if ids_by_kind[KIND_GROUP] else {},
+    }
+
+    # Первый гость каждой группы - один запрос на всю страницу
+    first_guests = {}
+    if ids_by_kind[KIND_GROUP]:
+        for guest in GroupGuest.objects.filter(
+            group_invitation_id__in=ids_by_kind[KIND_GROUP]
+        ).order_by('group_invitation_id', 'id').distinct('group_invitation_id'):
+            first_guests[guest.group_invitation_id] = guest
+
+    now = timezone.now()
+    result = []
+    for pk, rank, _ in keys:
+        kind = RANK_KINDS[rank]
+        obj = objects[kind].get(pk)
+        if obj is None:
+            continue  # удалён между выборкой ключей и загрузкой
+        obj.visit_kind = kind
+        if kind == KIND_GROUP:
+            if obj.is_completed:
+                obj.status = STATUS_CHECKED_OUT
+            elif obj.visit_time and obj.visit_time > now:
+                obj.status = STATUS_AWAITING_ARRIVAL
+            else:
+                obj.status = STATUS_CHECKED_IN
+            obj.entry_time = obj.visit_time
+            obj.guest = first_guests.get(pk)
+            obj.guests_count = obj.guests_total
+            obj.group_invitation = obj
+        result.append(obj)
+    return result
+
+
+def get_history_page(official_qs, student_qs, group_qs, per_page: int = 20,
+                     after: Optional[str] = None, before: Optional[str] = None) -> HistoryPage:
+    """
+    Страница объединённой истории визитов.
+
+    Args:
+        official_qs, student_qs, group_qs: Отфильтрованные QuerySet'ы
+            (None - тип визитов исключён)
+        per_page: Размер страницы
+        after: Курсор - вернуть записи старше него (следующая страница)
+        before: Курсор - вернуть записи новее него (предыдущая страница)
+
+    Returns:
+        HistoryPage с объектами в порядке от новых к старым
+    """
+    backward = bool(before) and not after
+    cursor = decode_cursor(before if backward else after)
+    if cursor is None:
+        backward = False
+
+    keys = _page_keys(official_qs, student_qs, group_qs, per_page, cursor, backward)
+    has_more = len(keys) > per_page
+    keys = keys[:per_page]
+    if backward:
+        keys.reverse()
+
+    next_cursor = previous_cursor = None
+    if keys:
+        first_pk, first_rank, first_time = keys[0]
+        last_pk, last_rank, last_time = keys[-1]
+        # Назад листаем со страницы, после которой записи точно есть;
+        # вперёд - с любой страницы, открытой по курсору
+        if has_more or backward:
+            next_cursor = encode_cursor(last_time, last_rank, last_pk)
+        if (has_more if backward else cursor is not None):
+            previous_cursor = encode_cursor(first_time, first_rank, first_pk)
+
+    return HistoryPage(
+        object_list=_hydrate(keys),
+        per_page=per_page,
+        next_cursor=next_cursor,
+        previous_cursor=previous_cursor,
+        keys=keys,
+    )
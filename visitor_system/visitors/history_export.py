@@ -0,0 +1,261 @@
+"""
+Потоковый экспорт истории визитов в XLSX (export_visits_xlsx).
+
+Раньше все визиты загружались в память, сортировались в Python и
+складывались в обычный Workbook. Теперь:
+- официальные и студенческие визиты читаются .iterator(chunk_size=...)
+  уже отсортированными в БД и сливаются heapq.merge без материализации;
+- строки пишутся в write-only книгу openpyxl (лист сразу уходит во
+  временный файл), готовый файл отдаётся FileResponse по частям.
+
+Память процесса не зависит от количества строк.
+"""
+import datetime
+import hashlib
+import heapq
+import logging
+from typing import Callable, Iterator, Optional, Tuple
+
+from django.db.models import DateTimeField, F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from .access import get_access_scope
+from .forms import HistoryFilterForm
+from .models import StudentVisit, Visit
+from .search import employee_filter, name_filter
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_SIZE = 2000
+
+HEADERS = [
+    "ID Визита", "Тип визита", "Статус", "ФИО Посетителя", "ИИН", "Телефон Посетителя", "Email Посетителя",
+    "Сотрудник ФИО", "Сотрудник Email", "Студент ID", "Студент Группа", "Студент Курс",
+    "Департамент", "Цель визита", "Конт. тел. сотрудника (визит)",
+    "Планируемое время входа", "Время входа", "Время выхода", "Зарегистрировал ФИО", "Зарегистрировал Email",
+    "Согласие ПДн"
+]
+
+COLUMN_WIDTHS = {
+    "ФИО Посетителя": 30, "Цель визита": 30, "Сотрудник ФИО": 30, "Зарегистрировал ФИО": 30,
+    "Время входа": 20, "Время выхода": 20, "Планируемое время входа": 20,
+    "Email Посетителя": 20, "Сотрудник Email": 20, "Зарегистрировал Email": 20,
+    "ИИН": 18, "Телефон Посетителя": 18, "Конт. тел. сотрудника (визит)": 18,
+}
+DEFAULT_COLUMN_WIDTH = 15
+
+# Визиты без времени - в конце выгрузки (как в истории)
+_VERY_OLD = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def export_querysets(user, params) -> Tuple:
+    """
+    Визиты для выгрузки: область доступа пользователя + фильтры формы истории.
+
+    Args:
+        user: Пользователь, от имени которого строится выгрузка
+        params: GET-параметры (QueryDict или dict) фильтров истории
+    """
+    scope = get_access_scope(user)
+    official_visits_qs = scope.filter_visits(Visit.objects.all())
+    student_visits_qs = scope.filter_visits(StudentVisit.objects.all())
+
+    filter_form = HistoryFilterForm(params or None)
+    if params and filter_form.is_valid():
+        data = filter_form.cleaned_data
+        guest_name = data.get('guest_name')
+        guest_iin = data.get('guest_iin')
+        entry_date_from = data.get('entry_date_from')
+        entry_date_to = data.get('entry_date_to')
+        purpose_filter = data.get('purpose')
+        status = data.get('status')
+        department = data.get('department')
+        employee_info = data.get('employee_info')
+        student_id = data.get('student_id_number')
+        student_group = data.get('student_group')
+
+        if guest_name:
+            official_visits_qs = official_visits_qs.filter(name_filter(guest_name, 'guest__full_name'))
+            student_visits_qs = student_visits_qs.filter(name_filter(guest_name, 'guest__full_name'))
+        if guest_iin:
+            iin_hash = hashlib.sha256(guest_iin.encode()).hexdigest()
+            official_visits_qs = official_visits_qs.filter(guest__iin_hash=iin_hash)
+            student_visits_qs = student_visits_qs.filter(guest__iin_hash=iin_hash)
+        if entry_date_from:
+            official_visits_qs = official_visits_qs.filter(
+                Q(entry_time__date__gte=entry_date_from) |
+                Q(entry_time__isnull=True, expected_entry_time__date__gte=entry_date_from)
+            )
+            student_visits_qs = student_visits_qs.filter(entry_time__date__gte=entry_date_from)
+        if entry_date_to:
+            official_visits_qs = official_visits_qs.filter(
+                Q(entry_time__date__lte=entry_date_to) |
+                Q(entry_time__isnull=True, expected_entry_time__date__lte=entry_date_to)
+            )
+            student_visits_qs = student_visits_qs.filter(entry_time__date__lte=entry_date_to)
+        if purpose_filter:
+            official_visits_qs = official_visits_qs.filter(purpose__icontains=purpose_filter)
+            student_visits_qs = student_visits_qs.filter(purpose__icontains=purpose_filter)
+        if status:
+            official_visits_qs = official_visits_qs.filter(status=status)
+            student_visits_qs = student_visits_qs.filter(status=status)
+        if department:
+            official_visits_qs = official_visits_qs.filter(department=department)
+            student_visits_qs = student_visits_qs.filter(department=department)
+        if employee_info:
+            official_visits_qs = official_visits_qs.filter(employee_filter(employee_info, 'employee__'))
+        if student_id:
+            student_visits_qs = student_visits_qs.filter(student_id_number__icontains=student_id)
+        if student_group:
+            student_visits_qs = student_visits_qs.filter(student_group__icontains=student_group)
+
+    return official_visits_qs, student_visits_qs
+
+
+def _ordered(qs, kind: str, *time_fields: str, chunk_size: int) -> Iterator:
+    """Визиты одного типа от новых к старым, читаемые пачками с курсора БД."""
+    if len(time_fields) > 1:
+        sort_time = Coalesce(*time_fields, output_field=DateTimeField())
+    else:
+        sort_time = F(time_fields[0])
+    qs = qs.annotate(export_sort_time=sort_time).order_by(
+        F('export_sort_time').desc(nulls_last=True), '-id'
+    )
+    for visit in qs.iterator(chunk_size=chunk_size):
+        visit.visit_kind = kind
+        yield visit
+
+
+def iter_visits(official_qs, student_qs, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator:
+    """Слияние двух отсортированных потоков визитов (порядок как в истории)."""
+    official = _ordered(
+        official_qs.select_related('guest', 'employee', 'department', 'registered_by'),
+        'official', 'entry_time', 'expected_entry_time', chunk_size=chunk_size,
+    )
+    student = _ordered(
+        student_qs.select_related('guest', 'department', 'registered_by'),
+        'student', 'entry_time', chunk_size=chunk_size,
+    )
+    return heapq.merge(
+        official, student,
+        key=lambda visit: visit.export_sort_time or _VERY_OLD,
+        reverse=True,
+    )
+
+
+def _fmt(value) -> str:
+    if not value:
+        return ''
+    return value.astimezone(timezone.get_default_timezone()).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _masked_iin(guest) -> str:
+    try:
+        raw_iin = getattr(guest, 'iin', None)
+    except Exception:
+        return ''
+    if not raw_iin:
+        return ''
+    return ('********' + str(raw_iin)[-4:]) if len(str(raw_iin)) >= 4 else '********'
+
+
+def visit_row(visit, status_display_map: dict) -> list:
+    """Строка выгрузки для официального или студенческого визита."""
+    status_str = status_display_map.get(visit.status, visit.status)
+    registered_by = visit.registered_by
+    if visit.visit_kind == 'official':
+        row = [
+            visit.id,
+            "Гость сотрудника/Другое",
+            status_str,
+            visit.guest.full_name,
+            _masked_iin(visit.guest),
+            visit.guest.phone_number,
+            visit.guest.email,
+            visit.employee.get_full_name() if visit.employee else '-',
+            visit.employee.email if visit.employee else '-',
+            '-', '-', '-',
+            visit.department.name if visit.department else '-',
+            visit.purpose,
+            visit.employee_contact_phone,
+            _fmt(visit.expected_entry_time),
+            _fmt(visit.entry_time),
+            _fmt(visit.exit_time),
+            registered_by.get_full_name() if registered_by else '-',
+            registered_by.email if registered_by else '-',
+            "Да" if visit.consent_acknowledged else "Нет",
+        ]
+    elif visit.visit_kind == 'student':
+        # У студенческих визитов нет expected_entry_time/consent
+        row = [
+            visit.id,
+            "Студент/Абитуриент",
+            status_str,
+            visit.guest.full_name,
+            _masked_iin(visit.guest),
+            visit.guest.phone_number,
+            visit.guest.email,
+            '-', '-',
+            visit.student_id_number,
+            visit.student_group,
+            visit.student_course,
+            visit.department.name,
+            visit.purpose,
+            '-',
+            '-',
+            _fmt(visit.entry_time),
+            _fmt(visit.exit_time),
+            registered_by.get_full_name() if registered_by else '-',
+            registered_by.email if registered_by else '-',
+            '-',
+        ]
+    else:
+        row = [visit.id, 'Неизвестный тип'] + ['-'] * (len(HEADERS) - 2)
+    # Заменяем None на пустую строку для корректного отображения
+    return [str(item) if item is not None else '' for item in row]
+
+
+def write_visits_xlsx(official_qs, student_qs, fileobj,
+                      chunk_size: int = EXPORT_CHUNK_SIZE,
+                      progress: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Пишет выгрузку в fileobj (write-only книга openpyxl).
+
+    Args:
+        progress: Вызывается с числом записанных строк после каждой пачки
+
+    Returns:
+        Количество строк с визитами
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("История визитов")
+
+    # Ширина колонок задаётся до первой строки (требование write-only режима)
+    for col_idx, title in enumerate(HEADERS, 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = COLUMN_WIDTHS.get(title, DEFAULT_COLUMN_WIDTH)
+
+    bold = Font(bold=True)
+    header_cells = []
+    for title in HEADERS:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = bold
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    status_display_map = dict(Visit._meta.get_field('status').choices)
+    rows = 0
+    for visit in iter_visits(official_qs, student_qs, chunk_size):
+        ws.append(visit_row(visit, status_display_map))
+        rows += 1
+        if progress is not None and rows % chunk_size == 0:
+            progress(rows)
+
+    wb.save(fileobj)
+    if progress is not None:
+        progress(rows)
+    return rows
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from visitors.timeline import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленту визитов (VisitTimelineEntry) из исходных таблиц. Использование: rebuild_visit_timeline --chunk-size 2000'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Размер пачки upsert (по умолчанию 1000)')
+
+    def handle(self, *args, **options):
+        total = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Лента визитов пересобрана: {total} записей'))
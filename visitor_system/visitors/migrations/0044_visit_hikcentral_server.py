@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hikvision_integration', '0003_multi_server_routing'),
+        ('visitors', '0043_securityincident'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='hikcentral_server',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='visits', to='hikvision_integration.hikcentralserver', verbose_name='Сервер HikCentral'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+RULE_INCIDENT_TYPES = ['exit_without_entry', 'long_stay', 'suspicious_time']
+
+
+def remove_duplicate_incidents(apps, schema_editor):
+    """Оставляет самый ранний инцидент каждого типа на визит (get_or_create мог гоняться)."""
+    SecurityIncident = apps.get_model('visitors', 'SecurityIncident')
+    seen = set()
+    duplicate_ids = []
+    rows = SecurityIncident.objects.filter(
+        incident_type__in=RULE_INCIDENT_TYPES
+    ).order_by('visit_id', 'incident_type', 'id').values_list('id', 'visit_id', 'incident_type')
+    for incident_id, visit_id, incident_type in rows.iterator():
+        key = (visit_id, incident_type)
+        if key in seen:
+            duplicate_ids.append(incident_id)
+        else:
+            seen.add(key)
+    if duplicate_ids:
+        SecurityIncident.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0044_visit_hikcentral_server'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_incidents, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='securityincident',
+            constraint=models.UniqueConstraint(condition=models.Q(('incident_type__in', RULE_INCIDENT_TYPES)), fields=('visit', 'incident_type'), name='incident_unique_rule_per_visit'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Первичное наполнение ленты из существующих визитов (INSERT ... SELECT)
+BACKFILL_SQL = [
+    """
+    INSERT INTO visitors_visittimelineentry
+        (kind, source_id, department_id, employee_id, relevant_time, exit_time,
+         status, guest_name, guests_count, purpose, updated_at)
+    SELECT 'official', v.id, v.department_id, v.employee_id,
+           COALESCE(v.entry_time, v.expected_entry_time), v.exit_time,
+           v.status, COALESCE(g.full_name, ''), 1, LEFT(COALESCE(v.purpose, ''), 255), NOW()
+    FROM visitors_visit v
+    LEFT JOIN visitors_guest g ON g.id = v.guest_id
+    WHERE v.entry_time IS NOT NULL OR v.expected_entry_time IS NOT NULL
+    """,
+    """
+    INSERT INTO visitors_visittimelineentry
+        (kind, source_id, department_id, employee_id, relevant_time, exit_time,
+         status, guest_name, guests_count, purpose, updated_at)
+    SELECT 'student', s.id, s.department_id, s.registered_by_id,
+           s.entry_time, s.exit_time,
+           s.status, COALESCE(g.full_name, ''), 1, LEFT(COALESCE(s.purpose, ''), 255), NOW()
+    FROM visitors_studentvisit s
+    LEFT JOIN visitors_guest g ON g.id = s.guest_id
+    WHERE s.entry_time IS NOT NULL
+    """,
+    """
+    INSERT INTO visitors_visittimelineentry
+        (kind, source_id, department_id, employee_id, relevant_time, exit_time,
+         status, guest_name, guests_count, purpose, updated_at)
+    SELECT 'group', gi.id, gi.department_id, gi.employee_id,
+           gi.visit_time, gi.exit_time,
+           CASE WHEN gi.is_completed THEN 'CHECKED_OUT' ELSE 'AWAITING' END,
+           COALESCE(
+               (SELECT gg.full_name FROM visitors_groupguest gg
+                WHERE gg.group_invitation_id = gi.id ORDER BY gg.id LIMIT 1),
+               gi.group_name, ''
+           ),
+           (SELECT COUNT(*) FROM visitors_groupguest gg WHERE gg.group_invitation_id = gi.id),
+           LEFT(COALESCE(gi.purpose, ''), 255), NOW()
+    FROM visitors_groupinvitation gi
+    WHERE gi.is_registered AND gi.visit_time IS NOT NULL
+    """,
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('departments', '0003_alter_department_name'),
+        ('visitors', '0045_securityincident_incident_unique_rule_per_visit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitTimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('official', 'Официальный'), ('student', 'Студенческий'), ('group', 'Групповой')], max_length=10, verbose_name='Тип визита')),
+                ('source_id', models.PositiveBigIntegerField(verbose_name='ID исходного визита')),
+                ('relevant_time', models.DateTimeField(verbose_name='Время визита')),
+                ('exit_time', models.DateTimeField(blank=True, null=True, verbose_name='Время выхода')),
+                ('status', models.CharField(choices=[('AWAITING', 'Ожидает прибытия'), ('CHECKED_IN', 'В здании'), ('CHECKED_OUT', 'Вышел'), ('CANCELLED', 'Отменен')], max_length=20, verbose_name='Статус')),
+                ('guest_name', models.CharField(blank=True, max_length=255, verbose_name='Гость')),
+                ('guests_count', models.PositiveIntegerField(default=1, verbose_name='Количество гостей')),
+                ('purpose', models.CharField(blank=True, max_length=255, verbose_name='Цель визита')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='departments.department', verbose_name='Департамент')),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Сотрудник')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты визитов',
+                'verbose_name_plural': 'Лента визитов',
+                'ordering': ['-relevant_time', '-kind', '-source_id'],
+                'indexes': [models.Index(fields=['-relevant_time', '-kind', '-source_id'], name='timeline_keyset_idx'), models.Index(fields=['department', '-relevant_time'], name='timeline_dept_time_idx'), models.Index(fields=['status', '-relevant_time'], name='timeline_status_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'source_id'), name='timeline_unique_source')],
+            },
+        ),
+        migrations.RunSQL(
+            BACKFILL_SQL,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
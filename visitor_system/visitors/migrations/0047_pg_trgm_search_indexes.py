@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:26
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# auth_user принадлежит django.contrib.auth - индексы создаём SQL'ом.
+# Выражение UPPER(...) совпадает с тем, что Django строит для __icontains.
+USER_TRGM_COLUMNS = ('first_name', 'last_name', 'email')
+
+USER_INDEXES_SQL = [
+    f'CREATE INDEX IF NOT EXISTS auth_user_{column}_trgm '
+    f'ON auth_user USING gin (UPPER({column}) gin_trgm_ops)'
+    for column in USER_TRGM_COLUMNS
+]
+
+DROP_USER_INDEXES_SQL = [
+    f'DROP INDEX IF EXISTS auth_user_{column}_trgm'
+    for column in USER_TRGM_COLUMNS
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0046_visittimelineentry'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='guest',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='gin_trgm_ops'), name='guest_full_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='groupguest',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='gin_trgm_ops'), name='groupguest_full_name_trgm'),
+        ),
+        migrations.RunSQL(USER_INDEXES_SQL, reverse_sql=DROP_USER_INDEXES_SQL),
+    ]
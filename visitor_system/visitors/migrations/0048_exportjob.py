@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:30
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0047_pg_trgm_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=50, verbose_name='Тип выгрузки')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Параметры')),
+                ('scope_key', models.CharField(blank=True, max_length=64, verbose_name='Область доступа')),
+                ('filter_hash', models.CharField(max_length=64, verbose_name='Хэш параметров')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Прогресс, %')),
+                ('rows', models.PositiveIntegerField(default=0, verbose_name='Строк выгружено')),
+                ('file', models.FileField(blank=True, upload_to='exports/%Y/%m/%d/', verbose_name='Файл')),
+                ('filename', models.CharField(blank=True, max_length=255, verbose_name='Имя файла')),
+                ('content_type', models.CharField(blank=True, max_length=255, verbose_name='MIME-тип')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начато')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Хранить до')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Фоновая выгрузка',
+                'verbose_name_plural': 'Фоновые выгрузки',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['filter_hash', '-created_at'], name='exportjob_hash_idx'), models.Index(fields=['user', '-created_at'], name='exportjob_user_idx'), models.Index(fields=['expires_at'], name='exportjob_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 23:40
+
+from django.db import migrations, models
+
+# Плановое время официальных визитов в уже заполненной ленте
+BACKFILL_SQL = """
+    UPDATE visitors_visittimelineentry t
+    SET expected_time = v.expected_entry_time
+    FROM visitors_visit v
+    WHERE t.kind = 'official' AND t.source_id = v.id AND v.expected_entry_time IS NOT NULL
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0048_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visittimelineentry',
+            name='expected_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Планируемое время входа'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='visittimelineentry',
+            index=models.Index(condition=models.Q(('expected_time__isnull', False)), fields=['expected_time'], name='timeline_expected_time_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.db.models import Index, Q
+from django.db.models.functions import Upper
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.contrib.auth.models import User # Стандартная модель пользователя Django
 from departments.models import Department
 from django.utils import timezone
@@ -83,6 +85,10 @@ class Guest(models.Model):
     class Meta:
         verbose_name = "Гость"
         verbose_name_plural = "Гости"
+        indexes = [
+            # Поиск по ФИО (__icontains -> UPPER(full_name) LIKE), см. search.py
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='guest_full_name_trgm'),
+        ]
 
 class VisitPurpose(models.Model):
     name = models.CharField(max_length=200, unique=True, verbose_name='Название цели визита')
@@ -236,6 +242,14 @@ class Visit(models.Model):
         null=True,
         verbose_name="ID персоны в HikCentral"
     )
+    hikcentral_server = models.ForeignKey(
+        'hikvision_integration.HikCentralServer',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='visits',
+        verbose_name="Сервер HikCentral"
+    )
     # FIX #7: Tracking notification sent status
     entry_notification_sent = models.BooleanField(
         default=False,
@@ -504,6 +518,9 @@ class GroupGuest(models.Model):
     class Meta:
         verbose_name = "Гость группы"
         verbose_name_plural = "Гости группы"
+        indexes = [
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='groupguest_full_name_trgm'),
+        ]
 
     def save(self, *args, **kwargs):
         # Обновляем iin_last4
@@ -715,6 +732,17 @@ class SecurityIncident(models.Model):
             Index(fields=['incident_type', '-detected_at'], name='incident_type_date_idx'),
             Index(fields=['severity', 'status'], name='incident_severity_status_idx'),
         ]
+        constraints = [
+            # Правила движка аномалий создают не больше одного инцидента
+            # каждого типа на визит (bulk_create с ignore_conflicts)
+            models.UniqueConstraint(
+                fields=['visit', 'incident_type'],
+                condition=Q(incident_type__in=[
+                    'exit_without_entry', 'long_stay', 'suspicious_time',
+                ]),
+                name='incident_unique_rule_per_visit',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.get_incident_type_display()} - {self.visit.guest.full_name} ({self.detected_at.strftime('%Y-%m-%d %H:%M')})"
@@ -733,4 +761,152 @@ class SecurityIncident(models.Model):
         self.resolved_at = timezone.now()
         if notes:
             self.resolution_notes = notes
-        self.save()
\ No newline at end of file
+        self.save()
+
+class VisitTimelineEntry(models.Model):
+    """
+    Денормализованная лента визитов всех типов (read model).
+
+    Официальные, студенческие и групповые визиты хранятся в разных таблицах
+    с разными полями времени. Эта таблица сводит их к одной строке на визит
+    с единым relevant_time и поддерживается сигналами (visitors/timeline.py),
+    поэтому списки и календарь читают ленту одним индексированным запросом.
+
+    Для групповых визитов хранится STATUS_AWAITING_ARRIVAL или
+    STATUS_CHECKED_OUT: переход в «в здании» зависит от текущего времени,
+    его вычисляет effective_status.
+    """
+
+    KIND_OFFICIAL = 'official'
+    KIND_STUDENT = 'student'
+    KIND_GROUP = 'group'
+
+    KIND_CHOICES = [
+        (KIND_OFFICIAL, 'Официальный'),
+        (KIND_STUDENT, 'Студенческий'),
+        (KIND_GROUP, 'Групповой'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name='Тип визита')
+    source_id = models.PositiveBigIntegerField(verbose_name='ID исходного визита')
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Департамент'
+    )
+    employee = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Сотрудник'
+    )
+    relevant_time = models.DateTimeField(verbose_name='Время визита')
+    # Только официальные визиты: календарь показывает визит и тогда, когда
+    # в диапазон попадает плановое время, а фактический вход - вне его
+    expected_time = models.DateTimeField(null=True, blank=True, verbose_name='Планируемое время входа')
+    exit_time = models.DateTimeField(null=True, blank=True, verbose_name='Время выхода')
+    status = models.CharField(max_length=20, choices=VISIT_STATUS_CHOICES, verbose_name='Статус')
+    guest_name = models.CharField(max_length=255, blank=True, verbose_name='Гость')
+    guests_count = models.PositiveIntegerField(default=1, verbose_name='Количество гостей')
+    purpose = models.CharField(max_length=255, blank=True, verbose_name='Цель визита')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Запись ленты визитов'
+        verbose_name_plural = 'Лента визитов'
+        ordering = ['-relevant_time', '-kind', '-source_id']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'source_id'], name='timeline_unique_source'),
+        ]
+        indexes = [
+            Index(fields=['-relevant_time', '-kind', '-source_id'], name='timeline_keyset_idx'),
+            Index(fields=['department', '-relevant_time'], name='timeline_dept_time_idx'),
+            Index(fields=['status', '-relevant_time'], name='timeline_status_time_idx'),
+            Index(fields=['expected_time'], name='timeline_expected_time_idx',
+                  condition=Q(expected_time__isnull=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.source_id}: {self.guest_name}"
+
+    @property
+    def effective_status(self):
+        if (
+            self.kind == self.KIND_GROUP
+            and self.status == STATUS_AWAITING_ARRIVAL
+            and self.relevant_time <= timezone.now()
+        ):
+            return STATUS_CHECKED_IN
+        return self.status
+
+
+class ExportJob(models.Model):
+    """
+    Фоновая выгрузка (XLSX/PDF/CSV), которую формирует Celery-задача.
+
+    Файл сохраняется в хранилище (default storage), пользователь следит за
+    прогрессом через HTMX и получает подписанную ссылку на скачивание.
+    filter_hash - хэш типа выгрузки, параметров и области доступа: по нему
+    повторный запрос тех же данных получает уже готовую (или идущую) задачу.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Формируется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='export_jobs',
+        verbose_name='Пользователь'
+    )
+    kind = models.CharField(max_length=50, verbose_name='Тип выгрузки')
+    params = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    scope_key = models.CharField(max_length=64, blank=True, verbose_name='Область доступа')
+    filter_hash = models.CharField(max_length=64, verbose_name='Хэш параметров')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name='Прогресс, %')
+    rows = models.PositiveIntegerField(default=0, verbose_name='Строк выгружено')
+    file = models.FileField(upload_to='exports/%Y/%m/%d/', blank=True, verbose_name='Файл')
+    filename = models.CharField(max_length=255, blank=True, verbose_name='Имя файла')
+    content_type = models.CharField(max_length=255, blank=True, verbose_name='MIME-тип')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начато')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершено')
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name='Хранить до')
+
+    class Meta:
+        verbose_name = 'Фоновая выгрузка'
+        verbose_name_plural = 'Фоновые выгрузки'
+        ordering = ['-created_at']
+        indexes = [
+            Index(fields=['filter_hash', '-created_at'], name='exportjob_hash_idx'),
+            Index(fields=['user', '-created_at'], name='exportjob_user_idx'),
+            Index(fields=['expires_at'], name='exportjob_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} [{self.get_status_display()}] {self.user}"
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= timezone.now()
@@ -0,0 +1,134 @@
+"""
+Поиск по ФИО и email (фильтры истории визитов и автокомплит сотрудников).
+
+Поиск идёт по индексам pg_trgm (GIN по UPPER(колонка) gin_trgm_ops,
+миграция 0047): именно такое выражение Django строит для __icontains,
+поэтому ILIKE '%...%' больше не сканирует таблицы целиком.
+
+Имена вводятся то кириллицей, то латиницей («Иванов» / «Ivanov»), поэтому
+запрос расширяется транслитерированными вариантами, а результаты
+автокомплита ранжируются по триграммному сходству с лучшим из вариантов.
+"""
+from functools import reduce
+from operator import or_
+from typing import Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Greatest
+
+# Русский + казахский алфавит -> латиница (упрощённая транслитерация)
+CYR_TO_LAT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'ә': 'a', 'ғ': 'g', 'қ': 'k', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u',
+    'һ': 'h', 'і': 'i',
+}
+
+# Латиница -> кириллица: сначала длинные сочетания
+LAT_TO_CYR = (
+    ('shch', 'щ'), ('sch', 'щ'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'),
+    ('ch', 'ч'), ('sh', 'ш'), ('yu', 'ю'), ('ya', 'я'), ('yo', 'ё'),
+    ('a', 'а'), ('b', 'б'), ('c', 'к'), ('d', 'д'), ('e', 'е'), ('f', 'ф'),
+    ('g', 'г'), ('h', 'х'), ('i', 'и'), ('j', 'дж'), ('k', 'к'), ('l', 'л'),
+    ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'), ('q', 'к'), ('r', 'р'),
+    ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'), ('w', 'в'), ('x', 'кс'),
+    ('y', 'й'), ('z', 'з'),
+)
+
+
+def to_latin(text: str) -> str:
+    return ''.join(CYR_TO_LAT.get(ch, ch) for ch in text.lower())
+
+
+def to_cyrillic(text: str) -> str:
+    text = text.lower()
+    result = []
+    i = 0
+    while i < len(text):
+        for lat, cyr in LAT_TO_CYR:
+            if text.startswith(lat, i):
+                result.append(cyr)
+                i += len(lat)
+                break
+        else:
+            result.append(text[i])
+            i += 1
+    return ''.join(result)
+
+
+def _has_cyrillic(text: str) -> bool:
+    return any('а' <= ch <= 'я' or ch in CYR_TO_LAT for ch in text.lower())
+
+
+def name_variants(term: str) -> Tuple[str, ...]:
+    """Исходная строка и её транслитерация (без дубликатов)."""
+    term = ' '.join((term or '').split())
+    if not term:
+        return ()
+    if '@' in term:
+        return (term,)  # email не транслитерируем
+    other = to_latin(term) if _has_cyrillic(term) else to_cyrillic(term)
+    variants = [term]
+    if other and other.lower() != term.lower():
+        variants.append(other)
+    return tuple(variants)
+
+
+def name_filter(term: str, *fields: str) -> Q:
+    """
+    Q «любое из полей содержит любой из вариантов строки».
+
+    Всегда __icontains, как и до индексов: строки от трёх символов
+    идут по триграммному индексу, более короткие (триграмм в них нет)
+    PostgreSQL ищет без индекса - семантика «содержит» сохраняется.
+    Пустая строка даёт пустой Q() (без фильтра).
+    """
+    variants = name_variants(term)
+    if not variants or not fields:
+        return Q()
+    return reduce(or_, (
+        Q(**{f'{field}__icontains': variant})
+        for field in fields for variant in variants
+    ))
+
+
+def similarity(term: str, *fields: str):
+    """Выражение ранга: максимум TrigramWordSimilarity по полям и вариантам."""
+    parts = [
+        TrigramWordSimilarity(variant, field)
+        for field in fields for variant in name_variants(term)
+    ]
+    if not parts:
+        return Value(0.0, output_field=FloatField())
+    if len(parts) == 1:
+        return parts[0]
+    return Greatest(*parts, output_field=FloatField())
+
+
+EMPLOYEE_FIELDS = ('first_name', 'last_name', 'email')
+
+
+def employee_filter(term: str, prefix: str = '') -> Q:
+    """Фильтр сотрудника по имени/фамилии/email (prefix - путь к User, напр. 'employee__')."""
+    return name_filter(term, *(f'{prefix}{field}' for field in EMPLOYEE_FIELDS))
+
+
+def search_employees(term: str, department_id: Optional[int] = None, limit: int = 20):
+    """
+    Активные сотрудники, подходящие под строку, лучшие совпадения первыми.
+
+    Без строки - первые limit сотрудников (по фамилии).
+    """
+    qs = User.objects.filter(is_active=True)
+    if department_id:
+        qs = qs.filter(employee_profile__department_id=department_id)
+    if not name_variants(term):
+        return qs.order_by('last_name', 'first_name', 'id')[:limit]
+    return qs.filter(employee_filter(term)).annotate(
+        rank=similarity(term, *EMPLOYEE_FIELDS)
+    ).order_by('-rank', 'last_name', 'first_name', 'id')[:limit]
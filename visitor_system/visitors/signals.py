@@ -3,7 +3,7 @@ from __future__ import annotations
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
-from .models import Visit, StudentVisit, AuditLog
+from .models import Visit, StudentVisit, AuditLog, GroupInvitation, VisitTimelineEntry
 
 
 def _safe_write_audit(action: str, model: str, obj_id: str, actor, extra=None):
@@ -266,4 +266,129 @@ def invalidate_auditlog_cache(sender, instance, **kwargs):
             cache.delete_pattern('dashboard:auto_checkin:*')
             cache_logger.debug(f'Cache invalidated for AuditLog #{instance.id}')
         except Exception as e:
-            cache_logger.error(f'Error invalidating auditlog cache: {e}')
\ No newline at end of file
+            cache_logger.error(f'Error invalidating auditlog cache: {e}')
+
+# ==================== VISIT TIMELINE (READ MODEL) ====================
+
+from django.db.models.signals import post_delete
+
+from . import timeline
+
+
+def _safe_timeline(func, *args):
+    try:
+        func(*args)
+    except Exception as e:
+        # Не ломаем сохранение визита; ленту починит rebuild_visit_timeline
+        cache_logger.error(f'Error syncing visit timeline ({func.__name__}): {e}')
+
+
+@receiver(post_save, sender='visitors.Visit')
+def sync_visit_timeline(sender, instance, **kwargs):
+    _safe_timeline(timeline.sync_visit, instance)
+
+
+@receiver(post_save, sender='visitors.StudentVisit')
+def sync_student_visit_timeline(sender, instance, **kwargs):
+    _safe_timeline(timeline.sync_student_visit, instance)
+
+
+@receiver(post_save, sender='visitors.GroupInvitation')
+def sync_group_timeline(sender, instance, **kwargs):
+    _safe_timeline(timeline.sync_group, instance)
+
+
+@receiver(post_save, sender='visitors.GroupGuest')
+@receiver(post_delete, sender='visitors.GroupGuest')
+def sync_group_guests_timeline(sender, instance, **kwargs):
+    # Имя первого гостя и количество гостей группы
+    group = GroupInvitation.objects.filter(pk=instance.group_invitation_id).first()
+    if group is not None:
+        _safe_timeline(timeline.sync_group, group)
+
+
+@receiver(post_save, sender='visitors.Guest')
+def sync_guest_name_timeline(sender, instance, created, **kwargs):
+    if not created:
+        _safe_timeline(timeline.rename_guest, instance)
+
+
+@receiver(post_delete, sender='visitors.Visit')
+def remove_visit_timeline(sender, instance, **kwargs):
+    _safe_timeline(timeline.remove, VisitTimelineEntry.KIND_OFFICIAL, instance.pk)
+
+
+@receiver(post_delete, sender='visitors.StudentVisit')
+def remove_student_visit_timeline(sender, instance, **kwargs):
+    _safe_timeline(timeline.remove, VisitTimelineEntry.KIND_STUDENT, instance.pk)
+
+
+@receiver(post_delete, sender='visitors.GroupInvitation')
+def remove_group_timeline(sender, instance, **kwargs):
+    _safe_timeline(timeline.remove, VisitTimelineEntry.KIND_GROUP, instance.pk)
+
+
+# ==================== ACCESS SCOPE INVALIDATION ====================
+
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, pre_delete
+
+from .access import invalidate_access_scope
+
+
+def _forget_scope(user) -> None:
+    # Область, уже запомненная на объекте пользователя в текущем запросе
+    user.__dict__.pop('_access_scope', None)
+
+
+@receiver(m2m_changed, sender=UserModel.groups.through)
+def invalidate_scope_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        _forget_scope(instance)
+        invalidate_access_scope(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...)/remove(...)
+        invalidate_access_scope(*pk_set)
+    elif action == 'pre_clear':
+        # group.user_set.clear(): участников нужно взять до очистки
+        invalidate_access_scope(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_scope_on_group_delete(sender, instance, **kwargs):
+    invalidate_access_scope(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=UserModel)
+def invalidate_scope_on_user_change(sender, instance, created, **kwargs):
+    if not created:
+        _forget_scope(instance)
+        invalidate_access_scope(instance.pk)
+
+
+@receiver(post_save, sender='visitors.EmployeeProfile')
+@receiver(post_delete, sender='visitors.EmployeeProfile')
+def invalidate_scope_on_profile_change(sender, instance, **kwargs):
+    invalidate_access_scope(instance.user_id)
+
+
+# ==================== EMPLOYEE AUTOCOMPLETE INDEX ====================
+
+from . import employee_index
+
+
+@receiver(post_save, sender=UserModel)
+@receiver(post_delete, sender=UserModel)
+def invalidate_employee_index_on_user_change(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя сохраняет только last_login - индекс не затрагивается
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    employee_index.invalidate()
+
+
+@receiver(post_save, sender='visitors.EmployeeProfile')
+@receiver(post_delete, sender='visitors.EmployeeProfile')
+def invalidate_employee_index_on_profile_change(sender, instance, **kwargs):
+    employee_index.invalidate()
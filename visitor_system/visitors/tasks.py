@@ -351,4 +351,34 @@ def backup_database_task(self, upload_to_s3=False):
             raise self.retry(exc=exc, countdown=countdown)
         else:
             logger.error('Max retries reached for backup task')
-            raise
\ No newline at end of file
+            raise
+
+@shared_task(acks_late=True)
+def render_export_job_task(job_id):
+    """Формирует файл фоновой выгрузки (см. visitors/export_jobs.py)."""
+    from .export_jobs import run_export
+
+    job = run_export(job_id)
+    if job is None:
+        logger.warning("Export job %s not found", job_id)
+        return None
+    return {'job_id': str(job.pk), 'status': job.status, 'rows': job.rows}
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
+def cleanup_export_jobs_task():
+    """Удаляет просроченные фоновые выгрузки и их файлы."""
+    from .export_jobs import cleanup_expired
+
+    removed = cleanup_expired()
+    logger.info("Cleaned up %d expired export jobs", removed)
+    return {'removed': removed}
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={'max_retries': 3})
+def rebuild_visit_timeline_task():
+    """Пересобирает ленту визитов (изменения через queryset.update() сигналы не видят)."""
+    from .timeline import rebuild
+
+    total = rebuild()
+    return {'entries': total}
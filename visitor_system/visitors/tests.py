@@ -0,0 +1,145 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.test import SimpleTestCase, override_settings
+
+from . import employee_index, history, timeline
+from .models import GroupInvitation, StudentVisit, Visit
+
+
+class HistoryPageQueryTests(SimpleTestCase):
+    """Фильтр visit_type оставляет одну ветку - запрос строится без повторной сортировки."""
+
+    def build(self, official, student, group, cursor=None, backward=False):
+        querysets = (
+            Visit.objects.all() if official else Visit.objects.none(),
+            StudentVisit.objects.all() if student else StudentVisit.objects.none(),
+            GroupInvitation.objects.all() if group else GroupInvitation.objects.none(),
+        )
+        return history._page_query(*querysets, 20, cursor, backward)
+
+    def assertSingleBranch(self, query, model):
+        self.assertIs(query.model, model)
+        self.assertIsNone(query.query.combinator)
+        self.assertEqual(query.query.high_mark, 21)
+
+    def test_official_only(self):
+        self.assertSingleBranch(self.build(True, False, False), Visit)
+
+    def test_student_only(self):
+        self.assertSingleBranch(self.build(False, True, False), StudentVisit)
+
+    def test_group_only(self):
+        self.assertSingleBranch(self.build(False, False, True), GroupInvitation)
+
+    def test_single_branch_with_cursor(self):
+        cursor = history.decode_cursor(history.encode_cursor(history.EPOCH, 1, 5))
+        self.assertSingleBranch(self.build(False, True, False, cursor, backward=True), StudentVisit)
+
+    def test_no_visible_branches(self):
+        self.assertIsNone(self.build(False, False, False))
+        self.assertEqual(history._page_keys(None, None, StudentVisit.objects.none(), 20, None, False), [])
+
+    def test_all_branches_are_unioned(self):
+        query = self.build(True, True, True)
+        self.assertEqual(query.query.combinator, 'union')
+        self.assertEqual(len(query.query.combined_queries), 3)
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+EMPLOYEE_ROWS = [
+    (1, 'aivanova', 'Анна', 'Иванова', 'anna@kazuni.kz', 10),
+    (2, 'petrov', 'Пётр', 'Петров', 'petrov@kazuni.kz', 20),
+    (3, 'ivanchuk', 'Сергей', 'Иванчук', 'sergey@kazuni.kz', 20),
+]
+
+
+class EmployeeIndexSearchTests(SimpleTestCase):
+    def setUp(self):
+        self.index = employee_index.EmployeeIndex.from_rows(EMPLOYEE_ROWS)
+
+    def ids(self, term, department_id=None):
+        return [row['id'] for row in self.index.search(term, department_id)]
+
+    def test_word_prefix_with_transliteration(self):
+        self.assertEqual(self.ids('Иван'), [1, 3])
+        self.assertEqual(self.ids('ivan'), [1, 3])
+        self.assertEqual(self.ids('anna@'), [1])
+
+    def test_department_filter(self):
+        self.assertEqual(self.ids('иван', 20), [3])
+        self.assertEqual(self.ids('', 20), [3, 2])  # по фамилии
+        self.assertEqual(self.ids('иван', 99), [])
+
+    def test_username_is_not_searched(self):
+        self.assertEqual(self.ids('aivanova'), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EmployeeIndexSharingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        employee_index._local.update({'version': None, 'index': None, 'checked_at': 0.0})
+        self.addCleanup(employee_index._local.update, {'version': None, 'index': None, 'checked_at': 0.0})
+        patcher = mock.patch.object(
+            employee_index.EmployeeIndex, 'build',
+            side_effect=lambda: employee_index.EmployeeIndex.from_rows(EMPLOYEE_ROWS),
+        )
+        self.build = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(employee_index, '_search_db', return_value=[{'id': 1, 'text': 'db'}])
+        self.search_db = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def forget_local(self):
+        """Другой процесс: своей копии нет."""
+        employee_index._local.update({'version': None, 'index': None, 'checked_at': 0.0})
+
+    def test_index_is_built_once_and_shared(self):
+        employee_index.get_index()
+        self.forget_local()
+        self.assertIsNotNone(employee_index.get_index())
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_invalidate_triggers_rebuild(self):
+        employee_index.get_index()
+        employee_index.invalidate()
+        employee_index.get_index()
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_concurrent_rebuild_is_single_flight(self):
+        cache.add(employee_index.BUILD_LOCK_KEY, 'other-process')
+        self.assertIsNone(employee_index.get_index())
+        self.build.assert_not_called()
+        # Пока индекс собирается в другом процессе, ответ строится по БД
+        self.assertEqual(employee_index.search('Иван'), [{'id': 1, 'text': 'db'}])
+
+    def test_stale_copy_is_served_during_rebuild(self):
+        index = employee_index.get_index()
+        employee_index.invalidate()
+        cache.add(employee_index.BUILD_LOCK_KEY, 'other-process')
+        self.assertIs(employee_index.get_index(), index)
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_substring_falls_back_to_db(self):
+        self.assertEqual([row['id'] for row in employee_index.search('Иван')], [1, 3])
+        self.search_db.assert_not_called()
+        employee_index.search('ова')
+        self.search_db.assert_called_once_with('ова', None, 20)
+
+
+class TimelineEntryTests(SimpleTestCase):
+    def test_official_visit_keeps_planned_time(self):
+        planned = timezone.now()
+        entered = planned + timedelta(days=3)
+        fields = timeline.entry_for_visit(Visit(entry_time=entered, expected_entry_time=planned, purpose=''))
+        self.assertEqual(fields['relevant_time'], entered)
+        self.assertEqual(fields['expected_time'], planned)
+        self.assertIn('expected_time', timeline.UPDATE_FIELDS)
+
+    def test_student_visit_has_no_planned_time(self):
+        fields = timeline.entry_for_student_visit(StudentVisit(entry_time=timezone.now(), purpose=''))
+        self.assertIsNone(fields['expected_time'])
@@ -0,0 +1,203 @@
+"""
+Синхронизация ленты визитов (VisitTimelineEntry) с исходными таблицами.
+
+Сигналы из visitors/signals.py вызывают sync_* при сохранении и remove()
+при удалении визита. rebuild() пересобирает ленту целиком (management
+команда rebuild_visit_timeline и ежедневная задача rebuild_visit_timeline_task) -
+на случай bulk update/queryset.update(), которые сигналы не отправляют.
+"""
+import logging
+from typing import Iterable, Optional
+
+from django.db.models import Count, Min, Q
+
+from .models import (
+    GroupGuest,
+    GroupInvitation,
+    StudentVisit,
+    Visit,
+    VisitTimelineEntry,
+    STATUS_AWAITING_ARRIVAL,
+    STATUS_CHECKED_OUT,
+)
+
+logger = logging.getLogger(__name__)
+
+UPDATE_FIELDS = [
+    'department', 'employee', 'relevant_time', 'expected_time', 'exit_time', 'status',
+    'guest_name', 'guests_count', 'purpose',
+]
+
+
+def _purpose(text) -> str:
+    return (text or '')[:255]
+
+
+def entry_for_visit(visit: Visit) -> Optional[dict]:
+    relevant_time = visit.entry_time or visit.expected_entry_time
+    if relevant_time is None:
+        return None
+    return {
+        'department_id': visit.department_id,
+        'employee_id': visit.employee_id,
+        'relevant_time': relevant_time,
+        'expected_time': visit.expected_entry_time,
+        'exit_time': visit.exit_time,
+        'status': visit.status,
+        'guest_name': visit.guest.full_name if visit.guest_id else '',
+        'guests_count': 1,
+        'purpose': _purpose(visit.purpose),
+    }
+
+
+def entry_for_student_visit(visit: StudentVisit) -> Optional[dict]:
+    if visit.entry_time is None:
+        return None
+    return {
+        'department_id': visit.department_id,
+        'employee_id': visit.registered_by_id,
+        'relevant_time': visit.entry_time,
+        'expected_time': None,
+        'exit_time': visit.exit_time,
+        'status': visit.status,
+        'guest_name': visit.guest.full_name if visit.guest_id else '',
+        'guests_count': 1,
+        'purpose': _purpose(visit.purpose),
+    }
+
+
+def entry_for_group(group: GroupInvitation, first_guest_name: str = None,
+                    guests_count: int = None) -> Optional[dict]:
+    """В ленту попадают только зарегистрированные группы с указанным временем."""
+    if not group.is_registered or group.visit_time is None:
+        return None
+    if guests_count is None:
+        guests = list(group.guests.order_by('id').values_list('full_name', flat=True))
+        guests_count = len(guests)
+        first_guest_name = guests[0] if guests else ''
+    return {
+        'department_id': group.department_id,
+        'employee_id': group.employee_id,
+        'relevant_time': group.visit_time,
+        'expected_time': None,
+        'exit_time': group.exit_time,
+        'status': STATUS_CHECKED_OUT if group.is_completed else STATUS_AWAITING_ARRIVAL,
+        'guest_name': first_guest_name or group.group_name or '',
+        'guests_count': guests_count,
+        'purpose': _purpose(group.purpose),
+    }
+
+
+def _apply(kind: str, source_id: int, fields: Optional[dict]) -> None:
+    if fields is None:
+        remove(kind, source_id)
+        return
+    VisitTimelineEntry.objects.update_or_create(
+        kind=kind, source_id=source_id, defaults=fields
+    )
+
+
+def sync_visit(visit: Visit) -> None:
+    _apply(VisitTimelineEntry.KIND_OFFICIAL, visit.pk, entry_for_visit(visit))
+
+
+def sync_student_visit(visit: StudentVisit) -> None:
+    _apply(VisitTimelineEntry.KIND_STUDENT, visit.pk, entry_for_student_visit(visit))
+
+
+def sync_group(group: GroupInvitation) -> None:
+    _apply(VisitTimelineEntry.KIND_GROUP, group.pk, entry_for_group(group))
+
+
+def remove(kind: str, source_id: int) -> None:
+    VisitTimelineEntry.objects.filter(kind=kind, source_id=source_id).delete()
+
+
+def rename_guest(guest) -> None:
+    """Обновляет имя гостя во всех его записях ленты (одним UPDATE на тип)."""
+    VisitTimelineEntry.objects.filter(
+        kind=VisitTimelineEntry.KIND_OFFICIAL,
+        source_id__in=Visit.objects.filter(guest=guest).values('id'),
+    ).update(guest_name=guest.full_name)
+    VisitTimelineEntry.objects.filter(
+        kind=VisitTimelineEntry.KIND_STUDENT,
+        source_id__in=StudentVisit.objects.filter(guest=guest).values('id'),
+    ).update(guest_name=guest.full_name)
+
+
+def _upsert(entries: Iterable[VisitTimelineEntry]) -> int:
+    entries = list(entries)
+    if entries:
+        VisitTimelineEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['kind', 'source_id'],
+            update_fields=UPDATE_FIELDS,
+        )
+    return len(entries)
+
+
+def _batched(rows, chunk_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebuild(chunk_size: int = 1000) -> int:
+    """
+    Пересобирает ленту из исходных таблиц (upsert пачками + удаление сирот).
+
+    Returns:
+        Количество записей в ленте
+    """
+    total = 0
+    sources = (
+        (VisitTimelineEntry.KIND_OFFICIAL, entry_for_visit,
+         Visit.objects.filter(
+             Q(entry_time__isnull=False) | Q(expected_entry_time__isnull=False)
+         ).select_related('guest')),
+        (VisitTimelineEntry.KIND_STUDENT, entry_for_student_visit,
+         StudentVisit.objects.filter(entry_time__isnull=False).select_related('guest')),
+    )
+    for kind, builder, qs in sources:
+        for batch in _batched(qs.order_by('pk').iterator(chunk_size=chunk_size), chunk_size):
+            total += _upsert(
+                VisitTimelineEntry(kind=kind, source_id=obj.pk, **builder(obj))
+                for obj in batch
+            )
+
+    # Первый гость и количество гостей группы - агрегатами, без запроса на группу
+    groups = GroupInvitation.objects.filter(is_registered=True, visit_time__isnull=False)
+    annotated = groups.annotate(
+        guests_total=Count('guests'), first_guest_id=Min('guests__id')
+    ).order_by('pk')
+    for batch in _batched(annotated.iterator(chunk_size=chunk_size), chunk_size):
+        names = dict(GroupGuest.objects.filter(
+            id__in=[group.first_guest_id for group in batch if group.first_guest_id]
+        ).values_list('id', 'full_name'))
+        total += _upsert(
+            VisitTimelineEntry(
+                kind=VisitTimelineEntry.KIND_GROUP,
+                source_id=group.pk,
+                **entry_for_group(group, names.get(group.first_guest_id, ''), group.guests_total),
+            )
+            for group in batch
+        )
+
+    # Сироты: источник удалён или перестал подходить (например, сброшено время)
+    stale = 0
+    for kind, _, qs in sources:
+        stale += VisitTimelineEntry.objects.filter(kind=kind).exclude(
+            source_id__in=qs.values('id')
+        ).delete()[0]
+    stale += VisitTimelineEntry.objects.filter(kind=VisitTimelineEntry.KIND_GROUP).exclude(
+        source_id__in=groups.values('id')
+    ).delete()[0]
+
+    logger.info("Visit timeline rebuilt: %d entries upserted, %d stale removed", total, stale)
+    return total
@@ -6,7 +6,8 @@ from .dashboards import auto_checkin_dashboard, security_incidents_dashboard, hi
 from .exports import (
     export_auto_checkin_pdf, export_auto_checkin_excel,
     export_security_incidents_pdf, export_security_incidents_excel,
-    export_hikcentral_pdf, export_hikcentral_excel
+    export_hikcentral_pdf, export_hikcentral_excel,
+    start_export_job, export_job_status, download_export_job
 )
 from rest_framework.views import APIView  
 from rest_framework.response import Response  
@@ -88,6 +89,11 @@ urlpatterns = [
     path('dashboards/security-incidents/export/excel/', export_security_incidents_excel, name='export_security_incidents_excel'),
     path('dashboards/hikcentral/export/pdf/', export_hikcentral_pdf, name='export_hikcentral_pdf'),
     path('dashboards/hikcentral/export/excel/', export_hikcentral_excel, name='export_hikcentral_excel'),
+
+    # --- Фоновые выгрузки (Celery + HTMX-прогресс) ---
+    path('exports/<str:kind>/start/', start_export_job, name='export_job_start'),
+    path('exports/jobs/<uuid:job_id>/', export_job_status, name='export_job_status'),
+    path('exports/download/<str:token>/', download_export_job, name='export_job_download'),
 ]
 
 # DRF API маршруты регистрируются на уровне корневого urls.py (prefix /api/v1/)
@@ -3,7 +3,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test, permission_required
 from django.core.exceptions import PermissionDenied
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse, Http404, QueryDict
+from django.http import JsonResponse, HttpResponse, Http404, QueryDict, FileResponse
 from django.views.decorators.cache import never_cache, cache_page, cache_control
 from django.core.cache import cache
 from django_htmx.http import HttpResponseStopPolling, trigger_client_event, push_url
@@ -22,6 +22,7 @@ import datetime
 from datetime import timedelta
 import json
 import logging
+import tempfile
 import uuid
 from django.urls import reverse
 from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
@@ -35,13 +36,8 @@ from django.db.models import Count
 from itertools import chain as itertools_chain  # Переименуем для избежания конфликта
 from celery import chain  # Для цепочки задач Celery
 from operator import attrgetter
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import transaction
 
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Font
-
 from django.views.decorators.http import require_POST # Для ограничения методов
 from rest_framework.views import APIView  # type: ignore
 from rest_framework.response import Response  # type: ignore
@@ -54,14 +50,17 @@ from django.core.mail import send_mail
 from notifications.utils import send_new_visit_notification_to_security
 
 from .models import GroupInvitation, GroupGuest
+from .history import get_history_page
+from .counters import get_counter_snapshot
+from .access import get_access_scope
+from .search import employee_filter, name_filter
+from . import employee_index
+from . import history_export
 from django.forms import modelformset_factory
 from django.utils.dateparse import parse_datetime
 
 logger = logging.getLogger(__name__)
 
-# Имя группы для сотрудников ресепшн
-RECEPTION_GROUP = "Reception"
-
 SECURITY_GROUP = "FunctionalManager" # Например, "FunctionalManager" или "РасширенныйДоступ"
 
 # --- Вспомогательная функция для получения визитов с учетом прав доступа ---
@@ -72,31 +71,10 @@ def get_scoped_visits_qs(user):
     - Администраторы (is_staff) и члены группы RECEPTION_GROUP видят все визиты.
     - Остальные сотрудники видят визиты только своего департамента.
     """
-    official_visits_qs = Visit.objects.all()
-    student_visits_qs = StudentVisit.objects.all()
-
-    is_reception = user.is_authenticated and user.groups.filter(name=RECEPTION_GROUP).exists()
-    is_staff = user.is_staff
-
-    if not is_reception and not is_staff:
-        if not user.is_authenticated or user.pk is None:
-            official_visits_qs = official_visits_qs.none()
-            student_visits_qs = student_visits_qs.none()
-        else:
-            try:
-                # Пытаемся получить профиль сотрудника и его департамент
-                employee_profile = EmployeeProfile.objects.get(user=user)
-                if employee_profile.department:
-                    employee_department = employee_profile.department
-                    official_visits_qs = official_visits_qs.filter(department=employee_department)
-                    student_visits_qs = student_visits_qs.filter(department=employee_department)
-                else: # Сотрудник без департамента не видит визиты других департаментов
-                    official_visits_qs = official_visits_qs.none()
-                    student_visits_qs = student_visits_qs.none()
-            except EmployeeProfile.DoesNotExist: # Пользователь без профиля сотрудника
-                official_visits_qs = official_visits_qs.none()
-                student_visits_qs = student_visits_qs.none()
-    
+    # Роль и департамент вычисляются один раз за запрос и кэшируются (access.py)
+    scope = get_access_scope(user)
+    official_visits_qs = scope.filter_visits(Visit.objects.all())
+    student_visits_qs = scope.filter_visits(StudentVisit.objects.all())
     return official_visits_qs, student_visits_qs
 
 
@@ -451,26 +429,11 @@ def visit_history_view(request):
     ).prefetch_related('guests')
     
     # Фильтруем групповые визиты по правам доступа, аналогично другим типам визитов
-    is_reception = user.is_authenticated and user.groups.filter(name=RECEPTION_GROUP).exists()
-    is_staff = user.is_staff
-    
-    if not is_reception and not is_staff:
-        if not user.is_authenticated or user.pk is None:
-            group_visits_qs = group_visits_qs.none()
-        else:
-            try:
-                employee_profile = EmployeeProfile.objects.get(user=user)
-                if employee_profile.department:
-                    # Если это обычный сотрудник с департаментом, показываем групповые визиты этого департамента
-                    group_visits_qs = group_visits_qs.filter(department=employee_profile.department)
-                else:
-                    # Если нет департамента - не показываем групповые визиты других департаментов
-                    group_visits_qs = group_visits_qs.none()
-            except EmployeeProfile.DoesNotExist:
-                group_visits_qs = group_visits_qs.none()
-    
+    scope = get_access_scope(user)
+    group_visits_qs = scope.filter_visits(group_visits_qs)
+
     # Определяем, должен ли пользователь видеть полные фильтры
-    is_reception_or_staff = user.is_staff or user.groups.filter(name=RECEPTION_GROUP).exists()
+    is_reception_or_staff = scope.sees_all
 
     # Инициализируем форму фильтра GET-данными
     filter_form = HistoryFilterForm(request.GET or None)
@@ -521,10 +484,11 @@ def visit_history_view(request):
 
         # Apply guest_name_query filter
         if guest_name_query:
-            official_visits_qs = official_visits_qs.filter(guest__full_name__icontains=guest_name_query)
-            student_visits_qs = student_visits_qs.filter(guest__full_name__icontains=guest_name_query)
+            # Триграммный индекс + транслитерированный вариант ФИО (search.py)
+            official_visits_qs = official_visits_qs.filter(name_filter(guest_name_query, 'guest__full_name'))
+            student_visits_qs = student_visits_qs.filter(name_filter(guest_name_query, 'guest__full_name'))
             # Filter group visits by guest name (any guest in the group)
-            group_visits_qs = group_visits_qs.filter(guests__full_name__icontains=guest_name_query)
+            group_visits_qs = group_visits_qs.filter(name_filter(guest_name_query, 'guests__full_name'))
         
         if guest_iin:
             # Хэшируем ввод и ищем совпадения по полному ИИН через хэш и маске по последним 4
@@ -554,17 +518,9 @@ def visit_history_view(request):
         # Фильтры только для Visit
         employee_info = filter_form.cleaned_data.get('employee_info')
         if employee_info:
-            official_visits_qs = official_visits_qs.filter(
-                Q(employee__first_name__icontains=employee_info) |
-                Q(employee__last_name__icontains=employee_info) |
-                Q(employee__email__icontains=employee_info)
-            )
+            official_visits_qs = official_visits_qs.filter(employee_filter(employee_info, 'employee__'))
             # Также применяем фильтр к групповым визитам
-            group_visits_qs = group_visits_qs.filter(
-                Q(employee__first_name__icontains=employee_info) |
-                Q(employee__last_name__icontains=employee_info) |
-                Q(employee__email__icontains=employee_info)
-            )
+            group_visits_qs = group_visits_qs.filter(employee_filter(employee_info, 'employee__'))
 
         # Фильтры только для StudentVisit
         student_id = filter_form.cleaned_data.get('student_id_number')
@@ -572,84 +528,32 @@ def visit_history_view(request):
         if student_id:
             student_visits_qs = student_visits_qs.filter(student_id_number__icontains=student_id)
         if student_group:
-            student_visits_qs = student_visits_qs.filter(student_group__icontains=student_group)    # Добавляем атрибут для различения в шаблоне
-    for v in official_visits_qs: v.visit_kind = 'official'
-    for v in student_visits_qs: v.visit_kind = 'student'    # Добавляем аналогичный атрибут для групповых визитов
-    for v in group_visits_qs: 
-        v.visit_kind = 'group'
-        # Добавляем требуемые атрибуты для совместимости с шаблоном
-        if v.is_completed:
-            v.status = STATUS_CHECKED_OUT
-        else: # is_registered = True, visit_time is not null, and not is_completed
-            if v.visit_time and v.visit_time > timezone.now():
-                v.status = STATUS_AWAITING_ARRIVAL
-            else: # visit_time is now or in the past, and not completed
-                v.status = STATUS_CHECKED_IN
-        v.entry_time = v.visit_time
-        v.exit_time = v.exit_time  # Fixed: Use the model's exit_time field
-        # Добавляем гостей как атрибуты для более удобного доступа
-        guests_count = v.guests.count()
-        if guests_count > 0:
-            # Получаем первого гостя в группе для отображения в списке
-            first_guest = v.guests.first()
-            v.guest = first_guest
-            v.guests_count = guests_count
-        else:
-            v.guest = None
-            v.guests_count = 0
-            
-        # Добавляем ссылку на само групповое приглашение для доступа в шаблоне
-        v.group_invitation = v
-    
-    def get_sort_key(visit):
-        # Сортируем по релевантному времени: фактическое > планируемое
-        # None ставим в самый конец (самое старое время)
-        relevant_time = None
-        if hasattr(visit, 'entry_time') and visit.entry_time:
-            relevant_time = visit.entry_time
-        elif hasattr(visit, 'expected_entry_time') and visit.expected_entry_time:
-            relevant_time = visit.expected_entry_time
-        elif hasattr(visit, 'visit_time') and visit.visit_time:
-            relevant_time = visit.visit_time
-
-        # Даем очень старую дату для None, чтобы они были последними при reverse=True
-        very_old_time = timezone.make_aware(datetime.datetime.min, timezone.get_default_timezone())
-        return relevant_time if relevant_time else very_old_time
-
-    # Объединяем все три типа визитов в один список
-    combined_list = sorted(
-        itertools_chain(official_visits_qs, student_visits_qs, group_visits_qs),
-        key=get_sort_key, # Используем функцию ключа
-        reverse=True # Самые свежие - вверху
-    )# ---------------------------------------------
-
+            student_visits_qs = student_visits_qs.filter(student_group__icontains=student_group)
 
-    # --- Логика пагинации ---
+    # --- Keyset-пагинация по объединённой истории (UNION ALL в БД) ---
     try:
         items_per_page = int(request.GET.get('per_page', 20))  # Получаем количество записей из GET параметра
         if items_per_page not in [10, 20, 50, 100]:  # Разрешаем только определенные значения
             items_per_page = 20  # Значение по умолчанию
     except (ValueError, TypeError):
         items_per_page = 20  # Если параметр невалидный, используем значение по умолчанию
-        
-    paginator = Paginator(combined_list, items_per_page)
-    page_number = request.GET.get('page')  # Получаем номер страницы из GET параметра 'page'
 
-    try:
-        page_obj = paginator.get_page(page_number)
-    except PageNotAnInteger:
-        # Если номер страницы не целое число, показать первую страницу
-        page_obj = paginator.get_page(1)
-    except EmptyPage:
-        # Если номер страницы больше максимального, показать последнюю страницу
-        page_obj = paginator.get_page(paginator.num_pages)
+    page_obj = get_history_page(
+        official_visits_qs,
+        student_visits_qs,
+        group_visits_qs,
+        per_page=items_per_page,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
     # ------------------------
 
     # --- Формируем строку GET параметров для сохранения фильтров в пагинации ---
     # Удаляем параметр 'page', чтобы он не дублировался
     get_params = request.GET.copy()
-    if 'page' in get_params:
-        del get_params['page']
+    for cursor_param in ('page', 'after', 'before'):
+        if cursor_param in get_params:
+            del get_params[cursor_param]
     filter_params_url = get_params.urlencode()
     # --------------------------------------------------------------------
 
@@ -1288,42 +1192,8 @@ def employee_dashboard_view(request):
     if has_invitation_data_issues:
         messages.warning(request, "Некоторые групповые приглашения могут отображаться некорректно из-за проблем с данными.")
     
-    # Подсчитываем статистики для счетчиков
-    active_visits_count = Visit.objects.filter(
-        department_filter,
-        status__in=[STATUS_CHECKED_IN, STATUS_AWAITING_ARRIVAL],
-        exit_time__isnull=True
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter,
-        status__in=[STATUS_CHECKED_IN, STATUS_AWAITING_ARRIVAL],
-        exit_time__isnull=True
-    ).count()
-    
-    current_guests_count = Visit.objects.filter(
-        department_filter,
-        status=STATUS_CHECKED_IN,
-        exit_time__isnull=True
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter, 
-        status=STATUS_CHECKED_IN,
-        exit_time__isnull=True
-    ).count()
-    
-    awaiting_visits_count = Visit.objects.filter(
-        department_filter,
-        status=STATUS_AWAITING_ARRIVAL
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter,
-        status=STATUS_AWAITING_ARRIVAL
-    ).count()
-    
-    today_visits_count = Visit.objects.filter(
-        department_filter,
-        entry_time__date=today
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter,
-        entry_time__date=today
-    ).count()
+    # Счетчики - тот же кэшированный снимок, что отдает get_counters_api
+    counters = _counters_snapshot(request)['counters']
 
     context = {
         'upcoming_visits': upcoming_visits_week_list, # Визиты на неделю всего департамента
@@ -1339,95 +1209,45 @@ def employee_dashboard_view(request):
         'official_visits_percent': official_percent,  # Процент официальных визитов для графика
         'student_visits_percent': student_percent,   # Процент студенческих визитов для графика
         # Добавляем счетчики для HTMX
-        'active_visits_count': active_visits_count,
-        'current_guests_count': current_guests_count,
-        'awaiting_visits_count': awaiting_visits_count,
-        'today_visits_count': today_visits_count,
+        **counters,
     }
     return render(request, 'visitors/employee_dashboard.html', context)
 
 
+def _counters_snapshot(request):
+    """Снимок счётчиков пользователя (один раз за запрос: для ETag и ответа)."""
+    snapshot = getattr(request, '_counters_snapshot', None)
+    if snapshot is None:
+        user = request.user
+        snapshot = get_counter_snapshot(get_access_scope(user).department_id, user.id)
+        request._counters_snapshot = snapshot
+    return snapshot
+
+
 @login_required
 @htmx_cache_control(max_age=30, must_revalidate=True)
-@etag_htmx(lambda request, *args, **kwargs: f"counters_{request.user.id}_{timezone.now().strftime('%Y%m%d%H%M')}")
+@etag_htmx(lambda request, *args, **kwargs: f"counters_{request.user.id}_{_counters_snapshot(request)['etag']}")
 def get_counters_api(request):
-    """API для получения актуальных счетчиков через polling."""
-    user = request.user
-    
-    # Получаем департамент пользователя
-    try:
-        user_profile = EmployeeProfile.objects.select_related('department').get(user=user)
-        user_department = user_profile.department
-    except EmployeeProfile.DoesNotExist:
-        user_department = None
-    
-    # Фильтры для подсчетов
-    department_filter = Q(department=user_department) if user_department else Q(employee=user)
-    student_department_filter = Q(department=user_department) if user_department else Q()
-    
-    today = timezone.now().date()
-    
-    # Подсчитываем актуальные значения
-    active_visits_count = Visit.objects.filter(
-        department_filter,
-        status__in=[STATUS_CHECKED_IN, STATUS_AWAITING_ARRIVAL],
-        exit_time__isnull=True
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter,
-        status__in=[STATUS_CHECKED_IN, STATUS_AWAITING_ARRIVAL],
-        exit_time__isnull=True
-    ).count()
-    
-    current_guests_count = Visit.objects.filter(
-        department_filter,
-        status=STATUS_CHECKED_IN,
-        exit_time__isnull=True
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter, 
-        status=STATUS_CHECKED_IN,
-        exit_time__isnull=True
-    ).count()
-    
-    awaiting_visits_count = Visit.objects.filter(
-        department_filter,
-        status=STATUS_AWAITING_ARRIVAL
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter,
-        status=STATUS_AWAITING_ARRIVAL
-    ).count()
-    
-    today_visits_count = Visit.objects.filter(
-        department_filter,
-        entry_time__date=today
-    ).count() + StudentVisit.objects.filter(
-        student_department_filter,
-        entry_time__date=today
-    ).count()
+    """
+    API для получения актуальных счетчиков через polling.
+
+    Счётчики берутся из кэшированного снимка департамента (два запроса
+    с условной агрегацией раз в несколько секунд); если снимок не
+    изменился, etag_htmx отвечает 304 без тела.
+    """
+    counters = _counters_snapshot(request)['counters']
     
     if request.htmx:
         # Возвращаем HTML фрагменты для обновления счетчиков с hx-swap-oob
         response = HttpResponse()
         
         # Добавляем HX-Trigger для обновления счетчиков
-        trigger_client_event(response, 'updateCounters', {
-            'active_visits_count': active_visits_count,
-            'current_guests_count': current_guests_count,
-            'awaiting_visits_count': awaiting_visits_count,
-            'today_visits_count': today_visits_count
-        })
-        
-        # Если счетчики не изменились, можем остановить polling на некоторое время
-        # (это можно сделать через дополнительную логику проверки предыдущих значений)
+        trigger_client_event(response, 'updateCounters', counters)
         
         return response
     
     # Fallback для обычных запросов
-    return JsonResponse({
-        'active_visits_count': active_visits_count,
-        'current_guests_count': current_guests_count,
-        'awaiting_visits_count': awaiting_visits_count,
-        'today_visits_count': today_visits_count
-    })
+    return JsonResponse(counters)
 
 
 def has_functional_access(user):
@@ -1581,224 +1401,29 @@ def export_visits_xlsx(request):
         return HttpResponse("У вас нет прав для экспорта данных.", status=403)
     # ---------------------------
     
-    # Получаем визиты с учетом прав доступа пользователя
-    official_visits_qs, student_visits_qs = get_scoped_visits_qs(user)
-
-    # --- Применяем фильтры (логика копируется из visit_history_view) ---
-    filter_form = HistoryFilterForm(request.GET or None) # Получаем GET параметры
-
-    # official_visits_qs = Visit.objects.select_related(
-    #    'guest', 'employee', 'department', 'registered_by'
-    #).all()
-    #student_visits_qs = StudentVisit.objects.select_related(
-    #    'guest', 'department', 'registered_by'
-    #).all()
-
-    # Применяем фильтры, если они есть в запросе
-    if request.GET and filter_form.is_valid():
-        # Копируем логику фильтрации из visit_history_view
-        guest_name = filter_form.cleaned_data.get('guest_name')
-        guest_iin = filter_form.cleaned_data.get('guest_iin')
-        entry_date_from = filter_form.cleaned_data.get('entry_date_from')
-        entry_date_to = filter_form.cleaned_data.get('entry_date_to')
-        purpose_filter = filter_form.cleaned_data.get('purpose')
-        status = filter_form.cleaned_data.get('status')
-        department = filter_form.cleaned_data.get('department')
-        employee_info = filter_form.cleaned_data.get('employee_info')
-        student_id = filter_form.cleaned_data.get('student_id_number')
-        student_group = filter_form.cleaned_data.get('student_group')
-
-        if guest_name:
-            official_visits_qs = official_visits_qs.filter(guest__full_name__icontains=guest_name)
-            student_visits_qs = student_visits_qs.filter(guest__full_name__icontains=guest_name)
-        if guest_iin:
-            import hashlib
-            iin_hash = hashlib.sha256(guest_iin.encode()).hexdigest()
-            official_visits_qs = official_visits_qs.filter(guest__iin_hash=iin_hash)
-            student_visits_qs = student_visits_qs.filter(guest__iin_hash=iin_hash)
-        if entry_date_from:
-            official_visits_qs = official_visits_qs.filter(
-                Q(entry_time__date__gte=entry_date_from) |
-                Q(entry_time__isnull=True, expected_entry_time__date__gte=entry_date_from)
-            )
-            student_visits_qs = student_visits_qs.filter(entry_time__date__gte=entry_date_from)
-        if entry_date_to:
-            official_visits_qs = official_visits_qs.filter(
-                Q(entry_time__date__lte=entry_date_to) |
-                Q(entry_time__isnull=True, expected_entry_time__date__lte=entry_date_to)
-            )
-            student_visits_qs = student_visits_qs.filter(entry_time__date__lte=entry_date_to)
-        if purpose_filter:
-            official_visits_qs = official_visits_qs.filter(purpose__icontains=purpose_filter)
-            student_visits_qs = student_visits_qs.filter(purpose__icontains=purpose_filter)
-        if status:
-            official_visits_qs = official_visits_qs.filter(status=status)
-            student_visits_qs = student_visits_qs.filter(status=status)
-        if department:
-            official_visits_qs = official_visits_qs.filter(department=department)
-            student_visits_qs = student_visits_qs.filter(department=department)
-        if employee_info:
-            official_visits_qs = official_visits_qs.filter(
-                Q(employee__first_name__icontains=employee_info) |
-                Q(employee__last_name__icontains=employee_info) |
-                Q(employee__email__icontains=employee_info)
-            )
-        if student_id:
-            student_visits_qs = student_visits_qs.filter(student_id_number__icontains=student_id)
-        if student_group:
-            student_visits_qs = student_visits_qs.filter(student_group__icontains=student_group)
-
-
-    # --- Объединение результатов ---
-    # Добавляем тип для дальнейшего использования
-    for v in official_visits_qs: v.visit_kind = 'official'
-    for v in student_visits_qs: v.visit_kind = 'student'
-
-    # Используем ключ сортировки из visit_history_view
-    def get_sort_key(visit):
-        relevant_time = None
-        if visit.entry_time:
-            relevant_time = visit.entry_time
-        elif hasattr(visit, 'expected_entry_time') and visit.expected_entry_time:
-            relevant_time = visit.expected_entry_time
-        very_old_time = timezone.make_aware(datetime.datetime.min, timezone.get_default_timezone())
-        return relevant_time if relevant_time else very_old_time
-
-    combined_list = sorted(
-        itertools_chain(official_visits_qs, student_visits_qs),
-        key=get_sort_key,
-        reverse=True
-    )
-    # ----------------------------
+    # Визиты с учетом прав доступа пользователя и фильтров истории
+    official_visits_qs, student_visits_qs = history_export.export_querysets(user, request.GET)
 
     # --- Создание Excel файла ---
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "История визитов"
-
-    # Заголовки колонок
-    headers = [
-        "ID Визита", "Тип визита", "Статус", "ФИО Посетителя", "ИИН", "Телефон Посетителя", "Email Посетителя",
-        "Сотрудник ФИО", "Сотрудник Email", "Студент ID", "Студент Группа", "Студент Курс",
-        "Департамент", "Цель визита", "Конт. тел. сотрудника (визит)",
-        "Планируемое время входа", "Время входа", "Время выхода", "Зарегистрировал ФИО", "Зарегистрировал Email",
-        "Согласие ПДн"
-    ]
-    ws.append(headers)
-
-    # Делаем заголовки жирными (опционально)
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-
-    # Заполняем строки данными
-    # Получаем отображения статусов
-    status_display_map = dict(Visit._meta.get_field('status').choices)
-
-    for visit in combined_list:
-        # Форматируем даты и время
-        entry_time_str = visit.entry_time.astimezone(timezone.get_default_timezone()).strftime('%Y-%m-%d %H:%M:%S') if visit.entry_time else ''
-        exit_time_str = visit.exit_time.astimezone(timezone.get_default_timezone()).strftime('%Y-%m-%d %H:%M:%S') if visit.exit_time else ''
-        expected_entry_time_str = ''
-        consent_acknowledged_str = ''
-
-        # Подготавливаем данные в зависимости от типа визита
-        row_data = []
-        status_str = status_display_map.get(visit.status, visit.status) # Отображение статуса
-
-        if visit.visit_kind == 'official':
-            expected_entry_time_str = visit.expected_entry_time.astimezone(timezone.get_default_timezone()).strftime('%Y-%m-%d %H:%M:%S') if visit.expected_entry_time else ''
-            consent_acknowledged_str = "Да" if visit.consent_acknowledged else "Нет"
-            row_data = [
-                visit.id,
-                "Гость сотрудника/Другое", # Тип
-                status_str, # Статус
-                visit.guest.full_name,
-                (('********' + str(getattr(visit.guest, 'iin', ''))[-4:]) if getattr(visit.guest, 'iin', None) else ''),
-                visit.guest.phone_number,
-                visit.guest.email,
-                visit.employee.get_full_name() if visit.employee else '-', # Сотрудник ФИО
-                visit.employee.email if visit.employee else '-',           # Сотрудник Email
-                '-', # Студент ID
-                '-', # Студент Группа
-                '-', # Студент Курс
-                visit.department.name if visit.department else '-',        # Департамент
-                visit.purpose,
-                visit.employee_contact_phone, # Конт. тел. сотрудника (визит)
-                expected_entry_time_str, # Планируемое время
-                entry_time_str,
-                exit_time_str,
-                visit.registered_by.get_full_name() if visit.registered_by else '-',
-                visit.registered_by.email if visit.registered_by else '-',
-                consent_acknowledged_str, # Согласие
-            ]
-        elif visit.visit_kind == 'student':
-            # У студенческих визитов нет expected_entry_time/consent
-            expected_entry_time_str = '-'
-            consent_acknowledged_str = '-'
-            masked_iin = ''
-            try:
-                raw_iin = getattr(visit.guest, 'iin', None)
-                if raw_iin:
-                    masked_iin = ('********' + str(raw_iin)[-4:]) if len(str(raw_iin)) >= 4 else '********'
-            except Exception:
-                masked_iin = ''
-            row_data = [
-                visit.id,
-                "Студент/Абитуриент", # Тип
-                status_str, # Статус
-                visit.guest.full_name,
-                masked_iin,
-                visit.guest.phone_number,
-                visit.guest.email,
-                '-', # Сотрудник ФИО
-                '-', # Сотрудник Email
-                visit.student_id_number, # Студент ID
-                visit.student_group,     # Студент Группа
-                visit.student_course,    # Студент Курс
-                visit.department.name,   # Департамент (обязателен для StudentVisit)
-                visit.purpose,
-                 '-', # Конт. тел. сотрудника (визит) - нет в этой модели
-                expected_entry_time_str, # Планируемое время
-                entry_time_str,
-                exit_time_str,
-                visit.registered_by.get_full_name() if visit.registered_by else '-',
-                visit.registered_by.email if visit.registered_by else '-',
-                consent_acknowledged_str, # Согласие
-            ]
-        else: # На случай непредвиденных данных
-            row_data = [visit.id, 'Неизвестный тип'] + ['-'] * (len(headers) - 2)
-
-        # Добавляем строку в лист Excel
-        # Заменяем None на пустую строку для корректного отображения
-        ws.append([str(item) if item is not None else '' for item in row_data])
-
-    # Опционально: Настройка ширины колонок
-    for col_idx, column_title in enumerate(headers, 1):
-        column_letter = openpyxl.utils.get_column_letter(col_idx)
-        # Простая автоширина (может быть не идеальной)
-        # ws.column_dimensions[column_letter].width = len(column_title) + 5
-        # Или установим фиксированную ширину для некоторых колонок
-        if column_title in ["ФИО Посетителя", "Цель визита", "Сотрудник ФИО", "Зарегистрировал ФИО"]:
-            ws.column_dimensions[column_letter].width = 30
-        elif column_title in ["Время входа", "Время выхода", "Планируемое время входа", "Email Посетителя", "Сотрудник Email", "Зарегистрировал Email"]:
-            ws.column_dimensions[column_letter].width = 20
-        elif column_title in ["ИИН", "Телефон Посетителя", "Конт. тел. сотрудника (визит)"]:
-            ws.column_dimensions[column_letter].width = 18
-        else:
-            ws.column_dimensions[column_letter].width = 15
-
+    # Строки читаются из БД пачками и пишутся в write-only книгу во временном
+    # файле; ответ отдаётся потоком, память не растёт с размером выгрузки
+    tmp = tempfile.TemporaryFile()
+    try:
+        rows = history_export.write_visits_xlsx(official_visits_qs, student_visits_qs, tmp)
+    except Exception:
+        tmp.close()
+        raise
+    tmp.seek(0)
+    logger.info("Visit history export for %s: %d rows", user.username, rows)
 
-    # --- Создание HTTP ответа с файлом ---
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
     # Формируем имя файла с датой и временем
     filename = f"visit_history_{timezone.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-    # Сохраняем книгу Excel в ответ
-    wb.save(response)
-
+    response = FileResponse(
+        tmp,
+        as_attachment=True,
+        filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
     return response
 # ------------------------------------------
 
@@ -1822,42 +1447,21 @@ def employee_autocomplete_view(request):
     department_id = request.GET.get('department_id') # Получаем ID
     logger.debug("[autocomplete] Search Term='%s', Department ID='%s'", term, department_id)
 
-    results = []
-    queryset = User.objects.filter(is_active=True)
-
-    # Фильтруем по поисковому термину, если он не пустой
-    if len(term) >= 1:
-        queryset = queryset.filter(
-            Q(first_name__icontains=term) |
-            Q(last_name__icontains=term) |
-            Q(email__icontains=term)
-        )
-
-    logger.debug("[autocomplete] Users found before department filter: %s", queryset.count())
-
+    dept_id_int = None
     # Проверяем department_id и фильтруем по нему, если он валидный
     if department_id and department_id.strip() and department_id.strip().lower() not in ['none', 'null', 'undefined', ''] and department_id.isdigit():
-        try:
-            dept_id_int = int(department_id)
-            # Важный фильтр: только пользователи с профилем и из выбранного департамента
-            queryset = queryset.filter(employee_profile__department__id=dept_id_int)
-            logger.debug("[autocomplete] Users after dept filter (Dept ID=%s): %s", dept_id_int, queryset.count())
-        except ValueError:
-            logger.warning("[autocomplete] department_id '%s' is not int", department_id)
+        dept_id_int = int(department_id)
     else:
         # Если department_id отсутствует, пустой, None, null или не является числом
         # При инициализации формы показываем первые 10 активных пользователей
         logger.debug("[autocomplete] Department ID not valid ('%s'), showing first 10 active users", department_id)
 
     # Ограничиваем количество результатов: если term пустой, показываем максимум 10 пользователей
-    if not term:
-        queryset = queryset[:10]
-    else:
-        queryset = queryset[:20]
-
-    count_total = queryset.count()
-
-    results = [{'id': user.id, 'text': f"{user.get_full_name() or user.username} ({user.email})"} for user in queryset]
+    limit = 20 if term else 10
+    # Совпадения по началу слов - из индекса в памяти; остальное (и отказ
+    # индекса) - триграммный поиск по вхождению в БД (employee_index.py)
+    results = employee_index.search(term, dept_id_int, limit=limit)
+    count_total = len(results)
 
     logger.debug("[autocomplete] Returning %s results", len(results))
 
@@ -1930,8 +1534,7 @@ def get_employee_details_view(request, user_id):
 def check_in_visit(request, visit_kind, visit_id):
     """Отмечает фактический вход для ожидающего визита."""
     # Ограничиваем право check-in: только staff или члены группы RECEPTION
-    is_reception = request.user.is_authenticated and request.user.groups.filter(name=RECEPTION_GROUP).exists()
-    if not (request.user.is_staff or is_reception):
+    if not get_access_scope(request.user).sees_all:
         raise PermissionDenied
 
     model = Visit if visit_kind == 'official' else StudentVisit if visit_kind == 'student' else None